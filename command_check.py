@@ -0,0 +1,263 @@
+"""
+Checks the command optimiser (optimise_commands parameter) against the unoptimised run.
+
+Every protocol is simulated twice, with optimise_commands off and on. The optimised run has to
+send the same commands in the same order with only repeated blow outs, touch tips, latch
+changes and deactivations left out, and the heater shaker latch has to be in the same state at
+every pipette command, labware move, shake and pause. Prints the commands removed per protocol.
+
+The incubations the modelled clock logs in the unoptimised run are checked too: each has to be
+logged with the duration it is meant to last and be ready no sooner, and no more than
+incubation_overrun later, than that after it started. Dry runs skip the incubations.
+
+Usage: python command_check.py [protocol.py ...] [-L labware_dir] [name=value ...]
+name=value sets the default of a runtime parameter, e.g. number_samples=96
+"""
+
+import sys
+import re
+import os
+import io
+from opentrons import simulate
+
+protocols = [
+    "bradford_final.py",
+    "single_plate_bca.py",
+    "multi_plate_bca.py",
+    "hilic_large_plate.py",
+]
+
+# runlog text the optimiser is allowed to leave out: command name
+removable = {
+    "Blowing out": "blow_out",
+    "Touching tip": "touch_tip",
+    "Deactivating Heater": "deactivate_heater",
+    "Deactivating Shaker": "deactivate_shaker",
+}
+# commands that need the latch in the same state in both runs
+latch_checked = [
+    "Moving ",
+    "Setting Heater-Shaker to Shake",
+    "Pausing",
+    "Picking up tip",
+    "Dropping tip",
+    "Returning tip",
+    "Aspirating",
+    "Dispensing",
+    "Mixing",
+    "Blowing out",
+    "Touching tip",
+    "Air gap",
+]
+# comments that change with the number of commands
+ignored = ["Command optimiser removed", "Modelled run time", "Clock "]
+# incubations logged by the modelled clock: {name pattern: function(runtime parameters) returning seconds}
+incubations = {
+    "bradford_final.py": {
+        r"plate \d+ incubation": lambda params: 15 * 60,
+    },
+    "hilic_large_plate.py": {
+        "DTT incubation": lambda params: 20 * 60,
+        "IAA incubation": lambda params: 45 * 60,
+        "binding incubation": lambda params: 30 * 60,
+        "digestion": lambda params: int(params.get("incubation_time", "1")) * 60 * 60,
+    },
+}
+incubation_overrun = 5 * 60  # s an incubation may run past its duration
+
+
+def protocol_source(path, params):
+    """
+    Get's the protocol with the defaults of some runtime parameters changed
+    Params: {variable name: value as python source}
+    Return: protocol source
+    """
+    with open(path) as f:
+        source = f.read()
+    for name, value in params.items():
+        pattern = re.compile(r'(variable_name="%s".*?default=)([^,\n]+)' % re.escape(name), re.S)
+        source, found = pattern.subn(lambda m: m.group(1) + value, source, count=1)
+        if not found:
+            raise ValueError("%s has no parameter %s" % (path, name))
+    return source
+
+
+def simulate_texts(path, params, labware_paths):
+    """
+    Simulates a protocol with some runtime parameters changed
+    Return: runlog text of every command, nested commands follow their parent
+    """
+    source = protocol_source(path, params)
+    runlog, _ = simulate.simulate(
+        io.StringIO(source),
+        file_name=os.path.basename(path),
+        custom_labware_paths=labware_paths,
+    )
+    return [entry["payload"]["text"] for entry in runlog]
+
+
+def comparable_commands(texts):
+    # times from the modelled clock change with the number of commands, and so do the
+    # delays that wait for a plate to be ready
+    texts = [re.sub(r"\d+:\d\d:\d\d", "h:mm:ss", text) for text in texts]
+    texts = [
+        re.sub(r"Delaying for .*? seconds", "Delaying", text) if "incubation" in text else text
+        for text in texts
+    ]
+    return [text for text in texts if not text.startswith(tuple(ignored))]
+
+
+def clock_seconds(text):
+    hours, minutes, seconds = text.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def check_incubations(path, params, texts):
+    """
+    Checks the incubations logged by the modelled clock ("Clock h:mm:ss: event" comments)
+    against the durations they are meant to last
+    Return: list of problems
+    """
+    expected = incubations.get(os.path.basename(path), {})
+    problems = []
+    started = {}
+    for text in texts:
+        match = re.match(r"Clock (\d+:\d\d:\d\d): (.*) started, (\d+) s$", text)
+        if match:
+            start, name, seconds = match.groups()
+            pattern = next((pattern for pattern in expected if re.fullmatch(pattern, name)), None)
+            if pattern is None:
+                problems.append("%s has no expected duration" % name)
+                continue
+            duration = expected[pattern](params)
+            if int(seconds) != duration:
+                problems.append("%s is meant to last %d s, logged %s s" % (name, duration, seconds))
+            started[name] = clock_seconds(start), duration
+            continue
+        match = re.match(r"Clock (\d+:\d\d:\d\d): (.*) ready$", text)
+        if match:
+            ready, name = match.groups()
+            if name not in started:
+                problems.append("%s is ready without starting" % name)
+                continue
+            start, duration = started.pop(name)
+            incubated = clock_seconds(ready) - start
+            if incubated < duration:
+                problems.append("%s ready after %d s, %d s short" % (name, incubated, duration - incubated))
+            elif incubated > duration + incubation_overrun:
+                problems.append("%s ready after %d s, %d s over" % (name, incubated, incubated - duration))
+    for name in started:
+        problems.append("%s is never ready" % name)
+    return problems
+
+
+def command_kind(text):
+    for prefix, name in removable.items():
+        if text.startswith(prefix):
+            return name
+    return None
+
+
+def latch_state(state, text):
+    if text.startswith("Unlatching labware"):
+        return "open"
+    if text.startswith("Latching labware"):
+        return "closed"
+    return state
+
+
+def latch_states(texts):
+    """
+    Get's the commands without the latch changes, each with the latch state it runs at
+    Return: [(text, latch state)], number of latch changes
+    """
+    commands = []
+    changes = 0
+    state = None
+    for text in texts:
+        new_state = latch_state(state, text)
+        if new_state != state or text.startswith(("Latching labware", "Unlatching labware")):
+            state = new_state
+            changes += 1
+            continue
+        commands.append((text, state))
+    commands.append(("end of run", state))
+    return commands, changes
+
+
+def compare(original, optimised):
+    """
+    Checks the optimised commands are the original ones with only removable commands left out.
+    Latch changes may move, as long as the latch is the same at every command that needs it
+    Return: ({command name: number removed}, list of problems)
+    """
+    removed = {}
+    problems = []
+    original, original_changes = latch_states(original)
+    optimised, optimised_changes = latch_states(optimised)
+    if original_changes > optimised_changes:
+        removed["labware_latch"] = original_changes - optimised_changes
+    j = 0
+    for i, (text, state) in enumerate(original):
+        if j < len(optimised) and optimised[j][0] == text:
+            if (text.startswith(tuple(latch_checked)) or text == "end of run") and optimised[j][1] != state:
+                problems.append(
+                    "command %d (%s): latch %s, optimised %s" % (i, text, state, optimised[j][1])
+                )
+            j += 1
+            continue
+        kind = command_kind(text)
+        if kind is None:
+            problems.append("command %d (%s) is missing from the optimised run" % (i, text))
+            break
+        removed[kind] = removed.get(kind, 0) + 1
+    if j < len(optimised) and not problems:
+        problems.append("optimised command %d (%s) isn't in the original run" % (j, optimised[j][0]))
+    if original_changes < optimised_changes:
+        problems.append("%d more latch changes" % (optimised_changes - original_changes))
+    return removed, problems
+
+
+def main(args):
+    paths = []
+    params = {}
+    labware_paths = []
+    while args:
+        arg = args.pop(0)
+        if arg == "-L":
+            labware_paths.append(args.pop(0))
+        elif "=" in arg:
+            name, value = arg.split("=", 1)
+            params[name] = value
+        else:
+            paths.append(arg)
+    failed = False
+    for path in paths or protocols:
+        texts = simulate_texts(path, dict(params, optimise_commands="False"), labware_paths)
+        original = comparable_commands(texts)
+        optimised = comparable_commands(
+            simulate_texts(path, dict(params, optimise_commands="True"), labware_paths)
+        )
+        removed, problems = compare(original, optimised)
+        print(
+            "%s: %d commands, %d removed (%s)"
+            % (
+                path,
+                len(original),
+                sum(removed.values()),
+                ", ".join("%s: %d" % (name, n) for name, n in sorted(removed.items())) or "none",
+            )
+        )
+        for problem in problems:
+            failed = True
+            print("    NOT EQUIVALENT: " + problem)
+        if params.get("dry_run") == "True":
+            continue
+        for problem in check_incubations(path, params, texts):
+            failed = True
+            print("    INCUBATION: " + problem)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,121 @@
+"""
+Checks the per-sample dilutions (dilution_csv) of the BCA protocols.
+
+A CSV with samples at mixed dilutions is parsed, each sample has to get the dilution it is listed
+at and the rest the default one, and the protocol is simulated with the CSV in dilution_csv. A CSV
+with a sample diluted past what a dilution well takes has to be refused with a message that names
+the sample, before anything is pipetted.
+
+Usage: python dilution_check.py [protocol.py ...] [-L labware_dir] [name=value ...]
+name=value sets the default of a runtime parameter, e.g. number_samples=24
+"""
+
+import sys
+import os
+import io
+import re
+from opentrons import simulate
+from command_check import protocol_source
+from single_plate_bca import read_dilution_csv
+
+protocols = [
+    "single_plate_bca.py",
+    "multi_plate_bca.py",
+]
+mixed = {1: 1, 2: 2, 3: 5, 4: 10, 6: 20, 7: 40}  # sample: dilution, the others get the default
+too_dilute = 8, 50  # sample, dilution
+
+
+def dilution_text(dilutions):
+    return "sample,dilution\n" + "".join("%d,%g\n" % item for item in sorted(dilutions.items()))
+
+
+def with_dilutions(source, text):
+    """
+    Get's the protocol source with a dilution CSV in dilution_csv
+    """
+    source, found = re.subn(
+        r'dilution_csv = """.*?"""', lambda m: 'dilution_csv = """\n%s"""' % text, source, count=1, flags=re.S
+    )
+    if not found:
+        raise ValueError("The protocol takes no dilution CSV")
+    return source
+
+
+def simulate_dilutions(path, params, labware_paths, dilutions):
+    """
+    Simulates a protocol with a dilution CSV
+    Return: run log
+    """
+    source = with_dilutions(protocol_source(path, params), dilution_text(dilutions))
+    runlog, _ = simulate.simulate(
+        io.StringIO(source),
+        file_name=os.path.basename(path),
+        custom_labware_paths=labware_paths,
+    )
+    return runlog
+
+
+def check_parsing():
+    """
+    Get's the problems with how the dilution CSV is read
+    Return: list of problems
+    """
+    problems = []
+    dilutions = read_dilution_csv(dilution_text(mixed), 10, 3)
+    expected = [mixed.get(i + 1, 3) for i in range(0, 10)]
+    if dilutions != expected:
+        problems.append("read %s, expected %s" % (dilutions, expected))
+    sample, dilution = too_dilute
+    try:
+        read_dilution_csv(dilution_text({**mixed, sample: dilution}), 10, 3)
+        problems.append("sample %d at %gx was read" % (sample, dilution))
+    except ValueError as error:
+        if "Sample %d " % sample not in str(error):
+            problems.append("the error for sample %d at %gx doesn't name it: %s" % (sample, dilution, error))
+    return problems
+
+
+def main(args):
+    paths = []
+    params = {}
+    labware_paths = []
+    while args:
+        arg = args.pop(0)
+        if arg == "-L":
+            labware_paths.append(args.pop(0))
+        elif "=" in arg:
+            name, value = arg.split("=", 1)
+            params[name] = value
+        else:
+            paths.append(arg)
+    params.setdefault("number_samples", "10")
+    failed = False
+    problems = check_parsing()
+    print("read_dilution_csv: %s" % ("ok" if not problems else "FAILED"))
+    for problem in problems:
+        failed = True
+        print("    " + problem)
+    for path in paths or protocols:
+        try:
+            runlog = simulate_dilutions(path, params, labware_paths, mixed)
+            print("%s: %d commands with samples at %s" % (
+                path, len(runlog), ", ".join("%gx" % d for d in sorted(set(mixed.values())))
+            ))
+        except Exception as error:
+            failed = True
+            print("%s: FAILED with mixed dilutions: %s" % (path, error))
+        sample, dilution = too_dilute
+        try:
+            simulate_dilutions(path, params, labware_paths, {sample: dilution})
+            failed = True
+            print("%s: FAILED, sample %d at %gx ran" % (path, sample, dilution))
+        except Exception as error:
+            if "Sample %d " % sample not in str(error):
+                failed = True
+                print("%s: FAILED, sample %d at %gx stopped with: %s" % (path, sample, dilution, error))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
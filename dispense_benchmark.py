@@ -0,0 +1,266 @@
+"""
+Gravimetric-style benchmark of the multi dispense of the BCA protocols.
+
+A protein or standard addition is run on a simulated Flex, a 1-channel 1000 µL pipette with
+200 µL tips filling the replicates of each tube of a 1.5 mL tube rack into a flat plate, in
+three modes:
+single: a tip, an aspiration and a blow out per well, what the protocols do by default
+multi: one aspiration for as many wells as fit, no conditioning, disposal or pre-wet
+compensated: MultiDispense of single_plate_bca.py with its defaults
+Time is the modelled duration of the commands (ProtocolClock of bradford_final.py). Every
+dispense into the plate is weighed with the error model below on a number of simulated plates, and
+reported as the mean error and CV of the dispenses, overall and by position in their aspiration.
+
+Balance readings given with -r replace the model: a CSV with position,volume,weight (position in
+the aspiration from 1, µL asked for, mg weighed, water at 1 mg/µL). Their errors by position are
+reported with the correction table that evens them out, ready for MultiDispense(corrections=...).
+
+Usage: python dispense_benchmark.py [-s sources] [-n replicates] [-v volume] [-p plates] [-r weights.csv]
+"""
+
+import sys
+import csv
+import numpy
+from opentrons import simulate
+from opentrons import types
+from bradford_final import ProtocolClock
+from single_plate_bca import MultiDispense
+
+# error model of an air displacement pipette, fractions of the volume asked for
+first_dispense_bias = -0.04  # first dispense of an aspiration with no conditioning, the plunger's backlash
+empty_tip_bias = -0.03  # a dispense that empties the tip with no blow out after it, the film stays in the tip
+dry_tip_bias = -0.015  # the first aspiration of a tip that wasn't pre-wet, the film is taken from the liquid
+position_bias = -0.002  # per dispense down the aspiration, liquid creeping back up the tip
+dispense_cv = 0.01  # random error of every dispense
+modes = ["single", "multi", "compensated"]
+
+
+class DispenseRecorder:
+    """
+    Follows what is in the tip and records every dispense that isn't back into the source
+    Dispenses: {volume, position, conditioned, wet, empties, blown_out}
+    """
+
+    def __init__(self):
+        self.dispenses = []
+        self.tips = 0
+        self.aspirations = 0
+        self.depth = 0
+        self.in_tip = 0
+        self.source = None
+        self.position = 0
+        self.conditioned = False
+        self.wet = False
+        self.was_wet = False
+
+    @staticmethod
+    def well(location):
+        if isinstance(location, types.Location):
+            return location.labware.as_well()
+        return location
+
+    def _wrap(self, pipette, name, handler):
+        method = getattr(pipette, name)
+
+        def wrapped(*args, **kwargs):
+            if self.depth == 0:  # the aspirates and dispenses inside a mix are the mix
+                handler(*args, **kwargs)
+            self.depth += 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.depth -= 1
+
+        setattr(pipette, name, wrapped)
+
+    def pick_up_tip(self, *args, **kwargs):
+        self.tips += 1
+        self.in_tip = 0
+        self.wet = False
+
+    def mix(self, *args, **kwargs):
+        self.wet = True
+
+    def aspirate(self, volume=None, location=None, *args, **kwargs):
+        self.aspirations += 1
+        self.in_tip += volume
+        self.source = self.well(location)
+        self.position = 0
+        self.conditioned = False
+        self.was_wet = self.wet
+        self.wet = True
+
+    def dispense(self, volume=None, location=None, *args, **kwargs):
+        self.in_tip -= volume
+        if self.well(location) is self.source:
+            self.conditioned = self.conditioned or self.position == 0
+            return
+        self.dispenses.append(
+            {
+                "volume": volume,
+                "position": self.position,
+                "conditioned": self.conditioned,
+                "wet": self.was_wet,
+                "empties": self.in_tip < 0.01,
+                "blown_out": False,
+                "well": self.well(location),
+            }
+        )
+        self.position += 1
+
+    def blow_out(self, location=None, *args, **kwargs):
+        if self.dispenses and self.dispenses[-1]["well"] is self.well(location):
+            self.dispenses[-1]["blown_out"] = True
+
+    def attach(self, pipette):
+        for name in ["pick_up_tip", "mix", "aspirate", "dispense", "blow_out"]:
+            self._wrap(pipette, name, getattr(self, name))
+
+
+def run_mode(mode, sources, replicates, volume):
+    """
+    Simulates the addition in a mode
+    Return: DispenseRecorder, modelled seconds
+    """
+    protocol = simulate.get_protocol_api("2.21", robot_type="Flex")
+    tip_racks = [
+        protocol.load_labware("opentrons_flex_96_tiprack_200ul", slot) for slot in ["A3", "B3"]
+    ]
+    pipette = protocol.load_instrument("flex_1channel_1000", "left", tip_racks=tip_racks)
+    chute = protocol.load_waste_chute()
+    rack = protocol.load_labware("opentrons_24_tuberack_eppendorf_1.5ml_safelock_snapcap", "A2")
+    plate = protocol.load_labware("corning_96_wellplate_360ul_flat", "C2")
+    clock = ProtocolClock(virtual=True)
+    clock.attach(protocol, [pipette])
+    recorder = DispenseRecorder()
+    recorder.attach(pipette)
+    multi_dispense = {
+        "multi": MultiDispense(conditioning=0, disposal=0, pre_wet=0),
+        "compensated": MultiDispense(),
+    }.get(mode)
+    for i in range(0, sources):
+        source = rack.wells()[i]
+        wells = plate.wells()[i * replicates:(i + 1) * replicates]
+        if multi_dispense is None:
+            for well in wells:
+                pipette.pick_up_tip()
+                pipette.aspirate(volume, source.bottom(1.5), 0.25)
+                pipette.dispense(volume, well.bottom(0.1), 0.25)
+                pipette.blow_out(well.top())
+                pipette.drop_tip(chute)
+            continue
+        pipette.pick_up_tip()
+        multi_dispense.dispense(
+            pipette, source, [well.bottom(0.1) for well in wells], volume, 0.25, 200, height=1.5
+        )
+        pipette.drop_tip(chute)
+    return recorder, clock.now()
+
+
+def weigh(dispenses, plates, rng):
+    """
+    Weighs the dispenses with the error model on a number of plates
+    Return: array of plates x dispenses of µL delivered
+    """
+    asked = numpy.array([d["volume"] for d in dispenses], dtype=float)
+    bias = numpy.zeros(len(dispenses))
+    for i, d in enumerate(dispenses):
+        if d["empties"]:
+            if not d["blown_out"]:
+                bias[i] += empty_tip_bias
+        elif d["position"] == 0 and not d["conditioned"]:
+            bias[i] += first_dispense_bias
+        if not d["wet"]:
+            bias[i] += dry_tip_bias
+        bias[i] += position_bias * d["position"]
+    noise = rng.normal(0, dispense_cv, (plates, len(dispenses)))
+    return asked * (1 + bias) * (1 + noise)
+
+
+def by_position(positions, errors):
+    """
+    Get's the mean error of the dispenses at each position of an aspiration
+    Return: [(position, mean error)]
+    """
+    positions = numpy.asarray(positions)
+    return [(p, errors[..., positions == p].mean()) for p in numpy.unique(positions)]
+
+
+def read_weights(path):
+    """
+    Get's the balance readings of a CSV with position,volume,weight
+    Return: arrays of positions (from 0), µL asked for and µL weighed
+    """
+    positions, volumes, weights = [], [], []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            positions.append(int(row["position"]) - 1)
+            volumes.append(float(row["volume"]))
+            weights.append(float(row["weight"]))
+    if not positions:
+        raise ValueError("%s has no balance readings" % path)
+    return numpy.array(positions), numpy.array(volumes), numpy.array(weights)
+
+
+def report_weights(path):
+    positions, volumes, weights = read_weights(path)
+    errors = (weights - volumes) / volumes
+    print("%s: %d dispenses, mean error %+.1f%%, cv %.1f%%" % (
+        path, len(volumes), errors.mean() * 100, (weights / volumes).std(ddof=1) / (weights / volumes).mean() * 100
+    ))
+    corrections = []
+    for position, error in by_position(positions, errors):
+        correction = (volumes - weights)[positions == position].mean()
+        corrections.append(round(correction, 2))
+        print("    position %d: %+.1f%%, correct by %+.2f µL" % (position + 1, error * 100, correction))
+    print("corrections=(%s)" % ", ".join("%g" % c for c in corrections))
+
+
+def main(args):
+    sources = 7
+    replicates = 3
+    volume = 25.0
+    plates = 20
+    weights_path = None
+    while args:
+        arg = args.pop(0)
+        if arg == "-s":
+            sources = int(args.pop(0))
+        elif arg == "-n":
+            replicates = int(args.pop(0))
+        elif arg == "-v":
+            volume = float(args.pop(0))
+        elif arg == "-p":
+            plates = int(args.pop(0))
+        elif arg == "-r":
+            weights_path = args.pop(0)
+        else:
+            print(__doc__)
+            return 1
+    if weights_path is not None:
+        report_weights(weights_path)
+        return 0
+    rng = numpy.random.default_rng(0)
+    print("%d tubes x %d replicates of %g µL, %d plates" % (sources, replicates, volume, plates))
+    for mode in modes:
+        recorder, seconds = run_mode(mode, sources, replicates, volume)
+        dispenses = recorder.dispenses
+        delivered = weigh(dispenses, plates, rng)
+        errors = (delivered - volume) / volume
+        cv = (delivered.std(axis=1, ddof=1) / delivered.mean(axis=1)).mean()
+        print("%s: %d tips, %d aspirations, %.0f s (%.1f s per well), mean error %+.1f%%, cv %.1f%%" % (
+            mode,
+            recorder.tips,
+            recorder.aspirations,
+            seconds,
+            seconds / len(dispenses),
+            errors.mean() * 100,
+            cv * 100,
+        ))
+        for position, error in by_position([d["position"] for d in dispenses], errors):
+            print("    position %d: %+.1f%%" % (position + 1, error * 100))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
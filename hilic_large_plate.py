@@ -25,7 +25,11 @@ import urllib.request
 import json
 from opentrons import types
 import time
-from datetime import datetime
+import inspect
+import functools
+import itertools
+import os
+import numpy
 
 metadata = {
     "protocolName": "SP3 HILIC protocol",
@@ -35,6 +39,8 @@ metadata = {
 
 requirements = {"robotType": "Flex", "apiLevel": "2.20"}
 
+journal_path = "/data/user_storage/hilic_run_journal.jsonl"
+
 
 def add_parameters(parameters: protocol_api.Parameters):
 
@@ -130,6 +136,19 @@ def add_parameters(parameters: protocol_api.Parameters):
         default=False,
     )
 
+    parameters.add_bool(
+        variable_name="resume",
+        display_name="Resume Run",
+        description="Continue the last run from its first unfinished step (uses the run journal on the robot)",
+        default=False,
+    )
+    parameters.add_bool(
+        variable_name="optimise_commands",
+        display_name="Optimise Commands",
+        description="Skip repeated blow outs, touch tips, latch changes and deactivations. Check with command_check.py",
+        default=False,
+    )
+
 
 def send_email(msg):
     url = "http://NicoTo.pythonanywhere.com/send-email"
@@ -183,6 +202,7 @@ def get_height_50ml_falcon(volume):
     return height
 
 
+# copy of get_vol_15ml_falcon in bradford_final.py, edit it there and run shared_check.py -w
 def get_vol_15ml_falcon(height):
     """
     Get's the volume of the liquid in the tube
@@ -197,6 +217,7 @@ def get_vol_15ml_falcon(height):
         return volume
 
 
+# copy of get_vol_50ml_falcon in bradford_final.py, edit it there and run shared_check.py -w
 def get_vol_50ml_falcon(height):
     """
     Get's the volume of the liquid in the tube
@@ -207,9 +228,1165 @@ def get_vol_50ml_falcon(height):
     return volume
 
 
+# copy of find_aspirate_height in bradford_final.py, edit it there and run shared_check.py -w
+def find_aspirate_height(pip, source_well):
+    """
+    Get's the aspirate height from the liquid level the pipette measures, the tip has to be on
+    Return: mm above the bottom of the well
+    """
+    lld_height = (
+        pip.measure_liquid_height(source_well) - source_well.bottom().point.z
+    )
+    aspirate_height = max(lld_height - 5, 1)
+    return aspirate_height
+
+
+# copy of above_liquid in bradford_final.py, edit it there and run shared_check.py -w
+def above_liquid(well, volume, held=0, clearance=2):
+    """
+    Get's where to dispense a volume so the tip stays clear of the liquid, clearance mm over the
+    surface the well has once the volume is in. The surface is the well's depth times the
+    fraction of its maximum volume it holds, the same as liquid_sim takes it
+    Held: µL already in the well
+    Return: location above the liquid
+    """
+    height = well.depth * (held + volume) / well.max_volume + clearance
+    if height > well.depth - 1:
+        raise ValueError(
+            "%s fills too close to its top for the tip to stay %g mm above the liquid" % (well, clearance)
+        )
+    return well.bottom(height)
+
+
+# copy of dispense_chunks in bradford_final.py, edit it there and run shared_check.py -w
+def dispense_chunks(volumes, max_volume, extra=0):
+    """
+    Splits dispenses of different volumes into multi dispense aspirations, each takes the dispenses
+    in order while they fit in the tip with the extra, the same as TipPlanner costs them
+    Volumes: µL of each dispense, dispenses of 0 are skipped
+    Max_volume: µL the tip holds
+    Return: list of lists of dispense indexes
+    """
+    chunks = []
+    in_tip = 0
+    for i, volume in enumerate(volumes):
+        if volume <= 0:
+            continue
+        if chunks and in_tip + volume + extra <= max_volume:
+            chunks[-1].append(i)
+            in_tip += volume
+            continue
+        chunks.append([i])
+        in_tip = volume
+    return chunks
+
+
+# copy of ProtocolClock in bradford_final.py, edit it there and run shared_check.py -w
+class ProtocolClock:
+    """
+    Protocol time in seconds since the start of the run.
+    On the robot this is the wall clock. When simulating it is a virtual clock that is
+    advanced by the modelled duration of every command, so incubation timing can be checked
+    Virtual: True to use modelled time instead of the wall clock
+    """
+
+    gantry_speed = 300  # mm/s, average travel speed between locations
+    z_travel_time = 1.0  # s, raising and lowering at every new location
+    command_overhead = {
+        "pick_up_tip": 3.0,
+        "drop_tip": 4.0,
+        "return_tip": 4.0,
+        "blow_out": 1.0,
+        "touch_tip": 2.0,
+        "air_gap": 1.0,
+        "move_to": 0.0,
+        "aspirate": 0.5,
+        "dispense": 0.5,
+        "mix": 0.5,
+    }
+    gripper_move_time = 25.0  # s per move_labware with the gripper
+    latch_time = 2.0
+    shake_ramp_time = 5.0
+    heating_rate = 0.1  # °C per second
+    ambient_temp = 25.0
+
+    def __init__(self, virtual=False):
+        self.virtual = virtual
+        self.start = time.monotonic()
+        self.virtual_time = 0.0
+        self.events = []  # (seconds, event) logged by the protocol, in the order they happened
+        self.last_point = None
+        self.module_temps = {}
+        self.depth = 0
+
+    def now(self):
+        if self.virtual:
+            return self.virtual_time
+        return time.monotonic() - self.start
+
+    def advance(self, seconds):
+        if self.virtual:
+            self.virtual_time += max(seconds, 0)
+
+    def log(self, event, seconds=None):
+        self.events.append((self.now() if seconds is None else seconds, event))
+
+    def start_incubation(self, name, seconds, start=None):
+        """
+        Logs an incubation and how long it has to last, ended by end_incubation
+        Start: protocol time it started at, earlier than now when resuming part way through it
+        """
+        self.log("%s started, %d s" % (name, seconds), start)
+
+    def end_incubation(self, name):
+        self.log(name + " ready")
+
+    def report(self, protocol):
+        """
+        Prints the logged events with their modelled times and the modelled run time
+        Only when simulating, on the robot the run log has the real times
+        """
+        if not self.virtual:
+            return
+        for seconds, event in self.events:
+            protocol.comment("Clock %s: %s" % (self.format_time(seconds), event))
+        protocol.comment("Modelled run time: " + self.format_time())
+
+    def format_time(self, seconds=None):
+        if seconds is None:
+            seconds = self.now()
+        seconds = int(seconds)
+        return "%d:%02d:%02d" % (seconds // 3600, (seconds % 3600) // 60, seconds % 60)
+
+    def travel_time(self, location):
+        """
+        Get's the modelled time to move to a location
+        Location: Well, Location or a trash (no coordinates)
+        Return: seconds
+        """
+        if isinstance(location, types.Location):
+            point = location.point
+        elif isinstance(location, protocol_api.Well):
+            point = location.top().point
+        else:
+            point = None
+        if location is None:  # staying where it is
+            return 0
+        if point is None or self.last_point is None:
+            self.last_point = point
+            return self.z_travel_time + 1.0
+        distance = math.sqrt(
+            (point.x - self.last_point.x) ** 2 + (point.y - self.last_point.y) ** 2
+        )
+        self.last_point = point
+        if distance < 0.01:
+            return 0
+        return self.z_travel_time + distance / self.gantry_speed
+
+    def pipette_duration(self, pipette, name, args):
+        """
+        Get's the modelled duration of a pipette command
+        Name: name of the InstrumentContext method
+        Args: bound arguments of the call
+        Return: seconds
+        """
+        seconds = self.command_overhead.get(name, 0)
+        location = args.get("location")
+        if name == "pick_up_tip" and location is None:
+            location = pipette.tip_racks[0].wells()[0] if pipette.tip_racks else None
+        seconds += self.travel_time(location)
+        volume = args.get("volume") or 0
+        rate = args.get("rate", 1.0) or 1.0
+        if name == "aspirate" and volume:
+            seconds += volume / (pipette.flow_rate.aspirate * rate)
+        elif name == "dispense" and volume:
+            seconds += volume / (pipette.flow_rate.dispense * rate)
+        elif name == "mix":
+            volume = volume or pipette.max_volume
+            seconds += args.get("repetitions", 1) * (
+                volume / (pipette.flow_rate.aspirate * rate)
+                + volume / (pipette.flow_rate.dispense * rate)
+            )
+        return seconds
+
+    def _timed(self, obj, name, duration):
+        """
+        Replaces obj.name with a version that advances the clock after every call
+        Duration: function(bound arguments) returning the modelled seconds
+        """
+        method = getattr(obj, name)
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)  # keeps the signature for other wrappers
+        def timed(*args, **kwargs):
+            if self.depth > 0:  # e.g. the aspirates inside a mix are timed by the mix
+                return method(*args, **kwargs)
+            self.depth += 1
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                self.depth -= 1
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            self.advance(duration(bound.arguments))
+            return result
+
+        setattr(obj, name, timed)
+
+    def attach(self, protocol, pipettes=(), modules=()):
+        """
+        Times the protocol, pipette and module commands with the modelled durations
+        Does nothing on the robot, where the wall clock keeps time
+        """
+        if not self.virtual:
+            return
+        self._timed(
+            protocol,
+            "delay",
+            lambda a: a["seconds"] + a["minutes"] * 60,
+        )
+        self._timed(
+            protocol,
+            "move_labware",
+            lambda a: self.gripper_move_time if a["use_gripper"] else 0,
+        )
+        for pipette in pipettes:
+            for name in self.command_overhead:
+                self._timed(
+                    pipette,
+                    name,
+                    lambda a, pipette=pipette, name=name: self.pipette_duration(pipette, name, a),
+                )
+        for module in modules:
+            if hasattr(module, "set_and_wait_for_shake_speed"):
+                self._timed(module, "set_and_wait_for_shake_speed", lambda a: self.shake_ramp_time)
+                self._timed(module, "open_labware_latch", lambda a: self.latch_time)
+                self._timed(module, "close_labware_latch", lambda a: self.latch_time)
+            if hasattr(module, "set_and_wait_for_temperature"):
+                self.module_temps[id(module)] = self.ambient_temp
+
+                def heat(a, module=module):
+                    seconds = abs(a["celsius"] - self.module_temps[id(module)]) / self.heating_rate
+                    self.module_temps[id(module)] = a["celsius"]
+                    return seconds
+
+                def cool(a, module=module):
+                    self.module_temps[id(module)] = self.ambient_temp
+                    return 0
+
+                self._timed(module, "set_and_wait_for_temperature", heat)
+                self._timed(module, "deactivate_heater", cool)
+
+
+
+# copy of CommandOptimiser in bradford_final.py, edit it there and run shared_check.py -w
+class CommandOptimiser:
+    """
+    Peephole pass over the commands as the protocol issues them. Commands that can't change the
+    outcome are dropped before they reach the robot:
+    repeated_blow_out: a blow out at the well the tip was just blown out at (touch tips between are ignored)
+    repeated_touch_tip: a touch tip at the well the tip was just touched off at
+    lazy_latch: heater shaker latch changes are held back until a pipette command, labware move,
+        shake or pause needs the latch, so an open followed by a close with nothing between is never sent
+    repeated_deactivate: turning off a heater or shaker that is already off
+    Enabled: False to send every command as written
+    Rules: names of the rules to apply, all of them by default
+    """
+
+    rule_names = ["repeated_blow_out", "repeated_touch_tip", "lazy_latch", "repeated_deactivate"]
+    pipette_commands = [
+        "aspirate",
+        "dispense",
+        "mix",
+        "blow_out",
+        "touch_tip",
+        "air_gap",
+        "move_to",
+        "pick_up_tip",
+        "drop_tip",
+        "return_tip",
+    ]
+
+    def __init__(self, enabled=True, rules=None):
+        self.enabled = enabled
+        self.rules = set(self.rule_names if rules is None else rules)
+        self.removed = {}  # command name: number of times it was dropped
+        self.tips = {}  # id(pipette): where the tip was blown out and touched off
+        self.latches = {}  # id(module): latch state sent and wanted, and the latch commands
+        self.off = {}  # (id(module), "heater"/"shaker"): True when known to be off
+
+    def skip(self, name):
+        self.removed[name] = self.removed.get(name, 0) + 1
+
+    def well_key(self, location):
+        """
+        Get's the well a command happens at
+        Location: Well, Location or anything else (trash)
+        Return: (id(labware), well name) or None when it isn't a well
+        """
+        if isinstance(location, types.Location):
+            if not location.labware.is_well:
+                return None
+            location = location.labware.as_well()
+        if isinstance(location, protocol_api.Well):
+            return (id(location.parent), location.well_name)
+        return None
+
+    def _wrap(self, obj, name, handler):
+        """
+        Replaces obj.name with handler(method, args, kwargs, bound arguments)
+        """
+        method = getattr(obj, name)
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapped(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return handler(method, args, kwargs, bound.arguments)
+
+        setattr(obj, name, wrapped)
+
+    def pipette_command(self, pipette, name):
+        tip = self.tips.setdefault(id(pipette), {"current": None, "blown_out": None, "touched": None})
+
+        def handler(method, args, kwargs, a):
+            if "location" in a and a["location"] is not None:
+                key = self.well_key(a["location"])
+            elif name in ["pick_up_tip", "drop_tip", "return_tip"]:
+                key = None
+            else:  # staying where it is
+                key = tip["current"]
+            if key is not None:
+                if name == "blow_out" and "repeated_blow_out" in self.rules and tip["blown_out"] == key:
+                    self.skip(name)
+                    return pipette
+                if name == "touch_tip" and "repeated_touch_tip" in self.rules and tip["touched"] == key:
+                    self.skip(name)
+                    return pipette
+            self.sync_latches()  # the pipette can't go to the heater shaker with the latch open
+            result = method(*args, **kwargs)
+            tip["current"] = key
+            if name == "blow_out":
+                tip["blown_out"] = key
+                tip["touched"] = None
+            elif name == "touch_tip":
+                tip["touched"] = key
+            else:
+                tip["blown_out"] = None
+                tip["touched"] = None
+            return result
+
+        return handler
+
+    def latch_command(self, module, state):
+        latch = self.latches.setdefault(id(module), {"sent": None, "wanted": None})
+        name = "open_labware_latch" if state == "open" else "close_labware_latch"
+        latch[state] = getattr(module, name)
+
+        def handler(method, args, kwargs, a):
+            latch["wanted"] = state
+            self.skip(name)  # taken back if sync_latches sends it
+            return None
+
+        return handler
+
+    def sync_latches(self):
+        """
+        Sends the latch state each heater shaker has been asked for
+        """
+        for latch in self.latches.values():
+            state = latch["wanted"]
+            if state is not None and state != latch["sent"]:
+                self.removed["open_labware_latch" if state == "open" else "close_labware_latch"] -= 1
+                latch[state]()
+                latch["sent"] = state
+            latch["wanted"] = None
+
+    def synced(self, after=None):
+        """
+        Handler for commands that need the latch in the state it was asked for
+        After: called once the command is done
+        """
+        def handler(method, args, kwargs, a):
+            self.sync_latches()
+            result = method(*args, **kwargs)
+            if after is not None:
+                after()
+            return result
+
+        return handler
+
+    def deactivate_command(self, module, part):
+        def handler(method, args, kwargs, a):
+            if "repeated_deactivate" in self.rules and self.off.get((id(module), part)):
+                self.skip("deactivate_" + part)
+                return None
+            result = method(*args, **kwargs)
+            self.off[(id(module), part)] = True
+            return result
+
+        return handler
+
+    def attach(self, protocol, pipettes=(), modules=()):
+        """
+        Puts the optimiser between the protocol and the robot
+        Does nothing when it isn't enabled
+        """
+        if not self.enabled:
+            return
+        for pipette in pipettes:
+            for name in self.pipette_commands:
+                self._wrap(pipette, name, self.pipette_command(pipette, name))
+        if "lazy_latch" in self.rules:
+            self._wrap(protocol, "move_labware", self.synced())
+            self._wrap(protocol, "pause", self.synced())
+        for module in modules:
+            if not hasattr(module, "open_labware_latch"):
+                continue
+            if "lazy_latch" in self.rules:
+                self._wrap(module, "open_labware_latch", self.latch_command(module, "open"))
+                self._wrap(module, "close_labware_latch", self.latch_command(module, "closed"))
+            shaking = lambda module=module: self.off.update({(id(module), "shaker"): False})
+            heating = lambda module=module: self.off.update({(id(module), "heater"): False})
+            self._wrap(module, "set_and_wait_for_shake_speed", self.synced(after=shaking))
+            self._wrap(module, "set_and_wait_for_temperature", self.synced(after=heating))
+            self._wrap(module, "set_target_temperature", self.synced(after=heating))
+            self._wrap(module, "deactivate_shaker", self.deactivate_command(module, "shaker"))
+            self._wrap(module, "deactivate_heater", self.deactivate_command(module, "heater"))
+
+    def finish(self, protocol):
+        """
+        Sends the held back latch changes and reports what was dropped
+        """
+        if not self.enabled:
+            return
+        self.sync_latches()
+        removed = {name: n for name, n in self.removed.items() if n > 0}
+        protocol.comment(
+            "Command optimiser removed %d commands%s"
+            % (
+                sum(removed.values()),
+                "".join(", %s: %d" % (name, n) for name, n in sorted(removed.items())),
+            )
+        )
+
+
+# copy of LoadingSheet in bradford_final.py, edit it there and run shared_check.py -w
+class LoadingSheet:
+    """
+    Works out how much of each reagent to load from what the run takes out of its source wells.
+    Every aspirate, dispense and blow out at a source is followed, and at the end of the run each
+    source is loaded (load_liquid) with the most the run ever needed out of it plus the volume
+    the tip can't reach. The sheet is printed as comments, one line per source well
+    Simulating: False on the robot, where the liquids were already set up by the analysis
+    (the app and the robot simulate the protocol to analyse it) and nothing is followed
+    """
+
+    # µL left in a well that the tip can't reach, by labware load name
+    dead_volumes = {
+        "nest_12_reservoir_15ml": 1500,
+        "opentrons_10_tuberack_falcon_4x50ml_6x15ml_conical": 500,
+        "opentrons_24_tuberack_eppendorf_1.5ml_safelock_snapcap": 20,
+    }
+
+    def __init__(self, simulating=True):
+        self.simulating = simulating
+        self.sources = {}  # (id(labware), well name): [well, liquid, µL now, lowest µL]
+        self.last_location = {}  # id(pipette): where the pipette last went
+        self.air = False
+
+    def source(self, well, liquid):
+        """
+        Marks a well as a reagent the user loads before the run
+        """
+        self.sources[(id(well.parent), well.well_name)] = [well, liquid, 0.0, 0.0]
+
+    def wells_reached(self, pipette, location):
+        """
+        Get's the source wells the nozzles of a pipette reach
+        Location: Well, Location or anything else (trash)
+        Return: [(source, number of channels in it)]
+        """
+        if isinstance(location, types.Location):
+            if not location.labware.is_well:
+                return []
+            location = location.labware.as_well()
+        if not isinstance(location, protocol_api.Well):
+            return []
+        channels = pipette.active_channels
+        column = location.parent.columns_by_name()[location.well_name[1:]]
+        if channels == 1 or len(column) == 1:  # one well, or a reservoir taking every channel
+            wells = [(location, channels)]
+        else:
+            row = [well.well_name for well in column].index(location.well_name)
+            wells = [(well, 1) for well in column[row : row + channels]]
+        reached = []
+        for well, n in wells:
+            key = (id(well.parent), well.well_name)
+            if key in self.sources:
+                reached.append((self.sources[key], n))
+        return reached
+
+    def _followed(self, pipette, name):
+        method = getattr(pipette, name)
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def followed(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            location = bound.arguments.get("location")
+            if location is None:
+                location = self.last_location.get(id(pipette))
+            if name == "air_gap":
+                self.air = True
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    self.air = False
+            before = pipette.current_volume if pipette.has_tip else 0
+            result = method(*args, **kwargs)
+            after = pipette.current_volume if pipette.has_tip else 0
+            self.last_location[id(pipette)] = location
+            if not self.air:
+                for source, channels in self.wells_reached(pipette, location):
+                    source[2] += (before - after) * channels
+                    source[3] = min(source[3], source[2])
+            return result
+
+        setattr(pipette, name, followed)
+
+    def attach(self, pipettes):
+        """
+        Follows the liquid the pipettes move, attach before anything that skips commands
+        """
+        if not self.simulating:
+            return
+        for pipette in pipettes:
+            for name in ["aspirate", "dispense", "blow_out", "air_gap"]:
+                self._followed(pipette, name)
+
+    def finish(self, protocol):
+        """
+        Loads every source with what the run needed and prints the loading sheet
+        """
+        if not self.simulating:
+            return
+        protocol.comment("\n---------------Loading Sheet----------------\n\n")
+        for well, liquid, _, lowest in sorted(
+            self.sources.values(), key=lambda s: (str(s[0].parent), s[0].well_name)
+        ):
+            if lowest >= 0:
+                continue  # not used in this run
+            volume = math.ceil(-lowest + self.dead_volumes.get(well.parent.load_name, 0))
+            well.load_liquid(liquid, volume)
+            protocol.comment(
+                "%s %s: %s %d uL" % (well.parent, well.well_name, liquid.name, volume)
+            )
+
+
+# copy of TipPlanner in bradford_final.py, edit it there and run shared_check.py -w
+class TipPlanner:
+    """
+    Transfer-cost model that picks the pipette and tip size for each group of transfers and lays
+    out the tip racks for the run. A group is one step of the protocol, given as the volumes it
+    dispenses. Every way of doing a group (1 or 8 channel pipette, 200 or 1000 µL tips) is costed
+    as the predicted seconds of its aspirations, dispenses and tip changes plus what the tips it
+    uses are worth in seconds. Dispenses below the volume a tip is accurate for are costed as a
+    penalty, so the smallest tip is used for them when no tip is accurate
+    Slots: deck slots for the tip racks in use, each holds one tip size
+    Staging_slots: slots for the racks that replace the empty ones
+    Max_swaps: most rack swaps the run can do, None when the staging racks are refilled
+    """
+
+    tip_racks = {
+        200: "opentrons_flex_96_filtertiprack_200uL",
+        1000: "opentrons_flex_96_filtertiprack_1000uL",
+    }
+    max_volume = {200: 195, 1000: 995}  # µL per aspiration, 5 µL is kept for the blow out
+    min_volume = {200: 5, 1000: 50}  # µL, smallest dispense the tip is accurate for
+    tip_value = {200: 4.0, 1000: 6.0}  # s of run time one tip is worth
+    inaccurate_time = 60.0  # s, penalty for each dispense below the tip's min_volume
+    aspirate_time = 2.5  # s, moving to the source and aspirating
+    dispense_time = 2.0  # s, moving to the well and dispensing
+    tip_time = 9.0  # s, picking up and dropping a tip
+    rack_time = 50.0  # s, the gripper swapping an empty rack for a staging rack
+
+    def __init__(self, slots, staging_slots=(), sizes=(200, 1000), max_swaps=None):
+        self.slots = list(slots)
+        self.staging_slots = list(staging_slots)
+        self.sizes = list(sizes)
+        self.max_swaps = max_swaps
+        self.groups = []
+        self.choices = {}  # group name: chosen way of doing it, see cost
+        self.layout = {}  # slot: tip size
+        self.staging = {}  # staging slot: tip size
+
+    def add(
+        self,
+        name,
+        volumes,
+        channels=(1,),
+        multi_dispense=False,
+        extra=0,
+        tips=1,
+        aspirations_per_tip=None,
+        dispenses_per_source=None,
+    ):
+        """
+        Adds a group of transfers to the plan
+        Volumes: µL of each dispense in order. For the 8 channel they are per well, 8 wells in a row are one dispense
+        Channels: pipettes the protocol can do the group with, 1 and/or 8
+        Multi_dispense: True when one aspiration fills as many dispenses as fit in the tip
+        Extra: µL aspirated on top of every aspiration
+        Tips: tips picked up for the group, 0 when it keeps the tip of the group before
+        Aspirations_per_tip: the tip is changed after this many aspirations instead
+        Dispenses_per_source: the dispenses come in runs of this many from one source, an aspiration never spans two
+        """
+        self.groups.append(
+            {
+                "name": name,
+                "volumes": list(volumes),
+                "channels": list(channels),
+                "multi_dispense": multi_dispense,
+                "extra": extra,
+                "tips": tips,
+                "aspirations_per_tip": aspirations_per_tip,
+                "dispenses_per_source": dispenses_per_source,
+            }
+        )
+
+    def cost(self, group, channels, size):
+        """
+        Get's the predicted cost of a group done with one pipette and tip size
+        Return: {channels, size, max_volume, aspirations, tips, seconds, cost}
+        """
+        volumes = group["volumes"]
+        if channels == 8:
+            volumes = [max(volumes[i : i + 8]) for i in range(0, len(volumes), 8)]
+        inaccurate = sum(1 for volume in volumes if 0 < volume < self.min_volume[size])
+        max_volume = self.max_volume[size]
+        run = group["dispenses_per_source"] or len(volumes)
+        aspirations = 0
+        in_tip = None
+        for i, volume in enumerate(volumes):
+            if (
+                group["multi_dispense"]
+                and i % run != 0
+                and in_tip + volume + group["extra"] <= max_volume
+            ):
+                in_tip += volume
+                continue
+            aspirations += math.ceil((volume + group["extra"]) / max_volume)
+            in_tip = volume
+        dispenses = max(len(volumes), aspirations)
+        if group["aspirations_per_tip"] is None:
+            pick_ups = group["tips"]
+        else:
+            pick_ups = math.ceil(aspirations / group["aspirations_per_tip"])
+        seconds = (
+            aspirations * self.aspirate_time
+            + dispenses * self.dispense_time
+            + pick_ups * self.tip_time
+        )
+        return {
+            "channels": channels,
+            "size": size,
+            "max_volume": max_volume,
+            "aspirations": aspirations,
+            "tips": pick_ups * channels,
+            "seconds": seconds,
+            "cost": (
+                seconds
+                + pick_ups * channels * self.tip_value[size]
+                + inaccurate * self.inaccurate_time
+            ),
+        }
+
+    def rack_layout(self, tips):
+        """
+        Get's the slots for each tip size, the size using the most tips gets the spare slots
+        Tips: {tip size: tips used}
+        Return: {slot: tip size}, {staging slot: tip size}, number of rack swaps
+        """
+        sizes = sorted(tips, key=lambda size: -tips[size])
+        layout = {}
+        for i, slot in enumerate(self.slots):
+            layout[slot] = sizes[i] if i < len(sizes) else sizes[0]
+        needed = {
+            size: max(math.ceil(tips[size] / 96) - list(layout.values()).count(size), 0)
+            for size in sizes
+        }
+        staging = {}
+        for slot in self.staging_slots:
+            size = max(sizes, key=lambda size: needed[size])
+            if needed[size] == 0:
+                size = sizes[0]
+            staging[slot] = size
+            needed[size] = max(needed[size] - 1, 0)
+        swaps = sum(
+            max(math.ceil(tips[size] / 96) - list(layout.values()).count(size), 0)
+            for size in sizes
+        )
+        return layout, staging, swaps
+
+    def plan(self):
+        """
+        Picks the pipette and tip size of every group. Every set of tip sizes that fits in the
+        slots is tried, the cheapest one that needs no more rack swaps than the run can do is kept
+        """
+        best = None
+        for n in range(1, len(self.slots) + 1):
+            for sizes in itertools.combinations(self.sizes, n):
+                choices = {}
+                for group in self.groups:
+                    options = [
+                        self.cost(group, channels, size)
+                        for channels in group["channels"]
+                        for size in sizes
+                    ]
+                    choices[group["name"]] = min(options, key=lambda option: option["cost"])
+                tips = {size: 0 for size in sizes}
+                for choice in choices.values():
+                    tips[choice["size"]] += choice["tips"]
+                if 0 in tips.values() and len(sizes) > 1:
+                    continue  # the same as a smaller set of sizes
+                layout, staging, swaps = self.rack_layout(tips)
+                total = sum(choice["cost"] for choice in choices.values())
+                total += swaps * self.rack_time
+                over = self.max_swaps is not None and swaps > self.max_swaps
+                if best is None or (over, total) < best[0]:
+                    best = ((over, total), choices, layout, staging)
+        _, self.choices, self.layout, self.staging = best
+
+    def choice(self, name):
+        return self.choices[name]
+
+    def slots_for(self, size):
+        return [slot for slot, slot_size in self.layout.items() if slot_size == size]
+
+    def report(self, protocol):
+        """
+        Prints the chosen pipettes and the tip rack layout for the operator
+        """
+        protocol.comment("\n---------------Tip Plan----------------\n\n")
+        tips = {}
+        for name, choice in self.choices.items():
+            tips[choice["size"]] = tips.get(choice["size"], 0) + choice["tips"]
+            protocol.comment(
+                "%s: %d-channel, %d uL tips, %d aspirations, %d tips, about %d s"
+                % (
+                    name,
+                    choice["channels"],
+                    choice["size"],
+                    choice["aspirations"],
+                    choice["tips"],
+                    choice["seconds"],
+                )
+            )
+        for slot, size in list(self.layout.items()) + list(self.staging.items()):
+            protocol.comment(
+                "Tip rack %s: %d uL%s" % (slot, size, " (staging)" if slot in self.staging else "")
+            )
+        for size, n in sorted(tips.items()):
+            protocol.comment("Planned steps use %d tips of %d uL" % (n, size))
+
+
+class SampleNormaliser:
+    """
+    Per-sample protein normalisation. From the concentration of every sample it works out, as
+    arrays over the samples, the volumes that put the same µg of protein in every sample well.
+    Samples too dilute for the load go in undiluted with the protein they have, samples so concentrated that their stock volume is too small to
+    pipette are diluted in their pre-dilution well first. The beads of each well follow its load
+    Concentrations: µg/µl of each sample in order
+    Load: µg of protein per well
+    Well_volume: µl of sample + buffer in each well
+    """
+
+    min_volume = 5  # µl, smallest volume pipetted
+    dead_volume = 5  # µl, left in the pre-dilution well
+    well_max = 200  # µl, pre-dilution well capacity
+    bead_ratio = 4  # µg of protein per µl of beads
+    min_beads = 5  # µl
+
+    def __init__(self, concentrations, load, well_volume):
+        self.concentrations = numpy.array(concentrations, dtype=float)
+        self.load = load
+        self.well_volume = well_volume
+        c = self.concentrations
+        if load <= 0:
+            raise ValueError("The protein load has to be above 0 ug")
+        if (c <= 0).any():
+            raise ValueError("Every sample needs a concentration above 0 ug/ul")
+        stock = load / c
+        # a stock volume leaving less buffer than can be pipetted goes to the nearer of no buffer
+        # and the smallest buffer volume
+        most = well_volume - self.min_volume
+        stock = numpy.where(
+            stock > most, numpy.where(stock - most < well_volume - stock, most, well_volume), stock
+        )
+        self.undiluted = stock == well_volume
+        self.loads = stock * c  # µg of protein in each well
+        self.loaded_volumes = stock + self.dead_volume  # µl of each sample put in the pre-dilution plate
+        self.pre_dilutions = numpy.where(
+            stock < self.min_volume, numpy.ceil(self.min_volume / stock), 1
+        )
+        self.pre_dilution_buffer = (self.pre_dilutions - 1) * self.loaded_volumes
+        too_concentrated = numpy.flatnonzero(self.loaded_volumes * self.pre_dilutions > self.well_max)
+        if len(too_concentrated):
+            raise ValueError(
+                "Samples %s are too concentrated to dilute in the pre-dilution plate, dilute them before loading"
+                % ", ".join(str(i + 1) for i in too_concentrated)
+            )
+        self.stock_volumes = stock * self.pre_dilutions  # µl taken from the pre-dilution well
+        self.buffer_volumes = well_volume - self.stock_volumes
+        self.bead_volumes = numpy.maximum(self.loads / self.bead_ratio, self.min_beads)
+
+    def columns(self):
+        """
+        Get's the columns of 8 samples that an 8 channel can move in one go, full columns with the
+        same stock volume in every row
+        Return: {column: stock volume}
+        """
+        columns = {}
+        for column in range(len(self.stock_volumes) // 8):
+            volumes = self.stock_volumes[column * 8 : column * 8 + 8]
+            if numpy.allclose(volumes, volumes[0]):
+                columns[column] = float(volumes[0])
+        return columns
+
+    def report(self, protocol):
+        """
+        Prints the volumes of every sample for the operator
+        """
+        protocol.comment("\n---------------Protein Normalisation----------------\n\n")
+        protocol.comment("%g ug of protein in %g ul per well" % (self.load, self.well_volume))
+        for i, conc in enumerate(self.concentrations):
+            protocol.comment(
+                "Sample %d (%g ug/ul): load %.1f ul, %.1f ul stock%s + %.1f ul buffer, %.1f ug, %.1f ul beads%s"
+                % (
+                    i + 1,
+                    conc,
+                    self.loaded_volumes[i],
+                    self.stock_volumes[i],
+                    " pre-diluted x%d" % self.pre_dilutions[i] if self.pre_dilutions[i] > 1 else "",
+                    self.buffer_volumes[i],
+                    self.loads[i],
+                    self.bead_volumes[i],
+                    ", undiluted" if self.undiluted[i] else "",
+                )
+            )
+
+
+class ColumnPrimer:
+    """
+    Fill plan for a column of the deep well plate the 8 channel takes a reagent from. The 8 channel
+    takes from every row for each sample column it adds the reagent to, so every row needs the
+    reagent of each sample column plus its dead volume. When the reagent is a working stock, it is
+    made in a well of its own first, with the tip that then fills the rows
+    Per_column: µl the 8 channel takes from each row for one sample column
+    Num_samples: samples in the plate, the plate is filled by column
+    Dead_volume: µl left in each row
+    Stock_conc: concentration of the stock, None when the source is used as it is
+    Working_conc: concentration of the working stock, in the units of the stock
+    Working_dead: µl left in the working stock well
+    """
+
+    min_volume = 5  # µl, smallest volume pipetted
+
+    def __init__(
+        self, per_column, num_samples, dead_volume, stock_conc=None, working_conc=None, working_dead=50
+    ):
+        columns = len(set(i // 8 for i in range(num_samples)))  # sample columns the 8 channel adds to
+        self.row_volumes = [per_column * columns + dead_volume] * 8
+        self.working_volume = sum(self.row_volumes) + working_dead
+        self.working_conc = working_conc
+        if stock_conc is None or stock_conc == working_conc:
+            self.stock_volume = 0
+        else:
+            self.stock_volume = working_conc * self.working_volume / stock_conc
+        self.diluent_volume = self.working_volume - self.stock_volume if self.stock_volume else 0
+        self.prepared = self.stock_volume > 0  # True when a working stock is made
+
+    def volumes(self):
+        """
+        Get's the volumes of the fill for the tip planner
+        Return: µl of the diluent and stock of the working stock (when one is made), then of each row
+        """
+        if self.prepared:
+            return [self.diluent_volume, self.stock_volume] + self.row_volumes
+        return list(self.row_volumes)
+
+    @staticmethod
+    def pieces(volume, max_volume):
+        """
+        Get's the aspirations that move a volume, all the same size
+        Return: list of µl
+        """
+        n = math.ceil(volume / max_volume)
+        return [volume / n] * n
+
+    def aspirations(self, max_volume, extra=5):
+        """
+        Get's the fewest aspirations that fill the rows. A row takes what is left in the tip, the
+        rest of it goes with the next aspiration, no dispense is smaller than can be pipetted
+        Max_volume: µl the tip holds
+        Extra: µl aspirated on top of every aspiration
+        Return: list of aspirations, each a list of (row, µl)
+        """
+        aspirations = []
+        space = 0
+        for row, volume in enumerate(self.row_volumes):
+            while volume > 0:
+                if space < self.min_volume:
+                    aspirations.append([])
+                    space = max_volume - extra
+                take = min(volume, space)
+                if 0 < volume - take < self.min_volume:
+                    take = volume - self.min_volume
+                if take < self.min_volume:
+                    space = 0
+                    continue
+                aspirations[-1].append((row, take))
+                space -= take
+                volume -= take
+        return aspirations
+
+
+class SettlingModel:
+    """
+    Settling model of a bead slurry. The fraction of the beads still in suspension halves every
+    half_life seconds after the slurry is mixed, a container is re-mixed before it's pipetted from
+    once the fraction drops below min_suspended. Slurry moved to another container keeps the time
+    it was mixed at
+    Clock: ProtocolClock of the run
+    """
+
+    half_life = 200  # s
+    min_suspended = 0.85  # re-mixed about every 47 s
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.mixed_at = {}  # container: time of its last mix
+
+    def mixed(self, *containers):
+        for container in containers:
+            self.mixed_at[container] = self.clock.now()
+
+    def moved(self, source, destination):
+        """Slurry from the source was added to the destination, it is as settled as the older of the two"""
+        mixed_at = self.mixed_at.get(source, -math.inf)
+        self.mixed_at[destination] = min(self.mixed_at.get(destination, mixed_at), mixed_at)
+
+    def suspended(self, container):
+        """
+        Get's the fraction of the beads still in suspension
+        Return: 1 just after a mix, 0 for a container never mixed
+        """
+        if container not in self.mixed_at:
+            return 0.0
+        return 0.5 ** ((self.clock.now() - self.mixed_at[container]) / self.half_life)
+
+    def needs_mix(self, *containers):
+        return any(self.suspended(container) < self.min_suspended for container in containers)
+
+
+class WasteManager:
+    """
+    Liquid waste of the run. Each dump goes into the first waste well it fits in, filled to
+    fill_fraction of the well's volume, and into the waste chute once every well is full. The
+    waste of the whole run is planned before it starts, so a run that can't hold its waste never
+    stops half way for a manual empty
+    Wells: waste wells in the order they fill
+    Chute: waste chute the dumps go to once the wells are full, None to stop the run instead
+    """
+
+    fill_fraction = 0.9  # of a waste well's max volume
+
+    def __init__(self, wells, chute=None):
+        self.wells = list(wells)
+        self.chute = chute
+        self.volumes = [0.0] * len(self.wells)  # µL in each waste well
+        self.to_chute = 0.0  # µL dumped in the chute
+
+    def place(self, volumes, dump):
+        """
+        Get's the waste well a dump goes into
+        Volumes: µL in each waste well
+        Return: index of the well, None for the chute
+        """
+        for i, well in enumerate(self.wells):
+            if volumes[i] + dump <= well.max_volume * self.fill_fraction:
+                return i
+        if self.chute is None:
+            raise ValueError(
+                "%g µl of waste doesn't fit in the waste wells and there is no waste chute" % dump
+            )
+        return None
+
+    def plan(self, dumps):
+        """
+        Fills the waste wells with the dumps of the whole run without moving anything
+        Dumps: µL of every dump in run order
+        Return: µL in each waste well at the end, µL that go to the chute
+        """
+        volumes = list(self.volumes)
+        to_chute = 0.0
+        for dump in dumps:
+            i = self.place(volumes, dump)
+            if i is None:
+                to_chute += dump
+            else:
+                volumes[i] += dump
+        return volumes, to_chute
+
+    def dump(self, pipette, volume):
+        """
+        Dispenses the pipette's volume into the waste and blows out there
+        Volume: µL per channel
+        """
+        dump = volume * pipette.channels
+        i = self.place(self.volumes, dump)
+        if i is None:
+            self.to_chute += dump
+            pipette.dispense(volume, self.chute)
+            pipette.blow_out(self.chute)
+            return
+        self.volumes[i] += dump
+        pipette.dispense(volume, self.wells[i].top(0))
+        pipette.blow_out(self.wells[i].top(0))
+
+    def report(self, protocol, dumps):
+        volumes, to_chute = self.plan(dumps)
+        protocol.comment("\n---------------Liquid Waste----------------\n\n")
+        for well, volume in zip(self.wells, volumes):
+            protocol.comment("%s: %.1f ml of waste" % (well.well_name, volume / 1000))
+        if to_chute > 0:
+            protocol.comment("%.1f ml of waste goes down the waste chute" % (to_chute / 1000))
+
+
+class RunJournal:
+    """
+    Append-only record of the finished steps of a run, one json object per line.
+    Every record also holds the tip, deck and liquid state at that point, so a resumed run
+    can skip the finished steps and pick up with the same state. A run that got to the end
+    is marked finished and has nothing left to resume.
+    Path: journal file on the robot
+    Write: False when simulating, the journal is only read
+    Resume: True to continue from the last run in the journal
+    """
+
+    def __init__(self, path, write=True, resume=False):
+        self.path = path
+        self.write = write
+        self.resume = resume
+        self.records = []
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:  # last line cut off by the crash
+                        continue
+                    if record.get("event") == "start":
+                        self.records = []  # only the last run counts
+                    self.records.append(record)
+        self.finished = len(self.records) > 0 and self.records[-1].get("event") == "finish"
+        if self.finished:
+            self.records = []
+        self.steps_done = set()
+        self.columns_done = {}
+        self.step_starts = {}
+        for record in self.records:
+            if record.get("event") == "step":
+                if record.get("column") is None:
+                    self.steps_done.add(record["step"])
+                else:
+                    self.columns_done.setdefault(record["step"], set()).add(record["column"])
+            elif record.get("event") == "step_start":
+                self.step_starts.setdefault(record["step"], record["time"])
+        self.resuming = len(self.steps_done) > 0 or len(self.columns_done) > 0
+
+    def append(self, record):
+        if not self.write:
+            return
+        record["time"] = time.time()
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            print("Could not write to the run journal: " + str(e))
+
+    def start(self, params):
+        """
+        Starts a new run in the journal, unless the last one is being resumed
+        Params: runtime parameters of this run, a resumed run has to have the ones it started with
+        """
+        if not self.resuming:
+            self.append({"event": "start", "params": params})
+            return
+        started = self.records[0].get("params", {}) if self.records[0].get("event") == "start" else {}
+        changed = [
+            name for name in sorted(set(started) | set(params)) if started.get(name) != params.get(name)
+        ]
+        if changed:
+            raise ValueError(
+                "Can't resume the last run with different parameters: "
+                + ", ".join(
+                    "%s was %s, now %s" % (name, started.get(name), params.get(name)) for name in changed
+                )
+            )
+
+    def finish(self):
+        """Marks the run finished, so it isn't resumed"""
+        self.append({"event": "finish"})
+
+    def done(self, step):
+        return step in self.steps_done
+
+    def column_done(self, step, column):
+        return column in self.columns_done.get(step, set())
+
+    def record(self, step, state, column=None):
+        """
+        Records a finished step (or one column of a step)
+        State: tip, deck and liquid state after the step
+        """
+        if column is None:
+            self.steps_done.add(step)
+        else:
+            self.columns_done.setdefault(step, set()).add(column)
+        self.append({"event": "step", "step": step, "column": column, "state": state})
+
+    def start_step(self, step):
+        """Records when a timed step (incubation) started, only the first start counts"""
+        if step not in self.step_starts:
+            self.step_starts[step] = time.time()
+            self.append({"event": "step_start", "step": step})
+
+    def elapsed(self, step):
+        """
+        Get's the wall clock time since a timed step started in an earlier (crashed) run
+        Return: seconds, 0 if the step was not started before this run
+        """
+        if not self.resuming or step not in self.step_starts:
+            return 0
+        return max(time.time() - self.step_starts[step], 0)
+
+    def last_state(self):
+        for record in reversed(self.records):
+            if record.get("event") == "step":
+                return record["state"]
+        return None
 
 
-def run(protocol: protocol_api.ProtocolContext):
+def run(protocol: protocol_api.ProtocolContext, clock=None):
+    if clock is None:
+        clock = ProtocolClock(virtual=protocol.is_simulating())
     # defining variables
     wash_volume = 150  # protocol.params.wash_volume   #µl
     shake_speed = 1400  # protocol.params.shake_speed   #rpm
@@ -240,17 +1417,121 @@ def run(protocol: protocol_api.ProtocolContext):
     # Random variables for testing
     amt_extra_in_2ml_reservoir = 40
 
-    # loading tips
-    if load_buffers:
-        tips200 = [
-            protocol.load_labware("opentrons_flex_96_filtertiprack_1000uL", "A3"),
-            protocol.load_labware("opentrons_flex_96_filtertiprack_200uL", "B3"),
-        ]
+    # TIP PLAN
+    num_columns = math.ceil(num_samples / 8)
+    pipette_min = 5  # 5ul is the minimum volume for the pipette
+    if protocol.params.dilute_sample:
+        if protein_stock_conc <= 0:
+            raise ValueError("protein_stock_conc has to be above 0 ug to normalise the samples with dilute_sample")
+        missing = [n for n in range(1, num_samples + 1) if n not in protien_dilution_data]
+        if missing:
+            raise ValueError(
+                "protien_dilution_data has no concentration for samples %s"
+                % ", ".join(str(n) for n in missing)
+            )
+        normaliser = SampleNormaliser(
+            [protien_dilution_data[n] for n in range(1, num_samples + 1)],
+            protein_stock_conc,
+            protein_sample_amt - 10,
+        )
+        bead_volumes = normaliser.bead_volumes
+        stock_columns = normaliser.columns()
+        single_stock = [
+            i for i in range(num_samples) if i // 8 not in stock_columns
+        ]  # samples moved with the 1 channel
     else:
-        tips200 = [
-            protocol.load_labware("opentrons_flex_96_filtertiprack_200uL", "A3"),
-            protocol.load_labware("opentrons_flex_96_filtertiprack_200uL", "B3"),
-        ]
+        bead_volumes = numpy.full(num_samples, bead_amt)
+    # the beads go to a column of the deep well plate, one row for each row of the reagent plate,
+    # then the 8 channel stamps every full column. A column gets the most beads any of its wells
+    # takes, the wells of a part column are loaded from the rows with the 1 channel
+    full_columns = num_samples // 8
+    column_beads = [
+        float(max(bead_volumes[column * 8 : column * 8 + 8])) for column in range(full_columns)
+    ]
+    partial_beads = [float(volume) for volume in bead_volumes[full_columns * 8 :]]
+    bead_column_dead = 15  # µl left in each row
+    bead_row_volumes = [
+        sum(column_beads) + (partial_beads[row] if row < len(partial_beads) else 0) + bead_column_dead
+        for row in range(8)
+    ]
+    if max(bead_row_volumes) > 1900:
+        raise ValueError("The beads for %d samples don't fit in a column of the deep well plate" % num_samples)
+    # deep well columns the 8 channel takes the reagents from
+    dtt_final_conc = 10  # 10 mM
+    iaa_final_conc = 30  # 30 mM
+    dtt_primer = ColumnPrimer(
+        5,
+        num_samples,
+        amt_extra_in_2ml_reservoir,
+        dtt_conc,
+        dtt_final_conc * protein_sample_amt / pipette_min,  # DTT working stock concentration so that 5ul is 10 mM
+    )
+    iaa_primer = ColumnPrimer(
+        5,
+        num_samples,
+        amt_extra_in_2ml_reservoir,
+        iaa_conc,
+        iaa_final_conc * protein_sample_amt / pipette_min,  # IAA working stock concentration so that 5ul is 30 mM
+    )
+    digestion_primer = ColumnPrimer(digestion_buffer_per_sample_amt, num_samples, 50)
+    planner = TipPlanner(["A3", "B3"], ["A4", "B4", "C4", "D4"])
+    if protocol.params.dilute_sample:
+        planner.add(
+            "sample buffer",
+            list(normaliser.buffer_volumes) + list(normaliser.pre_dilution_buffer),
+            multi_dispense=True,
+            extra=5,
+        )
+        if single_stock:
+            planner.add(
+                "sample stock",
+                [normaliser.stock_volumes[i] for i in single_stock],
+                tips=len(single_stock),
+            )
+        if stock_columns:
+            planner.add(
+                "sample stock columns",
+                [volume for volume in stock_columns.values() for _ in range(8)],
+                channels=(8,),
+                tips=len(stock_columns),
+            )
+    if protocol.params.reduction_alkylation:
+        planner.add("dtt working stock", dtt_primer.volumes(), multi_dispense=True, extra=5)
+        planner.add("iaa working stock", iaa_primer.volumes(), multi_dispense=True, extra=5)
+    planner.add("digestion buffer stock", digestion_primer.volumes(), multi_dispense=True, extra=5)
+    planner.add("bead column", bead_row_volumes, multi_dispense=True, extra=5)
+    if partial_beads:
+        planner.add("bead partial column", partial_beads)
+    if column_beads:
+        planner.add(
+            "bead stamp",
+            [volume for volume in column_beads for _ in range(8)],
+            channels=(8,),
+        )
+    formic_acid_per_sample_amt = 5
+    formic_acid_tubes_per_aspirate = 8
+    if num_samples <= 24:
+        planner.add(
+            "formic acid",
+            [formic_acid_per_sample_amt] * num_samples,
+            multi_dispense=True,
+            extra=5,
+            aspirations_per_tip=1,
+            dispenses_per_source=formic_acid_tubes_per_aspirate,
+        )
+    planner.add(
+        "plate steps",
+        [wash_volume] * (num_columns * 8),
+        channels=(8,),
+        tips=(9 if protocol.params.reduction_alkylation else 7) * num_columns + 11,
+    )
+    planner.plan()
+
+    # loading tips
+    tips200 = [
+        protocol.load_labware(planner.tip_racks[size], slot)
+        for slot, size in planner.layout.items()
+    ]
 
     chute = protocol.load_waste_chute()
     left_pipette = protocol.load_instrument(
@@ -263,6 +1544,11 @@ def run(protocol: protocol_api.ProtocolContext):
     hs_mod = protocol.load_module(
         module_name="heaterShakerModuleV1", location="D1"
     )  # heat shaker module
+    sheet = LoadingSheet(simulating=protocol.is_simulating())
+    sheet.attach([left_pipette, right_pipette])
+    clock.attach(protocol, [left_pipette, right_pipette], [hs_mod])
+    optimiser = CommandOptimiser(enabled=protocol.params.optimise_commands)
+    optimiser.attach(protocol, [left_pipette, right_pipette], [hs_mod])
     # red_alk_plate = protocol.load_labware("opentrons_96_wellplate_200ul_pcr_full_skirt", "A2", "reduction and alkylation plate")
     # tube_rack = protocol.load_labware("opentrons_24_tuberack_eppendorf_1.5ml_safelock_snapcap", "A2", "bead + final solution rack")
     sample_plate = protocol.load_labware(
@@ -329,19 +1615,22 @@ def run(protocol: protocol_api.ProtocolContext):
     protien_buffer = protocol.define_liquid("Protien Buffer", "", "#03ff35")
     sample = protocol.define_liquid("sample", "", "#ff2503")
     
-    # formic_acid = protocol.define_liquid("Formic Acid", "", "#42f5c2")
+    formic_acid = protocol.define_liquid("Formic Acid", "", "#42f5c2")
     # water = protocol.define_liquid("water", "water", "#00b7ff")
     # acetonitrile = protocol.define_liquid("acn", "acn", "#03fc31")
     # ammoniumAcetate = protocol.define_liquid("ammonium acetate", "ammonium acetate", "#fa05ee")
     # Loading Liquids
-    falcon_tube_rack["A1"].load_liquid(bead_sol, bead_amt * num_samples * 1.2 + 50)
+    sheet.source(falcon_tube_rack["A1"], bead_sol)
     # falcon_tube_rack["B2"].load_liquid(empty_tube, 0)
     # falcon_tube_rack["C2"].load_liquid(empty_tube, 0)
-    falcon_tube_rack["A3"].load_liquid(protien_buffer, 200)
+    sheet.source(falcon_tube_rack["A3"], protien_buffer)
     # falcon_tube_rack["B3"].load_liquid(binding_buffer, binding_buffer_amt + math.ceil(binding_buffer_amt/ 10)*1000 + 500)
     # falcon_tube_rack["A4"].load_liquid(equilibration_buffer, equilibartion_buffer_amt + math.ceil(equilibartion_buffer_amt/ 10)*1000 + 500)
     # falcon_tube_rack["B4"].load_liquid(wash_buffer, wash_buffer_amt + math.ceil(wash_buffer_amt/ 10)*1000 + 500)
-    # digestion_buffer_reservoir["H12"].load_liquid(formic_acid, num_samples * 5 + 100)
+    # formic acid is loaded in H12 and spread over column 12 before the quench
+    if num_samples > 24:
+        formic_acid_per_well_amt = math.ceil(num_samples / 8) * formic_acid_per_sample_amt + 20
+    sheet.source(digestion_buffer_reservoir["H12"], formic_acid)
     bead_storage = falcon_tube_rack["A1"]
     dtt_stock_storage = falcon_tube_rack["B1"]
     # dtt_working_storage = falcon_tube_rack["B2"]
@@ -353,9 +1642,7 @@ def run(protocol: protocol_api.ProtocolContext):
     # digestion_buffer_storage = tube_rack["B1"]
     # digestion_buffer_storage = reservoir.columns_by_name()['1']
     # digestion_buffer_storage.load_liquid(digestion_buffer, digestion_buffer_stock_amt)
-    falcon_tube_rack["A2"].load_liquid(
-        digestion_buffer, digestion_buffer_per_sample_amt * num_samples + 50 * 8
-    )
+    sheet.source(falcon_tube_rack["A2"], digestion_buffer)
     dig_buffer_location = falcon_tube_rack["A2"]
 
     equilibration_stock_buffer_storage = falcon_tube_rack["A4"]
@@ -389,19 +1676,35 @@ def run(protocol: protocol_api.ProtocolContext):
         working_reagent_reservoir["A9"],
     ]
 
-    trash_storage = working_reagent_reservoir["A11"]
+    # supernatant removal
+    removal_fast_rate = 0.5  # above the last removal_slow_volume
+    removal_slow_volume = 20  # µl per well taken at the slow rate at the bottom
+    removal_step = 50  # µl per aspiration while following the meniscus
+    removal_immersion = 2  # mm the tip goes under the meniscus
+    removal_offset = 0.15  # fraction of the well diameter the last aspiration is off centre
+
+    # supernatant removals fill A11 first, then the free reservoir wells, then the chute
+    waste = WasteManager([working_reagent_reservoir[well] for well in ["A11", "A10", "A12"]], chute)
+    waste_passes = [5] + [wash_volume - 15] + [wash_volume] * (num_washes - 2)  # bead buffer, equilibration
+    waste_passes += [wash_volume, wash_volume - 15]  # equilibration removal, binding
+    waste_passes += [
+        wash_volume - 10 if wash_num == num_washes - 1 else wash_volume - 20 if wash_num == 0 else wash_volume
+        for wash_num in range(0, num_washes)
+    ]
+    waste.report(protocol, [amt * 8 for amt in waste_passes for _ in range(0, num_columns)])
 
     # trash1=trash_reservoir.wells()[0].bottom(7)
-    staging_slots = ["A4", "B4", "C4", "D4"]
+    staging_slots = list(planner.staging)
     staging_racks = [
-        protocol.load_labware("opentrons_flex_96_filtertiprack_200uL", slot)
-        for slot in staging_slots
+        protocol.load_labware(planner.tip_racks[size], slot)
+        for slot, size in planner.staging.items()
     ]
-    pipette_max = 1000 - 5
+    planner.report(protocol)
     # bead_amt_list = [6.25, 6.25, 6.25, 6.25, 6.25, 12.5, 12.5,12.5,12.5,12.5, 25,25,25,25,25]
 
     # REPLENISHING TIPS
     count = 0
+    resume_tip_columns = [0, 0]  # columns of the A3/B3 racks used up before the run was resumed
 
     # Functions
     def remove_tip(pipette, is_dry_run=protocol.params.dry_run):
@@ -412,49 +1715,98 @@ def run(protocol: protocol_api.ProtocolContext):
 
     def remove_tip_dispense_trash(pipette, amt, is_dry_run=protocol.params.dry_run):
         if is_dry_run:
-            pipette.dispense(amt, trash_storage.top(0))
+            waste.dump(pipette, amt)
             pipette.return_tip()
         else:
-            pipette.dispense(amt, trash_storage.top(0))
+            waste.dump(pipette, amt)
             pipette.drop_tip(chute)
 
     def aspirate_spuernatent_to_trash(
-        pipette, amt, speed=0.05, discard_tip=True, height=0.5
+        pipette, amt, speed=0.05, discard_tip=True, height=0.5, held=None
     ):
-        """amt: amount ot aspirirate out"""
+        """
+        amt: amount ot aspirirate out
+        Most of it is taken at removal_fast_rate in steps that follow the meniscus down, the
+        surface worked out the same way as above_liquid. The last removal_slow_volume is taken at
+        speed from height over the bottom, moved off centre away from the bead pellet. The
+        magnets sit between the columns, so the pellet is on alternate sides in alternate columns
+        held: µL in each well before the removal, amt when left out
+        """
+        held = amt if held is None else held
+        fast_volume = max(amt - removal_slow_volume, 0)
+        steps = math.ceil(fast_volume / removal_step)
         protocol.comment("\nAspriating supernatant to trash")
         for i in range(0, math.ceil(num_samples / 8)):
             if pipette.has_tip == False:
                 pick_up(pipette)
                 # print("hi")
                 # pipette.pick_up_tip()
+            well = reagent_plate["A" + str(i + 1)]
+            taken = 0
+            for step in range(0, steps):
+                taken += fast_volume / steps
+                surface = well.depth * (held - taken) / well.max_volume
+                pipette.aspirate(
+                    fast_volume / steps, well.bottom(max(surface - removal_immersion, height)), rate=removal_fast_rate
+                )
+            away_from_pellet = (1 if i % 2 == 0 else -1) * well.diameter * removal_offset
             pipette.aspirate(
-                amt, reagent_plate["A" + str(i + 1)].bottom(height), rate=speed
+                amt - fast_volume, well.bottom(height).move(types.Point(x=away_from_pellet)), rate=speed
             )
             # pipette.air_gap(volume=10)
-            pipette.dispense(amt, trash_storage.top(0))
-            pipette.blow_out( trash_storage.top(0))
+            waste.dump(pipette, amt)
             if discard_tip:
                 remove_tip(pipette, protocol.params.dry_run)
                 
         if pipette.has_tip == True:
             remove_tip(pipette, protocol.params.dry_run)
+        flow = pipette.flow_rate.aspirate
+        overhead = ProtocolClock.command_overhead["aspirate"]
+        protocol.comment(
+            "Supernatant aspirated in %.0f s per column, %.0f s at the slow rate throughout"
+            % (
+                overhead * (steps + 1) + fast_volume / (flow * removal_fast_rate) + (amt - fast_volume) / (flow * speed),
+                overhead + amt / (flow * speed),
+            )
+        )
 
-    def pick_up(pip):
-        nonlocal tips200
+    def pick_up(pip, group="plate steps"):
+        """
+        Picks up a tip of the size planned for a group of transfers, swapping in a staging rack when they run out
+        """
+        nonlocal tips200
         nonlocal staging_racks
         nonlocal count
 
+        size = planner.choice(group)["size"]
         try:
             # print(tips200)
-            pip.tip_racks = tips200
+            pip.tip_racks = [
+                rack for rack in tips200 if rack.load_name == planner.tip_racks[size].lower()
+            ]
             # print(pip.tip_racks)
-            pip.pick_up_tip()
+            if sum(resume_tip_columns) > 0:
+                pip.pick_up_tip(next_resumed_tip(pip))
+            else:
+                pip.pick_up_tip()
 
         except protocol_api.labware.OutOfTipsError:
             print("\nout of tips\n")
             check_tips()
-            pick_up(pip)
+            pick_up(pip, group)
+
+    def next_resumed_tip(pip):
+        """
+        Get's the next tip while the A3/B3 racks are the partly used ones from before the resume
+        Return: tip well, skipping the columns used before the resume
+        """
+        for i in range(0, len(tips200)):
+            if resume_tip_columns[i] >= 12 or tips200[i] not in pip.tip_racks:
+                continue
+            well = tips200[i].next_tip(pip.channels, tips200[i].columns()[resume_tip_columns[i]][0])
+            if well is not None:
+                return well
+        raise protocol_api.labware.OutOfTipsError
 
     def check_tips():
         # print("\nchecking tips")
@@ -464,65 +1816,44 @@ def run(protocol: protocol_api.ProtocolContext):
         # tip_box = protocol.load_labware('opentrons_flex_96_filtertiprack_1000uL', 'A3')
         tip_box_slots = ["A3", "B3"]
         for i in range(0, len(tip_box_slots)):
-            # aaaaaaaaaaaaaaaaa
-            # try:
             bottom_right_well = tips200[i].wells_by_name()["H12"]
             top_right_well = tips200[i].wells_by_name()["A12"]
             # print(bottom_right_well.has_tip)
-            # except:
-            # print("ESCEPT")
-            # bottom_right_well = tips200[0].wells_by_name()['A1']
-            if (bottom_right_well.has_tip and top_right_well.has_tip) or protocol.deck[
-                "D4"
-            ] == None:
-                # print("AAA" + str(protocol.deck['D4']))
+            if (
+                bottom_right_well.has_tip
+                and top_right_well.has_tip
+                and resume_tip_columns[i] < 12
+            ):
+                continue
+            # only a staging rack of the same tip size can replace the rack
+            rack_num = None
+            for j, slot in enumerate(staging_slots):
+                labware = protocol.deck[slot]
+                if labware and labware.is_tiprack and labware.load_name == tips200[i].load_name:
+                    rack_num = j
+                    break
+            if rack_num is None:
                 protocol.comment(
-                    "A tip is present in the bottom-right corner (H12). or all staging slots are empty"
+                    "No staging tip rack of " + tips200[i].load_name + " left, refill the empty staging slots"
                 )
-                if protocol.deck["D4"] == None:
-                    protocol.comment("No tip box detected in slot D4.")
-                    staging_slots = ["A4", "B4", "C4", "D4"]
-                    staging_racks = [
-                        protocol.load_labware(
-                            "opentrons_flex_96_filtertiprack_200uL", slot
+                for j, slot in enumerate(staging_slots):
+                    if protocol.deck[slot] is None:
+                        staging_racks[j] = protocol.load_labware(
+                            planner.tip_racks[planner.staging[slot]], slot
                         )
-                        for slot in staging_slots
-                    ]
                 continue
-            else:
-                print("starging moving phase")
-                # protocol.comment("\n\n\n Starting moving phase")
-                protocol.move_labware(
-                    labware=tips200[i], new_location=chute, use_gripper=True
-                )
-                rack_num = 0
-                for slot in ["A4", "B4", "C4", "D4"]:
-                    labware = protocol.deck[slot]
-                    if labware and labware.is_tiprack:
-                        tips200[i] = staging_racks[rack_num]
-                        # print(tips200[i])
-                        # print(tip_box_slots[i])
-                        protocol.move_labware(
-                            labware=staging_racks[rack_num],
-                            new_location=tip_box_slots[i],
-                            use_gripper=True,
-                        )
-                        break
-                        # protocol.comment(f"A tip box is present in slot {slot}.")
-                    else:
-                        protocol.comment(f"No tip box detected in slot {slot}.")
-                        rack_num += 1
-                        pass
-
-    def find_aspirate_height(pip, source_well):
-        """
-        returns: aspirate height from bottom in mm
-        """
-        lld_height = (
-            pip.measure_liquid_height(source_well) - source_well.bottom().point.z
-        )
-        aspirate_height = max(lld_height - 5, 1)
-        return aspirate_height
+            print("starging moving phase")
+            # protocol.comment("\n\n\n Starting moving phase")
+            protocol.move_labware(
+                labware=tips200[i], new_location=chute, use_gripper=True
+            )
+            tips200[i] = staging_racks[rack_num]
+            resume_tip_columns[i] = 0
+            protocol.move_labware(
+                labware=staging_racks[rack_num],
+                new_location=tip_box_slots[i],
+                use_gripper=True,
+            )
 
     def mix_sides(pipette, num_mixes, vol, plate, rate=0.3):
         if protocol.params.well_plate_type == 1:    # normal/small plate
@@ -593,224 +1924,315 @@ def run(protocol: protocol_api.ProtocolContext):
     def delay(seconds, msg=""):
         if protocol.params.dry_run:
             return
-        # start_time = datetime.now()
+        # start_time = clock.now()
         # protocol.comment(f"Delaying for {seconds} seconds")
         check_tips()
+        if seconds <= 0:
+            clock.log("no delay left for: " + msg + " (over by " + str(round(-seconds)) + " s)")
+            return
+        clock.log("delay " + str(round(seconds)) + " s: " + msg)
         protocol.delay(seconds=seconds, msg=msg)
         # while True:
-        #     if (datetime.now() - start_time).seconds > seconds:
+        #     if (clock.now() - start_time) > seconds:
         #         break
 
-    def transfer_large_amt(
-        vol, start_loc, end_loc, pipette, rate, aspirate_height=0, dispense_height=0
-    ):
+    def prime_column(primer, source, column, group, rate, working_well=None):
         """
-        vol: volume to transfer (ul)
-        start_loc: location to aspirate from
-        end_loc: location to dispense to
-        pipette: pipette to use
-        rate: rate to aspirate and dispense
+        Fills the rows of a deep well column with one tip, making the working stock first when the
+        primer has one. The diluent and stock go in from above the working stock, so the tip only
+        touches it once it's mixed
+        Primer: ColumnPrimer of the reagent
+        Source: well the reagent comes from, the stock when a working stock is made
+        Column: wells of the deep well column in row order
+        Group: tip planner group of the fill
+        Working_well: well the working stock is made in
         """
-        for i in range(0, math.ceil(vol / pipette_max)):
-            if i != math.ceil(vol / pipette_max) - 1:
-                # print(aspirate_height)
-                pipette.aspirate(
-                    pipette_max, start_loc.bottom(aspirate_height), rate=rate
-                )
-                pipette.dispense(
-                    pipette_max, end_loc.bottom(dispense_height), rate=rate
-                )
-            else:
-                pipette.aspirate(
-                    vol - (pipette_max * i),
-                    start_loc.bottom(aspirate_height),
-                    rate=rate,
-                )
-                pipette.dispense(
-                    vol - (pipette_max * i), end_loc.bottom(dispense_height), rate=rate
+        pipette_max = planner.choice(group)["max_volume"]
+        pick_up(left_pipette, group)
+        if primer.prepared:
+            volume_of_protein_buffer_storage = get_vol_50ml_falcon(
+                find_aspirate_height(left_pipette, protien_buffer_storage) - 5
+            )
+            for volume in primer.pieces(primer.diluent_volume, pipette_max):
+                volume_of_protein_buffer_storage -= volume
+                left_pipette.aspirate(
+                    volume,
+                    protien_buffer_storage.bottom(
+                        get_height_50ml_falcon(volume_of_protein_buffer_storage)
+                    ),
+                    rate,
                 )
+                left_pipette.dispense(volume, working_well.bottom(30), rate)
+            for volume in primer.pieces(primer.stock_volume, pipette_max):
+                left_pipette.aspirate(volume, source.bottom(0.1), rate)
+                left_pipette.dispense(volume, working_well.bottom(30), rate)
+            left_pipette.mix(
+                10,
+                min(pipette_max, primer.working_volume - 50),
+                working_well.bottom(1),
+                rate=0.2,
+            )
+            left_pipette.blow_out(working_well.bottom(30))
+            source = working_well
+        for aspiration in primer.aspirations(pipette_max, 5):
+            left_pipette.aspirate(
+                sum(volume for _, volume in aspiration) + 5, source.bottom(0.1), rate
+            )
+            for row, volume in aspiration:
+                left_pipette.dispense(volume, column[row].bottom(1), rate)
+            left_pipette.blow_out(source.top())
+        remove_tip(left_pipette, protocol.params.dry_run)
+
     def load_beads():
         if not load_beads:
             return
-        pipette_max = 195
-        # num_transfers = math.ceil((bead_amt * num_samples) / (pipette_max))
-        # well_counter = 0
-        change_tip_after = 3
-        protocol.comment("\nTransfering 25µl HILIC beads into well plate")
-        # pick_up(left_pipette)
-        # total_bead_amt = sum(bead_amt_list)
-        total_bead_amt = bead_amt * num_samples
-        # num_transfers = math.ceil(
-        #     total_bead_amt / (change_tip_after * bead_amt)
-        # )  # math.ceil(total_bead_amt / (math.floor((pipette_max-10)/bead_amt)*bead_amt))
-        pick_up(left_pipette)
-        bead_amt_mix = total_bead_amt
-        for i in range (0, num_samples):
-            # bead_amt = bead_amt_list[i]
-            if i % 3 == 0:
-                if i !=0:
-                    remove_tip(left_pipette)
-                    pick_up(left_pipette)
-                left_pipette.mix(3, min(200, bead_amt_mix), bead_storage, 0.5)
+        protocol.comment("\nTransfering HILIC beads into the bead column, then into the well plate")
+        bead_column = digestion_buffer_reservoir.columns()[5]
+        settling = SettlingModel(clock)
+
+        # Filling the rows of the bead column from the falcon, mixing it when the beads have settled
+        pipette_max = planner.choice("bead column")["max_volume"]
+        bead_amt_mix = sum(bead_row_volumes)
+        pick_up(left_pipette, "bead column")
+        for chunk in dispense_chunks(bead_row_volumes, pipette_max, 5):
+            if settling.needs_mix(bead_storage):
+                left_pipette.mix(3, min(pipette_max, bead_amt_mix), bead_storage, 0.5)
                 left_pipette.blow_out(bead_storage)
-                
-            left_pipette.aspirate(bead_amt, bead_storage.bottom(0.1), 0.1)
-            left_pipette.dispense(
-                bead_amt, reagent_plate.wells()[i], 0.1
+                settling.mixed(bead_storage)
+            left_pipette.aspirate(
+                sum(bead_row_volumes[row] for row in chunk) + 5, bead_storage.bottom(0.1), 0.1
             )
-            left_pipette.blow_out(reagent_plate.wells()[i].top())
-            bead_amt_mix -= bead_amt
+            for row in chunk:
+                left_pipette.dispense(bead_row_volumes[row], bead_column[row], 0.1)
+                settling.moved(bead_storage, bead_column[row])
+                bead_amt_mix -= bead_row_volumes[row]
+            left_pipette.blow_out(bead_storage)
         remove_tip(left_pipette, protocol.params.dry_run)
- 
-            
-        # for i in range(0, num_transfers):
-        #     if i == num_transfers - 1:  # on last iteration
-        #         aspirate_amt = (
-        #             num_transfers * bead_amt * change_tip_after
-        #             - bead_amt * (num_transfers - 1) * change_tip_after
-        #             + 3
-        #         )
-        #         pick_up(left_pipette)
-        #         left_pipette.mix(
-        #             3, total_bead_amt - bead_amt * well_counter, bead_storage, 0.1
-        #         )
-        #         left_pipette.aspirate(aspirate_amt, bead_storage.bottom(0.1), 0.1)
-        #         # print(math.floor(aspirate_amt/bead_amt))
-        #         # print("aspirate amt: " + str(aspirate_amt))
-        #         # print("num_transfers: " + str(num_transfers))
-        #         # print("bead_amt: " + str(bead_amt))
-        #         for x in range(0, math.floor(aspirate_amt / bead_amt)):
-        #             left_pipette.dispense(
-        #                 bead_amt, reagent_plate.wells()[well_counter], 0.1
-        #             )
-        #             well_counter += 1
-        #         left_pipette.blow_out(bead_storage.top(-5))
-        #         remove_tip(left_pipette, protocol.params.dry_run)
+        row_volumes = list(bead_row_volumes)
+
+        # Part column, each well from its row
+        if partial_beads:
+            pipette_max = planner.choice("bead partial column")["max_volume"]
+            pick_up(left_pipette, "bead partial column")
+            for row, volume in enumerate(partial_beads):
+                if settling.needs_mix(bead_column[row]):
+                    left_pipette.mix(
+                        3, min(pipette_max, row_volumes[row] - 5), bead_column[row].bottom(0.5), 0.5
+                    )
+                    left_pipette.blow_out(bead_column[row].top())
+                    settling.mixed(bead_column[row])
+                left_pipette.aspirate(volume, bead_column[row].bottom(0.5), 0.1)
+                left_pipette.dispense(volume, reagent_plate.columns()[full_columns][row], 0.1)
+                left_pipette.blow_out(reagent_plate.columns()[full_columns][row].top())
+                row_volumes[row] -= volume
+            remove_tip(left_pipette, protocol.params.dry_run)
+
+        # Stamping the full columns
+        if column_beads:
+            pipette_max = planner.choice("bead stamp")["max_volume"]
+            pick_up(right_pipette, "bead stamp")
+            for column, volume in enumerate(column_beads):
+                if settling.needs_mix(*bead_column):
+                    right_pipette.mix(
+                        3, min(pipette_max, min(row_volumes) - 5), bead_column[0].bottom(0.5), 0.5
+                    )
+                    right_pipette.blow_out(bead_column[0].top())
+                    settling.mixed(*bead_column)
+                right_pipette.aspirate(volume, bead_column[0].bottom(0.5), 0.1)
+                right_pipette.dispense(volume, reagent_plate.columns()[column][0], 0.1)
+                right_pipette.blow_out(reagent_plate.columns()[column][0].top())
+                row_volumes = [row_volume - volume for row_volume in row_volumes]
+            remove_tip(right_pipette, protocol.params.dry_run)
 
-        #     else:
-        #         aspirate_amt = change_tip_after * bead_amt + 5
-        #         pick_up(left_pipette)
-        #         left_pipette.mix(
-        #             3, min(total_bead_amt - bead_amt * well_counter, 200), bead_storage, 0.1
-        #         )
-        #         left_pipette.aspirate(aspirate_amt, bead_storage.bottom(0.5), 0.1)
-        #         for x in range(0, change_tip_after):
-        #             left_pipette.dispense(bead_amt, reagent_plate.wells()[well_counter], 0.1)
-        #             well_counter += 1
-        #         left_pipette.blow_out(bead_storage.top())
-        #         remove_tip(left_pipette, protocol.params.dry_run)
-        # # print(well_counter)
-    
     # LOADING BUFFERS
     hs_mod.open_labware_latch()
-    start = 1
-    eqReservoirs = ["A1", "A2", "A3"]
-    for i in range(0, math.ceil(equilibartion_buffer_amt / 10)):
-        if i == math.ceil(equilibartion_buffer_amt / 10) - 1:  # on last iteration
-            amt_to_transfer = (equilibartion_buffer_amt % 10) * 1000 + 500
-            # print(amt_to_transfer)
-        else:
-            amt_to_transfer = 10500
-        working_reagent_reservoir[eqReservoirs[i]].load_liquid(
-            equilibration_buffer, amt_to_transfer
-        )
-        start += 1
+    # equilibration buffer
+    for well in ["A1", "A2", "A3"]:
+        sheet.source(working_reagent_reservoir[well], equilibration_buffer)
     # binding buffer
-    start = 4
-    bbReservoirs = ["A4", "A5", "A6"]
-    for i in range(0, math.ceil(binding_buffer_amt / 10)):
-        if i == math.ceil(binding_buffer_amt / 10) - 1:  # on last iteration
-            amt_to_transfer = (binding_buffer_amt % 10) * 1000 + 500
-            # print(amt_to_transfer)
-        else:
-            amt_to_transfer = 10500
-        working_reagent_reservoir[bbReservoirs[i]].load_liquid(
-            binding_buffer, amt_to_transfer
-        )
-        start += 1
+    for well in ["A4", "A5", "A6"]:
+        sheet.source(working_reagent_reservoir[well], binding_buffer)
     # wash buffer
-    start = 7
-    wbReservoirs = ["A7", "A8", "A9"]
-    for i in range(0, math.ceil(wash_buffer_amt / 10)):
-        if i == math.ceil(wash_buffer_amt / 10) - 1:  # on last iteration
-            amt_to_transfer = (wash_buffer_amt % 10) * 1000 + 500
-            # print(amt_to_transfer)
-        else:
-            amt_to_transfer = 10500
-        working_reagent_reservoir[wbReservoirs[i]].load_liquid(
-            wash_buffer, amt_to_transfer
-        )
-        start += 1
+    for well in ["A7", "A8", "A9"]:
+        sheet.source(working_reagent_reservoir[well], wash_buffer)
 
-    pipette_max = 200 - 5
+    # RUN JOURNAL
+    journal = RunJournal(
+        journal_path, write=not protocol.is_simulating(), resume=protocol.params.resume
+    )
+    movable_labware = {"sample_plate": sample_plate, "reagent_plate": reagent_plate, "lid": lid}
 
-    if protocol.params.dilute_sample:
+    def labware_location(labware):
+        """
+        Return: deck slot of the labware, or the name of the module/labware it sits on
+        """
+        parent = labware.parent
+        if parent is hs_mod:
+            return "heater_shaker"
+        if parent is magnetic_block:
+            return "magnetic_block"
+        for name, other in movable_labware.items():
+            if parent is other:
+                return name
+        return str(parent)
+
+    def run_state(deck=None):
+        """
+        Tip, deck and liquid state stored with every journal record
+        Deck: deck state to store instead of the current one (steps recorded in the middle of an incubation)
+        """
+        tip_columns = []
+        for i in range(0, len(tips200)):
+            first_unused = 12
+            for col in range(11, resume_tip_columns[i] - 1, -1):
+                if all(well.has_tip for well in tips200[i].columns()[col]):
+                    first_unused = col
+                else:
+                    break
+            tip_columns.append(first_unused)
+        if deck is None:
+            deck = {name: labware_location(labware) for name, labware in movable_labware.items()}
+        return {
+            "tip_columns": tip_columns,
+            "staging_racks": [slot for slot in staging_slots if protocol.deck[slot] is not None],
+            "deck": deck,
+            "ledger": {
+                "equilibartion_buffer_amt": equilibartion_buffer_amt,
+                "binding_buffer_amt": binding_buffer_amt,
+                "wash_buffer_amt": wash_buffer_amt,
+                "waste_volumes": list(waste.volumes),
+            },
+        }
+
+    journal.start(
+        {name: value for name, value in protocol.params.get_all().items() if name != "resume"}
+    )
+    if protocol.params.resume and journal.finished:
+        protocol.comment("The last run in the run journal finished, starting from the beginning")
+    elif protocol.params.resume and not journal.resuming:
+        protocol.comment("No finished steps in the run journal, starting from the beginning")
+    if journal.resuming:
+        state = journal.last_state()
+        protocol.comment(
+            "\nResuming run. Finished steps: "
+            + ", ".join(sorted(journal.steps_done) + sorted(journal.columns_done))
+        )
+        protocol.pause(
+            "Resuming: place the sample plate on "
+            + state["deck"]["sample_plate"].replace("_", " ")
+            + ", the reagent plate on "
+            + state["deck"]["reagent_plate"].replace("_", " ")
+            + " and the lid on "
+            + state["deck"]["lid"].replace("_", " ")
+            + ". Leave the tip racks in A3/B3 and staging slots "
+            + ", ".join(state["staging_racks"])
+            + " as they are"
+        )
+        for slot in staging_slots:
+            if slot not in state["staging_racks"]:
+                del protocol.deck[slot]
+        resume_tip_columns[:] = state["tip_columns"]
+        equilibartion_buffer_amt = state["ledger"]["equilibartion_buffer_amt"]
+        binding_buffer_amt = state["ledger"]["binding_buffer_amt"]
+        wash_buffer_amt = state["ledger"]["wash_buffer_amt"]
+        waste.volumes[:] = state["ledger"].get("waste_volumes", waste.volumes)
+        locations = {"heater_shaker": hs_mod, "magnetic_block": magnetic_block}
+        locations.update(movable_labware)
+        hs_mod.open_labware_latch()
+        for name in ["sample_plate", "reagent_plate", "lid"]:  # plates first, the lid can go on one
+            if labware_location(movable_labware[name]) != state["deck"][name]:
+                protocol.move_labware(
+                    movable_labware[name],
+                    locations.get(state["deck"][name], state["deck"][name]),
+                    use_gripper=False,
+                )
+        hs_mod.close_labware_latch()
+
+    if protocol.params.dilute_sample and journal.done("sample_dilution"):
+        protocol.comment("Samples were diluted before resuming")
+    elif protocol.params.dilute_sample:
         hs_mod.close_labware_latch()
         sample_stock_pre_dilution_plate = hs_mod.load_labware(
             "opentrons_96_wellplate_200ul_pcr_full_skirt", "sample pre-dilution plate"
         )
-        vol_sample_stock= []
-        vol_buffer = []
-        for sample_num, conc in protien_dilution_data.items():
-            # v1 = (conc * (protein_sample_amt-10))/protein_stock_conc
-            v1 = (
-                (protein_stock_conc / (protein_sample_amt - 10))
-                * (protein_sample_amt - 10)
-            ) / conc
-            vol_sample_stock.append(v1)
-            vol_buffer.append(protein_sample_amt - 10 - v1)
-            sample_stock_pre_dilution_plate.wells()[sample_num-1].load_liquid(
-                sample, v1 + 5)
-        
-        print(vol_buffer)
-        
-        vol_buffer_pipettes = []
-        temp_vol_pipette = 0
-        for i in range (0, len(vol_buffer)):
-            temp_vol_pipette += vol_buffer[i]
-            if i != len(vol_buffer) - 1:
-                if temp_vol_pipette + vol_buffer[i+1] >= pipette_max:
-                    vol_buffer_pipettes.append(temp_vol_pipette)
-                    temp_vol_pipette = 0
-            if i == len(vol_buffer) - 1:
-                vol_buffer_pipettes.append(temp_vol_pipette)
-        
-        #Adding buffer
-        well_counter = 0
-        pick_up(left_pipette)
+        for i in range(0, num_samples):
+            sample_stock_pre_dilution_plate.wells()[i].load_liquid(
+                sample, float(normaliser.loaded_volumes[i])
+            )
+        normaliser.report(protocol)
+
+        # Adding buffer to the sample wells, then to the pre-dilution wells of the concentrated
+        # samples from above so the tip never touches a sample
+        pipette_max = planner.choice("sample buffer")["max_volume"]
+        targets = [sample_plate.wells()[i].bottom(0.1) for i in range(0, num_samples)]
+        targets += [sample_stock_pre_dilution_plate.wells()[i].top(-1) for i in range(0, num_samples)]
+        volumes = list(normaliser.buffer_volumes) + list(normaliser.pre_dilution_buffer)
+        pick_up(left_pipette, "sample buffer")
         volume_of_protein_buffer_storage = get_vol_50ml_falcon(
                 find_aspirate_height(left_pipette, protien_buffer_storage)
             )
-        for i in range (0, len(vol_buffer_pipettes)):
-            volume_of_protein_buffer_storage -= vol_buffer_pipettes[i]+5
+        for chunk in dispense_chunks(volumes, pipette_max, 5):
+            aspirate_amt = sum(volumes[x] for x in chunk) + 5
+            volume_of_protein_buffer_storage -= aspirate_amt
             aspirate_height=get_height_50ml_falcon(
                     volume_of_protein_buffer_storage
                 )
             left_pipette.aspirate(
-                vol_buffer_pipettes[i]+5, protien_buffer_storage.bottom(aspirate_height), 0.1
+                aspirate_amt, protien_buffer_storage.bottom(aspirate_height), 0.1
             )
-            vol_in_tip = vol_buffer_pipettes[i]+5
-            while vol_in_tip > 5:
-                left_pipette.dispense(vol_buffer[well_counter], sample_plate.wells()[well_counter].bottom(0.1), 0.1)
-                vol_in_tip -= vol_buffer[well_counter]
-                well_counter+=1
+            for x in chunk:
+                left_pipette.dispense(volumes[x], targets[x], 0.1)
             left_pipette.blow_out(protien_buffer_storage)
         remove_tip(left_pipette, protocol.params.dry_run)
-        for i in range (0, num_samples):
-            # print(v1)
-            pick_up(left_pipette)
+
+        # Adding the stock, a column with the same stock volume in every well goes with the 8 channel
+        for i in single_stock:
+            stock_well = sample_stock_pre_dilution_plate.wells()[i]
+            pick_up(left_pipette, "sample stock")
+            if normaliser.pre_dilutions[i] > 1:
+                left_pipette.mix(
+                    3,
+                    min(
+                        normaliser.loaded_volumes[i] * normaliser.pre_dilutions[i] - 5,
+                        planner.choice("sample stock")["max_volume"],
+                    ),
+                    stock_well.bottom(0.1),
+                    0.3,
+                )
             left_pipette.aspirate(
-                vol_sample_stock[i], sample_stock_pre_dilution_plate.wells()[i].bottom(0.1), 0.1
+                normaliser.stock_volumes[i], stock_well.bottom(0.1), 0.1
             )
-            left_pipette.dispense(vol_sample_stock[i], sample_plate.wells()[i], 0.1)
+            left_pipette.dispense(normaliser.stock_volumes[i], sample_plate.wells()[i], 0.1)
             left_pipette.mix(
                 3, protein_sample_amt - 15, sample_plate.wells()[i], 0.3
             )
             left_pipette.blow_out(sample_plate.wells()[i].top())
             remove_tip(left_pipette)
+        for column, stock_volume in stock_columns.items():
+            stock_well = sample_stock_pre_dilution_plate.columns()[column][0]
+            pick_up(right_pipette, "sample stock columns")
+            if max(normaliser.pre_dilutions[column * 8 : column * 8 + 8]) > 1:
+                right_pipette.mix(
+                    3,
+                    min(
+                        normaliser.loaded_volumes[column * 8 : column * 8 + 8]
+                        * normaliser.pre_dilutions[column * 8 : column * 8 + 8]
+                    )
+                    - 5,
+                    stock_well.bottom(0.1),
+                    0.3,
+                )
+            right_pipette.aspirate(stock_volume, stock_well.bottom(0.1), 0.1)
+            right_pipette.dispense(stock_volume, sample_plate["A" + str(column + 1)], 0.1)
+            right_pipette.mix(
+                3, protein_sample_amt - 15, sample_plate["A" + str(column + 1)], 0.3
+            )
+            right_pipette.blow_out(sample_plate["A" + str(column + 1)].top())
+            remove_tip(right_pipette)
 
         hs_mod.open_labware_latch()
         protocol.move_labware(sample_stock_pre_dilution_plate, chute, use_gripper=True)
+        journal.record("sample_dilution", run_state())
 
     else:
         for i in range (0, num_samples):
@@ -820,87 +2242,25 @@ def run(protocol: protocol_api.ProtocolContext):
                 sample_plate.wells()[i].load_liquid(sample, protein_sample_amt)
                 
     if protocol.params.reduction_alkylation:
-        hs_mod.set_target_temperature(56)  # pre-heat shaker
-        dtt_final_conc = 10  # 10 mM
-        iaa_final_conc = 30  # 30 mM
-        pipette_min = 5  # 5ul is the minimum volume for the pipette
+        if not journal.done("dtt_incubation"):
+            hs_mod.set_target_temperature(56)  # pre-heat shaker
         protocol.comment("-------------Reduction and Alkylation ---------------")
-        # Creating DTT Dilution
-        dtt_working_stock_conc = (
-            dtt_final_conc * protein_sample_amt
-        ) / pipette_min  # DTT working stock concentration so that 5ul is 20 mM
-        print("DTT working stock concentration: " + str(dtt_working_stock_conc))
-        dtt_working_vol = (
-            pipette_min * num_samples + 8 * amt_extra_in_2ml_reservoir + 50
-        )
-        dtt_stock_vol = (
-            dtt_working_stock_conc * dtt_working_vol
-        ) / dtt_conc  # amt of stock that needs to be transfered to create working dtt solution
-        if dtt_conc == dtt_working_stock_conc:
-            falcon_tube_rack["B1"].load_liquid(dtt_stock, dtt_stock_vol)
-            dtt_working_storage = dtt_stock_storage
-        else:
-            dtt_working_storage = digestion_buffer_reservoir["A4"]
-            falcon_tube_rack["B1"].load_liquid(dtt_stock, dtt_stock_vol + 100)
-            # LOADING THE DTT
-            pick_up(left_pipette)
-            # volume_of_dtt_stock_storage_tube = get_vol_15ml_falcon(find_aspirate_height(left_pipette, dtt_stock_storage))
-            # volume_of_dtt_stock_storage_tube -= dtt_stock_vol
-            # print(volume_of_dtt_stock_storage_tube)
-            transfer_large_amt(
-                dtt_stock_vol,
+        if not journal.done("dtt_working_stock"):
+            print("DTT working stock concentration: " + str(dtt_primer.working_conc))
+            sheet.source(falcon_tube_rack["B1"], dtt_stock)
+            prime_column(
+                dtt_primer,
                 dtt_stock_storage,
-                dtt_working_storage,
-                left_pipette,
+                digestion_buffer_reservoir.columns()[1],
+                "dtt working stock",
                 0.5,
-                aspirate_height=0.1,
-                dispense_height=30,
+                working_well=digestion_buffer_reservoir["A4"],
             )
-            left_pipette.blow_out(dtt_working_storage.bottom(30))
-            # print(dtt_stock_vol)
-            remove_tip(left_pipette, protocol.params.dry_run)
-            pick_up(left_pipette)
-            volume_of_protein_buffer_storage = get_vol_50ml_falcon(
-                find_aspirate_height(left_pipette, protien_buffer_storage) - 5
-            )
-            volume_of_protein_buffer_storage -= dtt_working_vol - dtt_stock_vol
-            transfer_large_amt(
-                dtt_working_vol - dtt_stock_vol,
-                protien_buffer_storage,
-                dtt_working_storage,
-                left_pipette,
-                0.5,
-                aspirate_height=get_height_50ml_falcon(
-                    volume_of_protein_buffer_storage
-                ),
-                dispense_height=30,
-            )
-            left_pipette.mix(10, pipette_max, dtt_working_storage.bottom(1), rate=0.2)
-            left_pipette.blow_out(dtt_working_storage.bottom(30))
-            remove_tip(left_pipette, protocol.params.dry_run)
-
-        pick_up(left_pipette)
-        for i in range(0, 8):
-            if i < num_samples % 8:
-                amt_in_well = (
-                    5 * math.ceil(num_samples / 8) + amt_extra_in_2ml_reservoir
-                )
-            else:
-                amt_in_well = (
-                    5 * math.floor(num_samples / 8) + amt_extra_in_2ml_reservoir
-                )
-            # print(amt_in_well)
-            transfer_large_amt(
-                amt_in_well,
-                dtt_working_storage,
-                digestion_buffer_reservoir.wells()[i + 8],
-                left_pipette,
-                0.5,
-                dispense_height=1,
-            )
-        remove_tip(left_pipette, protocol.params.dry_run)
+            journal.record("dtt_working_stock", run_state())
         # ADDING DTT TO PLATE
         for i in range(0, math.ceil(num_samples / 8)):
+            if journal.column_done("dtt_addition", i):
+                continue
             pick_up(right_pipette)
             right_pipette.aspirate(5, digestion_buffer_reservoir["A2"].bottom(0.1), 0.2)
             right_pipette.dispense(5, sample_plate["A" + str(i + 1)].bottom(1), 0.5)
@@ -912,118 +2272,61 @@ def run(protocol: protocol_api.ProtocolContext):
             )
             right_pipette.blow_out(sample_plate["A" + str(i + 1)].top())
             remove_tip(right_pipette, protocol.params.dry_run)
-        hs_mod.open_labware_latch()
-        # 56 C for 30 minutes
-        protocol.move_labware(sample_plate, hs_mod, use_gripper=True)
-        hs_mod.close_labware_latch()
-        hs_mod.open_labware_latch()
-        try:
-            protocol.move_labware(labware=lid, new_location=sample_plate, use_gripper=True)
-        except:
-            protocol.pause("Please place the lid on the sample plate and press RESUME")
-        hs_mod.close_labware_latch()
-
-        hs_mod.set_and_wait_for_shake_speed(400)  # 400 rpm
-        # hs_mod.set_and_wait_for_temperature(56)
-        start_time = datetime.now()
-
-        # PREPARING IAA
-        iaa_working_stock_conc = (
-            iaa_final_conc * protein_sample_amt
-        ) / pipette_min  # IAA working stock concentration so that 5ul is 20 mM
-        print("IAA working stock concentration: " + str(iaa_working_stock_conc))
-        iaa_working_vol = (
-            pipette_min * num_samples + 8 * amt_extra_in_2ml_reservoir + 50
-        )
-        iaa_stock_vol = (
-            iaa_working_stock_conc * iaa_working_vol
-        ) / iaa_conc  # amt of stock that needs to be transfered to create working dtt solution
-        if iaa_conc == iaa_working_stock_conc:
-            iaa_working_storage = iaa_stock_storage
-            falcon_tube_rack["C1"].load_liquid(iaa_stock, iaa_stock_vol)
-        else:
-            iaa_working_storage = digestion_buffer_reservoir["A5"]
-
-            falcon_tube_rack["C1"].load_liquid(iaa_stock, iaa_stock_vol + 100)
-
-            pick_up(left_pipette)
-            # volume_of_iaa_stock_storage_tube = get_vol_15ml_falcon(find_aspirate_height(left_pipette, iaa_stock_storage))
-            # volume_of_iaa_stock_storage_tube -= iaa_stock_vol
-            transfer_large_amt(
-                iaa_stock_vol,
-                iaa_stock_storage,
-                iaa_working_storage,
-                left_pipette,
-                0.5,
-                aspirate_height=0.1,
-                dispense_height=30,
-            )
-            left_pipette.blow_out(iaa_working_storage.bottom(30))
-
-            remove_tip(left_pipette, protocol.params.dry_run)
-            pick_up(left_pipette)
+            journal.record("dtt_addition", run_state(), column=i)
+        if not journal.done("dtt_incubation"):
+            step_deck = run_state()["deck"]
+            hs_mod.open_labware_latch()
+            # 56 C for 30 minutes
+            protocol.move_labware(sample_plate, hs_mod, use_gripper=True)
+            hs_mod.close_labware_latch()
+            hs_mod.open_labware_latch()
             try:
-                volume_of_protein_buffer_storage -= iaa_working_vol - iaa_stock_vol
+                protocol.move_labware(labware=lid, new_location=sample_plate, use_gripper=True)
             except:
-                volume_of_protein_buffer_storage = get_vol_50ml_falcon(
-                    find_aspirate_height(left_pipette, protien_buffer_storage) - 5
+                protocol.pause("Please place the lid on the sample plate and press RESUME")
+            hs_mod.close_labware_latch()
+
+            hs_mod.set_and_wait_for_shake_speed(400)  # 400 rpm
+            # hs_mod.set_and_wait_for_temperature(56)
+            journal.start_step("dtt_incubation")
+            start_time = clock.now() - journal.elapsed("dtt_incubation")
+            clock.start_incubation("DTT incubation", 1200, start_time)
+
+            if not journal.done("iaa_working_stock"):
+                print("IAA working stock concentration: " + str(iaa_primer.working_conc))
+                sheet.source(falcon_tube_rack["C1"], iaa_stock)
+                prime_column(
+                    iaa_primer,
+                    iaa_stock_storage,
+                    digestion_buffer_reservoir.columns()[2],
+                    "iaa working stock",
+                    0.5,
+                    working_well=digestion_buffer_reservoir["A5"],
                 )
-                volume_of_protein_buffer_storage -= iaa_working_vol - iaa_stock_vol
-
-            transfer_large_amt(
-                iaa_working_vol - iaa_stock_vol,
-                protien_buffer_storage,
-                iaa_working_storage,
-                left_pipette,
-                0.5,
-                aspirate_height=get_height_50ml_falcon(
-                    volume_of_protein_buffer_storage
-                ),
-                dispense_height=30,
-            )
-            left_pipette.mix(10, pipette_max, iaa_working_storage.bottom(1), rate=0.2)
-            left_pipette.blow_out(iaa_working_storage.bottom(30))
-            remove_tip(left_pipette, protocol.params.dry_run)
-
-        pick_up(left_pipette)
-        for i in range(0, 8):
-            if i < num_samples % 8:
-                amt_in_well = (
-                    5 * math.ceil(num_samples / 8) + amt_extra_in_2ml_reservoir
-                )
-            else:
-                amt_in_well = (
-                    5 * math.floor(num_samples / 8) + amt_extra_in_2ml_reservoir
-                )
-            # print(amt_in_well)
-            transfer_large_amt(
-                amt_in_well,
-                iaa_working_storage,
-                digestion_buffer_reservoir.wells()[i + 16],
-                left_pipette,
-                0.5,
-                dispense_height=1,
-            )
-        remove_tip(left_pipette, protocol.params.dry_run)
-        check_tips()
+                journal.record("iaa_working_stock", run_state(deck=step_deck))
+            check_tips()
 
-        # 20 min incubation
-        time_elasped = (datetime.now() - start_time).seconds
-        delay(seconds=1200 - time_elasped, msg="20 minute DTT incubation at 56 C")
-        # moving plate and adding IAA to plate
-        hs_mod.deactivate_heater()
-        hs_mod.deactivate_shaker()
-        hs_mod.deactivate_heater()
-        hs_mod.open_labware_latch()
-        try:
-            protocol.move_labware(lid, "C3", use_gripper=True)
-        except:
-            protocol.pause("Please move lid ")
+            # 20 min incubation
+            time_elasped = clock.now() - start_time
+            delay(seconds=1200 - time_elasped, msg="20 minute DTT incubation at 56 C")
+            clock.end_incubation("DTT incubation")
+            # moving plate and adding IAA to plate
+            hs_mod.deactivate_heater()
+            hs_mod.deactivate_shaker()
+            hs_mod.deactivate_heater()
+            hs_mod.open_labware_latch()
+            try:
+                protocol.move_labware(lid, "C3", use_gripper=True)
+            except:
+                protocol.pause("Please move lid ")
 
-        protocol.move_labware(sample_plate, "A1", use_gripper=True)
+            protocol.move_labware(sample_plate, "A1", use_gripper=True)
         
-        delay(seconds=10*60, msg="Waiting 10 minutes for heat shaker to cool down")
+            delay(seconds=10*60, msg="Waiting 10 minutes for heat shaker to cool down")
+            journal.record("dtt_incubation", run_state())
         for i in range(0, math.ceil(num_samples / 8)):
+            if journal.column_done("iaa_addition", i):
+                continue
             pick_up(right_pipette)
             right_pipette.aspirate(5, digestion_buffer_reservoir["A3"].bottom(0.1), 0.2)
             right_pipette.dispense(5, sample_plate["A" + str(i + 1)].bottom(1), 0.5)
@@ -1035,31 +2338,40 @@ def run(protocol: protocol_api.ProtocolContext):
             )
             right_pipette.blow_out(sample_plate["A" + str(i + 1)].top())
             remove_tip(right_pipette, protocol.params.dry_run)
-        # 45 minute IAA incubation at RT
-        hs_mod.open_labware_latch()
-        protocol.move_labware(sample_plate, hs_mod, use_gripper=True)
-        hs_mod.close_labware_latch()
-        hs_mod.open_labware_latch()
-        try:
-            protocol.move_labware(lid, sample_plate, use_gripper=True)
-        except:
-            protocol.pause("Please move lid")
-        hs_mod.close_labware_latch()
-        hs_mod.set_and_wait_for_shake_speed(400)  # 400 rpm
-        start_time = datetime.now()
+            journal.record("iaa_addition", run_state(), column=i)
+        if not journal.done("iaa_incubation"):
+            step_deck = run_state()["deck"]
+            # 45 minute IAA incubation at RT
+            hs_mod.open_labware_latch()
+            protocol.move_labware(sample_plate, hs_mod, use_gripper=True)
+            hs_mod.close_labware_latch()
+            hs_mod.open_labware_latch()
+            try:
+                protocol.move_labware(lid, sample_plate, use_gripper=True)
+            except:
+                protocol.pause("Please move lid")
+            hs_mod.close_labware_latch()
+            hs_mod.set_and_wait_for_shake_speed(400)  # 400 rpm
+            journal.start_step("iaa_incubation")
+            start_time = clock.now() - journal.elapsed("iaa_incubation")
+            clock.start_incubation("IAA incubation", 2700, start_time)
         
-        load_beads()
-        check_tips()
-        time_elasped = (datetime.now() - start_time).seconds
-        delay(seconds=2700-time_elasped, msg="45 minute IAA incubation at room temperature")
-        hs_mod.deactivate_shaker()
-        hs_mod.deactivate_heater()
-        hs_mod.open_labware_latch()
-        try:
-            protocol.move_labware(lid, "C3", use_gripper=True)
-        except:
-            protocol.pause("Please move lid")
-        protocol.move_labware(sample_plate, "A1", use_gripper=True)
+            if not journal.done("bead_loading"):
+                load_beads()
+                journal.record("bead_loading", run_state(deck=step_deck))
+            check_tips()
+            time_elasped = clock.now() - start_time
+            delay(seconds=2700-time_elasped, msg="45 minute IAA incubation at room temperature")
+            clock.end_incubation("IAA incubation")
+            hs_mod.deactivate_shaker()
+            hs_mod.deactivate_heater()
+            hs_mod.open_labware_latch()
+            try:
+                protocol.move_labware(lid, "C3", use_gripper=True)
+            except:
+                protocol.pause("Please move lid")
+            protocol.move_labware(sample_plate, "A1", use_gripper=True)
+            journal.record("iaa_incubation", run_state())
         # protocol.pause('''IAA incubation for 45 minutes at room temperature''')
 
         # protocol.move_labware(sample_plate, hs_mod, use_gripper=True)
@@ -1077,28 +2389,32 @@ def run(protocol: protocol_api.ProtocolContext):
     hs_mod.close_labware_latch()
     protocol.comment("-------------Equilibration ---------------")
     
-    if protocol.params.reduction_alkylation == False:
+    if protocol.params.reduction_alkylation == False and not journal.done("bead_loading"):
         load_beads()
+        journal.record("bead_loading", run_state())
 
-    protocol.comment(
-        "\nPlacing tube on magnetic separator and allowing 10s for microparticles to clear"
-    )
-    hs_mod.open_labware_latch()
-    protocol.move_labware(reagent_plate, magnetic_block, use_gripper=True)
-    protocol.delay(
-        seconds=bead_settle_time,
-        msg="waiting 7 seconds for microparticles to clear",
-    )
-    # pick_up(left_pipette)
-    # for i in range (0, num_samples):
-    #     left_pipette.aspirate(bead_amt_list[i]-(bead_amt_list[i] - 5), reagent_plate.wells()[i].bottom(0.5), 0.1)
-    #     left_pipette.dispense(bead_amt_list[i]-(bead_amt_list[i] - 5), trash_storage)
-    #     left_pipette.blow_out(trash_storage.top())
-    # remove_tip(left_pipette)
-
-    aspirate_spuernatent_to_trash(
-        right_pipette, bead_amt - (bead_amt - 5), speed=0.03, discard_tip=False
-    )
+    if not journal.done("bead_buffer_removal"):
+        protocol.comment(
+            "\nPlacing tube on magnetic separator and allowing 10s for microparticles to clear"
+        )
+        hs_mod.open_labware_latch()
+        protocol.move_labware(reagent_plate, magnetic_block, use_gripper=True)
+        protocol.delay(
+            seconds=bead_settle_time,
+            msg="waiting 7 seconds for microparticles to clear",
+        )
+        # pick_up(left_pipette)
+        # for i in range (0, num_samples):
+        #     left_pipette.aspirate(bead_amt_list[i]-(bead_amt_list[i] - 5), reagent_plate.wells()[i].bottom(0.5), 0.1)
+        #     left_pipette.dispense(bead_amt_list[i]-(bead_amt_list[i] - 5), trash_storage)
+        #     left_pipette.blow_out(trash_storage.top())
+        # remove_tip(left_pipette)
+
+        aspirate_spuernatent_to_trash(
+            right_pipette, bead_amt - (bead_amt - 5), speed=0.03, discard_tip=False
+        )
+
+        journal.record("bead_buffer_removal", run_state())
 
     protocol.comment(
         "\nWashing and equilibrating the microparticles in "
@@ -1108,6 +2424,8 @@ def run(protocol: protocol_api.ProtocolContext):
     for wash_num in range(
         0, num_washes
     ):  # all washes before the last wash with EQ buffer
+        if journal.column_done("equilibration_wash", wash_num):
+            continue
         protocol.comment("Wash number: " + str(wash_num + 1))
         hs_mod.open_labware_latch()
         protocol.move_labware(reagent_plate, new_location=hs_mod, use_gripper=True)
@@ -1170,6 +2488,7 @@ def run(protocol: protocol_api.ProtocolContext):
             aspirate_spuernatent_to_trash(
                 right_pipette, wash_volume, discard_tip=False
             )  # leave the last 5ul in the well plate
+        journal.record("equilibration_wash", run_state(), column=wash_num)
         # protocol.move_labware(reagent_plate, new_location="B2", use_gripper=True)
 
     # protocol.move_labware(reagent_plate, new_location="B2", use_gripper=True)
@@ -1184,42 +2503,53 @@ def run(protocol: protocol_api.ProtocolContext):
         + str(protein_sample_amt)
         + "µl protein sample"
     )
+    # one tip for every column, the buffer goes in from above the sample and the sample is mixed
+    # by the loading tip, the wells taper so the tip is kept higher than the depth fraction says
     for i in range(0, math.ceil(num_samples / 8)):
-        # right_pipette.pick_up_tip()
-        pick_up(right_pipette)
+        if journal.column_done("binding_buffer", i):
+            continue
+        if right_pipette.has_tip == False:
+            pick_up(right_pipette)
         binding_buffer_amt -= (protein_sample_amt / 1000) * 8
         right_pipette.aspirate(
             protein_sample_amt,
             binding_buffer_storage[math.ceil(binding_buffer_amt / 10.5) - 1].bottom(1),
             0.4,
         )
-        right_pipette.dispense(
-            protein_sample_amt, sample_plate["A" + str(i + 1)].bottom(1), 0.5
-        )
-        right_pipette.mix(
-            4,
-            protein_sample_amt - 15,
-            sample_plate["A" + str(i + 1)].bottom(1),
-            rate=0.1,
+        above_sample = above_liquid(
+            sample_plate["A" + str(i + 1)], protein_sample_amt, protein_sample_amt, clearance=4
         )
-        right_pipette.blow_out(sample_plate["A" + str(i + 1)].top())
+        right_pipette.dispense(protein_sample_amt, above_sample, 0.5)
+        right_pipette.blow_out(above_sample)
+        journal.record("binding_buffer", run_state(), column=i)
+    if right_pipette.has_tip:
         remove_tip(right_pipette, protocol.params.dry_run)
     check_tips()
 
-    hs_mod.open_labware_latch()
-    protocol.move_labware(reagent_plate, magnetic_block, use_gripper=True)
-    aspirate_spuernatent_to_trash(
-        right_pipette, wash_volume, discard_tip=False
-    )
+    if not journal.done("equilibration_removal"):
+        hs_mod.open_labware_latch()
+        protocol.move_labware(reagent_plate, magnetic_block, use_gripper=True)
+        aspirate_spuernatent_to_trash(
+            right_pipette, wash_volume, discard_tip=False
+        )
     
-    hs_mod.open_labware_latch()
-    protocol.move_labware(reagent_plate, hs_mod, use_gripper=True)
-    hs_mod.close_labware_latch()
+        hs_mod.open_labware_latch()
+        protocol.move_labware(reagent_plate, hs_mod, use_gripper=True)
+        hs_mod.close_labware_latch()
+        journal.record("equilibration_removal", run_state())
 
     protocol.comment("\nAdding binding buffer and protein sample to well plate")
     for i in range(0, math.ceil(num_samples / 8)):
+        if journal.column_done("protein_loading", i):
+            continue
         # right_pipette.pick_up_tip()
         pick_up(right_pipette)
+        right_pipette.mix(
+            4,
+            protein_sample_amt - 15,
+            sample_plate["A" + str(i + 1)].bottom(1),
+            rate=0.1,
+        )
         right_pipette.aspirate(
             protein_added_to_beads + 10, sample_plate["A" + str(i + 1)], rate=0.1
         )
@@ -1233,70 +2563,46 @@ def run(protocol: protocol_api.ProtocolContext):
         right_pipette.touch_tip()
         right_pipette.blow_out(reagent_plate["A" + str(i + 1)].top())
         remove_tip(right_pipette, protocol.params.dry_run)
+        journal.record("protein_loading", run_state(), column=i)
 
-    protocol.comment(
-        "\nAllow proteins to bind to microparticles for 30 min. Mix gently and continuously"
-    )
-    start_time = time.time()
-    protocol.comment("\n\n\n\n\n" + str(start_time))
-    hs_mod.open_labware_latch()
-    hs_mod.close_labware_latch()
-    # protocol.pause('''"Put the lid on!!!" -O____________O''')
-    hs_mod.set_and_wait_for_shake_speed(1550)  # 1100 rpm
-    # protocol.pause('''"Tell me when to stop!! (30 min incubation time)''')
-    protocol.comment("\n\n" * 20)
-
-    start_time = datetime.now()
-    transfer_vol = (math.ceil(num_samples / 8)) * 100 + 50  # transfer into each well
-    total_dig_buffer = transfer_vol * 8
-    pipette_max = 200
-    num_transfers = math.ceil((total_dig_buffer) / (pipette_max))
-    well_counter = 0
-    left_pipette.pick_up_tip()
-    for well_counter in range(0, 8):
-        if (num_samples % 8) > well_counter:
-            transfer_vol = (
-                math.ceil(num_samples / 8)
-            ) * 100 + 50  # transfer into each well
-        else:
-            transfer_vol = (
-                math.floor(num_samples / 8)
-            ) * 100 + 50  # transfer into each well
-        transfer_large_amt(
-            transfer_vol,
-            dig_buffer_location,
-            digestion_buffer_reservoir.wells()[well_counter],
-            left_pipette,
-            0.25,
+    if not journal.done("binding_incubation"):
+        step_deck = run_state()["deck"]
+        protocol.comment(
+            "\nAllow proteins to bind to microparticles for 30 min. Mix gently and continuously"
         )
+        protocol.comment("\n\n\n\n\n" + clock.format_time())
+        hs_mod.open_labware_latch()
+        hs_mod.close_labware_latch()
+        # protocol.pause('''"Put the lid on!!!" -O____________O''')
+        hs_mod.set_and_wait_for_shake_speed(1550)  # 1100 rpm
+        # protocol.pause('''"Tell me when to stop!! (30 min incubation time)''')
+        protocol.comment("\n\n" * 20)
+
+        journal.start_step("binding_incubation")
+        start_time = clock.now() - journal.elapsed("binding_incubation")
+        clock.start_incubation("binding incubation", 1800, start_time)
+        if not journal.done("digestion_buffer_stock"):
+            prime_column(
+                digestion_primer,
+                dig_buffer_location,
+                digestion_buffer_reservoir.columns()[0],
+                "digestion buffer stock",
+                0.25,
+            )
+            journal.record("digestion_buffer_stock", run_state(deck=step_deck))
+        # left_pipette.pick_up_tip()
+        # left_pipette.pick_up_tip()
+        time_elasped = clock.now() - start_time
+        # 30 minute incubation
+        delay(1800 - time_elasped)
+        clock.end_incubation("binding incubation")
 
-        # if i == 0 or i == 1:
-        #     transfer_large_amt(250, dig_buffer_location, digestion_buffer_reservoir.wells()[well_counter], left_pipette, 0.25)
-        #     well_counter += 1
-        # else:
-        #     transfer_large_amt(150, dig_buffer_location, digestion_buffer_reservoir.wells()[well_counter], left_pipette, 0.25)
-        #     well_counter+=1
-        # left_pipette.aspirate(aspirate_vol, dig_buffer_location, 0.25)
-    #     for i in range (0, math.ceil(transfer_vol/pipette_max)):
-    #         if i != math.ceil(transfer_vol/pipette_max):    # not on last iteration
-    #             aspirate_vol = pipette_max
-    #         else:
-    #             aspirate_vol = transfer_vol - (pipette_max*i)
-    #         left_pipette.aspirate(aspirate_vol, dig_buffer_location, 0.25)
-    #         print(aspirate_vol)
-    #         left_pipette.dispense(aspirate_vol, digestion_buffer_reservoir.wells()[well_counter].bottom(), 0.1)
-    remove_tip(left_pipette, protocol.params.dry_run)
-    # left_pipette.pick_up_tip()
-    # left_pipette.pick_up_tip()
-    time_elasped = (datetime.now() - start_time).seconds
-    # 30 minute incubation
-    delay(1800 - time_elasped)
-
-    hs_mod.deactivate_shaker()
-    hs_mod.open_labware_latch()
-    protocol.move_labware(reagent_plate, magnetic_block, use_gripper=True)
-    protocol.delay(seconds=bead_settle_time, msg="waiting for beads to settle (20 sec)")
-    aspirate_spuernatent_to_trash(right_pipette, wash_volume - 15)
+        hs_mod.deactivate_shaker()
+        hs_mod.open_labware_latch()
+        protocol.move_labware(reagent_plate, magnetic_block, use_gripper=True)
+        protocol.delay(seconds=bead_settle_time, msg="waiting for beads to settle (20 sec)")
+        aspirate_spuernatent_to_trash(right_pipette, wash_volume - 15)
+        journal.record("binding_incubation", run_state())
 
     protocol.comment(
         "\nResuspend beads in "
@@ -1307,6 +2613,8 @@ def run(protocol: protocol_api.ProtocolContext):
     # protocol.move_labware(reagent_plate, new_location="B2", use_gripper=True)
     wash_buffer_resuspend_amt = wash_volume
     for wash_num in range(0, num_washes):
+        if journal.column_done("bead_wash", wash_num):
+            continue
         protocol.comment("Resuspend number: " + str(i + 1))
         hs_mod.open_labware_latch()
         protocol.move_labware(reagent_plate, new_location=hs_mod, use_gripper=True)
@@ -1367,102 +2675,111 @@ def run(protocol: protocol_api.ProtocolContext):
             )
         else:
             aspirate_spuernatent_to_trash(right_pipette, wash_buffer_resuspend_amt)
-    hs_mod.open_labware_latch()
-    protocol.move_labware(reagent_plate, new_location=hs_mod, use_gripper=True)
-    hs_mod.close_labware_latch()
-
-    protocol.comment(
-        "\n\n--------------------Protein Digestion Procedure-----------------------"
-    )
-    protocol.comment(
-        "Resuspending microparticles with absorbed protein mix in 100-200µl digestion buffer"
-    )
+        journal.record("bead_wash", run_state(), column=wash_num)
+    if not journal.done("digestion_buffer"):
+        hs_mod.open_labware_latch()
+        protocol.move_labware(reagent_plate, new_location=hs_mod, use_gripper=True)
+        hs_mod.close_labware_latch()
 
-    # DO THE MATH AND FIX THIS PART LATER
-    pick_up(right_pipette)
-    for i in range(0, math.ceil(num_samples / 8)):
-        right_pipette.aspirate(
-            digestion_buffer_per_sample_amt, digestion_buffer_reservoir["A1"], 0.1
+        protocol.comment(
+            "\n\n--------------------Protein Digestion Procedure-----------------------"
         )
-        right_pipette.dispense(
-            digestion_buffer_per_sample_amt,
-            reagent_plate["A" + str(i + 1)].top(-2),
-            0.5,
+        protocol.comment(
+            "Resuspending microparticles with absorbed protein mix in 100-200µl digestion buffer"
         )
-        right_pipette.blow_out(reagent_plate["A" + str(i + 1)].top(-2))
-        right_pipette.touch_tip(reagent_plate["A" + str(i + 1)])
-        right_pipette.blow_out(reagent_plate["A" + str(i + 1)].top(-2))
-    remove_tip(right_pipette, protocol.params.dry_run)
-        # print('A' + str(i+1))
-    # pick_up(left_pipette)
-    # pick_up(left_pipette)
 
-    # MIXING DIGESTION BUFFER
-    for i in range(0, math.ceil(num_samples / 8)):
+        # DO THE MATH AND FIX THIS PART LATER
         pick_up(right_pipette)
-        fancy_mix_sides(
-            right_pipette,
-            3,
-            digestion_buffer_per_sample_amt - 25,
-            reagent_plate["A" + str(i + 1)], num_points = 8
-        )
-        right_pipette.blow_out(reagent_plate["A" + str(i + 1)].top())
-        right_pipette.blow_out(reagent_plate["A" + str(i + 1)].top())
-        # right_pipette.blow_out(reagent_plate['A' + str(i+1)].top(1))
+        for i in range(0, math.ceil(num_samples / 8)):
+            right_pipette.aspirate(
+                digestion_buffer_per_sample_amt, digestion_buffer_reservoir["A1"], 0.1
+            )
+            right_pipette.dispense(
+                digestion_buffer_per_sample_amt,
+                reagent_plate["A" + str(i + 1)].top(-2),
+                0.5,
+            )
+            right_pipette.blow_out(reagent_plate["A" + str(i + 1)].top(-2))
+            right_pipette.touch_tip(reagent_plate["A" + str(i + 1)])
+            right_pipette.blow_out(reagent_plate["A" + str(i + 1)].top(-2))
         remove_tip(right_pipette, protocol.params.dry_run)
+            # print('A' + str(i+1))
+        # pick_up(left_pipette)
+        # pick_up(left_pipette)
 
-    protocol.comment(
-        "\nIncubating sample at 47°C for ___ hours. Mix continuously at "
-        + str(shake_speed)
-        + " rpm"
-    )
-    hs_mod.open_labware_latch()
+        # MIXING DIGESTION BUFFER
+        for i in range(0, math.ceil(num_samples / 8)):
+            pick_up(right_pipette)
+            fancy_mix_sides(
+                right_pipette,
+                3,
+                digestion_buffer_per_sample_amt - 25,
+                reagent_plate["A" + str(i + 1)], num_points = 8
+            )
+            right_pipette.blow_out(reagent_plate["A" + str(i + 1)].top())
+            right_pipette.blow_out(reagent_plate["A" + str(i + 1)].top())
+            # right_pipette.blow_out(reagent_plate['A' + str(i+1)].top(1))
+            remove_tip(right_pipette, protocol.params.dry_run)
+        journal.record("digestion_buffer", run_state())
 
-    try:
-        protocol.move_labware(labware=lid, new_location=reagent_plate, use_gripper=True)
-    except Exception as e:
-        protocol.pause("move lid")
-        # protocol.move_labware(labware=lid, new_location=reagent_plate, use_gripper=False)
-    hs_mod.close_labware_latch()
-    hs_mod.set_and_wait_for_shake_speed(1450)  # 1000 rpm
-    hs_mod.set_and_wait_for_temperature(protocol.params.incubation_temp)  # 37°C
-    start_time = datetime.now()
+    if not journal.done("digestion"):
+        protocol.comment(
+            "\nIncubating sample at 47°C for ___ hours. Mix continuously at "
+            + str(shake_speed)
+            + " rpm"
+        )
+        hs_mod.open_labware_latch()
+
+        try:
+            protocol.move_labware(labware=lid, new_location=reagent_plate, use_gripper=True)
+        except Exception as e:
+            protocol.pause("move lid")
+            # protocol.move_labware(labware=lid, new_location=reagent_plate, use_gripper=False)
+        hs_mod.close_labware_latch()
+        hs_mod.set_and_wait_for_shake_speed(1450)  # 1000 rpm
+        hs_mod.set_and_wait_for_temperature(protocol.params.incubation_temp)  # 37°C
+        journal.start_step("digestion")
+        start_time = clock.now() - journal.elapsed("digestion")
+        if protocol.params.incubation_time > 0:
+            clock.start_incubation("digestion", protocol.params.incubation_time * 60 * 60, start_time)
     
-    #adding buffer
-    # final_buffer_storage = falcon_tube_rack["B2"]
-    # pick_up(left_pipette)
-    # vol_in_buffer_falcon = amt_final_buffer_to_add*num_samples#get_vol_15ml_falcon(find_aspirate_height(left_pipette, final_buffer_storage))
-    # for i in range (0, num_samples):
-    #     if i%8 == 0:
-    #         remove_tip(left_pipette, protocol.params.dry_run)
-    #         pick_up(left_pipette)
-    #     vol_in_buffer_falcon -= amt_final_buffer_to_add
-    #     left_pipette.blow_out(final_buffer_storage.top(-2))
-    #     left_pipette.aspirate(
-    #         amt_final_buffer_to_add,
-    #         final_buffer_storage.bottom(get_height_15ml_falcon(vol_in_buffer_falcon)),
-    #         0.25,
-    #     )
-    #     left_pipette.dispense(amt_final_buffer_to_add, final_tube_rack.wells()[i].bottom(0.2), 0.25)
-    #     left_pipette.blow_out(final_tube_rack.wells()[i].top(-2))
-    check_tips()
-    time_elasped = (datetime.now() - start_time).seconds
-    if protocol.params.incubation_time == 0:
+        #adding buffer
+        # final_buffer_storage = falcon_tube_rack["B2"]
+        # pick_up(left_pipette)
+        # vol_in_buffer_falcon = amt_final_buffer_to_add*num_samples#get_vol_15ml_falcon(find_aspirate_height(left_pipette, final_buffer_storage))
+        # for i in range (0, num_samples):
+        #     if i%8 == 0:
+        #         remove_tip(left_pipette, protocol.params.dry_run)
+        #         pick_up(left_pipette)
+        #     vol_in_buffer_falcon -= amt_final_buffer_to_add
+        #     left_pipette.blow_out(final_buffer_storage.top(-2))
+        #     left_pipette.aspirate(
+        #         amt_final_buffer_to_add,
+        #         final_buffer_storage.bottom(get_height_15ml_falcon(vol_in_buffer_falcon)),
+        #         0.25,
+        #     )
+        #     left_pipette.dispense(amt_final_buffer_to_add, final_tube_rack.wells()[i].bottom(0.2), 0.25)
+        #     left_pipette.blow_out(final_tube_rack.wells()[i].top(-2))
+        check_tips()
+        time_elasped = clock.now() - start_time
+        if protocol.params.incubation_time == 0:
         
-        protocol.pause("""Tell me when to stop!! (overnight incubation time)""")
-    else:
-        delay(protocol.params.incubation_time * 60 * 60 - time_elasped, msg="Incubation at 37°C for " + str(protocol.params.incubation_time) + " hours")
+            protocol.pause("""Tell me when to stop!! (overnight incubation time)""")
+        else:
+            delay(protocol.params.incubation_time * 60 * 60 - time_elasped, msg="Incubation at 37°C for " + str(protocol.params.incubation_time) + " hours")
+            clock.end_incubation("digestion")
 
-    # protocol.delay(minutes=1/6 if protocol.params.dry_run else 240, msg="4 hour incubation at 37°C (10 seconds for dry run)")
-    hs_mod.deactivate_shaker()
-    hs_mod.deactivate_heater()
-    hs_mod.open_labware_latch()
-    # protocol.pause('''Remove the lid and place on magnetic block''')
-    try:
-        protocol.move_labware(lid, "C3", use_gripper=True)
-    except Exception  as e:
-        protocol.pause("move lid to C3")
-    protocol.move_labware(reagent_plate, magnetic_block, use_gripper=True)
+        # protocol.delay(minutes=1/6 if protocol.params.dry_run else 240, msg="4 hour incubation at 37°C (10 seconds for dry run)")
+        hs_mod.deactivate_shaker()
+        hs_mod.deactivate_heater()
+        hs_mod.open_labware_latch()
+        # protocol.pause('''Remove the lid and place on magnetic block''')
+        try:
+            protocol.move_labware(lid, "C3", use_gripper=True)
+        except Exception  as e:
+            protocol.pause("move lid to C3")
+        protocol.move_labware(reagent_plate, magnetic_block, use_gripper=True)
+        journal.record("digestion", run_state())
     protocol.comment(
         "\nRecovering the microparticles on magnetic separator and aspirating the supernatant containing peptides with a pipette"
     )
@@ -1472,6 +2789,8 @@ def run(protocol: protocol_api.ProtocolContext):
     
     if num_samples<=24:
         for i in range(0, num_samples):
+            if journal.column_done("collection", i):
+                continue
             # left_pipette.pick_up_tip()
             pick_up(left_pipette)
             left_pipette.aspirate(
@@ -1488,9 +2807,12 @@ def run(protocol: protocol_api.ProtocolContext):
             left_pipette.touch_tip()
             # left_pipette.return_tip()
             remove_tip(left_pipette, protocol.params.dry_run)
+            journal.record("collection", run_state(), column=i)
         
     else:
         for i in range (0, math.ceil(num_samples/8)):
+            if journal.column_done("collection", i):
+                continue
             pick_up(right_pipette)
             right_pipette.aspirate(
                 amt_of_sample_to_collect,
@@ -1506,14 +2828,44 @@ def run(protocol: protocol_api.ProtocolContext):
             right_pipette.blow_out(final_tube_rack["A" + str(i+1)].top(-2))
             right_pipette.touch_tip()
             remove_tip(right_pipette, protocol.params.dry_run)
+            journal.record("collection", run_state(), column=i)
         
     add_formic_acid = True
-    if add_formic_acid:
-        for i in range(0, num_samples):
-            # protocol.comment("hi")
+    if add_formic_acid and not journal.done("formic_acid"):
+        if num_samples > 24:
+            # spreading the formic acid from H12 over column 12 so it can be stamped with the 8 channel
             pick_up(left_pipette)
-            left_pipette.aspirate(5, formic_acid_storage.bottom(0.1), 0.2)
-            left_pipette.dispense(5, final_tube_rack.wells()[i].bottom(0.25), 0.2)
+            for i in range(0, 7):
+                left_pipette.aspirate(formic_acid_per_well_amt, formic_acid_storage.bottom(0.1), 0.2)
+                left_pipette.dispense(formic_acid_per_well_amt, digestion_buffer_reservoir.wells()[88 + i].bottom(0.5), 0.2)
+                left_pipette.blow_out(digestion_buffer_reservoir.wells()[88 + i].top(-2))
             remove_tip(left_pipette, protocol.params.dry_run)
+            # one tip per column since the tips touch the peptide solution
+            for i in range(0, math.ceil(num_samples / 8)):
+                pick_up(right_pipette)
+                right_pipette.aspirate(formic_acid_per_sample_amt, digestion_buffer_reservoir["A12"].bottom(0.1), 0.2)
+                right_pipette.dispense(formic_acid_per_sample_amt, final_tube_rack["A" + str(i + 1)].bottom(0.25), 0.2)
+                remove_tip(right_pipette, protocol.params.dry_run)
+        else:
+            # multi dispensing just above the eluate of each tube, so the acid lands in it without the
+            # tip touching it, with a new tip for every aspiration
+            eluate = amt_of_sample_to_collect + amt_final_buffer_to_add
+            for i in range(0, num_samples, formic_acid_tubes_per_aspirate):
+                tubes = final_tube_rack.wells()[i:min(i + formic_acid_tubes_per_aspirate, num_samples)]
+                pick_up(left_pipette, "formic acid")
+                left_pipette.aspirate(
+                    formic_acid_per_sample_amt * len(tubes) + 5, formic_acid_storage.bottom(0.1), 0.2
+                )
+                for tube in tubes:
+                    left_pipette.dispense(
+                        formic_acid_per_sample_amt, above_liquid(tube, formic_acid_per_sample_amt, eluate), 0.2
+                    )
+                left_pipette.blow_out(formic_acid_storage.top(-2))
+                remove_tip(left_pipette, protocol.params.dry_run)
+        journal.record("formic_acid", run_state())
+    journal.finish()
     # pick_up(left_pipette)
     # pick_up(left_pipette)
+    sheet.finish(protocol)
+    optimiser.finish(protocol)
+    clock.report(protocol)
@@ -0,0 +1,379 @@
+"""
+Per-well liquid tracking for a simulated run.
+
+Every protocol is simulated and its aspirates, dispenses and blow outs are turned into volume
+changes, which are applied in bulk to one NumPy array of well volumes. Flags:
+underflow: a well is aspirated below empty
+overflow: a well is filled over its maximum volume
+dead volume: a source is aspirated below the volume the tip can't reach (see dead_volumes)
+unloaded: a well is aspirated from before anything was loaded or dispensed into it
+carryover: a tip that dispensed into a well holding liquid it didn't bring goes on to touch the
+liquid of a well that doesn't hold that liquid. Every loaded well is a liquid of its own (empty
+tubes loaded with 1 µL aren't) and the liquids are followed through the tips. A tip touches a
+well's liquid when it aspirates or dispenses below the surface, taken as the well's depth times
+the fraction of its maximum volume it holds. This is what lets a reagent addition that dispenses
+from above keep one tip
+Each problem is printed with the index of the offending command in the run log.
+
+load_liquid volumes are what the wells hold at the start of the run, wherever run() loads them.
+When a well is loaded more than once the last volume counts.
+
+Usage: python liquid_sim.py [protocol.py ...] [-L labware_dir] [name=value ...]
+name=value sets the default of a runtime parameter, e.g. numSamples=96
+"""
+
+import sys
+import io
+import os
+import time
+import numpy as np
+from opentrons import simulate
+from opentrons import types
+from opentrons import protocol_api
+from command_check import protocols, protocol_source
+
+# µL left in a well that the tip can't reach, by labware load name
+dead_volumes = {
+    "nest_12_reservoir_15ml": 1500,  # the protocols plan on 10.5 mL out of 12 mL per well
+    "opentrons_10_tuberack_falcon_4x50ml_6x15ml_conical": 500,
+    "opentrons_24_tuberack_eppendorf_1.5ml_safelock_snapcap": 20,
+}
+tolerance = 1e-6  # µL, rounding in the protocol's volume maths
+empty_load = 1  # µL, the protocols load empty tubes with this much so they show on the deck map
+max_listed = 10  # problems printed per kind
+
+
+class LiquidTracker:
+    """
+    Volume changes of every well in a run, applied with NumPy
+    Wells are numbered in the order their labware is first seen, so each labware is a slice
+    of the volume arrays
+    """
+
+    def __init__(self):
+        self.labware = []  # (labware, first well number)
+        self.wells = {}  # (id(labware), well name): well number
+        self.names = []
+        self.max_volumes = []
+        self.depths = []
+        self.dead_volumes = []
+        self.columns = []  # well numbers of the column each well is in
+        # one entry per volume change
+        self.commands = []  # command index in the run log
+        self.numbers = []  # well number
+        self.deltas = []  # µL, + into the well
+        self.heights = []  # mm of the tip above the well bottom, nan when it can't touch the liquid
+        self.tips = []  # tip the change was made with, -1 for loads
+        self.dispensed = []  # True for dispenses, blow outs are left out
+        self.channels = []  # (first channel, number of channels) of the tip in the well
+        self.loaded = set()  # well numbers that load_liquid was used on
+        self.empty = set()  # well numbers loaded with a placeholder for an empty tube
+
+    def well_number(self, well):
+        key = (id(well.parent), well.well_name)
+        if key not in self.wells:
+            labware = well.parent
+            self.labware.append((labware, len(self.names)))
+            dead = dead_volumes.get(labware.load_name, 0)
+            for w in labware.wells():
+                self.wells[(id(labware), w.well_name)] = len(self.names)
+                self.names.append(w.well_name + " of " + labware.name)
+                self.max_volumes.append(w.max_volume)
+                self.depths.append(w.depth)
+                self.dead_volumes.append(dead)
+            self.columns.extend([None] * len(labware.wells()))
+            for column in labware.columns():
+                numbers = [self.wells[(id(labware), w.well_name)] for w in column]
+                for number in numbers:
+                    self.columns[number] = numbers
+        return self.wells[key]
+
+    def targets(self, instrument, location):
+        """
+        Get's the wells the nozzles of a pipette reach
+        Location: Well, Location or anything else (trash)
+        Return: [(well number, number of channels in it)], empty when it isn't a well
+        """
+        if isinstance(location, types.Location):
+            if not location.labware.is_well:
+                return []
+            location = location.labware.as_well()
+        if not isinstance(location, protocol_api.Well):
+            return []
+        channels = instrument.active_channels if instrument is not None else 1
+        if channels == 1:
+            return [(self.well_number(location), 1)]
+        number = self.well_number(location)
+        column = self.columns[number]
+        if len(column) == 1:  # reservoir, all the channels in one well
+            return [(number, channels)]
+        row = column.index(number)
+        return [(well, 1) for well in column[row : row + channels]]
+
+    @staticmethod
+    def height(location, default):
+        """
+        Get's how high above the well bottom the tip goes
+        Default: mm used when the location is a well, the pipette's clearance
+        Return: mm, nan when the location isn't a well or wasn't made from one (see simulate_run)
+        """
+        if isinstance(location, types.Location):
+            return getattr(location, "height_above_bottom", np.nan)
+        if isinstance(location, protocol_api.Well):
+            return default
+        return np.nan
+
+    def change(self, index, targets, volume, height=np.nan, tip=-1, dispensed=False):
+        for i, (number, channels) in enumerate(targets):
+            self.commands.append(index)
+            self.numbers.append(number)
+            self.deltas.append(volume * channels)
+            self.heights.append(height)
+            self.tips.append(tip)
+            self.dispensed.append(dispensed)
+            self.channels.append((i, 1) if channels == 1 else (0, channels))
+
+    def load(self, index, well, volume):
+        number = self.well_number(well)
+        self.loaded.add(number)
+        if volume <= empty_load:
+            self.empty.add(number)
+        self.change(index, [(number, 1)], volume)
+
+    def add_run_log(self, runlog, loads):
+        """
+        Turns the aspirates, dispenses and blow outs of a run into volume changes.
+        The liquid in each tip is followed so blow outs put back what is left in it
+        Loads: [(well, liquid, µL)] from load_liquid
+        """
+        last = {}
+        for well, liquid, volume, _ in loads:
+            last[(id(well.parent), well.well_name)] = (well, volume)
+        for well, volume in last.values():
+            self.load(0, well, volume)
+        in_tip = {}  # id(instrument): µL per channel
+        tips = {}  # id(instrument): tip number
+        picked_up = 0
+        parents = []  # text of the enclosing commands
+        for index, entry in enumerate(runlog):
+            payload = entry["payload"]
+            del parents[entry["level"] :]
+            parents.append(payload["text"])
+            if entry["level"] > 0 and parents[-2].startswith("Air gap"):
+                continue  # aspirating air
+            instrument = payload.get("instrument")
+            if instrument is None:
+                continue
+            tip = in_tip.get(id(instrument), 0)
+            text = payload["text"]
+            volume = payload.get("volume")
+            location = payload.get("location")
+            number = tips.get(id(instrument), -1)
+            if text.startswith("Aspirating"):
+                self.change(
+                    index, self.targets(instrument, location), -volume, self.height(location, 1), number
+                )
+                tip += volume
+            elif text.startswith("Dispensing"):
+                volume = tip if volume is None else min(volume, tip)
+                self.change(
+                    index, self.targets(instrument, location), volume, self.height(location, 1), number, True
+                )
+                tip -= volume
+            elif text.startswith("Blowing out"):
+                self.change(index, self.targets(instrument, location), tip, tip=number)
+                tip = 0
+            elif text.startswith(("Picking up", "Dropping", "Returning")):
+                tip = 0
+                if text.startswith("Picking up"):
+                    tips[id(instrument)] = picked_up
+                    picked_up += 1
+            in_tip[id(instrument)] = tip
+
+    def run(self):
+        """
+        Applies every volume change at once
+        Return: final volume of each well, {kind: [(command index, well number, µL after)]}
+        """
+        commands = np.array(self.commands, dtype=np.int64)
+        numbers = np.array(self.numbers, dtype=np.int64)
+        deltas = np.array(self.deltas, dtype=np.float64)
+        max_volumes = np.array(self.max_volumes, dtype=np.float64)
+        dead = np.array(self.dead_volumes, dtype=np.float64)
+
+        # group the changes by well, in run order within each well
+        order = np.lexsort((np.arange(len(numbers)), numbers))
+        numbers, deltas, commands = numbers[order], deltas[order], commands[order]
+        first = np.ones(len(numbers), dtype=bool)
+        first[1:] = numbers[1:] != numbers[:-1]
+        starts = np.maximum.accumulate(np.where(first, np.arange(len(numbers)), 0))
+        total = np.cumsum(deltas)
+        after = total - total[starts] + deltas[starts]  # running volume of each well
+        filled = np.cumsum(np.maximum(deltas, 0))
+        filled_before = filled - filled[starts] + np.maximum(deltas[starts], 0) - np.maximum(deltas, 0)
+        loaded = np.isin(numbers, list(self.loaded))
+
+        taken = deltas < 0
+        underflow = taken & (after < -tolerance)
+        problems = {
+            "unloaded": underflow & (filled_before <= tolerance) & ~loaded,
+            "underflow": underflow & ((filled_before > tolerance) | loaded),
+            "overflow": (deltas > 0) & (after > max_volumes[numbers] + tolerance),
+            "dead volume": taken & ~underflow & (after < dead[numbers] - tolerance),
+        }
+        final = np.bincount(numbers, weights=deltas, minlength=len(self.names))
+        found = {}
+        for kind, flags in problems.items():
+            # first offending change of each well
+            flagged = np.flatnonzero(flags)
+            _, keep = np.unique(numbers[flagged], return_index=True)
+            flagged = flagged[keep][np.argsort(commands[flagged[keep]], kind="stable")]
+            found[kind] = [(int(commands[i]), int(numbers[i]), float(after[i])) for i in flagged]
+
+        # tips in the liquid, then the liquids every well and tip holds in run order
+        before = after - deltas
+        depths = np.array(self.depths, dtype=np.float64)
+        heights = np.array(self.heights, dtype=np.float64)[order]
+        with np.errstate(invalid="ignore"):
+            touched = (before > tolerance) & (heights < depths[numbers] * before / max_volumes[numbers])
+        tips = np.array(self.tips, dtype=np.int64)[order]
+        dispensed = np.array(self.dispensed, dtype=bool)[order]
+        channels = [self.channels[i] for i in order]
+        origins = {number: frozenset([number]) for number in self.loaded - self.empty}  # well number: loaded wells its liquid came from
+        in_tips = {}  # (tip, channel): loaded wells the liquid on the tip came from
+        dirty = {}  # (tip, channel): (well number, liquids the tip didn't bring) of liquid the tip was dispensed into
+        found["carryover"] = []
+        flagged = set()
+        for i in np.argsort(commands, kind="stable"):
+            tip, number = int(tips[i]), int(numbers[i])
+            if tip < 0:
+                continue
+            first, count = channels[i]
+            held = origins.get(number, frozenset())
+            for key in [(tip, channel) for channel in range(first, first + count)]:
+                if touched[i] and key in dirty and key[0] not in flagged:
+                    well, liquids = dirty[key]
+                    if well != number and not liquids <= held:
+                        flagged.add(key[0])
+                        found["carryover"].append((int(commands[i]), number, well))
+                if touched[i] and dispensed[i] and held - in_tips.get(key, frozenset()):
+                    dirty.setdefault(key, (number, held - in_tips.get(key, frozenset())))
+                if deltas[i] < 0:
+                    in_tips[key] = in_tips.get(key, frozenset()) | held
+                else:
+                    origins[number] = origins.get(number, frozenset()) | in_tips.get(key, frozenset())
+        return final, found
+
+
+def deck_slot(labware):
+    """
+    Get's the deck slot a labware is in, through any module or adapter under it
+    """
+    parent = labware.parent
+    while not isinstance(parent, str):
+        if parent is None or parent is protocol_api.OFF_DECK:
+            return "off deck"
+        parent = parent.parent
+    return parent
+
+
+def simulate_run(path, params, labware_paths):
+    """
+    Simulates a protocol, recording the load_liquid calls. Locations made with a well's top or
+    bottom (and moved from one) carry their height above the well bottom, the labware may have
+    moved by the time the run log is read
+    Return: run log, [(well, liquid, µL, deck slot when it was loaded)]
+    """
+    loads = []
+    load_liquid = protocol_api.Well.load_liquid
+    top = protocol_api.Well.top
+    bottom = protocol_api.Well.bottom
+    move = types.Location.move
+
+    def recording_load_liquid(self, liquid, volume):
+        loads.append((self, liquid, volume, deck_slot(self.parent)))
+        return load_liquid(self, liquid, volume)
+
+    def recording_top(self, z=0.0):
+        location = top(self, z)
+        location.height_above_bottom = self.depth + z
+        return location
+
+    def recording_bottom(self, z=0.0):
+        location = bottom(self, z)
+        location.height_above_bottom = z
+        return location
+
+    def recording_move(self, point):
+        location = move(self, point)
+        if hasattr(self, "height_above_bottom"):
+            location.height_above_bottom = self.height_above_bottom + point.z
+        return location
+
+    protocol_api.Well.load_liquid = recording_load_liquid
+    protocol_api.Well.top = recording_top
+    protocol_api.Well.bottom = recording_bottom
+    types.Location.move = recording_move
+    try:
+        runlog, _ = simulate.simulate(
+            io.StringIO(protocol_source(path, params)),
+            file_name=os.path.basename(path),
+            custom_labware_paths=labware_paths,
+        )
+    finally:
+        protocol_api.Well.load_liquid = load_liquid
+        protocol_api.Well.top = top
+        protocol_api.Well.bottom = bottom
+        types.Location.move = move
+    return runlog, loads
+
+
+def main(args):
+    paths = []
+    params = {}
+    labware_paths = []
+    while args:
+        arg = args.pop(0)
+        if arg == "-L":
+            labware_paths.append(args.pop(0))
+        elif "=" in arg:
+            name, value = arg.split("=", 1)
+            params[name] = value
+        else:
+            paths.append(arg)
+    failed = False
+    for path in paths or protocols:
+        protocol_params = {
+            name: value for name, value in params.items() if 'variable_name="%s"' % name in open(path).read()
+        }
+        runlog, loads = simulate_run(path, protocol_params, labware_paths)
+        start = time.perf_counter()
+        tracker = LiquidTracker()
+        tracker.add_run_log(runlog, loads)
+        final, found = tracker.run()
+        seconds = time.perf_counter() - start
+        print(
+            "%s: %d commands, %d volume changes in %d wells, tracked in %.3f s"
+            % (path, len(runlog), len(tracker.deltas), len(tracker.names), seconds)
+        )
+        for kind, problems in found.items():
+            if kind != "unloaded" and problems:
+                failed = True
+            for index, number, volume in problems[:max_listed]:
+                if kind == "carryover":
+                    print(
+                        "    %s: command %d (%s) touches %s with a tip that was in %s"
+                        % (kind, index, runlog[index]["payload"]["text"], tracker.names[number], tracker.names[volume])
+                    )
+                    continue
+                print(
+                    "    %s: command %d (%s) leaves %s at %.1f uL"
+                    % (kind, index, runlog[index]["payload"]["text"], tracker.names[number], volume)
+                )
+            if len(problems) > max_listed:
+                print("    %s: %d more wells" % (kind, len(problems) - max_listed))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,127 @@
+"""
+Pre-run loading sheet for a protocol.
+
+The protocol is simulated and every load_liquid of the run is collected. Reagent sources are
+loaded by the protocol's LoadingSheet with what the planned transfers take out of them plus the
+dead volume, so the volumes are exact for the chosen parameters. Writes a CSV and a printable
+HTML deck map next to each other.
+
+Usage: python loading_sheet.py [protocol.py ...] [-L labware_dir] [-o output_dir] [name=value ...]
+name=value sets the default of a runtime parameter, e.g. number_samples=96
+"""
+
+import sys
+import os
+import csv
+import html
+from command_check import protocols
+from liquid_sim import simulate_run
+
+deck_rows = ["A", "B", "C", "D"]
+deck_columns = ["1", "2", "3", "4"]  # 4 is the staging area
+
+
+def sheet_rows(loads):
+    """
+    Get's one row per loaded well, the last load of a well counts
+    Return: [{slot, labware, well, liquid, volume, color}] in deck order
+    """
+    rows = {}
+    for well, liquid, volume, slot in loads:
+        rows[(id(well.parent), well.well_name)] = {
+            "slot": slot,
+            "labware": well.parent.name,
+            "well": well.well_name,
+            "liquid": liquid.name,
+            "volume": round(volume, 1),
+            "color": liquid.display_color,
+        }
+    return sorted(
+        rows.values(),
+        key=lambda r: (r["slot"], r["labware"], int(r["well"][1:]), r["well"][0]),
+    )
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Slot", "Labware", "Well", "Liquid", "Volume (uL)"])
+        for r in rows:
+            writer.writerow([r["slot"], r["labware"], r["well"], r["liquid"], r["volume"]])
+
+
+def write_html(path, title, rows):
+    """
+    Writes the deck as a grid of slots, each listing the wells to fill and a total per liquid
+    """
+    cells = {}
+    for r in rows:
+        cells.setdefault(r["slot"], []).append(r)
+    totals = {}
+    for r in rows:
+        totals[r["liquid"]] = totals.get(r["liquid"], 0) + r["volume"]
+    out = [
+        "<!DOCTYPE html><html><head><meta charset='utf-8'><title>%s</title>" % html.escape(title),
+        "<style>body{font-family:sans-serif}table{border-collapse:collapse}"
+        "td{border:1px solid #444;vertical-align:top;width:14em;height:8em;padding:4px}"
+        ".slot{font-weight:bold}.swatch{display:inline-block;width:.8em;height:.8em;"
+        "margin-right:4px;border:1px solid #444}@media print{body{margin:0}}</style>",
+        "</head><body><h2>%s</h2><table>" % html.escape(title),
+    ]
+    for row in deck_rows:
+        out.append("<tr>")
+        for column in deck_columns:
+            slot = row + column
+            out.append("<td><div class='slot'>%s</div>" % slot)
+            labware = None
+            for r in cells.get(slot, []):
+                if r["labware"] != labware:
+                    labware = r["labware"]
+                    out.append("<div><i>%s</i></div>" % html.escape(labware))
+                out.append(
+                    "<div><span class='swatch' style='background:%s'></span>%s %s %.1f &micro;L</div>"
+                    % (r["color"], r["well"], html.escape(r["liquid"]), r["volume"])
+                )
+            out.append("</td>")
+        out.append("</tr>")
+    out.append("</table><h3>Totals</h3><table>")
+    for liquid, volume in sorted(totals.items()):
+        out.append("<tr><td>%s</td><td>%.1f &micro;L</td></tr>" % (html.escape(liquid), volume))
+    out.append("</table></body></html>")
+    with open(path, "w") as f:
+        f.write("\n".join(out))
+
+
+def main(args):
+    paths = []
+    params = {}
+    labware_paths = []
+    output_dir = "."
+    while args:
+        arg = args.pop(0)
+        if arg == "-L":
+            labware_paths.append(args.pop(0))
+        elif arg == "-o":
+            output_dir = args.pop(0)
+        elif "=" in arg:
+            name, value = arg.split("=", 1)
+            params[name] = value
+        else:
+            paths.append(arg)
+    for path in paths or protocols:
+        protocol_params = {
+            name: value for name, value in params.items() if 'variable_name="%s"' % name in open(path).read()
+        }
+        _, loads = simulate_run(path, protocol_params, labware_paths)
+        rows = sheet_rows(loads)
+        name = os.path.splitext(os.path.basename(path))[0]
+        write_csv(os.path.join(output_dir, name + "_loading_sheet.csv"), rows)
+        write_html(os.path.join(output_dir, name + "_loading_sheet.html"), name + " loading sheet", rows)
+        print("%s: %d wells to load" % (path, len(rows)))
+        for r in rows:
+            print("    %s %s %s: %s %.1f uL" % (r["slot"], r["labware"], r["well"], r["liquid"], r["volume"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -6,7 +6,14 @@ metadata = {
 requirements = {"robotType": "Flex", "apiLevel": "2.20"}
 import math
 from opentrons import protocol_api
+from opentrons import types
+import inspect
+import functools
+import itertools
+import csv
+import io
 
+# copy of get_vol_50ml_falcon in bradford_final.py, edit it there and run shared_check.py -w
 def get_vol_50ml_falcon(height):
     """
     Get's the volume of the liquid in the tube
@@ -15,6 +22,7 @@ def get_vol_50ml_falcon(height):
     """
     volume = (1000 * (height - 9)) / 1.8
     return volume
+# copy of get_height_50ml_falcon in bradford_final.py, edit it there and run shared_check.py -w
 def get_height_50ml_falcon(volume):
     """
     Get's the height of the liquid in the tube
@@ -35,6 +43,7 @@ def get_height_15ml_falcon(volume):
         return -3.33 * (volume**2) + 15.45 * volume + 9.50 - 1  # −3.33x2+15.45x+9.50
     else:
         return 6.41667 * volume + 15.1667 - 5
+# copy of get_vol_15ml_falcon in bradford_final.py, edit it there and run shared_check.py -w
 def get_vol_15ml_falcon(height):
     """
     Get's the volume of the liquid in the tube
@@ -48,6 +57,1366 @@ def get_vol_15ml_falcon(height):
         volume = ((height - 10.1667) / 6.41667) * 1000
         return volume
 
+# copy of plan_dispense_order in bradford_final.py, edit it there and run shared_check.py -w
+def plan_dispense_order(source, targets):
+    """
+    Orders the wells filled from one aspiration so the gantry travels the least, starting and
+    ending at the well it aspirates from (nearest neighbour, then 2-opt). Only used for
+    dispenses into empty wells, where the order can't carry anything between wells
+    Source: well the pipette aspirates from
+    Targets: wells filled from one aspiration
+    Return: reordered targets, mm travelled in the original order, mm travelled in the new order
+    """
+    points = [source.top().point] + [well.top().point for well in targets]
+
+    def dist(a, b):
+        return math.hypot(points[a].x - points[b].x, points[a].y - points[b].y)
+
+    def tour_length(order):
+        path = [0] + order + [0]
+        return sum(dist(path[k], path[k + 1]) for k in range(0, len(path) - 1))
+
+    original = list(range(1, len(points)))
+    order = []
+    remaining = list(original)
+    current = 0
+    while remaining:
+        current = min(remaining, key=lambda k: dist(current, k))
+        order.append(current)
+        remaining.remove(current)
+    improved = True
+    while improved:
+        improved = False
+        for a in range(0, len(order) - 1):
+            for b in range(a + 1, len(order)):
+                candidate = order[:a] + order[a:b + 1][::-1] + order[b + 1:]
+                if tour_length(candidate) < tour_length(order) - 0.01:
+                    order = candidate
+                    improved = True
+    before = tour_length(original)
+    after = tour_length(order)
+    if after >= before:
+        return list(targets), before, before
+    return [targets[k - 1] for k in order], before, after
+
+
+# copy of travel_report in bradford_final.py, edit it there and run shared_check.py -w
+def travel_report(before, after, speed=300):
+    """
+    Before/After: mm travelled between dispenses before and after ordering
+    Speed: average gantry speed in mm/s
+    Return: message for the run log
+    """
+    return (
+        "Dispense travel: " + str(round(before)) + " mm -> " + str(round(after)) + " mm (about "
+        + str(round(before / speed)) + " s -> " + str(round(after / speed)) + " s)"
+    )
+
+
+# copy of find_aspirate_height in bradford_final.py, edit it there and run shared_check.py -w
+def find_aspirate_height(pip, source_well):
+    """
+    Get's the aspirate height from the liquid level the pipette measures, the tip has to be on
+    Return: mm above the bottom of the well
+    """
+    lld_height = (
+        pip.measure_liquid_height(source_well) - source_well.bottom().point.z
+    )
+    aspirate_height = max(lld_height - 5, 1)
+    return aspirate_height
+
+
+# copy of above_liquid in bradford_final.py, edit it there and run shared_check.py -w
+def above_liquid(well, volume, held=0, clearance=2):
+    """
+    Get's where to dispense a volume so the tip stays clear of the liquid, clearance mm over the
+    surface the well has once the volume is in. The surface is the well's depth times the
+    fraction of its maximum volume it holds, the same as liquid_sim takes it
+    Held: µL already in the well
+    Return: location above the liquid
+    """
+    height = well.depth * (held + volume) / well.max_volume + clearance
+    if height > well.depth - 1:
+        raise ValueError(
+            "%s fills too close to its top for the tip to stay %g mm above the liquid" % (well, clearance)
+        )
+    return well.bottom(height)
+
+
+# copy of dispense_chunks in bradford_final.py, edit it there and run shared_check.py -w
+def dispense_chunks(volumes, max_volume, extra=0):
+    """
+    Splits dispenses of different volumes into multi dispense aspirations, each takes the dispenses
+    in order while they fit in the tip with the extra, the same as TipPlanner costs them
+    Volumes: µL of each dispense, dispenses of 0 are skipped
+    Max_volume: µL the tip holds
+    Return: list of lists of dispense indexes
+    """
+    chunks = []
+    in_tip = 0
+    for i, volume in enumerate(volumes):
+        if volume <= 0:
+            continue
+        if chunks and in_tip + volume + extra <= max_volume:
+            chunks[-1].append(i)
+            in_tip += volume
+            continue
+        chunks.append([i])
+        in_tip = volume
+    return chunks
+
+
+# copy of diluent_columns in bradford_final.py, edit it there and run shared_check.py -w
+def diluent_columns(volumes, min_volume):
+    """
+    Splits the diluent of the samples between the 8 channel and the 1 channel. The 8 channel fills
+    every well of a full column with the smallest volume of the column and the 1 channel tops up the
+    wells that take more. A column with less than 8 samples or a top up too small to pipette is left
+    to the 1 channel
+    Volumes: µL of diluent for each sample, 8 samples to a column
+    Return: [(column, µL per well)] for the 8 channel, µL of each sample for the 1 channel
+    """
+    columns = []
+    left = list(volumes)
+    for column in range(0, len(volumes) // 8):
+        column_vols = volumes[column * 8 : (column + 1) * 8]
+        smallest = min(column_vols)
+        top_ups = [round(volume - smallest, 2) for volume in column_vols]
+        if smallest <= 0 or any(0 < top_up < min_volume for top_up in top_ups):
+            continue
+        columns.append((column, smallest))
+        left[column * 8 : (column + 1) * 8] = top_ups
+    return columns, left
+
+
+# copy of MultiDispense in single_plate_bca.py, edit it there and run shared_check.py -w
+class MultiDispense:
+    """
+    One aspiration dispensed into several wells, made to deliver what one transfer per well does.
+    The plunger's backlash and the film the liquid leaves in the tip are what make a plain multi
+    dispense uneven, so:
+    conditioning: µL dispensed back into the source straight after aspirating, the first dispense
+        then starts with the plunger already moving down like the rest
+    disposal: µL left in the tip after the last dispense and blown out into the source, so the last
+        dispense never empties the tip
+    pre_wet: mixes in the source before the first aspiration of a tip, a tip that mixed in the
+        source already is wet and takes 0
+    corrections: µL added to the dispense at each position of an aspiration, the last entry goes on
+        for the positions past the end. 0 until measured on the robot (dispense_benchmark.py -r)
+    """
+
+    def __init__(self, conditioning=5, disposal=5, pre_wet=2, corrections=(0,)):
+        self.conditioning = conditioning
+        self.disposal = disposal
+        self.pre_wet = pre_wet
+        self.corrections = list(corrections)
+
+    @property
+    def extra(self):
+        """
+        µL aspirated on top of the dispenses
+        """
+        return self.conditioning + self.disposal
+
+    def volumes(self, volume, count):
+        """
+        Get's the corrected volumes of count dispenses from one aspiration
+        """
+        return [volume + self.corrections[min(i, len(self.corrections) - 1)] for i in range(0, count)]
+
+    def chunks(self, targets, volume, max_volume):
+        """
+        Splits the targets into aspirations, each takes as many as fit in the tip with the extra
+        Return: list of lists of targets
+        """
+        chunks = []
+        start = 0
+        while start < len(targets):
+            count = 1
+            while (
+                start + count < len(targets)
+                and sum(self.volumes(volume, count + 1)) + self.extra <= max_volume
+            ):
+                count += 1
+            chunks.append(targets[start:start + count])
+            start += count
+        return chunks
+
+    def fill(self, pipette, source, targets, volume, rate, height=None, aspirate_rate=None, first=True):
+        """
+        Fills the targets from one aspiration with the tip on the pipette
+        Source: well aspirated from, height mm above its bottom (the pipette's default if None)
+        Targets: dispense locations in order
+        Aspirate_rate: flow rate in the source, rate if None
+        First: True for the first aspiration of the tip, which is pre-wet
+        """
+        location = source if height is None else source.bottom(height)
+        aspirate_rate = aspirate_rate or rate
+        volumes = self.volumes(volume, len(targets))
+        aspirate_vol = sum(volumes) + self.extra
+        if first and self.pre_wet:
+            pipette.mix(self.pre_wet, aspirate_vol, location, aspirate_rate)
+        pipette.aspirate(aspirate_vol, location, aspirate_rate)
+        if self.conditioning:
+            pipette.dispense(self.conditioning, location, aspirate_rate)
+        for target, dispense_vol in zip(targets, volumes):
+            pipette.dispense(dispense_vol, target, rate)
+        pipette.blow_out(source.top())
+
+    def dispense(self, pipette, source, targets, volume, rate, max_volume, height=None, aspirate_rate=None):
+        """
+        Fills every target with the tip on the pipette, in as few aspirations as fit in the tip
+        Max_volume: µL the tip holds
+        """
+        for i, chunk in enumerate(self.chunks(targets, volume, max_volume)):
+            self.fill(pipette, source, chunk, volume, rate, height, aspirate_rate, first=i == 0)
+
+
+# copy of CommandOptimiser in bradford_final.py, edit it there and run shared_check.py -w
+class CommandOptimiser:
+    """
+    Peephole pass over the commands as the protocol issues them. Commands that can't change the
+    outcome are dropped before they reach the robot:
+    repeated_blow_out: a blow out at the well the tip was just blown out at (touch tips between are ignored)
+    repeated_touch_tip: a touch tip at the well the tip was just touched off at
+    lazy_latch: heater shaker latch changes are held back until a pipette command, labware move,
+        shake or pause needs the latch, so an open followed by a close with nothing between is never sent
+    repeated_deactivate: turning off a heater or shaker that is already off
+    Enabled: False to send every command as written
+    Rules: names of the rules to apply, all of them by default
+    """
+
+    rule_names = ["repeated_blow_out", "repeated_touch_tip", "lazy_latch", "repeated_deactivate"]
+    pipette_commands = [
+        "aspirate",
+        "dispense",
+        "mix",
+        "blow_out",
+        "touch_tip",
+        "air_gap",
+        "move_to",
+        "pick_up_tip",
+        "drop_tip",
+        "return_tip",
+    ]
+
+    def __init__(self, enabled=True, rules=None):
+        self.enabled = enabled
+        self.rules = set(self.rule_names if rules is None else rules)
+        self.removed = {}  # command name: number of times it was dropped
+        self.tips = {}  # id(pipette): where the tip was blown out and touched off
+        self.latches = {}  # id(module): latch state sent and wanted, and the latch commands
+        self.off = {}  # (id(module), "heater"/"shaker"): True when known to be off
+
+    def skip(self, name):
+        self.removed[name] = self.removed.get(name, 0) + 1
+
+    def well_key(self, location):
+        """
+        Get's the well a command happens at
+        Location: Well, Location or anything else (trash)
+        Return: (id(labware), well name) or None when it isn't a well
+        """
+        if isinstance(location, types.Location):
+            if not location.labware.is_well:
+                return None
+            location = location.labware.as_well()
+        if isinstance(location, protocol_api.Well):
+            return (id(location.parent), location.well_name)
+        return None
+
+    def _wrap(self, obj, name, handler):
+        """
+        Replaces obj.name with handler(method, args, kwargs, bound arguments)
+        """
+        method = getattr(obj, name)
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapped(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return handler(method, args, kwargs, bound.arguments)
+
+        setattr(obj, name, wrapped)
+
+    def pipette_command(self, pipette, name):
+        tip = self.tips.setdefault(id(pipette), {"current": None, "blown_out": None, "touched": None})
+
+        def handler(method, args, kwargs, a):
+            if "location" in a and a["location"] is not None:
+                key = self.well_key(a["location"])
+            elif name in ["pick_up_tip", "drop_tip", "return_tip"]:
+                key = None
+            else:  # staying where it is
+                key = tip["current"]
+            if key is not None:
+                if name == "blow_out" and "repeated_blow_out" in self.rules and tip["blown_out"] == key:
+                    self.skip(name)
+                    return pipette
+                if name == "touch_tip" and "repeated_touch_tip" in self.rules and tip["touched"] == key:
+                    self.skip(name)
+                    return pipette
+            self.sync_latches()  # the pipette can't go to the heater shaker with the latch open
+            result = method(*args, **kwargs)
+            tip["current"] = key
+            if name == "blow_out":
+                tip["blown_out"] = key
+                tip["touched"] = None
+            elif name == "touch_tip":
+                tip["touched"] = key
+            else:
+                tip["blown_out"] = None
+                tip["touched"] = None
+            return result
+
+        return handler
+
+    def latch_command(self, module, state):
+        latch = self.latches.setdefault(id(module), {"sent": None, "wanted": None})
+        name = "open_labware_latch" if state == "open" else "close_labware_latch"
+        latch[state] = getattr(module, name)
+
+        def handler(method, args, kwargs, a):
+            latch["wanted"] = state
+            self.skip(name)  # taken back if sync_latches sends it
+            return None
+
+        return handler
+
+    def sync_latches(self):
+        """
+        Sends the latch state each heater shaker has been asked for
+        """
+        for latch in self.latches.values():
+            state = latch["wanted"]
+            if state is not None and state != latch["sent"]:
+                self.removed["open_labware_latch" if state == "open" else "close_labware_latch"] -= 1
+                latch[state]()
+                latch["sent"] = state
+            latch["wanted"] = None
+
+    def synced(self, after=None):
+        """
+        Handler for commands that need the latch in the state it was asked for
+        After: called once the command is done
+        """
+        def handler(method, args, kwargs, a):
+            self.sync_latches()
+            result = method(*args, **kwargs)
+            if after is not None:
+                after()
+            return result
+
+        return handler
+
+    def deactivate_command(self, module, part):
+        def handler(method, args, kwargs, a):
+            if "repeated_deactivate" in self.rules and self.off.get((id(module), part)):
+                self.skip("deactivate_" + part)
+                return None
+            result = method(*args, **kwargs)
+            self.off[(id(module), part)] = True
+            return result
+
+        return handler
+
+    def attach(self, protocol, pipettes=(), modules=()):
+        """
+        Puts the optimiser between the protocol and the robot
+        Does nothing when it isn't enabled
+        """
+        if not self.enabled:
+            return
+        for pipette in pipettes:
+            for name in self.pipette_commands:
+                self._wrap(pipette, name, self.pipette_command(pipette, name))
+        if "lazy_latch" in self.rules:
+            self._wrap(protocol, "move_labware", self.synced())
+            self._wrap(protocol, "pause", self.synced())
+        for module in modules:
+            if not hasattr(module, "open_labware_latch"):
+                continue
+            if "lazy_latch" in self.rules:
+                self._wrap(module, "open_labware_latch", self.latch_command(module, "open"))
+                self._wrap(module, "close_labware_latch", self.latch_command(module, "closed"))
+            shaking = lambda module=module: self.off.update({(id(module), "shaker"): False})
+            heating = lambda module=module: self.off.update({(id(module), "heater"): False})
+            self._wrap(module, "set_and_wait_for_shake_speed", self.synced(after=shaking))
+            self._wrap(module, "set_and_wait_for_temperature", self.synced(after=heating))
+            self._wrap(module, "set_target_temperature", self.synced(after=heating))
+            self._wrap(module, "deactivate_shaker", self.deactivate_command(module, "shaker"))
+            self._wrap(module, "deactivate_heater", self.deactivate_command(module, "heater"))
+
+    def finish(self, protocol):
+        """
+        Sends the held back latch changes and reports what was dropped
+        """
+        if not self.enabled:
+            return
+        self.sync_latches()
+        removed = {name: n for name, n in self.removed.items() if n > 0}
+        protocol.comment(
+            "Command optimiser removed %d commands%s"
+            % (
+                sum(removed.values()),
+                "".join(", %s: %d" % (name, n) for name, n in sorted(removed.items())),
+            )
+        )
+
+
+# copy of LoadingSheet in bradford_final.py, edit it there and run shared_check.py -w
+class LoadingSheet:
+    """
+    Works out how much of each reagent to load from what the run takes out of its source wells.
+    Every aspirate, dispense and blow out at a source is followed, and at the end of the run each
+    source is loaded (load_liquid) with the most the run ever needed out of it plus the volume
+    the tip can't reach. The sheet is printed as comments, one line per source well
+    Simulating: False on the robot, where the liquids were already set up by the analysis
+    (the app and the robot simulate the protocol to analyse it) and nothing is followed
+    """
+
+    # µL left in a well that the tip can't reach, by labware load name
+    dead_volumes = {
+        "nest_12_reservoir_15ml": 1500,
+        "opentrons_10_tuberack_falcon_4x50ml_6x15ml_conical": 500,
+        "opentrons_24_tuberack_eppendorf_1.5ml_safelock_snapcap": 20,
+    }
+
+    def __init__(self, simulating=True):
+        self.simulating = simulating
+        self.sources = {}  # (id(labware), well name): [well, liquid, µL now, lowest µL]
+        self.last_location = {}  # id(pipette): where the pipette last went
+        self.air = False
+
+    def source(self, well, liquid):
+        """
+        Marks a well as a reagent the user loads before the run
+        """
+        self.sources[(id(well.parent), well.well_name)] = [well, liquid, 0.0, 0.0]
+
+    def wells_reached(self, pipette, location):
+        """
+        Get's the source wells the nozzles of a pipette reach
+        Location: Well, Location or anything else (trash)
+        Return: [(source, number of channels in it)]
+        """
+        if isinstance(location, types.Location):
+            if not location.labware.is_well:
+                return []
+            location = location.labware.as_well()
+        if not isinstance(location, protocol_api.Well):
+            return []
+        channels = pipette.active_channels
+        column = location.parent.columns_by_name()[location.well_name[1:]]
+        if channels == 1 or len(column) == 1:  # one well, or a reservoir taking every channel
+            wells = [(location, channels)]
+        else:
+            row = [well.well_name for well in column].index(location.well_name)
+            wells = [(well, 1) for well in column[row : row + channels]]
+        reached = []
+        for well, n in wells:
+            key = (id(well.parent), well.well_name)
+            if key in self.sources:
+                reached.append((self.sources[key], n))
+        return reached
+
+    def _followed(self, pipette, name):
+        method = getattr(pipette, name)
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def followed(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            location = bound.arguments.get("location")
+            if location is None:
+                location = self.last_location.get(id(pipette))
+            if name == "air_gap":
+                self.air = True
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    self.air = False
+            before = pipette.current_volume if pipette.has_tip else 0
+            result = method(*args, **kwargs)
+            after = pipette.current_volume if pipette.has_tip else 0
+            self.last_location[id(pipette)] = location
+            if not self.air:
+                for source, channels in self.wells_reached(pipette, location):
+                    source[2] += (before - after) * channels
+                    source[3] = min(source[3], source[2])
+            return result
+
+        setattr(pipette, name, followed)
+
+    def attach(self, pipettes):
+        """
+        Follows the liquid the pipettes move, attach before anything that skips commands
+        """
+        if not self.simulating:
+            return
+        for pipette in pipettes:
+            for name in ["aspirate", "dispense", "blow_out", "air_gap"]:
+                self._followed(pipette, name)
+
+    def finish(self, protocol):
+        """
+        Loads every source with what the run needed and prints the loading sheet
+        """
+        if not self.simulating:
+            return
+        protocol.comment("\n---------------Loading Sheet----------------\n\n")
+        for well, liquid, _, lowest in sorted(
+            self.sources.values(), key=lambda s: (str(s[0].parent), s[0].well_name)
+        ):
+            if lowest >= 0:
+                continue  # not used in this run
+            volume = math.ceil(-lowest + self.dead_volumes.get(well.parent.load_name, 0))
+            well.load_liquid(liquid, volume)
+            protocol.comment(
+                "%s %s: %s %d uL" % (well.parent, well.well_name, liquid.name, volume)
+            )
+
+
+# copy of TipPlanner in bradford_final.py, edit it there and run shared_check.py -w
+class TipPlanner:
+    """
+    Transfer-cost model that picks the pipette and tip size for each group of transfers and lays
+    out the tip racks for the run. A group is one step of the protocol, given as the volumes it
+    dispenses. Every way of doing a group (1 or 8 channel pipette, 200 or 1000 µL tips) is costed
+    as the predicted seconds of its aspirations, dispenses and tip changes plus what the tips it
+    uses are worth in seconds. Dispenses below the volume a tip is accurate for are costed as a
+    penalty, so the smallest tip is used for them when no tip is accurate
+    Slots: deck slots for the tip racks in use, each holds one tip size
+    Staging_slots: slots for the racks that replace the empty ones
+    Max_swaps: most rack swaps the run can do, None when the staging racks are refilled
+    """
+
+    tip_racks = {
+        200: "opentrons_flex_96_filtertiprack_200uL",
+        1000: "opentrons_flex_96_filtertiprack_1000uL",
+    }
+    max_volume = {200: 195, 1000: 995}  # µL per aspiration, 5 µL is kept for the blow out
+    min_volume = {200: 5, 1000: 50}  # µL, smallest dispense the tip is accurate for
+    tip_value = {200: 4.0, 1000: 6.0}  # s of run time one tip is worth
+    inaccurate_time = 60.0  # s, penalty for each dispense below the tip's min_volume
+    aspirate_time = 2.5  # s, moving to the source and aspirating
+    dispense_time = 2.0  # s, moving to the well and dispensing
+    tip_time = 9.0  # s, picking up and dropping a tip
+    rack_time = 50.0  # s, the gripper swapping an empty rack for a staging rack
+
+    def __init__(self, slots, staging_slots=(), sizes=(200, 1000), max_swaps=None):
+        self.slots = list(slots)
+        self.staging_slots = list(staging_slots)
+        self.sizes = list(sizes)
+        self.max_swaps = max_swaps
+        self.groups = []
+        self.choices = {}  # group name: chosen way of doing it, see cost
+        self.layout = {}  # slot: tip size
+        self.staging = {}  # staging slot: tip size
+
+    def add(
+        self,
+        name,
+        volumes,
+        channels=(1,),
+        multi_dispense=False,
+        extra=0,
+        tips=1,
+        aspirations_per_tip=None,
+        dispenses_per_source=None,
+    ):
+        """
+        Adds a group of transfers to the plan
+        Volumes: µL of each dispense in order. For the 8 channel they are per well, 8 wells in a row are one dispense
+        Channels: pipettes the protocol can do the group with, 1 and/or 8
+        Multi_dispense: True when one aspiration fills as many dispenses as fit in the tip
+        Extra: µL aspirated on top of every aspiration
+        Tips: tips picked up for the group, 0 when it keeps the tip of the group before
+        Aspirations_per_tip: the tip is changed after this many aspirations instead
+        Dispenses_per_source: the dispenses come in runs of this many from one source, an aspiration never spans two
+        """
+        self.groups.append(
+            {
+                "name": name,
+                "volumes": list(volumes),
+                "channels": list(channels),
+                "multi_dispense": multi_dispense,
+                "extra": extra,
+                "tips": tips,
+                "aspirations_per_tip": aspirations_per_tip,
+                "dispenses_per_source": dispenses_per_source,
+            }
+        )
+
+    def cost(self, group, channels, size):
+        """
+        Get's the predicted cost of a group done with one pipette and tip size
+        Return: {channels, size, max_volume, aspirations, tips, seconds, cost}
+        """
+        volumes = group["volumes"]
+        if channels == 8:
+            volumes = [max(volumes[i : i + 8]) for i in range(0, len(volumes), 8)]
+        inaccurate = sum(1 for volume in volumes if 0 < volume < self.min_volume[size])
+        max_volume = self.max_volume[size]
+        run = group["dispenses_per_source"] or len(volumes)
+        aspirations = 0
+        in_tip = None
+        for i, volume in enumerate(volumes):
+            if (
+                group["multi_dispense"]
+                and i % run != 0
+                and in_tip + volume + group["extra"] <= max_volume
+            ):
+                in_tip += volume
+                continue
+            aspirations += math.ceil((volume + group["extra"]) / max_volume)
+            in_tip = volume
+        dispenses = max(len(volumes), aspirations)
+        if group["aspirations_per_tip"] is None:
+            pick_ups = group["tips"]
+        else:
+            pick_ups = math.ceil(aspirations / group["aspirations_per_tip"])
+        seconds = (
+            aspirations * self.aspirate_time
+            + dispenses * self.dispense_time
+            + pick_ups * self.tip_time
+        )
+        return {
+            "channels": channels,
+            "size": size,
+            "max_volume": max_volume,
+            "aspirations": aspirations,
+            "tips": pick_ups * channels,
+            "seconds": seconds,
+            "cost": (
+                seconds
+                + pick_ups * channels * self.tip_value[size]
+                + inaccurate * self.inaccurate_time
+            ),
+        }
+
+    def rack_layout(self, tips):
+        """
+        Get's the slots for each tip size, the size using the most tips gets the spare slots
+        Tips: {tip size: tips used}
+        Return: {slot: tip size}, {staging slot: tip size}, number of rack swaps
+        """
+        sizes = sorted(tips, key=lambda size: -tips[size])
+        layout = {}
+        for i, slot in enumerate(self.slots):
+            layout[slot] = sizes[i] if i < len(sizes) else sizes[0]
+        needed = {
+            size: max(math.ceil(tips[size] / 96) - list(layout.values()).count(size), 0)
+            for size in sizes
+        }
+        staging = {}
+        for slot in self.staging_slots:
+            size = max(sizes, key=lambda size: needed[size])
+            if needed[size] == 0:
+                size = sizes[0]
+            staging[slot] = size
+            needed[size] = max(needed[size] - 1, 0)
+        swaps = sum(
+            max(math.ceil(tips[size] / 96) - list(layout.values()).count(size), 0)
+            for size in sizes
+        )
+        return layout, staging, swaps
+
+    def plan(self):
+        """
+        Picks the pipette and tip size of every group. Every set of tip sizes that fits in the
+        slots is tried, the cheapest one that needs no more rack swaps than the run can do is kept
+        """
+        best = None
+        for n in range(1, len(self.slots) + 1):
+            for sizes in itertools.combinations(self.sizes, n):
+                choices = {}
+                for group in self.groups:
+                    options = [
+                        self.cost(group, channels, size)
+                        for channels in group["channels"]
+                        for size in sizes
+                    ]
+                    choices[group["name"]] = min(options, key=lambda option: option["cost"])
+                tips = {size: 0 for size in sizes}
+                for choice in choices.values():
+                    tips[choice["size"]] += choice["tips"]
+                if 0 in tips.values() and len(sizes) > 1:
+                    continue  # the same as a smaller set of sizes
+                layout, staging, swaps = self.rack_layout(tips)
+                total = sum(choice["cost"] for choice in choices.values())
+                total += swaps * self.rack_time
+                over = self.max_swaps is not None and swaps > self.max_swaps
+                if best is None or (over, total) < best[0]:
+                    best = ((over, total), choices, layout, staging)
+        _, self.choices, self.layout, self.staging = best
+
+    def choice(self, name):
+        return self.choices[name]
+
+    def slots_for(self, size):
+        return [slot for slot, slot_size in self.layout.items() if slot_size == size]
+
+    def report(self, protocol):
+        """
+        Prints the chosen pipettes and the tip rack layout for the operator
+        """
+        protocol.comment("\n---------------Tip Plan----------------\n\n")
+        tips = {}
+        for name, choice in self.choices.items():
+            tips[choice["size"]] = tips.get(choice["size"], 0) + choice["tips"]
+            protocol.comment(
+                "%s: %d-channel, %d uL tips, %d aspirations, %d tips, about %d s"
+                % (
+                    name,
+                    choice["channels"],
+                    choice["size"],
+                    choice["aspirations"],
+                    choice["tips"],
+                    choice["seconds"],
+                )
+            )
+        for slot, size in list(self.layout.items()) + list(self.staging.items()):
+            protocol.comment(
+                "Tip rack %s: %d uL%s" % (slot, size, " (staging)" if slot in self.staging else "")
+            )
+        for size, n in sorted(tips.items()):
+            protocol.comment("Planned steps use %d tips of %d uL" % (n, size))
+
+
+# copy of AssayCompiler in bradford_final.py, edit it there and run shared_check.py -w
+class AssayCompiler:
+    """
+    Turns a declarative assay description into the standard tubes, the assay plate layout and the
+    pipetting steps that fill them. The BCA and Bradford protocols share this class, so a change to
+    how a step is planned or run lands in every assay. The steps pick up and drop their tips with
+    load_tips, the protocol's run() only says which labware and volumes they work on
+    Assay: {
+        name: shown in the run comments
+        standards: concentrations of the standard tubes, highest first
+        stock: concentration of the stock the standards are made from
+        dilution: "direct" when every tube is made from the stock, "serial" when each is made from the tube before
+        serial_from: tube that is diluted further when a direct volume is too small to pipette, None to not
+        blank: True to add a blank row after the standards
+        replicates: columns each standard and sample is put in
+        sample_volume: µL of standard, blank or sample per well
+        standard_extra: µL made of each standard on top of what the plates take
+        standard_min: smallest µL made of each standard
+        samples_per_plate: most samples on one plate, None to fill the plate
+        share_standards: True to put the standards on the first plate only when that takes fewer plates
+        max_plates: most assay plates the deck takes
+        reagent_volume: µL of working reagent per well
+        reagent_rate: aspirate rate of the working reagent
+        temperature: heater shaker °C, None for room temperature
+        shake_speed: rpm the reagent is mixed at
+        shake_minutes: minutes the reagent is mixed for
+        incubation_minutes: minutes the plate incubates after mixing
+        wavelength: nm the plate is read at
+        units: units of the standard concentrations
+        curve_degree: degree of the polynomial fitted to the standards, 1 for a straight line
+    }
+    """
+
+    rows = ["A", "B", "C", "D", "E", "F", "G", "H"]
+    min_volume = 5  # µL, smallest volume the protocols pipette
+    reagent_well_volume = 10500  # µL of working reagent used from each reservoir well
+    reagent_extra = 1000  # µL of working reagent loaded on top of what the plates take
+
+    stock_plate_samples = 48  # samples on a stock plate that are diluted, their dilutions take the other half
+
+    def __init__(self, assay, number_samples):
+        self.assay = dict(assay)
+        self.number_samples = number_samples
+        self.protocol = None
+        self.planner = None
+        self.dry_run = False
+        self.tips = []  # racks in use, the first is swapped for a staging rack when it runs out
+        self.staging_racks = []
+        self.chute = None
+        self.falcon_volumes = {}  # (id(labware), well name): µL left in a falcon
+        self.compile()
+
+    def compile(self):
+        """
+        Works out the plate layout, the standard tube volumes and the working reagent from the description
+        """
+        assay = self.assay
+        replicates = assay["replicates"]
+        standard_rows = len(assay["standards"]) + (1 if assay["blank"] else 0)
+        if standard_rows > len(self.rows):
+            raise ValueError("%s has more standards than rows on a plate" % assay["name"])
+
+        # LAYOUT
+        # the standards take the first replicates columns of a plate, the samples the rest. Either
+        # every plate has its own standards, or the first plate's are shared and the plates after it
+        # are all samples, which is only done when it takes fewer plates
+        self.sample_columns_per_plate = (12 - replicates) // replicates  # on a plate with standards
+        full_plate_columns = 12 // replicates  # on a plate without
+        if assay["samples_per_plate"] is not None:
+            self.sample_columns_per_plate = min(
+                self.sample_columns_per_plate, assay["samples_per_plate"] // 8
+            )
+            full_plate_columns = min(full_plate_columns, assay["samples_per_plate"] // 8)
+        self.num_sample_columns = math.ceil(self.number_samples / 8)
+        repeated_plates = max(math.ceil(self.num_sample_columns / self.sample_columns_per_plate), 1)
+        shared_plates = 1 + math.ceil(
+            max(self.num_sample_columns - self.sample_columns_per_plate, 0) / full_plate_columns
+        )
+        self.shared_standards = assay["share_standards"] and shared_plates < repeated_plates
+        self.plate_sample_columns = []  # sample columns (0 based) that go onto each plate
+        column = 0
+        while column < self.num_sample_columns or not self.plate_sample_columns:
+            size = self.sample_columns_per_plate
+            if self.shared_standards and self.plate_sample_columns:
+                size = full_plate_columns
+            self.plate_sample_columns.append(
+                list(range(column, min(column + size, self.num_sample_columns)))
+            )
+            column += size
+        self.num_plates = len(self.plate_sample_columns)
+        if self.num_plates > assay["max_plates"]:
+            raise ValueError(
+                "%d samples in %d replicates need %d %s plates, the deck takes %d"
+                % (self.number_samples, replicates, self.num_plates, assay["name"], assay["max_plates"])
+            )
+        self.standard_plates = [0] if self.shared_standards else list(range(0, self.num_plates))
+        self.plate_columns = [
+            (replicates if plate in self.standard_plates else 0) + len(columns) * replicates
+            for plate, columns in enumerate(self.plate_sample_columns)
+        ]
+        self.num_columns = sum(self.plate_columns)
+
+        # STANDARDS
+        # the standards are made once and loaded onto every plate that has them
+        concentrations = assay["standards"]
+        volume = assay["sample_volume"] * replicates * len(self.standard_plates) + assay["standard_extra"]
+        if assay["dilution"] == "serial":
+            # each tube only keeps what the next dilution leaves in it
+            volume = volume / min(
+                1 - concentrations[i + 1] / concentrations[i] for i in range(0, len(concentrations) - 1)
+            )
+        self.standard_volume = max(math.ceil(volume), assay["standard_min"])
+        self.tubes = []  # {source: None for the stock or the tube it's made from, stock: µL from the source, buffer: µL}
+        for i, concentration in enumerate(concentrations):
+            if assay["dilution"] == "serial" and i > 0:
+                stock = concentration * self.standard_volume / concentrations[i - 1]
+                self.tubes.append({"source": i - 1, "stock": stock, "buffer": self.standard_volume - stock})
+                continue
+            stock = self.standard_volume * concentration / assay["stock"]
+            if concentration == assay["stock"]:
+                if assay["dilution"] == "serial":
+                    stock = 0  # the stock tube is the first standard
+                self.tubes.append({"source": None, "stock": stock, "buffer": 0})
+            elif stock < self.min_volume and assay["serial_from"] is not None:
+                # made from the serial_from tube, which is made bigger to cover it
+                source = assay["serial_from"]
+                stock = stock * assay["stock"] / concentrations[source]
+                self.tubes.append({"source": source, "stock": stock, "buffer": self.standard_volume - stock})
+                self.tubes[source]["extra"] = self.tubes[source].get("extra", 0) + stock
+            else:
+                self.tubes.append({"source": None, "stock": stock, "buffer": self.standard_volume - stock})
+        for i, tube in enumerate(self.tubes):
+            if "extra" in tube:
+                total = self.standard_volume + tube.pop("extra")
+                tube["stock"] = total * concentrations[i] / assay["stock"]
+                tube["buffer"] = total - tube["stock"]
+
+        # WORKING REAGENT
+        self.reagent_left = self.num_columns * assay["reagent_volume"] * 8 + self.reagent_extra
+
+    def standard_wells(self, plate, tube):
+        """
+        Get's the wells a standard goes in
+        Tube: index of the standard, len(standards) for the blank
+        Return: well names, none on a plate that shares the first plate's standards
+        """
+        if plate not in self.standard_plates:
+            return []
+        return [self.rows[tube] + str(x) for x in range(1, self.assay["replicates"] + 1)]
+
+    def sample_wells(self, column):
+        """
+        Get's where a column of samples goes
+        Column: sample column (0 based)
+        Return: plate index, top well names of the plate columns it goes in
+        """
+        plate = [column in columns for columns in self.plate_sample_columns].index(True)
+        first = self.assay["replicates"] * self.plate_sample_columns[plate].index(column) + 1
+        if plate in self.standard_plates:
+            first += self.assay["replicates"]
+        return plate, ["A" + str(first + x) for x in range(0, self.assay["replicates"])]
+
+    def occupied_wells(self):
+        """
+        Get's every well that gets a standard, blank or sample
+        Return: [(plate index, well name)] in plate order, then row by row
+        """
+        wells = []
+        rows = len(self.assay["standards"]) + (1 if self.assay["blank"] else 0)
+        for plate in range(0, self.num_plates):
+            for tube in range(0, rows):
+                wells += [(plate, well) for well in self.standard_wells(plate, tube)]
+            for column in self.plate_sample_columns[plate]:
+                samples = min(self.number_samples - column * 8, 8)
+                for well in self.sample_wells(column)[1]:
+                    wells += [(plate, row + well[1:]) for row in self.rows[0:samples]]
+        return sorted(wells, key=lambda x: (x[0], x[1][0], int(x[1][1:])))
+
+    def stock_well(self, stocks, sample, diluted=False):
+        """
+        Get's the well of a sample that is diluted in the sample stock plates. A stock plate takes
+        6 columns of samples and their dilutions in the 6 after
+        Diluted: True for the well the sample is diluted into
+        """
+        well = sample % self.stock_plate_samples + (self.stock_plate_samples if diluted else 0)
+        return stocks[sample // self.stock_plate_samples].wells()[well]
+
+    # STEPS
+
+    def load_tips(self, protocol, planner, dry_run):
+        """
+        Loads the tip racks the plan lays out and the waste chute for the steps below
+        Dry_run: True to put the tips back in their racks instead of dropping them
+        Return: the tip racks
+        """
+        self.protocol = protocol
+        self.planner = planner
+        self.dry_run = dry_run
+        self.tips = [
+            protocol.load_labware(planner.tip_racks[size], slot)
+            for slot, size in planner.layout.items()
+        ]
+        self.chute = protocol.load_waste_chute()
+        return self.tips
+
+    def load_staging(self):
+        """
+        Loads the racks of the plan's staging slots, the first tip rack is swapped for one when it runs out
+        """
+        self.staging_racks = [
+            self.protocol.load_labware(self.planner.tip_racks[self.planner.staging[slot]], slot)
+            for slot in self.planner.staging_slots
+        ]
+
+    def remove_tip(self, pipette):
+        if self.dry_run:
+            pipette.return_tip()
+        else:
+            pipette.drop_tip(self.chute)
+
+    def pick_up(self, pipette, group):
+        """
+        Picks up a tip of the size planned for a group of transfers
+        """
+        size = self.planner.choice(group)["size"]
+        pipette.tip_racks = [rack for rack in self.tips if rack.load_name == self.planner.tip_racks[size].lower()]
+        try:
+            pipette.pick_up_tip()
+        except protocol_api.labware.OutOfTipsError:
+            if not self.staging_racks:
+                raise
+            self.check_tips()
+            self.pick_up(pipette, group)
+
+    def check_tips(self):
+        """
+        Swaps the empty first tip rack for the next staging rack with the gripper. The rack is swapped
+        once the pipette can't pick up from it, the 8 channel needs a full column. When every staging
+        slot is empty the staging racks are loaded again
+        """
+        protocol = self.protocol
+        staging_slots = self.planner.staging_slots
+        if protocol.deck[staging_slots[-1]] is None:
+            protocol.comment("No tip box detected in slot " + staging_slots[-1] + ", all staging slots are empty")
+            self.load_staging()
+            return
+        tip_slot = list(self.planner.layout)[0]
+        protocol.move_labware(labware=self.tips[0], new_location=self.chute, use_gripper=True)
+        for rack_num, slot in enumerate(staging_slots):
+            labware = protocol.deck[slot]
+            if labware and labware.is_tiprack:
+                self.tips[0] = self.staging_racks[rack_num]
+                protocol.move_labware(labware=self.staging_racks[rack_num], new_location=tip_slot, use_gripper=True)
+                break
+            protocol.comment("No tip box detected in slot " + slot + ".")
+
+    def falcon_height(self, pipette, falcon, volume):
+        """
+        Get's the aspirate height in a 15 mL falcon once a volume is taken out of it. The falcon is
+        measured with the tip on the first time, after that what the steps take out of it is counted
+        """
+        key = (id(falcon.parent), falcon.well_name)
+        if key not in self.falcon_volumes:
+            self.falcon_volumes[key] = get_vol_15ml_falcon(find_aspirate_height(pipette, falcon))
+        self.falcon_volumes[key] -= volume
+        return get_height_15ml_falcon(self.falcon_volumes[key])
+
+    def distribute(self, pipette, group, source, volumes, rate, dispense_rate, height=None, new_tips=False):
+        """
+        Fills wells from a 15 mL falcon with the 1 channel. Each aspiration takes as many wells as fit
+        in the tip with 5 µL extra and dispenses them in the order with the least travel
+        Volumes: {well: µL}
+        Height: mm above the bottom of the wells to dispense at, the pipette's default if None
+        New_tips: True for a new tip every aspiration, one tip for all of them otherwise
+        """
+        wells = list(volumes)
+        max_volume = self.planner.choice(group)["max_volume"]
+        travel_mm = [0, 0]  # before, after ordering the dispenses
+        for chunk in dispense_chunks([volumes[well] for well in wells], max_volume, 5):
+            if not pipette.has_tip:
+                self.pick_up(pipette, group)
+            aspirate_vol = sum(volumes[wells[x]] for x in chunk) + 5
+            source_height = self.falcon_height(pipette, source, aspirate_vol)
+            pipette.blow_out(source.top())
+            pipette.aspirate(aspirate_vol, source.bottom(source_height), rate)
+            targets, before, after = plan_dispense_order(source, [wells[x] for x in chunk])
+            travel_mm[0] += before
+            travel_mm[1] += after
+            for well in targets:
+                pipette.dispense(volumes[well], well if height is None else well.bottom(height), dispense_rate)
+            if new_tips:
+                self.remove_tip(pipette)
+        if pipette.has_tip:
+            self.remove_tip(pipette)
+        self.protocol.comment(travel_report(travel_mm[0], travel_mm[1]))
+
+    def add_from_above(self, pipette, group, source, volumes, rate, held=None, multi_dispense=True, extra=5, clearance=2):
+        """
+        Adds a reagent from a 15 mL falcon to wells with one tip. Every dispense is made from above the
+        liquid, so the tip never touches what is in the wells and goes back into the source clean. A
+        volume bigger than the tip is dispensed in tipfuls and what is left
+        Volumes: {well: µL}
+        Held: {well: µL} already in the wells, empty wells can be left out
+        """
+        held = held or {}
+        max_volume = self.planner.choice(group)["max_volume"]
+        if not multi_dispense:
+            extra = 0
+        dispenses = []  # (µL, location)
+        for well, volume in volumes.items():
+            if volume <= 0:
+                continue
+            pieces = [max_volume - extra] * (math.ceil(volume / (max_volume - extra)) - 1)
+            pieces.append(volume - sum(pieces))
+            for x, piece in enumerate(pieces):
+                dispenses.append((piece, above_liquid(well, piece, held.get(well, 0) + sum(pieces[:x]), clearance)))
+        if multi_dispense:
+            chunks = dispense_chunks([volume for volume, _ in dispenses], max_volume, extra)
+        else:
+            chunks = [[i] for i in range(0, len(dispenses))]
+        self.pick_up(pipette, group)
+        for chunk in chunks:
+            aspirate_vol = sum(dispenses[i][0] for i in chunk) + extra
+            pipette.aspirate(aspirate_vol, source.bottom(self.falcon_height(pipette, source, aspirate_vol)), rate)
+            for i in chunk:
+                pipette.dispense(dispenses[i][0], dispenses[i][1], rate)
+            # the extra goes back to the source, a single dispense is blown out where it was made
+            pipette.blow_out(source.top() if multi_dispense else dispenses[chunk[0]][1])
+        self.remove_tip(pipette)
+
+    def stamp_diluent(self, pipette, reservoir, columns, stocks):
+        """
+        Stamps the diluent of the full columns from the reservoir with the 8 channel, with one tip
+        Columns: [(sample column, µL per well)] from diluent_columns
+        Stocks: sample stock plates
+        """
+        max_volume = self.planner.choice("diluent stamping")["max_volume"]
+        self.pick_up(pipette, "diluent stamping")
+        for chunk in dispense_chunks([volume for _, volume in columns], max_volume, 5):
+            pipette.aspirate(sum(columns[x][1] for x in chunk) + 5, reservoir, 1)
+            for x in chunk:
+                column, volume = columns[x]
+                pipette.dispense(volume, self.stock_well(stocks, column * 8, diluted=True), 0.75)
+            pipette.blow_out(reservoir.top())
+        self.remove_tip(pipette)
+
+    def top_up_samples(self, pipette, group, stocks, top_ups):
+        """
+        Adds the sample the 8 channel doesn't move to the wells that are diluted from more, a tip per well
+        Top_ups: µL of each sample
+        """
+        for i, top_up in enumerate(top_ups):
+            if top_up > 0:
+                self.pick_up(pipette, group)
+                pipette.aspirate(top_up, self.stock_well(stocks, i).bottom(0.1), 0.5)
+                pipette.dispense(top_up, self.stock_well(stocks, i, diluted=True), 0.5)
+                self.remove_tip(pipette)
+
+    def load_column(self, pipette, group, source, targets, rate, dispense=None, new_tips=False, aspirate_rate=None, extra=5):
+        """
+        Loads a column onto its replicate columns with the 8 channel, with the tip on the pipette if it
+        has one. The tip is dropped at the end
+        Source: top well of the column
+        Targets: dispense locations in the top wells of the replicate columns
+        Dispense: MultiDispense made to deliver like a transfer per column, None for a plain multi dispense
+        New_tips: True for a transfer with a new tip per replicate column instead
+        Aspirate_rate: flow rate in the source, rate if None
+        Extra: µL aspirated on top of a plain multi dispense
+        """
+        volume = self.assay["sample_volume"]
+        aspirate_rate = aspirate_rate or rate
+        if new_tips:
+            for target in targets:
+                if not pipette.has_tip:
+                    self.pick_up(pipette, group)
+                pipette.aspirate(volume, source, aspirate_rate)
+                pipette.dispense(volume, target, rate)
+                pipette.blow_out(target.labware.as_well().top())
+                self.remove_tip(pipette)
+            return
+        if not pipette.has_tip:
+            self.pick_up(pipette, group)
+        if dispense is not None:
+            dispense.dispense(
+                pipette, source, targets, volume, rate, self.planner.choice(group)["max_volume"], aspirate_rate=aspirate_rate
+            )
+        else:
+            pipette.aspirate(volume * len(targets) + extra, source, aspirate_rate)
+            for target in targets:
+                pipette.dispense(volume, target, rate)
+        self.remove_tip(pipette)
+
+    def load_samples(self, pipette, group, plates, stocks, rate, height, sample_volumes=None, dilutions=None, dilution_rate=0.5, **load):
+        """
+        Loads every column of samples onto its replicate columns with the 8 channel, a tip per column
+        Plates: assay plates
+        Stocks: sample stock plates, the samples fill them unless they are diluted (stock_well)
+        Height: mm above the bottom of the assay wells to dispense at
+        Sample_volumes: µL of sample each well is diluted from, None to load the samples as they are.
+            A column is diluted with the smallest volume of its wells, the rest is added by top_up_samples
+        Dilutions: dilution of each sample
+        Load: keyword arguments for load_column
+        """
+        for column in range(0, self.num_sample_columns):
+            plate, wells = self.sample_wells(column)
+            targets = [plates[plate][well].bottom(height) for well in wells]
+            if sample_volumes is None:
+                source = stocks[column // 12].columns()[column % 12][0]
+                self.load_column(pipette, group, source, targets, rate, **load)
+                continue
+            first = column * 8
+            source = self.stock_well(stocks, first)
+            diluted = self.stock_well(stocks, first, diluted=True)
+            # the smallest well of the column sets the mix volume, a column with bigger wells gets more mixes
+            well_vols = [
+                volume * dilution
+                for volume, dilution in zip(sample_volumes[first:first + 8], dilutions[first:first + 8])
+            ]
+            mix_vol = max(min(well_vols) - 10, min(well_vols) / 2)
+            mixes = min(3 * math.ceil(max(well_vols) / min(well_vols)), 10)
+            column_vol = min(sample_volumes[first:first + 8])
+            self.pick_up(pipette, group)
+            pipette.aspirate(column_vol, source.bottom(0.1), dilution_rate)
+            pipette.dispense(column_vol, diluted, dilution_rate)
+            pipette.mix(mixes, mix_vol, diluted, dilution_rate)
+            pipette.blow_out(diluted.top())
+            pipette.touch_tip(diluted)
+            self.load_column(pipette, group, diluted, targets, rate, **load)
+
+    def make_standards(self, pipette, group, stock, tubes, rate, load, mixes=3, mix_rate=1.0, new_tip=True):
+        """
+        Makes the standard tubes with the 1 channel. Each is made from the stock or the tube it is
+        diluted from in tipfuls, mixed and loaded with the same tip
+        Stock: well of the stock, the first standard of a serial dilution
+        Tubes: well of each standard
+        Load: function(standard index) loading the mixed standard with the tip on the pipette
+        New_tip: False to carry the tip that loaded a standard on to making the next one, for a serial dilution
+        """
+        max_volume = self.planner.choice(group)["max_volume"]
+        for i, tube in enumerate(self.tubes):
+            if new_tip or not pipette.has_tip:
+                self.pick_up(pipette, group)
+            if tube["stock"] > 0:
+                source = stock if tube["source"] is None else tubes[tube["source"]]
+                for x in range(0, math.ceil(tube["stock"] / max_volume)):  # multi-plate standards can be more than one tip
+                    volume = min(max_volume, tube["stock"] - max_volume * x)
+                    pipette.aspirate(volume, source, rate)
+                    pipette.dispense(volume, tubes[i], rate)
+                pipette.mix(mixes, min(self.standard_volume - 10, max_volume), tubes[i], mix_rate)
+            load(i)
+            if new_tip:
+                self.remove_tip(pipette)
+        if pipette.has_tip:
+            self.remove_tip(pipette)
+
+    def load_standard(self, pipette, group, tube, source, plates, rate, height, dispense=None, new_tip=False):
+        """
+        Loads a standard from its tube onto its wells of the plates with standards, with the tip on the pipette
+        Tube: index of the standard, len(standards) for the blank
+        Height: mm above the bottom of the wells to dispense at
+        Dispense: MultiDispense to fill the wells from as few aspirations as fit in the tip, None for an aspiration per well
+        New_tip: True to blow the tip that made the standard out into its tube and load with a new one
+        """
+        volume = self.assay["sample_volume"]
+        if new_tip:
+            pipette.blow_out(source.top())
+            self.remove_tip(pipette)
+            self.pick_up(pipette, group)
+        targets = [plates[x][well] for x in self.standard_plates for well in self.standard_wells(x, tube)]
+        if dispense is None:
+            for well in targets:
+                pipette.aspirate(volume, source.bottom(1.5), rate)
+                pipette.dispense(volume, well.bottom(height), rate)
+                pipette.blow_out(well.top(-5))
+                pipette.touch_tip(well)
+            return
+        max_volume = self.planner.choice(group)["max_volume"]
+        travel_mm = [0, 0]  # before, after ordering the dispenses
+        for x, chunk in enumerate(dispense.chunks(targets, volume, max_volume)):
+            chunk, before, after = plan_dispense_order(source, chunk)
+            travel_mm[0] += before
+            travel_mm[1] += after
+            dispense.fill(
+                pipette, source, [well.bottom(height) for well in chunk], volume, rate, height=1.5, first=x == 0
+            )
+        self.protocol.comment(travel_report(travel_mm[0], travel_mm[1]))
+
+    def fill_standard_column(self, pipette, source, well, volume, height=1.5):
+        """
+        Fills a well of the standard column, the column of a sample plate that stamp_standards stamps
+        onto the plates with standards, with the tip on the pipette
+        Height: mm above the bottom of the source to aspirate at
+        """
+        pipette.aspirate(volume, source.bottom(height), 0.25)
+        pipette.dispense(volume, well, 0.25)
+        pipette.blow_out(well.top())
+
+    def stamp_standards(self, pipette, group, column, plates, dispense=None):
+        """
+        Stamps the standard column onto the replicate columns of every plate with standards with the 8 channel
+        Column: wells of the standard column
+        Dispense: MultiDispense for one tip, None for a new tip per replicate column
+        """
+        targets = [
+            plates[x][well].bottom(0.1) for x in self.standard_plates for well in self.standard_wells(x, 0)
+        ]
+        self.load_column(pipette, group, column[0], targets, 0.25, dispense=dispense, new_tips=dispense is None)
+
+    def add_reagent(self, pipette, reservoir, plate, columns, aspirations):
+        """
+        Adds the working reagent to the first columns of a plate with the 8 channel, the tip is kept
+        Aspirations: aspirations per column, more than one when the tip holds less than a well
+        """
+        volume = self.assay["reagent_volume"] / aspirations
+        for i in range(0, columns):
+            self.reagent_left -= self.assay["reagent_volume"] * 8
+            source = reservoir["A" + str(math.ceil(self.reagent_left / self.reagent_well_volume))]
+            for _ in range(0, aspirations):
+                pipette.aspirate(volume, source, self.assay["reagent_rate"])
+                pipette.dispense(volume, plate["A" + str(i + 1)].top(-1), rate=0.3)
+            pipette.blow_out(plate["A" + str(i + 1)].top(-1))
+            pipette.blow_out(plate["A" + str(i + 1)].top(-1))
+
+    def shake(self, protocol, heatshaker, dry_run):
+        """
+        Mixes the reagent into the plate on the heater shaker, heating it first when the assay incubates warm
+        """
+        if self.assay["temperature"] is not None:
+            heatshaker.set_and_wait_for_temperature(self.assay["temperature"])
+        heatshaker.set_and_wait_for_shake_speed(self.assay["shake_speed"])
+        if dry_run:
+            protocol.delay(seconds=10)
+        else:
+            protocol.delay(minutes=self.assay["shake_minutes"])
+        heatshaker.deactivate_shaker()
+
+    def incubation_seconds(self, dry_run):
+        return 10 if dry_run else self.assay["incubation_minutes"] * 60
+
+    def report(self, protocol):
+        """
+        Prints the compiled layout and standards for the operator
+        """
+        protocol.comment("\n---------------%s Plan----------------\n\n" % self.assay["name"])
+        for plate in range(0, self.num_plates):
+            protocol.comment(
+                "Plate %d: %d columns, sample columns %s"
+                % (
+                    plate + 1,
+                    self.plate_columns[plate],
+                    ", ".join(str(column + 1) for column in self.plate_sample_columns[plate]),
+                )
+            )
+        if self.shared_standards:
+            protocol.comment("The standards on plate 1 are shared by every plate")
+        for i, tube in enumerate(self.tubes):
+            source = "stock" if tube["source"] is None else "standard %d" % (tube["source"] + 1)
+            protocol.comment(
+                "Standard %d (%s): %.1f uL of %s + %.1f uL diluent"
+                % (i + 1, self.rows[i], tube["stock"], source, tube["buffer"])
+            )
+
+
+# ASSAY DESCRIPTION
+# replicates and sample_volume come from the runtime parameters
+assay = {
+    "name": "BCA",
+    "standards": [1500, 1000, 750, 500, 250, 125, 25],  # µg/mL
+    "stock": 1500,
+    "dilution": "direct",
+    "serial_from": 3,  # the 25 µg/mL tube is made from the 500 µg/mL one
+    "blank": True,
+    "standard_extra": 50,
+    "standard_min": 0,
+    "samples_per_plate": None,
+    "share_standards": True,  # the plates incubate together off deck
+    "max_plates": 4,
+    "reagent_volume": 200,
+    "reagent_rate": 0.75,
+    "temperature": 37,
+    "shake_speed": 400,
+    "shake_minutes": 0.5,
+    "incubation_minutes": 0,  # the plates incubate off deck
+    "wavelength": 562,
+    "units": "ug/mL",
+    "curve_degree": 2,
+}
+
+
+# SAMPLE DILUTIONS
+# Times each sample is diluted before it is loaded, for samples that need another dilution than
+# sample_vol + buffer_vol, e.g. from an earlier quantification. Columns sample,dilution with the
+# samples numbered from 1, at most 40x. Empty to dilute every sample the same
+dilution_csv = """
+"""
+
+
+# copy of read_dilution_csv in single_plate_bca.py, edit it there and run shared_check.py -w
+def read_dilution_csv(text, number_samples, dilution, max_dilution=40):
+    """
+    Get's the dilution of every sample
+    Text: CSV with the columns sample,dilution, samples not in it get the default dilution
+    Dilution: default dilution, 1 when the samples aren't diluted
+    Max_dilution: most a sample can be diluted, the 200 uL dilution well then holds 5 uL of it
+    Return: dilution of each sample in order
+    """
+    if dilution > max_dilution:
+        raise ValueError(
+            "sample_vol and buffer_vol dilute the samples %gx, the most a 200 uL dilution well takes is %dx"
+            % (dilution, max_dilution)
+        )
+    dilutions = [dilution] * number_samples
+    rows = [row for row in csv.reader(io.StringIO(text.strip())) if row]
+    if not rows:
+        return dilutions
+    if rows[0] != ["sample", "dilution"]:
+        raise ValueError("The dilution CSV needs the columns sample,dilution")
+    for sample, value in rows[1:]:
+        if not 1 <= int(sample) <= number_samples:
+            raise ValueError("Sample %s of the dilution CSV isn't one of the %d samples" % (sample, number_samples))
+        if float(value) < 1:
+            raise ValueError("Sample %s can't be diluted %s times" % (sample, value))
+        if float(value) > max_dilution:
+            raise ValueError(
+                "Sample %s of the dilution CSV is diluted %sx, the most a 200 uL dilution well takes is %dx"
+                % (sample, value, max_dilution)
+            )
+        dilutions[int(sample) - 1] = float(value)
+    return dilutions
+
+
 def add_parameters(parameters):
     parameters.add_int(
         variable_name="number_samples",
@@ -91,15 +1460,6 @@ def add_parameters(parameters):
         maximum=50,
         unit="ul",
     )
-    parameters.add_int(
-        variable_name="tip_type",
-        display_name="types of tips",
-        choices=[
-            {"display_name": "1000ul", "value": 1000},
-            {"display_name": "200ul", "value": 200},
-        ],
-        default=200,
-    )
     parameters.add_int(
         variable_name="replication_mode",
         display_name="Replication Mode",
@@ -110,12 +1470,30 @@ def add_parameters(parameters):
         default=3,
     )
 
+    parameters.add_bool(
+        variable_name="stamp_diluent",
+        display_name="Stamp Sample Diluent",
+        description="The 8 channel adds the sample diluent from reservoir A12, False: the 1 channel well by well",
+        default=True,
+    )
     parameters.add_bool(
         variable_name="dry_run",
         display_name="Dry Run",
         description="Return tips (ignore this unless you are testing)",
         default=False,
     )
+    parameters.add_bool(
+        variable_name="park_plates",
+        display_name="Park Plates",
+        description="Park finished plates on the deck with the gripper, False: take each off by hand",
+        default=False,
+    )
+    parameters.add_bool(
+        variable_name="optimise_commands",
+        display_name="Optimise Commands",
+        description="Skip repeated blow outs, touch tips, latch changes and deactivations. Check with command_check.py",
+        default=False,
+    )
 
 
 def run(protocol: protocol_api.ProtocolContext):
@@ -123,80 +1501,154 @@ def run(protocol: protocol_api.ProtocolContext):
     number_samples = protocol.params.number_samples
     is_dry_run = protocol.params.dry_run
     working_sample_vol = protocol.params.working_sample_vol
-    pipette_max = 200-5
+    sample_vol = protocol.params.sample_vol
+    buffer_vol = protocol.params.buffer_vol
+    dilutions = read_dilution_csv(
+        dilution_csv, number_samples, (sample_vol + buffer_vol) / sample_vol if protocol.params.dulute_with_walt else 1
+    )
+    dilute_with_walt = max(dilutions) > 1
 
-    # LOADING TIPS
-    tips = [
-        protocol.load_labware("opentrons_flex_96_filtertiprack_1000uL", slot)
-        for slot in ["A3"]
+    # SAMPLE VOLUMES
+    # each sample is diluted from sample_vol when the dilution loads every replicate and fits in the
+    # 200 ul well, otherwise the closest volume that does. The 8 channel moves the smallest volume of
+    # a column and the 1 channel tops up the wells that take more, the buffer makes up the dilution
+    loaded_vol = working_sample_vol * replication_mode + 10
+    well_sample_vols = [
+        min(max(sample_vol, math.ceil(loaded_vol / dilution)), math.floor(200 / dilution)) for dilution in dilutions
     ]
-    chute = protocol.load_waste_chute()
+    column_sample_vols = [min(well_sample_vols[i:i + 8]) for i in range(0, number_samples, 8)]
+    sample_top_ups = []
+    for i, dilution in enumerate(dilutions):
+        top_up = well_sample_vols[i] - column_sample_vols[i // 8]
+        if 0 < top_up < TipPlanner.min_volume[200]:
+            # too little to pipette, the well takes the column's volume when that's enough or 5 ul more
+            top_up = 0 if column_sample_vols[i // 8] * dilution >= loaded_vol else TipPlanner.min_volume[200]
+        sample_top_ups.append(top_up)
+        well_sample_vols[i] = column_sample_vols[i // 8] + top_up
+    sample_buffer_vols = [round(volume * (dilution - 1), 2) for volume, dilution in zip(well_sample_vols, dilutions)]
 
-    def remove_tip(pipette):
-        if is_dry_run:
-            pipette.return_tip()
-        else:
-            pipette.drop_tip(chute)
+    compiler = AssayCompiler(
+        dict(assay, replicates=replication_mode, sample_volume=working_sample_vol),
+        number_samples,
+    )
+    num_sample_plates = compiler.num_plates
 
-    def pick_up(pip):
-        nonlocal tips
-        nonlocal staging_racks
-        nonlocal count
+    # Standard volumes
+    standard_vol_per_tube = compiler.standard_volume
+    standard_tubes = compiler.tubes
+    buffer_vols = [tube["buffer"] for tube in standard_tubes]
+    num_columns = compiler.num_columns
+    working_reagent_volume = assay["reagent_volume"]
 
-        try:
-            pip.tip_racks = tips
-            pip.pick_up_tip()
+    # the samples and standards are mixed in their source just before they are loaded, which wets the tip
+    sample_dispense = MultiDispense(pre_wet=0)
+    standard_dispense = MultiDispense(pre_wet=0)
+    # the standards and blank are put in a column of a sample plate that no sample reaches, A-H,
+    # and the 8 channel stamps the column onto every replicate column of the plates with standards.
+    # A sample plate takes 6 columns of samples and their dilutions in the 6 after, so column 12 of
+    # the last plate is free unless it is full. 10 µL is left in each well. When there's no free
+    # column or the stamps don't fit in one tip, the standards are loaded tube by tube
+    standard_stamps = replication_mode * len(compiler.standard_plates)
+    standard_column_volume = working_sample_vol * standard_stamps + standard_dispense.extra + 10
+    standard_column_plate = None
+    for x in reversed(range(0, 2)):
+        if math.ceil(number_samples / 8) - x * 6 < 6:
+            standard_column_plate = x
+            break
+    stamp_standards = (
+        standard_column_plate is not None and standard_column_volume <= TipPlanner.max_volume[200]
+    )
 
-        except protocol_api.labware.OutOfTipsError:
-            check_tips()
-            pick_up(pip)    
-    def check_tips():
-        nonlocal tips
-        nonlocal staging_racks
-        nonlocal count
-        # tip_box = protocol.load_labware('opentrons_flex_96_filtertiprack_1000uL', 'A3')
-        for i in range (0,1):
-            tip_box_slots = ['A3']
-            bottom_right_well = tips[i].wells_by_name()['H12']
-            
-            if bottom_right_well.has_tip or protocol.deck['D4'] == None:
-                protocol.comment("A tip is present in the bottom-right corner (H12). or all staging slots are empty")
-                if protocol.deck['D4'] == None:
-                    protocol.comment("No tip box detected in slot D4.")
-                    staging_slots = ['A4', 'B4', 'C4', 'D4']
-                    staging_racks = [protocol.load_labware('opentrons_flex_96_filtertiprack_1000uL',
-                                      slot) for slot in staging_slots]
-                pass
-            else:
-                protocol.comment("\n\n\n Starting moving phase")
-                protocol.move_labware(
-                        labware=tips[i],
-                        new_location=chute,
-                        use_gripper=True
-                    )
-                rack_num = 0
-                for slot in ['A4', 'B4', 'C4', 'D4']:
-                    labware = protocol.deck[slot]
-                    if labware and labware.is_tiprack:
-                        tips[i] = staging_racks[rack_num]
-                        protocol.move_labware(
-                            labware=staging_racks[rack_num],
-                            new_location=tip_box_slots[i],
-                            use_gripper=True
-                        )
-                        break
-                        # protocol.comment(f"A tip box is present in slot {slot}.")
-                    else:
-                        protocol.comment(f"No tip box detected in slot {slot}.")
-                        rack_num+=1
-                        pass
-
-    def find_aspirate_height(pip, source_well):
-        lld_height = (
-            pip.measure_liquid_height(source_well) - source_well.bottom().point.z
+    # SAMPLE DILUENT
+    # the diluent is loaded into reservoir A12 when the working reagent leaves it free, and the 8
+    # channel stamps it onto the full diluted columns. A column with less than 8 samples is left to the
+    # 1 channel, a partial column of nozzles starts at the front nozzle and the unused ones behind it
+    # would hang over the racks and plates of row A and B
+    stamped_columns, diluent_left = [], sample_buffer_vols
+    if (
+        dilute_with_walt
+        and protocol.params.stamp_diluent
+        and math.ceil(compiler.reagent_left / compiler.reagent_well_volume) < 12
+    ):
+        stamped_columns, diluent_left = diluent_columns(sample_buffer_vols, TipPlanner.min_volume[200])
+
+    # TIP PLAN
+    # one rack slot, so every group runs on the same tip size
+    planner = TipPlanner(["A3"], ["A4", "B4", "C4", "D4"])
+    if stamped_columns:
+        planner.add(
+            "diluent stamping",
+            [volume for _, volume in stamped_columns for _ in range(0, 8)],
+            channels=(8,),
+            multi_dispense=True,
+            extra=5,
+        )
+    if any(volume > 0 for volume in diluent_left):
+        planner.add(
+            "sample diluent",
+            [volume for volume in diluent_left if volume > 0],
+            multi_dispense=True,
+            extra=5,
+        )
+    if dilute_with_walt:
+        if any(sample_top_ups):
+            planner.add(
+                "sample top up",
+                [volume for volume in sample_top_ups if volume > 0],
+                tips=len([volume for volume in sample_top_ups if volume > 0]),
+            )
+        planner.add(
+            "sample dilution",
+            [volume for volume in column_sample_vols for _ in range(0, 8)],
+            channels=(8,),
+            tips=math.ceil(number_samples/8),
+        )
+        planner.add(
+            "sample loading",
+            [working_sample_vol] * (math.ceil(number_samples/8) * 8 * replication_mode),
+            channels=(8,),
+            multi_dispense=True,
+            extra=sample_dispense.extra,
+            tips=0,
+            dispenses_per_source=replication_mode,
+        )
+    planner.add("standard diluent", buffer_vols, multi_dispense=True, extra=10)
+    if stamp_standards:
+        planner.add(
+            "standard bsa",
+            [tube["stock"] for tube in standard_tubes] + [standard_column_volume] * (len(standard_tubes) + 1),
+            tips=len(standard_tubes) + 1,
+        )
+        planner.add(
+            "standard stamping",
+            [working_sample_vol] * (8 * standard_stamps),
+            channels=(8,),
+            multi_dispense=True,
+            extra=standard_dispense.extra,
+        )
+    else:
+        planner.add(
+            "standard bsa",
+            [tube["stock"] for tube in standard_tubes],
+            tips=len(standard_tubes),
+        )
+        planner.add(
+            "standard loading",
+            [working_sample_vol] * (standard_stamps * (len(standard_tubes) + 1)),
+            multi_dispense=True,
+            extra=standard_dispense.extra,
+            tips=1,
+            dispenses_per_source=standard_stamps,
         )
-        aspirate_height = max(lld_height - 5, 1)
-        return aspirate_height
+    planner.add(
+        "working reagent",
+        [working_reagent_volume] * (num_columns * 8),
+        channels=(8,),
+    )
+    planner.plan()
+
+    # LOADING TIPS
+    tips = compiler.load_tips(protocol, planner, is_dry_run)
 
     # LOADING PIPETTES
     left_pipette = protocol.load_instrument(
@@ -206,6 +1658,10 @@ def run(protocol: protocol_api.ProtocolContext):
         "flex_8channel_1000", "right", tip_racks=tips
     )
     hs_mod = protocol.load_module("heaterShakerModuleV1", "D1")
+    sheet = LoadingSheet(simulating=protocol.is_simulating())
+    sheet.attach([left_pipette, right_pipette])
+    optimiser = CommandOptimiser(enabled=protocol.params.optimise_commands)
+    optimiser.attach(protocol, [left_pipette, right_pipette], [hs_mod])
     hs_mod.open_labware_latch()
     # LOADING LABWARE
     working_reagent_reservoir = protocol.load_labware("nest_12_reservoir_15ml", "D2")
@@ -223,16 +1679,13 @@ def run(protocol: protocol_api.ProtocolContext):
         protocol.load_labware("opentrons_96_wellplate_200ul_pcr_full_skirt", slot)
         for slot in sample_stock_slots
     ]
-    staging_slots = ["A4", "B4", "C4", "D4"]
-    staging_racks = [
-        protocol.load_labware("opentrons_flex_96_filtertiprack_1000uL", slot)
-        for slot in staging_slots
-    ]
+    staging_slots = planner.staging_slots
+    compiler.load_staging()
+    planner.report(protocol)
+    compiler.report(protocol)
 
 
     count = 0
-    samples_per_plate= 24       #ADD THIS FOR DUPLICATE AND TRIPLICATE
-    num_sample_plates = math.ceil(number_samples/samples_per_plate)
     # DEFINING LIQUIDS
     bsa_stock = protocol.define_liquid(
         "BSA Stock", "BSA Stock from Pierce BCA Protein protocol ; 1.5mg/mL", "#FF6433"
@@ -258,8 +1711,17 @@ def run(protocol: protocol_api.ProtocolContext):
     empty_tube = protocol.define_liquid("empty", "Empty Tubes for Standards", "#D3D3D3")
 
     # LOADING LIQUIDS
-    reagent_stock["A1"].load_liquid(water, 9000)
-    bsa_rack["A1"].load_liquid(bsa_stock, 550)
+    working_reagent = protocol.define_liquid(
+        "Working Reagent", "BCA Working Reagent, 50 parts Reagent A to 1 part Reagent B", "#A840FD"
+    )
+    sheet.source(reagent_stock["A1"], water)
+    sheet.source(bsa_rack["A1"], bsa_stock)
+    diluent_reservoir = working_reagent_reservoir["A12"]
+    for well in working_reagent_reservoir.wells():
+        if well.well_name == diluent_reservoir.well_name and stamped_columns:
+            sheet.source(well, water)
+        else:
+            sheet.source(well, working_reagent)
     # reagent_stock["A3"].load_liquid(Reagent_A, 22000)
     # bsa_rack["D1"].load_liquid(Reagent_B, 1000)
     bsa_rack["B1"].load_liquid(empty_tube, 1)  # 1500 µg/mL
@@ -278,256 +1740,135 @@ def run(protocol: protocol_api.ProtocolContext):
     
     # heatshaker.open_labware_latch()
     #Diluting Sample
-    diluted_sample_offset = 6
-    if protocol.params.dulute_with_walt:
-        pick_up(left_pipette)
-        vol_in_15_facon = get_vol_15ml_falcon(find_aspirate_height(left_pipette, dilutent_location))
-        # num_transfers = math.ceil((number_samples*protocol.params.buffer_vol)/pipette_max)
-        num_transfers = math.ceil((number_samples*protocol.params.buffer_vol)/(protocol.params.buffer_vol*math.floor(pipette_max/protocol.params.buffer_vol)))
-
-        well_counter = 0
-        col_num = 1#replication_mode+1     # col num for the sample_plate
-        # col_num = replication_mode+1     # col num for the sample_plate
-        stock_plate_num = 0
-        for i in range (0, num_transfers):
-            if i != 0 and i % 4 == 0:    # every 4th iteration
-                remove_tip(left_pipette)
-                # pick_up(left_pipette)
-            if i != num_transfers-1:    # not on last iteration
-                aspirate_vol = pipette_max - pipette_max%protocol.params.buffer_vol
-            else:
-                aspirate_vol = (number_samples*protocol.params.buffer_vol)-(pipette_max - pipette_max%protocol.params.buffer_vol)*(num_transfers-1)
-            if left_pipette.has_tip == False:
-                pick_up(left_pipette)
-            left_pipette.blow_out(dilutent_location.top())
-            left_pipette.aspirate(aspirate_vol+5, dilutent_location.bottom(get_height_15ml_falcon(vol_in_15_facon)), 1)
-            for x in range (0, math.floor(aspirate_vol/protocol.params.buffer_vol)):
-                left_pipette.dispense(protocol.params.buffer_vol, sample_stock[stock_plate_num].wells()[(well_counter%48) + 48], 0.75)
-                well_counter += 1
-                stock_plate_num = math.floor(well_counter/48)
-            # remove_tip(left_pipette)
-            vol_in_15_facon-=aspirate_vol+5
-        remove_tip(left_pipette)
-        for i in range (0, math.ceil(number_samples/8)):
-            stock_plate_num = math.floor(i/diluted_sample_offset)
-            pick_up(right_pipette)
-            i = i%diluted_sample_offset
-            right_pipette.aspirate(protocol.params.sample_vol, sample_stock[stock_plate_num]['A' + str(i+1)].bottom(0.1), 0.5)
-            right_pipette.dispense(protocol.params.sample_vol, sample_stock[stock_plate_num]['A' + str(i+1+diluted_sample_offset)], 0.5)
-            right_pipette.mix(3, protocol.params.sample_vol + protocol.params.buffer_vol-10, sample_stock[stock_plate_num]['A' + str(i+1+diluted_sample_offset)], 0.5)
-            right_pipette.blow_out(sample_stock[stock_plate_num]['A' + str(i+1+diluted_sample_offset)].top())
-            right_pipette.touch_tip(sample_stock[stock_plate_num]['A' + str(i+1+diluted_sample_offset)])
-            right_pipette.aspirate(working_sample_vol*replication_mode+10, sample_stock[stock_plate_num]['A' + str(i+1+diluted_sample_offset)],0.5)
-            for x in range (0,replication_mode):
-                sample_plate_num = math.ceil((col_num*8)/(samples_per_plate*replication_mode))
-                right_pipette.dispense(working_sample_vol, sample_plate[sample_plate_num-1]['A'+str( (col_num + sample_plate_num*replication_mode)%12 if (col_num + sample_plate_num*replication_mode)%12 !=0 else 12)].bottom(0.5), 0.5)
-                col_num+=1
-            remove_tip(right_pipette)
-    def standard_loading(old, new):
-        """
-        old: well from sample stock
-        new: row letter from sample plate
-        """
-        left_pipette.aspirate((working_sample_vol*replication_mode)*num_sample_plates+5, bsa_rack[old].bottom(1.5), 0.25)
-        for x in range(0, num_sample_plates):
-            for i in range(1, replication_mode+1):  # A1,A2,A3
-                left_pipette.dispense(working_sample_vol, sample_plate[x][new + str(i)].bottom(0.1), 0.25)
-        # remove_tip(left_pipette)
-    # Standard Preparation  FINISH LATER
-    # standard_vol_per_tube = 500#working_sample_vol*replication_mode+50
-    standard_vol_per_tube = (working_sample_vol*replication_mode)*(math.ceil(number_samples/samples_per_plate))+50
-    # dilutent_percentages = [0.25, 0.5, 0.625, 0.75, 0.875, 0.9375, 0.9875]
-    dilutent_percentages = [1, 2/3, 1/2, 1/3, 1/6, 1/12, 1/60]
-    buffer_vols =[]
-    bsa_vols = []
-    dilutent_pipette_vols = []
-    serial_dilution_stock_tube = 3      # tubes 0 to 7
-    amt_extra_in_1_over_12_tube=0
-    for i in range(0, len(dilutent_percentages)):
-        
-        if standard_vol_per_tube*dilutent_percentages[i] < 5:
-            #add extra to the serial_dilution_stock_tube duluted tube to make up for the 5ul minimum
-            amt_extra_in_1_over_12_tube = (1/dilutent_percentages[serial_dilution_stock_tube])*standard_vol_per_tube*dilutent_percentages[i]
-            amt_in_1_over_12_tube = standard_vol_per_tube + amt_extra_in_1_over_12_tube
-            bsa_vols[serial_dilution_stock_tube] = amt_in_1_over_12_tube*dilutent_percentages[serial_dilution_stock_tube]
-            buffer_vols[serial_dilution_stock_tube] =amt_in_1_over_12_tube*(1-dilutent_percentages[serial_dilution_stock_tube])
-            bsa_vols.append(0)
-            buffer_vols.append(standard_vol_per_tube*(1-dilutent_percentages[i]) - amt_extra_in_1_over_12_tube*(1-dilutent_percentages[i]))
-        
-        else:
-            bsa_vols.append(standard_vol_per_tube*dilutent_percentages[i])
-            buffer_vols.append(standard_vol_per_tube*(1-dilutent_percentages[i]))
-    
-    total_dilutent = 0
-    for i in range(0, len(buffer_vols)):
-        if total_dilutent + buffer_vols[i] < (pipette_max - 10):
-            total_dilutent += buffer_vols[i]
-            if i == len(buffer_vols) - 1:
-                dilutent_pipette_vols.append(total_dilutent)
-        else:
-            dilutent_pipette_vols.append(total_dilutent)
-            total_dilutent = buffer_vols[i]
-            if i == len(buffer_vols) - 1:
-                dilutent_pipette_vols.append(total_dilutent)
-    # dilutent_pipette_vols.append(total_dilutent)
-    
-    print(buffer_vols)
-    tube_spots = ["B1", "B2", "B3", "B4", "B5", "B6", "C1"]
-    well_num = 0
-    pick_up(left_pipette)
-    if protocol.params.tip_type == 1000:        #P1000 tips
-        for i in range(0, len(dilutent_pipette_vols)):
-            vol_in_15_facon -= dilutent_pipette_vols[i]+10
-            
-            left_pipette.aspirate(
-                dilutent_pipette_vols[i] + 10, dilutent_location.bottom(get_height_15ml_falcon(vol_in_15_facon)), 0.5
+    if dilute_with_walt:
+        if stamped_columns:
+            compiler.stamp_diluent(right_pipette, diluent_reservoir, stamped_columns, sample_stock)
+        if any(volume > 0 for volume in diluent_left):
+            # each aspiration fills as many of the sample buffers as fit in the tip, whatever their volumes
+            compiler.distribute(
+                left_pipette,
+                "sample diluent",
+                dilutent_location,
+                {
+                    compiler.stock_well(sample_stock, i, diluted=True): volume
+                    for i, volume in enumerate(diluent_left)
+                    if volume > 0
+                },
+                1,
+                0.75,
             )
-            amt_in_tip = dilutent_pipette_vols[i] + 10
-            while amt_in_tip > 10:
-                try:        # someties amt_in_tip is 10.0000000001
-                    left_pipette.dispense(
-                        buffer_vols[well_num],
-                        bsa_rack[tube_spots[well_num]],
-                        0.5,
-                    )
-                    amt_in_tip -= buffer_vols[well_num]
-                except:
-                    print(amt_in_tip)
-                    break
-                
-                well_num += 1
-    else:
-        for i in range (0, len(buffer_vols)):
-            vol_in_15_facon -= buffer_vols[i]
-            transfer_amt = buffer_vols[i]
-            for x in range (0, math.ceil(transfer_amt/pipette_max)):
-                if x ==math.ceil(transfer_amt/pipette_max) - 1:
-                    if buffer_vols[i]%pipette_max != 0:
-                        left_pipette.aspirate(buffer_vols[i]%pipette_max, dilutent_location.bottom(get_height_15ml_falcon(vol_in_15_facon)), 0.5)
-                        left_pipette.dispense(
-                                    buffer_vols[i]%pipette_max,
-                                    bsa_rack[tube_spots[i]],
-                                    0.5,
-                                )
-                    else:
-                        left_pipette.aspirate(pipette_max, dilutent_location.bottom(get_height_15ml_falcon(vol_in_15_facon)), 0.5)
-                        left_pipette.dispense(
-                                    pipette_max,
-                                    bsa_rack[tube_spots[i]],
-                                    0.5,
-                                )
-                else:
-                    left_pipette.aspirate(pipette_max, dilutent_location.bottom(get_height_15ml_falcon(vol_in_15_facon)), 0.5)
-                    left_pipette.dispense(
-                                pipette_max,
-                                bsa_rack[tube_spots[i]],
-                                0.5,
-                            )
-    remove_tip(left_pipette)
-    print (bsa_vols)
-    rack_order = ["B1", "B2", "B3", "B4", "B5", "B6", "C1"]
-    well_order = ["A", "B", "C", "D", "E", "F", "G"]
-    for i in range(0, len(bsa_vols)):
-        pick_up(left_pipette)
-        if bsa_vols[i] == 0:
-            left_pipette.aspirate(amt_extra_in_1_over_12_tube, bsa_rack[tube_spots[serial_dilution_stock_tube]], 0.5)
-            left_pipette.dispense(
-                bsa_vols[i],
-                bsa_rack[tube_spots[i]],
-                0.5,
-            )
-        else:
-            transfer_amt = bsa_vols[i]
-            for x in range (0, math.ceil(bsa_vols[i]/pipette_max)):     
-                if x == math.ceil(bsa_vols[i]/pipette_max) - 1:
-                    left_pipette.aspirate(
-                        transfer_amt%pipette_max,
-                        bsa_stock_location,
-                        0.5,
-                    )
-                    left_pipette.dispense(
-                        transfer_amt%pipette_max,
-                        bsa_rack[tube_spots[i]],
-                        0.5,
-                    )
-                else:
-                    left_pipette.aspirate(
-                        pipette_max,
-                        bsa_stock_location,
-                        0.5,
-                    )
-                    left_pipette.dispense(
-                        pipette_max,
-                        bsa_rack[tube_spots[i]],
-                        0.5,
-                    )
-        if standard_vol_per_tube > pipette_max:
-            left_pipette.mix(3, pipette_max, bsa_rack[tube_spots[i]])
+        compiler.top_up_samples(left_pipette, "sample top up", sample_stock, sample_top_ups)
+        compiler.load_samples(
+            right_pipette,
+            "sample dilution",
+            sample_plate,
+            sample_stock,
+            0.5,
+            0.5,
+            sample_volumes=well_sample_vols,
+            dilutions=dilutions,
+            dispense=sample_dispense,
+        )
+
+    # Standard Preparation
+    tube_spots = ["B1", "B2", "B3", "B4", "B5", "B6", "C1"]
+    standard_locations = [bsa_rack[spot] for spot in tube_spots]
+    # conical tubes fill higher at the bottom than their depth fraction says, so the tip stays well above
+    compiler.add_from_above(
+        left_pipette,
+        "standard diluent",
+        dilutent_location,
+        {standard_locations[i]: buffer_vols[i] for i in range(0, len(buffer_vols))},
+        0.5,
+        extra=10,
+        clearance=10,
+    )
+    if stamp_standards:
+        standard_column = sample_stock[standard_column_plate].columns()[11]
+
+    def load_standard(i):
+        if stamp_standards:
+            # the tip that mixed the standard fills its well of the standard column
+            compiler.fill_standard_column(left_pipette, standard_locations[i], standard_column[i], standard_column_volume)
         else:
-            left_pipette.mix(2, standard_vol_per_tube - 10, bsa_rack[tube_spots[i]])
-        standard_loading(rack_order[i], well_order[i])
-        # left_pipette.blow_out(bsa_rack[tube_spots[i]])
-        remove_tip(left_pipette)
-
-    # # Vial A
-    # standard_loading("B1", "A")
-    # # Vial B
-    # standard_loading("B2", "B")
-    # # Vial C
-    # standard_loading("B3", "C")
-    # # Vial D
-    # standard_loading("B4", "D")
-    # # Vial E
-    # standard_loading("B5", "E")
-    # # Vial F
-    # standard_loading("B6", "F")
-    # # Vial G
-    # standard_loading("C1", "G")
+            compiler.load_standard(
+                left_pipette, "standard loading", i, standard_locations[i], sample_plate, 0.25, 0.1, dispense=standard_dispense
+            )
+
+    compiler.make_standards(
+        left_pipette,
+        "standard bsa",
+        bsa_stock_location,
+        standard_locations,
+        0.5,
+        load_standard,
+        mixes=3 if standard_vol_per_tube > planner.choice("standard bsa")["max_volume"] else 2,
+    )
+
     # Vial H: Blank
-    pick_up(left_pipette)
-    vol_in_15_facon-=working_sample_vol*replication_mode+5
-    left_pipette.aspirate((working_sample_vol*replication_mode)*num_sample_plates+5, dilutent_location.bottom(get_height_15ml_falcon(vol_in_15_facon)), 0.25)
-    for x in range (0, num_sample_plates):
-        for i in range(1, replication_mode+1):  # A1,A2,A3
-            left_pipette.dispense(working_sample_vol, sample_plate[x]["H" + str(i)].bottom(0.1), 0.25)
-    remove_tip(left_pipette)
+    if stamp_standards:
+        compiler.pick_up(left_pipette, "standard bsa")
+        compiler.fill_standard_column(
+            left_pipette,
+            dilutent_location,
+            standard_column[len(standard_tubes)],
+            standard_column_volume,
+            compiler.falcon_height(left_pipette, dilutent_location, standard_column_volume),
+        )
+        compiler.remove_tip(left_pipette)
+        # the whole column goes onto every replicate column of the plates with standards at once
+        compiler.stamp_standards(right_pipette, "standard stamping", standard_column, sample_plate, standard_dispense)
+    else:
+        compiler.add_from_above(
+            left_pipette,
+            "standard loading",
+            dilutent_location,
+            {
+                sample_plate[x][well]: working_sample_vol
+                for x in compiler.standard_plates
+                for well in compiler.standard_wells(x, len(standard_tubes))  # H1,H2,H3
+            },
+            0.25,
+            clearance=1,
+        )
+
+    # PARKING
+    # the tip racks are all swapped in by now, so the staging slots they left are free for the
+    # finished plates, then the slot each plate came from. Worked out before any plate moves so a
+    # deck that can't take them fails at analysis
+    park_slots = []
+    if protocol.params.park_plates:
+        free_slots = [slot for slot in staging_slots if protocol.deck[slot] is None]
+        for x in range(0, num_sample_plates):
+            if free_slots:
+                park_slots.append(free_slots.pop(0))
+            elif protocol.deck[sample_plate_slots[x]] is sample_plate[x]:
+                park_slots.append(sample_plate_slots[x])
+            else:
+                raise ValueError("No free slot to park plate %d in" % (x + 1))
+            protocol.comment("Plate %d is parked in %s once it is shaken" % (x + 1, park_slots[x]))
 
     # Adding Working Reagent to Plate
-    num_columns = math.ceil(((math.ceil(number_samples / 8) * 8) * replication_mode) / 8) + num_sample_plates*replication_mode
-    working_reagent_volume = 200
-    pick_up(right_pipette)
-    working_reagent_volume_amt = (num_columns*200*8) + 200#(working_reagent_volume*8*(math.ceil(number_samples/8)) + 1000)/8
+    working_reagent_aspirations = planner.choice("working reagent")["aspirations"] // num_columns
+    compiler.pick_up(right_pipette, "working reagent")
     for x in range (0, num_sample_plates):
-        if x == num_sample_plates-1:
-            last_row = number_samples%8
-            if last_row == 0:
-                last_row = 12
-        else:
-            last_row = 12
-        for i in range (1, last_row+1):
-            working_reagent_volume_amt = working_reagent_volume_amt-(working_reagent_volume*8)
-            # print(working_reagent_volume_amt)
-            # print('A'+str(math.ceil(working_reagent_volume_amt/(10*1000))))
-            right_pipette.aspirate(working_reagent_volume, working_reagent_reservoir['A'+str(math.ceil(working_reagent_volume_amt/(10*1000)))],0.75)
-            right_pipette.dispense(working_reagent_volume, sample_plate[x]["A"+str(i)].top(-1), rate=0.3)
-            right_pipette.blow_out(sample_plate[x]["A"+str(i)].top(-1))
-            right_pipette.blow_out(sample_plate[x]["A"+str(i)].top(-1))
+        compiler.add_reagent(
+            right_pipette, working_reagent_reservoir, sample_plate[x], compiler.plate_columns[x], working_reagent_aspirations
+        )
         #Move sample plate
         hs_mod.open_labware_latch()
         protocol.move_labware(sample_plate[x], hs_mod, use_gripper=True)
         hs_mod.close_labware_latch()
-        hs_mod.set_and_wait_for_temperature(37)
-        hs_mod.set_and_wait_for_shake_speed(400)
 
         # Shake For 30 Seconds
-        if is_dry_run:
-            protocol.delay(seconds=10)
-        else:
-            protocol.delay(minutes=0.5)
-        hs_mod.deactivate_shaker()
+        compiler.shake(protocol, hs_mod, is_dry_run)
         hs_mod.open_labware_latch()
-        protocol.move_labware(sample_plate[x], new_location=protocol_api.OFF_DECK, use_gripper=False)
+        if park_slots:
+            protocol.move_labware(sample_plate[x], new_location=park_slots[x], use_gripper=True)
+        else:
+            protocol.move_labware(sample_plate[x], new_location=protocol_api.OFF_DECK, use_gripper=False)
 
         
-    remove_tip(right_pipette)
-
+    compiler.remove_tip(right_pipette)
+    sheet.finish(protocol)
+    optimiser.finish(protocol)
@@ -0,0 +1,1185 @@
+"""
+Recording stand-in for the Opentrons ProtocolContext, for fast offline runs of the protocols.
+
+RecordingContext has the parts of the protocol API the protocols use: pipettes with tip tracking
+and nozzle layouts, labware with the well geometry of its definition on the Flex deck, the heater
+shaker, absorbance reader and magnetic block, gripper moves, params, deck and define_liquid. Nothing is checked
+against the robot beyond what the protocols can get wrong (tips, volumes in the tip, occupied
+slots, the heater shaker latch and the reader lid), and every command is recorded into a
+CommandLog, a set of parallel arrays with one entry per command. A protocol file is executed
+once and its run() is called on a new RecordingContext for every run, so sweeps over runtime
+parameters only pay for the protocol's own code.
+
+Each protocol is run n times on the RecordingContext and once on the simulator. Prints the
+commands by kind, any difference from the simulator's run log (commands, levels, µL and comments),
+the time per run of both and the speedup.
+
+Usage: python recording_context.py [protocol.py ...] [-L labware_dir] [-n runs] [name=value ...]
+name=value sets the default of a runtime parameter, e.g. number_samples=96
+"""
+
+import sys
+import os
+import io
+import re
+import glob
+import json
+import time
+import array
+import inspect
+import functools
+import numpy
+from opentrons import simulate
+from opentrons import protocol_api
+from opentrons import types
+from opentrons_shared_data.deck import load as load_deck
+from opentrons_shared_data.labware import load_definition as load_labware_definition
+from opentrons_shared_data.module import load_definition as load_module_definition
+from opentrons.protocols.api_support.labware_like import LabwareLike, LabwareLikeType
+from command_check import protocols, protocol_source
+
+# command kinds of the log, the code of a kind is its index
+kinds = [
+    "comment",
+    "delay",
+    "pause",
+    "pick_up_tip",
+    "drop_tip",
+    "return_tip",
+    "aspirate",
+    "dispense",
+    "blow_out",
+    "touch_tip",
+    "mix",
+    "air_gap",
+    "move_to",
+    "move_labware",
+    "open_labware_latch",
+    "close_labware_latch",
+    "set_and_wait_for_shake_speed",
+    "deactivate_shaker",
+    "set_target_temperature",
+    "wait_for_temperature",
+    "deactivate_heater",
+    "open_lid",
+    "close_lid",
+    "initialize",
+    "read",
+    "configure_nozzle_layout",
+]
+kind_codes = {kind: code for code, kind in enumerate(kinds)}
+# load name: (name, channels, max µL, aspirate, dispense and blow out µL/s)
+pipettes = {
+    "flex_1channel_1000": ("p1000_single_flex", 1, 1000, 716.0, 716.0, 716.0),
+    "flex_8channel_1000": ("p1000_multi_flex", 8, 1000, 716.0, 716.0, 716.0),
+    "flex_1channel_50": ("p50_single_flex", 1, 50, 35.0, 57.0, 57.0),
+    "flex_8channel_50": ("p50_multi_flex", 8, 50, 35.0, 57.0, 57.0),
+}
+well_bottom_clearance = 1.0  # mm, where a well given as a well is aspirated and dispensed
+air_gap_height = 5  # mm over the top of the well
+tolerance = 1e-6  # µL
+block_size = 1024  # commands the log keeps as tuples before moving them into its arrays
+deck_definition = load_deck("ot3_standard", 5)
+cutout_positions = {c["id"]: c["position"] for c in deck_definition["locations"]["cutouts"]}
+area_offsets = {a["id"]: a["offsetFromCutoutFixture"] for a in deck_definition["locations"]["addressableAreas"]}
+definitions = {}  # (load name, version): labware definition, read once per process
+well_layouts = {}  # (namespace, load name, version): geometry of the wells by column, worked out once per process
+
+# simulator run log text: command kind, the longer prefixes first
+simulator_kinds = [
+    ("Aspirating", "aspirate"),
+    ("Dispensing", "dispense"),
+    ("Blowing out", "blow_out"),
+    ("Touching tip", "touch_tip"),
+    ("Mixing", "mix"),
+    ("Air gap", "air_gap"),
+    ("Picking up tip", "pick_up_tip"),
+    ("Dropping tip", "drop_tip"),
+    ("Returning tip", "return_tip"),
+    ("Moving to ", "move_to"),
+    ("Moving ", "move_labware"),
+    ("Delaying", "delay"),
+    ("Pausing", "pause"),
+    ("Unlatching labware", "open_labware_latch"),
+    ("Latching labware", "close_labware_latch"),
+    ("Setting Heater-Shaker to Shake", "set_and_wait_for_shake_speed"),
+    ("Deactivating Shaker", "deactivate_shaker"),
+    ("Setting Target Temperature", "set_target_temperature"),
+    ("Waiting for Heater-Shaker", "wait_for_temperature"),
+    ("Deactivating Heater", "deactivate_heater"),
+]
+# reader commands and nozzle layouts have no run log entry
+unpublished = ["open_lid", "close_lid", "initialize", "read", "configure_nozzle_layout"]
+nozzle_rows = "ABCDEFGH"
+volume_text = re.compile(r"^(?:Aspirating|Dispensing) ([\d.]+) uL")
+
+
+class CommandLog:
+    """
+    Every command of a run as parallel arrays, entry i of each array is command i
+    Kind: code of the command in kinds
+    Level: 0, or 1 for the aspirates and dispenses of a mix, air gap or tip return
+    Instrument: number of the pipette in load order, -1 for other commands
+    Value: µL for liquid handling, seconds for delays, rpm or °C for the heater shaker, 1 for
+    gripper moves, active nozzles for nozzle layouts
+    Labware, well: number of the labware in load order and of the well in it, -1 for none
+    Height: mm above the bottom of the well
+    Text: number of the text in strings (comments, messages, where labware is moved to, nozzle
+    layout and start nozzle), -1 for none
+    """
+
+    def __init__(self):
+        self.kind = array.array("B")
+        self.level = array.array("B")
+        self.instrument = array.array("b")
+        self.value = array.array("d")
+        self.labware = array.array("h")
+        self.well = array.array("h")
+        self.height = array.array("d")
+        self.text = array.array("i")
+        self.columns = [self.kind, self.level, self.instrument, self.value, self.labware, self.well, self.height, self.text]
+        self.rows = []  # the latest commands, moved into the arrays a block at a time
+        self.strings = []
+        self.string_numbers = {}
+
+    def add(self, kind, level=0, instrument=-1, value=0.0, labware=-1, well=-1, height=0.0, text=None):
+        if text is None:
+            number = -1
+        else:
+            number = self.string_numbers.get(text)
+            if number is None:
+                number = self.string_numbers[text] = len(self.strings)
+                self.strings.append(text)
+        rows = self.rows
+        rows.append((kind_codes[kind], level, instrument, value or 0.0, labware, well, height, number))
+        if len(rows) >= block_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Moves the latest commands into the arrays
+        """
+        if self.rows:
+            for column, values in zip(self.columns, zip(*self.rows)):
+                column.extend(values)
+            self.rows = []
+
+    def __len__(self):
+        return len(self.kind) + len(self.rows)
+
+    def counts(self):
+        """
+        Return: {command kind: number of commands}
+        """
+        self.flush()
+        counts = numpy.bincount(numpy.frombuffer(self.kind, dtype=numpy.uint8), minlength=len(kinds))
+        return {kinds[code]: int(n) for code, n in enumerate(counts) if n}
+
+    def texts(self, kind):
+        """
+        Get's the texts of every command of a kind, e.g. the comments
+        """
+        self.flush()
+        code = kind_codes[kind]
+        return [self.strings[t] for k, t in zip(self.kind, self.text) if k == code and t >= 0]
+
+    def arrays(self):
+        """
+        Return: {column: NumPy array}, sharing memory with the log
+        """
+        self.flush()
+        return {
+            name: numpy.frombuffer(getattr(self, name), dtype=getattr(self, name).typecode)
+            for name in ["kind", "level", "instrument", "value", "labware", "well", "height", "text"]
+        }
+
+
+class FastArguments(inspect.BoundArguments):
+    def apply_defaults(self):
+        pass  # the defaults are in from the start
+
+
+class FastSignature(inspect.Signature):
+    """
+    Signature that binds positional and keyword arguments onto the defaults in one go. The
+    protocols' wrappers (clock, optimiser, loading sheet) bind every command they see, anything
+    unusual goes to inspect's own bind for its errors
+    """
+
+    def __init__(self, parameters=None, **kwargs):
+        inspect.Signature.__init__(self, parameters, **kwargs)
+        self.names = list(self.parameters)
+        self.keywords = frozenset(self.names)
+        self.defaults = {name: p.default for name, p in self.parameters.items()}
+        self.required = [name for name, p in self.parameters.items() if p.default is inspect.Parameter.empty]
+
+    def bind(self, *args, **kwargs):
+        names = self.names
+        if len(args) > len(names) or (kwargs and not self.keywords.issuperset(kwargs)):
+            return inspect.Signature.bind(self, *args, **kwargs)
+        arguments = self.defaults.copy()
+        if args:
+            if kwargs and not kwargs.keys().isdisjoint(names[:len(args)]):
+                return inspect.Signature.bind(self, *args, **kwargs)
+            arguments.update(zip(names, args))
+        if kwargs:
+            arguments.update(kwargs)
+        if self.required and any(arguments[name] is inspect.Parameter.empty for name in self.required):
+            return inspect.Signature.bind(self, *args, **kwargs)
+        return FastArguments(self, arguments)
+
+
+class command:
+    """
+    Method of the recording stand-ins as the protocols see it: bound once per instance (so a
+    wrapper set on the instance replaces it, as with the real API) with a FastSignature
+    """
+
+    def __init__(self, function):
+        self.function = function
+        parameters = list(inspect.signature(function).parameters.values())[1:]  # without self
+        self.signature = FastSignature(parameters)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self.function
+        bound = functools.partial(self.function, instance)
+        bound.__signature__ = self.signature
+        bound.__name__ = self.function.__name__
+        bound.__doc__ = self.function.__doc__
+        instance.__dict__[self.function.__name__] = bound
+        return bound
+
+
+class WellLike(LabwareLike):
+    """LabwareLike of a well, made once per well and placement of its labware"""
+
+    is_well = True
+
+    def __init__(self, well):
+        self._labware_like = well
+        self._type = LabwareLikeType.WELL
+        self._as_str = repr(well)
+
+    def as_well(self):
+        return self._labware_like
+
+
+class Location(types.Location):
+    """Location in a well, made without wrapping the well again"""
+
+    def __init__(self, point, well):
+        self._point = point
+        self._given_labware = well
+        self._labware = well.like or well.make_like()
+        self._is_meniscus = None
+
+    def move(self, point):
+        return Location(self._point + point, self._given_labware)
+
+
+def labware_definition(load_name, version, labware_paths):
+    """
+    Get's a labware definition from the custom labware directories or the Opentrons definitions
+    """
+    key = (load_name, version, tuple(labware_paths))
+    if key not in definitions:
+        for path in labware_paths:
+            for file_name in sorted(glob.glob(os.path.join(path, "*.json"))):
+                with open(file_name) as f:
+                    definition = json.load(f)
+                if definition["parameters"]["loadName"] == load_name:
+                    definitions[key] = definition
+        if key not in definitions:
+            try:
+                definitions[key] = load_labware_definition(load_name, version or 1)
+            except FileNotFoundError:
+                definitions[key] = load_labware_definition(load_name.lower(), version or 1)
+    return definitions[key]
+
+
+def well_layout(definition):
+    """
+    Get's the geometry of the wells of a labware definition
+    Return: [[(name, x, y, z, depth, max volume, diameter, x dimension, y dimension)] of each column]
+    """
+    key = (definition["namespace"], definition["parameters"]["loadName"], definition["version"])
+    layout = well_layouts.get(key)
+    if layout is None:
+        layout = well_layouts[key] = [
+            [
+                (
+                    name,
+                    well["x"],
+                    well["y"],
+                    well["z"],
+                    well["depth"],
+                    well["totalLiquidVolume"],
+                    well.get("diameter"),
+                    well.get("xDimension"),
+                    well.get("yDimension"),
+                )
+                for name, well in ((name, definition["wells"][name]) for name in column)
+            ]
+            for column in definition["ordering"]
+        ]
+    return layout
+
+
+def area_position(area, cutout):
+    """
+    Get's the deck position of an addressable area of the Flex deck in a cutout
+    Return: (x, y, z)
+    """
+    if area not in area_offsets:
+        raise ValueError("the Flex deck has no %s" % area)
+    return tuple(p + o for p, o in zip(cutout_positions[cutout], area_offsets[area]))
+
+
+def slot_cutout(slot):
+    """
+    Get's the cutout of a slot, the staging slots sit in the cutout of column 3
+    """
+    return "cutout" + slot[0] + ("3" if slot[1] == "4" else slot[1])
+
+
+class Liquid:
+    def __init__(self, name, description=None, display_color=None):
+        self.name = name
+        self.description = description
+        self.display_color = display_color
+
+
+class ParameterValues:
+    """Runtime parameter values, read as attributes like protocol.params"""
+
+
+class Parameters:
+    """
+    Runtime parameter definitions, each parameter takes its default
+    """
+
+    def __init__(self):
+        self.values = ParameterValues()
+
+    def add_int(self, display_name, variable_name, default, minimum=None, maximum=None, description=None, choices=None, unit=None):
+        setattr(self.values, variable_name, default)
+
+    def add_float(self, display_name, variable_name, default, minimum=None, maximum=None, description=None, choices=None, unit=None):
+        setattr(self.values, variable_name, default)
+
+    def add_bool(self, display_name, variable_name, default, description=None):
+        setattr(self.values, variable_name, default)
+
+    def add_str(self, display_name, variable_name, default, description=None, choices=None):
+        setattr(self.values, variable_name, default)
+
+    def add_csv_file(self, display_name, variable_name, description=None):
+        setattr(self.values, variable_name, None)
+
+
+class Well(protocol_api.Well):
+    """
+    Well of a labware, passes the protocols' isinstance checks of protocol_api.Well. Points are
+    worked out from where the labware is when they are asked for
+    """
+
+    __slots__ = [
+        "parent", "well_name", "number", "x", "y", "z", "depth", "max_volume", "diameter", "length", "width",
+        "has_tip", "like", "top_location",
+    ]
+
+    def __init__(self, parent, number, geometry):
+        self.parent = parent
+        self.number = number
+        self.well_name, self.x, self.y, self.z, self.depth, self.max_volume, self.diameter, self.length, self.width = geometry
+        self.has_tip = parent.is_tiprack
+        self.like = None
+        self.top_location = None  # top(), kept until the labware moves
+
+    def make_like(self):
+        self.like = WellLike(self)
+        return self.like
+
+    @property
+    def display_name(self):
+        return repr(self)
+
+    def top(self, z=0.0):
+        if not z and self.top_location is not None:
+            return self.top_location
+        x, y, bottom = self.parent.origin
+        location = Location(types.Point(x + self.x, y + self.y, bottom + self.z + self.depth + z), self)
+        if not z:
+            self.top_location = location
+        return location
+
+    def bottom(self, z=0.0):
+        x, y, bottom = self.parent.origin
+        return Location(types.Point(x + self.x, y + self.y, bottom + self.z + z), self)
+
+    def center(self):
+        return self.top(-self.depth / 2)
+
+    def load_liquid(self, liquid, volume):
+        self.parent.context.liquids.append((self, liquid, volume))
+
+    def __repr__(self):
+        return self.well_name + " of " + self.parent.where
+
+    def __eq__(self, other):
+        if not isinstance(other, protocol_api.Well):
+            return NotImplemented
+        return self.top().point == other.top().point
+
+    def __hash__(self):
+        return hash(self.top().point)
+
+
+class Labware:
+    """
+    Labware made from its definition, placed on a slot, a module or another labware
+    """
+
+    def __init__(self, context, definition, number, label=None):
+        self.context = context
+        self.definition = definition
+        self.number = number
+        self.load_name = definition["parameters"]["loadName"]
+        self.name = self.load_name
+        self.is_tiprack = definition["parameters"]["isTiprack"]
+        self.label = label or definition["metadata"]["displayName"]
+        self.parent = None
+        self.stacked = None  # labware on top of this one
+        self.origin = (0.0, 0.0, 0.0)
+        self.where = "[off-deck]"
+        self.offset = (0.0, 0.0, 0.0)
+        self._columns = []
+        number = 0
+        for column in well_layout(definition):
+            self._columns.append([Well(self, number + i, geometry) for i, geometry in enumerate(column)])
+            number += len(column)
+        self._wells = [well for column in self._columns for well in column]
+        self._by_name = {well.well_name: well for well in self._wells}
+        self._columns_by_name = {column[0].well_name[1:]: column for column in self._columns}
+        row_names = sorted({name[0] for name in self._by_name}, key=lambda name: (len(name), name))
+        self._rows = [[well for well in self._wells if well.well_name[0] == row] for row in row_names]
+
+    def place(self, parent):
+        """
+        Puts the labware on a slot, module or labware (or off the deck) and works out where its
+        wells are
+        """
+        self.parent = parent
+        self.offset = (0.0, 0.0, 0.0)
+        for well in self._wells:
+            well.like = None  # its text has the labware's place in it
+            well.top_location = None
+        corner = self.definition["cornerOffsetFromSlot"]
+        if isinstance(parent, str):
+            base = area_position(parent, slot_cutout(parent))
+            self.where = "slot " + parent
+        elif isinstance(parent, Module):
+            base = parent.labware_position
+            self.where = "%s on slot %s" % (parent.display_name, parent.parent)
+        elif isinstance(parent, Labware):
+            x, y, z = parent.origin
+            stacking = self.definition.get("stackingOffsetWithLabware", {})
+            overlap = stacking.get(parent.load_name, stacking.get("default", {"z": 0}))["z"]
+            base = (x, y, z - parent.definition["cornerOffsetFromSlot"]["z"] + parent.definition["dimensions"]["zDimension"] - overlap)
+            self.where = "%s on %s" % (parent, parent.where)
+        else:
+            base = (0.0, 0.0, 0.0)
+            self.where = "[off-deck]"
+        self.origin = (base[0] + corner["x"], base[1] + corner["y"], base[2] + corner["z"])
+        if self.stacked is not None:
+            self.stacked.place(self)
+
+    def set_offset(self, x, y, z):
+        ox, oy, oz = self.origin
+        px, py, pz = self.offset
+        self.origin = (ox - px + x, oy - py + y, oz - pz + z)
+        self.offset = (x, y, z)
+        for well in self._wells:
+            well.top_location = None
+
+    def wells(self, *args):
+        if args:
+            return [self[arg] if isinstance(arg, str) else self._wells[arg] for arg in args]
+        return list(self._wells)
+
+    def columns(self, *args):
+        if args:
+            return [list(self._columns[int(arg) - 1 if isinstance(arg, str) else arg]) for arg in args]
+        return [list(column) for column in self._columns]
+
+    def rows(self, *args):
+        return [list(row) for row in self._rows]
+
+    def wells_by_name(self):
+        return dict(self._by_name)
+
+    def columns_by_name(self):
+        return self._columns_by_name  # read on every command by the loading sheet, not copied
+
+    def rows_by_name(self):
+        return {row[0].well_name[0]: list(row) for row in self._rows}
+
+    def __getitem__(self, name):
+        return self._by_name[name]
+
+    def next_tip(self, num_tips=1, starting_tip=None):
+        """
+        Get's the first well of the first run of num_tips tips down a column, from starting_tip on
+        """
+        start = 0 if starting_tip is None else starting_tip.number
+        for column in self._columns:
+            for i in range(0, len(column) - num_tips + 1):
+                if column[i].number >= start and all(well.has_tip for well in column[i:i + num_tips]):
+                    return column[i]
+        return None
+
+    def __repr__(self):
+        return self.label
+
+
+class FlowRates:
+    def __init__(self, aspirate, dispense, blow_out):
+        self.aspirate = aspirate
+        self.dispense = dispense
+        self.blow_out = blow_out
+
+
+class Pipette:
+    """
+    Pipette that records its commands, with the signatures of InstrumentContext so the protocols'
+    wrappers bind the same arguments
+    """
+
+    def __init__(self, context, instrument_name, mount, tip_racks, number):
+        if instrument_name not in pipettes:
+            raise ValueError("no pipette %s" % instrument_name)
+        name, channels, max_volume, aspirate, dispense, blow_out = pipettes[instrument_name]
+        self.context = context
+        self.number = number
+        self.name = name
+        self.mount = mount
+        self.channels = channels
+        self.active_channels = channels
+        self.start_nozzle = "A1"
+        self.max_volume = max_volume
+        self.min_volume = 5.0 if max_volume == 1000 else 1.0
+        self.flow_rate = FlowRates(aspirate, dispense, blow_out)
+        self.tip_racks = list(tip_racks or [])
+        self.has_tip = False
+        self.current_volume = 0.0
+        self.tip_volume = 0.0
+        self.last_tip = None
+
+    def _location(self, location, height, command):
+        """
+        Get's the location of a command given a well, a location or nothing (where the last command was)
+        Return: location, well (None for a disposal location)
+        """
+        if location is None:
+            location = self.context.last_location
+            if location is None:
+                raise RuntimeError("%s %s: no location given and no last location" % (self.name, command))
+        elif isinstance(location, Well):
+            location = location.bottom(height) if height is not None else location.top()
+        self.context.last_location = location
+        if isinstance(location, types.Location) and location.labware.is_well:
+            return location, location.labware.as_well()
+        return location, None
+
+    def _record(self, kind, volume=0.0, location=None, well=None):
+        if well is None:
+            self.context.log.add(kind, self.context.level, self.number, volume)
+            return
+        self.context.log.add(
+            kind,
+            self.context.level,
+            self.number,
+            volume,
+            well.parent.number,
+            well.number,
+            location.point.z - well.parent.origin[2] - well.z,
+        )
+
+    def _need_tip(self, command):
+        if not self.has_tip:
+            raise RuntimeError("%s %s without a tip" % (self.name, command))
+
+    @command
+    def aspirate(self, volume=None, location=None, rate=1.0):
+        self._need_tip("aspirate")
+        if volume is None:
+            volume = self.tip_volume - self.current_volume
+        if self.current_volume + volume > self.tip_volume + tolerance:
+            raise RuntimeError(
+                "%s aspirate of %g uL over the %g uL tip holding %g uL" % (self.name, volume, self.tip_volume, self.current_volume)
+            )
+        location, well = self._location(location, well_bottom_clearance, "aspirate")
+        self._record("aspirate", volume, location, well)
+        self.current_volume += volume
+        return self
+
+    @command
+    def dispense(self, volume=None, location=None, rate=1.0, push_out=None):
+        self._need_tip("dispense")
+        if volume is None:
+            volume = self.current_volume
+        if volume > self.current_volume + tolerance:
+            raise RuntimeError("%s dispense of %g uL with %g uL in the tip" % (self.name, volume, self.current_volume))
+        location, well = self._location(location, well_bottom_clearance, "dispense")
+        self._record("dispense", volume, location, well)
+        self.current_volume = max(self.current_volume - volume, 0.0)
+        return self
+
+    @command
+    def blow_out(self, location=None):
+        self._need_tip("blow_out")
+        location, well = self._location(location, None, "blow_out")
+        self._record("blow_out", 0.0, location, well)
+        self.current_volume = 0.0
+        return self
+
+    @command
+    def touch_tip(self, location=None, radius=1.0, v_offset=-1.0, speed=60.0):
+        self._need_tip("touch_tip")
+        if isinstance(location, Well):
+            location = location.top(v_offset)
+        location, well = self._location(location, None, "touch_tip")
+        self._record("touch_tip", 0.0, location, well)
+        return self
+
+    @command
+    def mix(self, repetitions=1, volume=None, location=None, rate=1.0):
+        self._need_tip("mix")
+        self._record("mix", self.tip_volume - self.current_volume if volume is None else volume)
+        self.context.level += 1
+        try:
+            self.aspirate(volume, location, rate)
+            while repetitions - 1 > 0:
+                self.dispense(volume, rate=rate, push_out=0.0)
+                self.aspirate(volume, rate=rate)
+                repetitions -= 1
+            self.dispense(volume, rate=rate)
+        finally:
+            self.context.level -= 1
+        return self
+
+    @command
+    def air_gap(self, volume=None, height=None):
+        self._need_tip("air_gap")
+        location = self.context.last_location
+        if location is None or not location.labware.is_well:
+            raise RuntimeError("%s air_gap with no last well" % self.name)
+        self._record("air_gap", volume)
+        self.context.level += 1
+        try:
+            self.move_to(location.labware.as_well().top(air_gap_height if height is None else height), publish=False)
+            self.aspirate(volume)
+        finally:
+            self.context.level -= 1
+        return self
+
+    @command
+    def move_to(self, location, force_direct=False, minimum_z_height=None, speed=None, publish=True):
+        self.context.last_location = location
+        if publish:
+            well = location.labware.as_well() if isinstance(location, types.Location) and location.labware.is_well else None
+            self._record("move_to", 0.0, location, well)
+        return self
+
+    @command
+    def pick_up_tip(self, location=None, presses=None, increment=None, prep_after=None):
+        if self.has_tip:
+            raise RuntimeError("%s already has a tip" % self.name)
+        if isinstance(location, types.Location):
+            location = location.labware.as_well()
+        if isinstance(location, Labware):
+            location = location.next_tip(self.active_channels)
+        elif location is None:
+            for rack in self.tip_racks:
+                location = rack.next_tip(self.active_channels)
+                if location is not None:
+                    break
+        if location is None:
+            raise protocol_api.labware.OutOfTipsError("%s is out of tips" % self.name)
+        column = location.parent.columns_by_name()[location.well_name[1:]]
+        row = column.index(location)
+        for well in column[row:row + self.active_channels]:
+            well.has_tip = False
+        if self.start_nozzle[0] == "H":
+            location = column[row + self.active_channels - 1]  # the front nozzle goes to the front tip
+        self._record("pick_up_tip", 0.0, location.top(), location)
+        self.context.last_location = location.top()
+        self.has_tip = True
+        self.current_volume = 0.0
+        self.tip_volume = min(location.max_volume, self.max_volume)
+        self.last_tip = location
+        return self
+
+    @command
+    def drop_tip(self, location=None, home_after=None):
+        self._need_tip("drop_tip")
+        if location is None:
+            location = self.context.trash
+        if isinstance(location, Well):
+            location = location.top()
+        if isinstance(location, types.Location):
+            self._record("drop_tip", 0.0, location, location.labware.as_well())
+        else:
+            self._record("drop_tip")
+        self.has_tip = False
+        self.current_volume = 0.0
+        return self
+
+    @command
+    def return_tip(self, home_after=None):
+        if self.last_tip is None:
+            raise TypeError("%s has no tip to return" % self.name)
+        self._record("return_tip")
+        self.context.level += 1
+        try:
+            self.drop_tip(self.last_tip, home_after=home_after)
+        finally:
+            self.context.level -= 1
+        return self
+
+    def measure_liquid_height(self, well):
+        return well.depth  # what the simulator gives, it has no liquid to find
+
+    @command
+    def configure_nozzle_layout(self, style, start=None, end=None, front_right=None, back_left=None, tip_racks=None):
+        style = getattr(style, "value", style)
+        if style == "ALL":
+            channels = self.channels
+            start = "A1"
+        elif self.channels == 1:
+            raise ValueError("%s has one nozzle, it has no %s layout" % (self.name, style))
+        elif start is None:
+            raise ValueError("%s %s layout needs a start nozzle" % (self.name, style))
+        elif style == "SINGLE":
+            channels = 1
+        elif style == "COLUMN":
+            channels = self.channels
+        elif style == "PARTIAL_COLUMN":
+            if end is None:
+                raise ValueError("%s PARTIAL_COLUMN layout needs an end nozzle" % self.name)
+            channels = abs(nozzle_rows.index(end[0]) - nozzle_rows.index(start[0])) + 1
+        else:
+            raise ValueError("%s has no %s layout" % (self.name, style))
+        self.context.log.add(
+            "configure_nozzle_layout", self.context.level, self.number, channels, text="%s %s" % (style, start)
+        )
+        self.active_channels = channels
+        self.start_nozzle = start
+        if tip_racks is not None:
+            self.tip_racks = list(tip_racks)
+        return self
+
+    def __repr__(self):
+        return "<Pipette: %s in %s>" % (self.name, str(self.mount).upper())
+
+
+class WasteChute:
+    def __repr__(self):
+        return "Waste Chute"
+
+
+class Module:
+    """
+    Module in a slot, its labware sits at the addressable area the module gives the slot
+    """
+
+    def __init__(self, context, model, slot):
+        definition = load_module_definition("3", model)
+        self.context = context
+        self.model = model
+        self.parent = slot
+        self.display_name = definition["displayName"]
+        fixtures = {f["id"]: f for f in deck_definition["cutoutFixtures"]}
+        area = fixtures[model]["providesAddressableAreas"][slot_cutout(slot)][0]
+        self.labware_position = area_position(area, slot_cutout(slot))
+        self.labware = None
+
+    def load_labware(self, name, label=None, namespace=None, version=None, adapter=None):
+        return self.context.load_labware(name, self, label=label, namespace=namespace, version=version)
+
+    def _record(self, kind, value=0.0):
+        self.context.log.add(kind, self.context.level, -1, value, text=self.parent)
+
+    def __repr__(self):
+        return "%s at %s on %s lw %s" % (self.context_name, self.display_name, self.parent, self.labware)
+
+
+class HeaterShaker(Module):
+    context_name = "HeaterShakerContext"
+
+    def __init__(self, context, model, slot):
+        Module.__init__(self, context, model, slot)
+        self.latch = None  # unknown until it is opened or closed
+        self.speed = 0
+        self.target_temperature = None
+
+    @command
+    def open_labware_latch(self):
+        if self.speed:
+            raise RuntimeError("%s: the latch can't be opened while shaking" % self)
+        self._record("open_labware_latch")
+        self.latch = "open"
+
+    @command
+    def close_labware_latch(self):
+        self._record("close_labware_latch")
+        self.latch = "closed"
+
+    @command
+    def set_and_wait_for_shake_speed(self, rpm):
+        if self.latch != "closed":
+            raise RuntimeError("%s: the latch has to be closed to shake" % self)
+        self._record("set_and_wait_for_shake_speed", rpm)
+        self.speed = rpm
+
+    @command
+    def deactivate_shaker(self):
+        self._record("deactivate_shaker")
+        self.speed = 0
+
+    @command
+    def set_target_temperature(self, celsius):
+        self._record("set_target_temperature", celsius)
+        self.target_temperature = celsius
+
+    @command
+    def wait_for_temperature(self):
+        if self.target_temperature is None:
+            raise RuntimeError("%s: no target temperature to wait for" % self)
+        self._record("wait_for_temperature", self.target_temperature)
+
+    @command
+    def set_and_wait_for_temperature(self, celsius):
+        self.set_target_temperature(celsius)
+        self.wait_for_temperature()
+
+    @command
+    def deactivate_heater(self):
+        self._record("deactivate_heater")
+        self.target_temperature = None
+
+
+class AbsorbanceReader(Module):
+    context_name = "AbsorbanceReaderContext"
+
+    def __init__(self, context, model, slot):
+        Module.__init__(self, context, model, slot)
+        self.lid = None  # unknown until it is opened or closed
+        self.wavelengths = None
+
+    @command
+    def open_lid(self):
+        self._record("open_lid")
+        self.lid = "open"
+
+    @command
+    def close_lid(self):
+        self._record("close_lid")
+        self.lid = "closed"
+
+    @command
+    def initialize(self, mode, wavelengths, reference_wavelength=None):
+        if self.lid != "closed":
+            raise RuntimeError("%s: the lid has to be closed to initialize" % self)
+        self._record("initialize", wavelengths[0])
+        self.wavelengths = list(wavelengths)
+
+    @command
+    def read(self, export_filename=None):
+        if self.wavelengths is None or self.lid != "closed":
+            raise RuntimeError("%s: read needs the reader initialized and its lid closed" % self)
+        self._record("read")
+        names = [well.well_name for well in self.labware.wells()] if self.labware else []
+        return {wavelength: {name: 0.0 for name in names} for wavelength in self.wavelengths}
+
+
+class MagneticBlock(Module):
+    context_name = "MagneticBlockContext"
+
+
+modules = {
+    "heaterShakerModuleV1": HeaterShaker,
+    "absorbanceReaderV1": AbsorbanceReader,
+    "magneticBlockV1": MagneticBlock,
+}
+
+
+class Deck:
+    """
+    Slots of the deck: the labware or module in each slot
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.slots = {}
+
+    def __getitem__(self, slot):
+        return self.slots.get(slot)
+
+    def __delitem__(self, slot):
+        item = self.slots.get(slot)
+        if isinstance(item, Module):
+            raise TypeError("Slot %r contains a module, %s. You can only delete labware, not modules." % (slot, item.display_name))
+        if item is not None:
+            self.context.place(item, protocol_api.OFF_DECK)
+
+    def __contains__(self, slot):
+        return self.slots.get(slot) is not None
+
+
+class RecordingContext:
+    """
+    Stand-in for ProtocolContext that records the commands of a run into a CommandLog
+    Labware_paths: directories of custom labware definitions
+    Parameters: Parameters with the runtime parameters of the protocol defined
+    """
+
+    def __init__(self, labware_paths=(), parameters=None):
+        self.labware_paths = list(labware_paths)
+        self.params = (parameters or Parameters()).values
+        self.log = CommandLog()
+        self.deck = Deck(self)
+        self.labware = []  # in load order, the number of a labware in the log
+        self.pipettes = []
+        self.liquids = []  # (well, liquid, µL) of every load_liquid
+        self.trash = None
+        self.last_location = None
+        self.level = 0
+
+    def is_simulating(self):
+        return True
+
+    @command
+    def comment(self, msg):
+        self.log.add("comment", self.level, text=msg)
+
+    @command
+    def delay(self, seconds=0, minutes=0, msg=None):
+        self.log.add("delay", self.level, value=seconds + minutes * 60, text=msg)
+
+    @command
+    def pause(self, msg=None):
+        self.log.add("pause", self.level, text=msg)
+
+    def define_liquid(self, name, description=None, display_color=None):
+        return Liquid(name, description, display_color)
+
+    def place(self, labware, location):
+        """
+        Takes a labware from where it is and puts it in a location, checking the location is free
+        """
+        parent = labware.parent
+        if isinstance(parent, str):
+            del self.deck.slots[parent]
+        elif isinstance(parent, Module):
+            parent.labware = None
+        elif isinstance(parent, Labware):
+            parent.stacked = None
+        if isinstance(location, str):
+            if self.deck.slots.get(location) is not None:
+                raise RuntimeError("slot %s already holds %s" % (location, self.deck.slots[location]))
+            self.deck.slots[location] = labware
+        elif isinstance(location, Module):
+            if location.labware is not None:
+                raise RuntimeError("%s already holds %s" % (location, location.labware))
+            location.labware = labware
+        elif isinstance(location, Labware):
+            roles = labware.definition.get("allowedRoles", [])
+            if "adapter" in roles or location.load_name not in labware.definition.get("stackingOffsetWithLabware", {}):
+                raise RuntimeError("%s can't be stacked on %s" % (labware.load_name, location.load_name))
+            if isinstance(location.parent, Module) and "lid" not in roles and "adapter" not in location.definition.get("allowedRoles", []):
+                raise RuntimeError("%s can't be stacked on labware on a module" % labware.load_name)
+            if location.stacked is not None:
+                raise RuntimeError("%s already has %s on it" % (location, location.stacked))
+            location.stacked = labware
+        elif isinstance(location, WasteChute):
+            location = protocol_api.OFF_DECK
+        labware.place(location)
+
+    def load_labware(self, load_name, location, label=None, namespace=None, version=None, adapter=None):
+        definition = labware_definition(load_name, version, self.labware_paths)
+        labware = Labware(self, definition, len(self.labware), label)
+        self.labware.append(labware)
+        self.place(labware, location)
+        return labware
+
+    def load_module(self, module_name, location=None, configuration=None):
+        if module_name not in modules:
+            raise ValueError("no module %s" % module_name)
+        if self.deck.slots.get(location) is not None:
+            raise RuntimeError("slot %s already holds %s" % (location, self.deck.slots[location]))
+        module = modules[module_name](self, module_name, location)
+        self.deck.slots[location] = module
+        return module
+
+    def load_instrument(self, instrument_name, mount=None, tip_racks=None, replace=False, liquid_presence_detection=None):
+        pipette = Pipette(self, instrument_name, mount, tip_racks, len(self.pipettes))
+        self.pipettes.append(pipette)
+        return pipette
+
+    def load_waste_chute(self):
+        self.trash = WasteChute()
+        return self.trash
+
+    @command
+    def move_labware(self, labware, new_location, use_gripper=False, pick_up_offset=None, drop_offset=None):
+        for module in [labware.parent, new_location]:
+            if isinstance(module, HeaterShaker) and module.latch != "open":
+                raise RuntimeError("%s: the latch has to be open to move labware to or from it" % module)
+            if isinstance(module, AbsorbanceReader) and module.lid != "open":
+                raise RuntimeError("%s: the lid has to be open to move labware to or from it" % module)
+        if isinstance(new_location, str):
+            where = new_location
+        elif new_location is protocol_api.OFF_DECK or isinstance(new_location, WasteChute):
+            where = repr(new_location)
+        else:
+            where = new_location.display_name if isinstance(new_location, Module) else repr(new_location)
+        self.log.add("move_labware", self.level, -1, 1.0 if use_gripper else 0.0, labware.number, text=where)
+        self.place(labware, new_location)
+
+
+def load_protocol(path, params):
+    """
+    Executes a protocol file once, with the defaults of some runtime parameters changed
+    Return: the protocol's namespace, run() and add_parameters() are called from it for every run
+    """
+    namespace = {"__name__": os.path.splitext(os.path.basename(path))[0], "__file__": path}
+    exec(compile(protocol_source(path, params), path, "exec"), namespace)
+    return namespace
+
+
+def record_run(namespace, labware_paths=()):
+    """
+    Runs a loaded protocol on a new RecordingContext
+    Return: RecordingContext with the run's CommandLog in log
+    """
+    parameters = Parameters()
+    if "add_parameters" in namespace:
+        namespace["add_parameters"](parameters)
+    context = RecordingContext(labware_paths, parameters)
+    namespace["run"](context)
+    context.log.flush()
+    return context
+
+
+def simulator_commands(path, params, labware_paths):
+    """
+    Simulates a protocol and sorts its run log into commands, the comments are caught on the way
+    in as their text can be anything
+    Return: [(kind, level, µL)], comments
+    """
+    comments = []
+    comment = protocol_api.ProtocolContext.comment
+
+    def recording_comment(self, msg):
+        comments.append(msg)
+        return comment(self, msg)
+
+    protocol_api.ProtocolContext.comment = recording_comment
+    try:
+        runlog, _ = simulate.simulate(
+            io.StringIO(protocol_source(path, params)),
+            file_name=os.path.basename(path),
+            custom_labware_paths=labware_paths,
+        )
+    finally:
+        protocol_api.ProtocolContext.comment = comment
+    commands = []
+    j = 0
+    for entry in runlog:
+        text = entry["payload"]["text"]
+        if j < len(comments) and text == comments[j]:
+            commands.append(("comment", entry["level"], 0.0))
+            j += 1
+            continue
+        kind = next((kind for prefix, kind in simulator_kinds if text.startswith(prefix)), text)
+        found = volume_text.match(text)
+        commands.append((kind, entry["level"], float(found.group(1)) if found else 0.0))
+    return commands, comments
+
+
+def recorded_commands(log):
+    """
+    Get's the commands of a CommandLog that show in the simulator's run log
+    Return: [(kind, level, µL)]
+    """
+    return [
+        (kinds[kind], level, round(value, 2) if kinds[kind] in ("aspirate", "dispense") else 0.0)
+        for kind, level, value in zip(log.kind, log.level, log.value)
+        if kinds[kind] not in unpublished
+    ]
+
+
+def compare(recorded, recorded_comments, simulated, simulated_comments):
+    """
+    Return: list of differences between the recorded and the simulated run
+    """
+    problems = []
+    simulated = [(kind, level, round(value, 2)) for kind, level, value in simulated]
+    for i, (mine, theirs) in enumerate(zip(recorded, simulated)):
+        if mine != theirs:
+            problems.append("command %d: %s, simulator %s" % (i, mine, theirs))
+            break
+    if len(recorded) != len(simulated):
+        problems.append("%d commands, simulator %d" % (len(recorded), len(simulated)))
+    for i, (mine, theirs) in enumerate(zip(recorded_comments, simulated_comments)):
+        if mine != theirs:
+            problems.append("comment %d: %r, simulator %r" % (i, mine, theirs))
+            break
+    return problems
+
+
+def main(args):
+    paths = []
+    params = {}
+    labware_paths = []
+    runs = 10
+    while args:
+        arg = args.pop(0)
+        if arg == "-L":
+            labware_paths.append(args.pop(0))
+        elif arg == "-n":
+            runs = int(args.pop(0))
+        elif "=" in arg:
+            name, value = arg.split("=", 1)
+            params[name] = value
+        else:
+            paths.append(arg)
+    failed = False
+    for path in paths or protocols:
+        protocol_params = {
+            name: value for name, value in params.items() if 'variable_name="%s"' % name in open(path).read()
+        }
+        namespace = load_protocol(path, protocol_params)
+        start = time.perf_counter()
+        for _ in range(0, runs):
+            context = record_run(namespace, labware_paths)
+        recorded_seconds = (time.perf_counter() - start) / runs
+        start = time.perf_counter()
+        simulated, simulated_comments = simulator_commands(path, protocol_params, labware_paths)
+        simulated_seconds = time.perf_counter() - start
+        log = context.log
+        print(
+            "%s: %d commands, %.4f s per recorded run, %.2f s simulated, %.0fx faster"
+            % (path, len(log), recorded_seconds, simulated_seconds, simulated_seconds / recorded_seconds)
+        )
+        print("    " + ", ".join("%s: %d" % (kind, n) for kind, n in log.counts().items()))
+        for problem in compare(recorded_commands(log), log.texts("comment"), simulated, simulated_comments):
+            failed = True
+            print("    DIFFERS: " + problem)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
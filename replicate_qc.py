@@ -0,0 +1,180 @@
+"""
+Re-run files from the replicate QC of a BCA or Bradford run.
+
+The protocol is simulated with its plates read on the absorbance reader, and the replicate QC it
+runs at the end lists the samples to re-run. Reader exports given with -r are read in place of the
+simulator's synthetic plates, one file per assay plate in plate order, so the QC runs on the
+absorbances of a real run done with the same parameters. For each dilution the samples are re-run
+at, writes the re-run CSV and a copy of the protocol with the CSV in rerun_csv, ready to upload. A
+protocol that dilutes each sample on its own gets a single re-run with every sample in it.
+
+The protocol's synthetic plates are clean, -f adds faults to them to try the QC out: every 7th
+sample gets a replicate 30% too high and every 11th sample reads above the top standard.
+
+Usage: python replicate_qc.py protocol.py [-L labware_dir] [-r plate.csv ...] [-f] [-o output_dir] [name=value ...]
+name=value sets the default of a runtime parameter, e.g. number_samples=24
+"""
+
+import sys
+import os
+import io
+import re
+import csv
+from opentrons import simulate
+from opentrons import protocol_api
+from command_check import protocol_source
+
+rerun_line = re.compile(r"^Re-run(?: x(\d+))?: (.*)$")  # run log comment of the protocol's ReplicateQC
+plate_rows = ["A", "B", "C", "D", "E", "F", "G", "H"]
+# appended to the protocol source, wraps the synthetic plate of its PlateQuantifier with faults
+synthetic_faults = """
+
+def _synthetic_with_faults(synthetic):
+    def faulty(self, plate_index):
+        absorbances = synthetic(self, plate_index)
+        above = self.synthetic_blank + numpy.polyval(self.synthetic_response, 1.15)
+        for sample, wells in self.layout(plate_index)[1]:
+            if sample % 11 == 10:
+                for well in wells:
+                    absorbances[well] = above
+            elif sample % 7 == 6:
+                absorbances[wells[-1]] *= 1.3
+        return absorbances
+
+    return faulty
+
+
+PlateQuantifier.synthetic = _synthetic_with_faults(PlateQuantifier.synthetic)
+"""
+
+
+def read_plate(path):
+    """
+    Get's the absorbances of a reader export, the plate is the lines that start with a row letter
+    followed by 12 numbers
+    Return: {well name: absorbance}
+    """
+    plate = {}
+    with open(path, newline="") as f:
+        for line in csv.reader(f):
+            cells = [cell.strip() for cell in line]
+            if not cells or cells[0] not in plate_rows:
+                continue
+            values = []
+            for cell in cells[1:13]:
+                try:
+                    values.append(float(cell))
+                except ValueError:
+                    break
+            if len(values) == 12:
+                for column, value in enumerate(values):
+                    plate[cells[0] + str(column + 1)] = value
+    if len(plate) != 96:
+        raise ValueError("%s doesn't have the absorbances of a 96 well plate" % path)
+    return plate
+
+
+def simulate_qc(path, params, labware_paths, plates, faults=False):
+    """
+    Simulates a protocol with its plates read. The reader gives the plates in order while there are
+    any left, then the protocol's synthetic plates
+    Faults: True to add faults to the synthetic plates
+    Return: {dilution: re-run CSV lines}, None for the dilution of a re-run at mixed dilutions
+    """
+    plates = list(plates)
+    read = protocol_api.AbsorbanceReaderContext.read
+
+    def exported_read(self, *args, **kwargs):
+        result = read(self, *args, **kwargs)
+        if not plates:
+            return result
+        plate = plates.pop(0)
+        return {wavelength: dict(plate) for wavelength in result}
+
+    source = protocol_source(path, params)
+    if faults:
+        source += synthetic_faults
+    protocol_api.AbsorbanceReaderContext.read = exported_read
+    try:
+        runlog, _ = simulate.simulate(
+            io.StringIO(source),
+            file_name=os.path.basename(path),
+            custom_labware_paths=labware_paths,
+        )
+    finally:
+        protocol_api.AbsorbanceReaderContext.read = read
+    reruns = {}
+    for entry in runlog:
+        found = rerun_line.match(entry["payload"]["text"])
+        if found:
+            dilution = None if found.group(1) is None else int(found.group(1))
+            reruns.setdefault(dilution, []).append(found.group(2))
+    return reruns
+
+
+def rerun_protocol(path, text):
+    """
+    Get's the protocol with a re-run CSV in rerun_csv
+    """
+    with open(path) as f:
+        source = f.read()
+    source, found = re.subn(
+        r'rerun_csv = """.*?"""', lambda m: 'rerun_csv = """\n%s"""' % text, source, count=1, flags=re.S
+    )
+    if not found:
+        raise ValueError("%s takes no re-run CSV" % path)
+    return source
+
+
+def main(args):
+    paths = []
+    params = {}
+    labware_paths = []
+    plate_paths = []
+    output_dir = "."
+    faults = False
+    while args:
+        arg = args.pop(0)
+        if arg == "-L":
+            labware_paths.append(args.pop(0))
+        elif arg == "-r":
+            plate_paths.append(args.pop(0))
+        elif arg == "-f":
+            faults = True
+        elif arg == "-o":
+            output_dir = args.pop(0)
+        elif "=" in arg:
+            name, value = arg.split("=", 1)
+            params[name] = value
+        else:
+            paths.append(arg)
+    if len(paths) != 1:
+        print(__doc__)
+        return 1
+    path = paths[0]
+    params["read_absorbance"] = "True"
+    plates = [read_plate(plate_path) for plate_path in plate_paths]
+    reruns = simulate_qc(path, params, labware_paths, plates, faults)
+    name = os.path.splitext(os.path.basename(path))[0]
+    if not reruns:
+        print("%s: every sample passes" % path)
+    for dilution, lines in sorted(reruns.items(), key=lambda item: item[0] or 0):
+        text = "\n".join(lines) + "\n"
+        if dilution is None:
+            stem = os.path.join(output_dir, "%s_rerun" % name)
+            at = "at their own dilutions"
+        else:
+            stem = os.path.join(output_dir, "%s_rerun_x%d" % (name, dilution))
+            at = "at x%d" % dilution
+        with open(stem + ".csv", "w") as f:
+            f.write(text)
+        with open(stem + ".py", "w") as f:
+            f.write(rerun_protocol(path, text))
+        print("%s: %d samples to re-run %s, %s.csv and %s.py" % (path, len(lines) - 1, at, stem, stem))
+        for line in lines[1:]:
+            print("    " + line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
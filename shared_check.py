@@ -0,0 +1,113 @@
+"""
+Checks the code the protocols share is the same in every protocol.
+
+The app takes a protocol as a single file, so the classes and functions the assays share are
+copied into each protocol that uses them. Each has a canonical protocol it is edited in, the
+copies in the other protocols have to match it exactly. -w copies the canonical definitions over
+the ones that drifted, so a fix is made once in the canonical protocol and then written out.
+
+Usage: python shared_check.py [-w]
+"""
+
+import sys
+import ast
+
+# name: canonical protocol, the protocols with a copy
+shared = {
+    "get_vol_50ml_falcon": ("bradford_final.py", ["single_plate_bca.py", "multi_plate_bca.py", "hilic_large_plate.py"]),
+    "get_height_50ml_falcon": ("bradford_final.py", ["single_plate_bca.py", "multi_plate_bca.py"]),
+    "get_vol_15ml_falcon": ("bradford_final.py", ["single_plate_bca.py", "multi_plate_bca.py", "hilic_large_plate.py"]),
+    "find_aspirate_height": ("bradford_final.py", ["single_plate_bca.py", "multi_plate_bca.py", "hilic_large_plate.py"]),
+    "above_liquid": ("bradford_final.py", ["single_plate_bca.py", "multi_plate_bca.py", "hilic_large_plate.py"]),
+    "dispense_chunks": ("bradford_final.py", ["single_plate_bca.py", "multi_plate_bca.py", "hilic_large_plate.py"]),
+    "plan_dispense_order": ("bradford_final.py", ["single_plate_bca.py", "multi_plate_bca.py"]),
+    "travel_report": ("bradford_final.py", ["single_plate_bca.py", "multi_plate_bca.py"]),
+    "diluent_columns": ("bradford_final.py", ["single_plate_bca.py", "multi_plate_bca.py"]),
+    "ProtocolClock": ("bradford_final.py", ["hilic_large_plate.py"]),
+    "CommandOptimiser": ("bradford_final.py", ["single_plate_bca.py", "multi_plate_bca.py", "hilic_large_plate.py"]),
+    "LoadingSheet": ("bradford_final.py", ["single_plate_bca.py", "multi_plate_bca.py", "hilic_large_plate.py"]),
+    "TipPlanner": ("bradford_final.py", ["single_plate_bca.py", "multi_plate_bca.py", "hilic_large_plate.py"]),
+    "AssayCompiler": ("bradford_final.py", ["single_plate_bca.py", "multi_plate_bca.py"]),
+    "PlateQuantifier": ("bradford_final.py", ["single_plate_bca.py"]),
+    "ReplicateQC": ("bradford_final.py", ["single_plate_bca.py"]),
+    "read_rerun_csv": ("bradford_final.py", ["single_plate_bca.py"]),
+    "MultiDispense": ("single_plate_bca.py", ["multi_plate_bca.py"]),
+    "read_dilution_csv": ("single_plate_bca.py", ["multi_plate_bca.py"]),
+}
+
+
+def definitions(path):
+    """
+    Get's the top level classes and functions of a protocol
+    Return: {name: (first line, last line)} counted from 0, the lines of the file
+    """
+    with open(path) as f:
+        source = f.read()
+    lines = source.splitlines(keepends=True)
+    found = {}
+    for node in ast.parse(source).body:
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            first = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list]) - 1
+            found[node.name] = (first, node.end_lineno)
+    return found, lines
+
+
+def check(write=False):
+    """
+    Compares the copies with their canonical definitions, writing the canonical ones over them if asked
+    Return: list of problems
+    """
+    files = {}
+
+    def read(path):
+        if path not in files:
+            files[path] = definitions(path)
+        return files[path]
+
+    problems = []
+    rewrites = {}  # path: [(first line, last line, canonical lines)]
+    for name, (canonical, copies) in shared.items():
+        found, lines = read(canonical)
+        if name not in found:
+            problems.append("%s has no %s" % (canonical, name))
+            continue
+        first, last = found[name]
+        text = lines[first:last]
+        for path in copies:
+            copy_found, copy_lines = read(path)
+            if name not in copy_found:
+                problems.append("%s has no copy of %s" % (path, name))
+                continue
+            copy_first, copy_last = copy_found[name]
+            if copy_lines[copy_first:copy_last] != text:
+                problems.append("%s in %s differs from %s" % (name, path, canonical))
+                rewrites.setdefault(path, []).append((copy_first, copy_last, text))
+    if write:
+        for path, changes in rewrites.items():
+            lines = list(files[path][1])
+            for first, last, text in sorted(changes, reverse=True):
+                lines[first:last] = text
+            with open(path, "w") as f:
+                f.write("".join(lines))
+    return problems
+
+
+def main(args):
+    write = False
+    while args:
+        arg = args.pop(0)
+        if arg == "-w":
+            write = True
+        else:
+            print(__doc__)
+            return 1
+    problems = check(write)
+    for problem in problems:
+        print(("WROTE: " if write and "differs" in problem else "DRIFTED: ") + problem)
+    if not problems:
+        print("%d shared definitions match their canonical protocol" % len(shared))
+    return 1 if problems and not write else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
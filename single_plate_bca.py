@@ -3,14 +3,23 @@
 #standard slow down create more
 
 metadata = {
-    "protocolName": "NO QUICK TRANSFER AT ALL Single-plate BCA protocol with Quick Transfer",
+    "protocolName": "Single-plate BCA protocol with Quick Transfer",
     "author": "Nico To (modification of Sasha's original BCA protocol)",
-    "description": "no quick transfer for protein addition step and standard creation. BCA for 1-24 samples.",
+    "description": "BCA for 1-24 samples. Protein addition and standard creation multi dispense when chosen.",
 }
-requirements = {"robotType": "Flex", "apiLevel": "2.20"}
+requirements = {"robotType": "Flex", "apiLevel": "2.21"}
 import math
 from opentrons import protocol_api
+from opentrons import types
+import inspect
+import functools
+import itertools
+import random
+import csv
+import io
+import numpy
 
+# copy of get_vol_50ml_falcon in bradford_final.py, edit it there and run shared_check.py -w
 def get_vol_50ml_falcon(height):
     """
     Get's the volume of the liquid in the tube
@@ -19,6 +28,7 @@ def get_vol_50ml_falcon(height):
     """
     volume = (1000 * (height - 9)) / 1.8
     return volume
+# copy of get_height_50ml_falcon in bradford_final.py, edit it there and run shared_check.py -w
 def get_height_50ml_falcon(volume):
     """
     Get's the height of the liquid in the tube
@@ -39,6 +49,7 @@ def get_height_15ml_falcon(volume):
         return -3.33 * (volume**2) + 15.45 * volume + 9.50 - 1  # −3.33x2+15.45x+9.50
     else:
         return 6.41667 * volume + 15.1667 - 5
+# copy of get_vol_15ml_falcon in bradford_final.py, edit it there and run shared_check.py -w
 def get_vol_15ml_falcon(height):
     """
     Get's the volume of the liquid in the tube
@@ -52,6 +63,1744 @@ def get_vol_15ml_falcon(height):
         volume = ((height - 10.1667) / 6.41667) * 1000
         return volume
 
+# copy of plan_dispense_order in bradford_final.py, edit it there and run shared_check.py -w
+def plan_dispense_order(source, targets):
+    """
+    Orders the wells filled from one aspiration so the gantry travels the least, starting and
+    ending at the well it aspirates from (nearest neighbour, then 2-opt). Only used for
+    dispenses into empty wells, where the order can't carry anything between wells
+    Source: well the pipette aspirates from
+    Targets: wells filled from one aspiration
+    Return: reordered targets, mm travelled in the original order, mm travelled in the new order
+    """
+    points = [source.top().point] + [well.top().point for well in targets]
+
+    def dist(a, b):
+        return math.hypot(points[a].x - points[b].x, points[a].y - points[b].y)
+
+    def tour_length(order):
+        path = [0] + order + [0]
+        return sum(dist(path[k], path[k + 1]) for k in range(0, len(path) - 1))
+
+    original = list(range(1, len(points)))
+    order = []
+    remaining = list(original)
+    current = 0
+    while remaining:
+        current = min(remaining, key=lambda k: dist(current, k))
+        order.append(current)
+        remaining.remove(current)
+    improved = True
+    while improved:
+        improved = False
+        for a in range(0, len(order) - 1):
+            for b in range(a + 1, len(order)):
+                candidate = order[:a] + order[a:b + 1][::-1] + order[b + 1:]
+                if tour_length(candidate) < tour_length(order) - 0.01:
+                    order = candidate
+                    improved = True
+    before = tour_length(original)
+    after = tour_length(order)
+    if after >= before:
+        return list(targets), before, before
+    return [targets[k - 1] for k in order], before, after
+
+
+# copy of travel_report in bradford_final.py, edit it there and run shared_check.py -w
+def travel_report(before, after, speed=300):
+    """
+    Before/After: mm travelled between dispenses before and after ordering
+    Speed: average gantry speed in mm/s
+    Return: message for the run log
+    """
+    return (
+        "Dispense travel: " + str(round(before)) + " mm -> " + str(round(after)) + " mm (about "
+        + str(round(before / speed)) + " s -> " + str(round(after / speed)) + " s)"
+    )
+
+
+# copy of find_aspirate_height in bradford_final.py, edit it there and run shared_check.py -w
+def find_aspirate_height(pip, source_well):
+    """
+    Get's the aspirate height from the liquid level the pipette measures, the tip has to be on
+    Return: mm above the bottom of the well
+    """
+    lld_height = (
+        pip.measure_liquid_height(source_well) - source_well.bottom().point.z
+    )
+    aspirate_height = max(lld_height - 5, 1)
+    return aspirate_height
+
+
+# copy of above_liquid in bradford_final.py, edit it there and run shared_check.py -w
+def above_liquid(well, volume, held=0, clearance=2):
+    """
+    Get's where to dispense a volume so the tip stays clear of the liquid, clearance mm over the
+    surface the well has once the volume is in. The surface is the well's depth times the
+    fraction of its maximum volume it holds, the same as liquid_sim takes it
+    Held: µL already in the well
+    Return: location above the liquid
+    """
+    height = well.depth * (held + volume) / well.max_volume + clearance
+    if height > well.depth - 1:
+        raise ValueError(
+            "%s fills too close to its top for the tip to stay %g mm above the liquid" % (well, clearance)
+        )
+    return well.bottom(height)
+
+
+# copy of dispense_chunks in bradford_final.py, edit it there and run shared_check.py -w
+def dispense_chunks(volumes, max_volume, extra=0):
+    """
+    Splits dispenses of different volumes into multi dispense aspirations, each takes the dispenses
+    in order while they fit in the tip with the extra, the same as TipPlanner costs them
+    Volumes: µL of each dispense, dispenses of 0 are skipped
+    Max_volume: µL the tip holds
+    Return: list of lists of dispense indexes
+    """
+    chunks = []
+    in_tip = 0
+    for i, volume in enumerate(volumes):
+        if volume <= 0:
+            continue
+        if chunks and in_tip + volume + extra <= max_volume:
+            chunks[-1].append(i)
+            in_tip += volume
+            continue
+        chunks.append([i])
+        in_tip = volume
+    return chunks
+
+
+# copy of diluent_columns in bradford_final.py, edit it there and run shared_check.py -w
+def diluent_columns(volumes, min_volume):
+    """
+    Splits the diluent of the samples between the 8 channel and the 1 channel. The 8 channel fills
+    every well of a full column with the smallest volume of the column and the 1 channel tops up the
+    wells that take more. A column with less than 8 samples or a top up too small to pipette is left
+    to the 1 channel
+    Volumes: µL of diluent for each sample, 8 samples to a column
+    Return: [(column, µL per well)] for the 8 channel, µL of each sample for the 1 channel
+    """
+    columns = []
+    left = list(volumes)
+    for column in range(0, len(volumes) // 8):
+        column_vols = volumes[column * 8 : (column + 1) * 8]
+        smallest = min(column_vols)
+        top_ups = [round(volume - smallest, 2) for volume in column_vols]
+        if smallest <= 0 or any(0 < top_up < min_volume for top_up in top_ups):
+            continue
+        columns.append((column, smallest))
+        left[column * 8 : (column + 1) * 8] = top_ups
+    return columns, left
+
+
+class MultiDispense:
+    """
+    One aspiration dispensed into several wells, made to deliver what one transfer per well does.
+    The plunger's backlash and the film the liquid leaves in the tip are what make a plain multi
+    dispense uneven, so:
+    conditioning: µL dispensed back into the source straight after aspirating, the first dispense
+        then starts with the plunger already moving down like the rest
+    disposal: µL left in the tip after the last dispense and blown out into the source, so the last
+        dispense never empties the tip
+    pre_wet: mixes in the source before the first aspiration of a tip, a tip that mixed in the
+        source already is wet and takes 0
+    corrections: µL added to the dispense at each position of an aspiration, the last entry goes on
+        for the positions past the end. 0 until measured on the robot (dispense_benchmark.py -r)
+    """
+
+    def __init__(self, conditioning=5, disposal=5, pre_wet=2, corrections=(0,)):
+        self.conditioning = conditioning
+        self.disposal = disposal
+        self.pre_wet = pre_wet
+        self.corrections = list(corrections)
+
+    @property
+    def extra(self):
+        """
+        µL aspirated on top of the dispenses
+        """
+        return self.conditioning + self.disposal
+
+    def volumes(self, volume, count):
+        """
+        Get's the corrected volumes of count dispenses from one aspiration
+        """
+        return [volume + self.corrections[min(i, len(self.corrections) - 1)] for i in range(0, count)]
+
+    def chunks(self, targets, volume, max_volume):
+        """
+        Splits the targets into aspirations, each takes as many as fit in the tip with the extra
+        Return: list of lists of targets
+        """
+        chunks = []
+        start = 0
+        while start < len(targets):
+            count = 1
+            while (
+                start + count < len(targets)
+                and sum(self.volumes(volume, count + 1)) + self.extra <= max_volume
+            ):
+                count += 1
+            chunks.append(targets[start:start + count])
+            start += count
+        return chunks
+
+    def fill(self, pipette, source, targets, volume, rate, height=None, aspirate_rate=None, first=True):
+        """
+        Fills the targets from one aspiration with the tip on the pipette
+        Source: well aspirated from, height mm above its bottom (the pipette's default if None)
+        Targets: dispense locations in order
+        Aspirate_rate: flow rate in the source, rate if None
+        First: True for the first aspiration of the tip, which is pre-wet
+        """
+        location = source if height is None else source.bottom(height)
+        aspirate_rate = aspirate_rate or rate
+        volumes = self.volumes(volume, len(targets))
+        aspirate_vol = sum(volumes) + self.extra
+        if first and self.pre_wet:
+            pipette.mix(self.pre_wet, aspirate_vol, location, aspirate_rate)
+        pipette.aspirate(aspirate_vol, location, aspirate_rate)
+        if self.conditioning:
+            pipette.dispense(self.conditioning, location, aspirate_rate)
+        for target, dispense_vol in zip(targets, volumes):
+            pipette.dispense(dispense_vol, target, rate)
+        pipette.blow_out(source.top())
+
+    def dispense(self, pipette, source, targets, volume, rate, max_volume, height=None, aspirate_rate=None):
+        """
+        Fills every target with the tip on the pipette, in as few aspirations as fit in the tip
+        Max_volume: µL the tip holds
+        """
+        for i, chunk in enumerate(self.chunks(targets, volume, max_volume)):
+            self.fill(pipette, source, chunk, volume, rate, height, aspirate_rate, first=i == 0)
+
+
+# copy of CommandOptimiser in bradford_final.py, edit it there and run shared_check.py -w
+class CommandOptimiser:
+    """
+    Peephole pass over the commands as the protocol issues them. Commands that can't change the
+    outcome are dropped before they reach the robot:
+    repeated_blow_out: a blow out at the well the tip was just blown out at (touch tips between are ignored)
+    repeated_touch_tip: a touch tip at the well the tip was just touched off at
+    lazy_latch: heater shaker latch changes are held back until a pipette command, labware move,
+        shake or pause needs the latch, so an open followed by a close with nothing between is never sent
+    repeated_deactivate: turning off a heater or shaker that is already off
+    Enabled: False to send every command as written
+    Rules: names of the rules to apply, all of them by default
+    """
+
+    rule_names = ["repeated_blow_out", "repeated_touch_tip", "lazy_latch", "repeated_deactivate"]
+    pipette_commands = [
+        "aspirate",
+        "dispense",
+        "mix",
+        "blow_out",
+        "touch_tip",
+        "air_gap",
+        "move_to",
+        "pick_up_tip",
+        "drop_tip",
+        "return_tip",
+    ]
+
+    def __init__(self, enabled=True, rules=None):
+        self.enabled = enabled
+        self.rules = set(self.rule_names if rules is None else rules)
+        self.removed = {}  # command name: number of times it was dropped
+        self.tips = {}  # id(pipette): where the tip was blown out and touched off
+        self.latches = {}  # id(module): latch state sent and wanted, and the latch commands
+        self.off = {}  # (id(module), "heater"/"shaker"): True when known to be off
+
+    def skip(self, name):
+        self.removed[name] = self.removed.get(name, 0) + 1
+
+    def well_key(self, location):
+        """
+        Get's the well a command happens at
+        Location: Well, Location or anything else (trash)
+        Return: (id(labware), well name) or None when it isn't a well
+        """
+        if isinstance(location, types.Location):
+            if not location.labware.is_well:
+                return None
+            location = location.labware.as_well()
+        if isinstance(location, protocol_api.Well):
+            return (id(location.parent), location.well_name)
+        return None
+
+    def _wrap(self, obj, name, handler):
+        """
+        Replaces obj.name with handler(method, args, kwargs, bound arguments)
+        """
+        method = getattr(obj, name)
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapped(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return handler(method, args, kwargs, bound.arguments)
+
+        setattr(obj, name, wrapped)
+
+    def pipette_command(self, pipette, name):
+        tip = self.tips.setdefault(id(pipette), {"current": None, "blown_out": None, "touched": None})
+
+        def handler(method, args, kwargs, a):
+            if "location" in a and a["location"] is not None:
+                key = self.well_key(a["location"])
+            elif name in ["pick_up_tip", "drop_tip", "return_tip"]:
+                key = None
+            else:  # staying where it is
+                key = tip["current"]
+            if key is not None:
+                if name == "blow_out" and "repeated_blow_out" in self.rules and tip["blown_out"] == key:
+                    self.skip(name)
+                    return pipette
+                if name == "touch_tip" and "repeated_touch_tip" in self.rules and tip["touched"] == key:
+                    self.skip(name)
+                    return pipette
+            self.sync_latches()  # the pipette can't go to the heater shaker with the latch open
+            result = method(*args, **kwargs)
+            tip["current"] = key
+            if name == "blow_out":
+                tip["blown_out"] = key
+                tip["touched"] = None
+            elif name == "touch_tip":
+                tip["touched"] = key
+            else:
+                tip["blown_out"] = None
+                tip["touched"] = None
+            return result
+
+        return handler
+
+    def latch_command(self, module, state):
+        latch = self.latches.setdefault(id(module), {"sent": None, "wanted": None})
+        name = "open_labware_latch" if state == "open" else "close_labware_latch"
+        latch[state] = getattr(module, name)
+
+        def handler(method, args, kwargs, a):
+            latch["wanted"] = state
+            self.skip(name)  # taken back if sync_latches sends it
+            return None
+
+        return handler
+
+    def sync_latches(self):
+        """
+        Sends the latch state each heater shaker has been asked for
+        """
+        for latch in self.latches.values():
+            state = latch["wanted"]
+            if state is not None and state != latch["sent"]:
+                self.removed["open_labware_latch" if state == "open" else "close_labware_latch"] -= 1
+                latch[state]()
+                latch["sent"] = state
+            latch["wanted"] = None
+
+    def synced(self, after=None):
+        """
+        Handler for commands that need the latch in the state it was asked for
+        After: called once the command is done
+        """
+        def handler(method, args, kwargs, a):
+            self.sync_latches()
+            result = method(*args, **kwargs)
+            if after is not None:
+                after()
+            return result
+
+        return handler
+
+    def deactivate_command(self, module, part):
+        def handler(method, args, kwargs, a):
+            if "repeated_deactivate" in self.rules and self.off.get((id(module), part)):
+                self.skip("deactivate_" + part)
+                return None
+            result = method(*args, **kwargs)
+            self.off[(id(module), part)] = True
+            return result
+
+        return handler
+
+    def attach(self, protocol, pipettes=(), modules=()):
+        """
+        Puts the optimiser between the protocol and the robot
+        Does nothing when it isn't enabled
+        """
+        if not self.enabled:
+            return
+        for pipette in pipettes:
+            for name in self.pipette_commands:
+                self._wrap(pipette, name, self.pipette_command(pipette, name))
+        if "lazy_latch" in self.rules:
+            self._wrap(protocol, "move_labware", self.synced())
+            self._wrap(protocol, "pause", self.synced())
+        for module in modules:
+            if not hasattr(module, "open_labware_latch"):
+                continue
+            if "lazy_latch" in self.rules:
+                self._wrap(module, "open_labware_latch", self.latch_command(module, "open"))
+                self._wrap(module, "close_labware_latch", self.latch_command(module, "closed"))
+            shaking = lambda module=module: self.off.update({(id(module), "shaker"): False})
+            heating = lambda module=module: self.off.update({(id(module), "heater"): False})
+            self._wrap(module, "set_and_wait_for_shake_speed", self.synced(after=shaking))
+            self._wrap(module, "set_and_wait_for_temperature", self.synced(after=heating))
+            self._wrap(module, "set_target_temperature", self.synced(after=heating))
+            self._wrap(module, "deactivate_shaker", self.deactivate_command(module, "shaker"))
+            self._wrap(module, "deactivate_heater", self.deactivate_command(module, "heater"))
+
+    def finish(self, protocol):
+        """
+        Sends the held back latch changes and reports what was dropped
+        """
+        if not self.enabled:
+            return
+        self.sync_latches()
+        removed = {name: n for name, n in self.removed.items() if n > 0}
+        protocol.comment(
+            "Command optimiser removed %d commands%s"
+            % (
+                sum(removed.values()),
+                "".join(", %s: %d" % (name, n) for name, n in sorted(removed.items())),
+            )
+        )
+
+
+# copy of LoadingSheet in bradford_final.py, edit it there and run shared_check.py -w
+class LoadingSheet:
+    """
+    Works out how much of each reagent to load from what the run takes out of its source wells.
+    Every aspirate, dispense and blow out at a source is followed, and at the end of the run each
+    source is loaded (load_liquid) with the most the run ever needed out of it plus the volume
+    the tip can't reach. The sheet is printed as comments, one line per source well
+    Simulating: False on the robot, where the liquids were already set up by the analysis
+    (the app and the robot simulate the protocol to analyse it) and nothing is followed
+    """
+
+    # µL left in a well that the tip can't reach, by labware load name
+    dead_volumes = {
+        "nest_12_reservoir_15ml": 1500,
+        "opentrons_10_tuberack_falcon_4x50ml_6x15ml_conical": 500,
+        "opentrons_24_tuberack_eppendorf_1.5ml_safelock_snapcap": 20,
+    }
+
+    def __init__(self, simulating=True):
+        self.simulating = simulating
+        self.sources = {}  # (id(labware), well name): [well, liquid, µL now, lowest µL]
+        self.last_location = {}  # id(pipette): where the pipette last went
+        self.air = False
+
+    def source(self, well, liquid):
+        """
+        Marks a well as a reagent the user loads before the run
+        """
+        self.sources[(id(well.parent), well.well_name)] = [well, liquid, 0.0, 0.0]
+
+    def wells_reached(self, pipette, location):
+        """
+        Get's the source wells the nozzles of a pipette reach
+        Location: Well, Location or anything else (trash)
+        Return: [(source, number of channels in it)]
+        """
+        if isinstance(location, types.Location):
+            if not location.labware.is_well:
+                return []
+            location = location.labware.as_well()
+        if not isinstance(location, protocol_api.Well):
+            return []
+        channels = pipette.active_channels
+        column = location.parent.columns_by_name()[location.well_name[1:]]
+        if channels == 1 or len(column) == 1:  # one well, or a reservoir taking every channel
+            wells = [(location, channels)]
+        else:
+            row = [well.well_name for well in column].index(location.well_name)
+            wells = [(well, 1) for well in column[row : row + channels]]
+        reached = []
+        for well, n in wells:
+            key = (id(well.parent), well.well_name)
+            if key in self.sources:
+                reached.append((self.sources[key], n))
+        return reached
+
+    def _followed(self, pipette, name):
+        method = getattr(pipette, name)
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def followed(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            location = bound.arguments.get("location")
+            if location is None:
+                location = self.last_location.get(id(pipette))
+            if name == "air_gap":
+                self.air = True
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    self.air = False
+            before = pipette.current_volume if pipette.has_tip else 0
+            result = method(*args, **kwargs)
+            after = pipette.current_volume if pipette.has_tip else 0
+            self.last_location[id(pipette)] = location
+            if not self.air:
+                for source, channels in self.wells_reached(pipette, location):
+                    source[2] += (before - after) * channels
+                    source[3] = min(source[3], source[2])
+            return result
+
+        setattr(pipette, name, followed)
+
+    def attach(self, pipettes):
+        """
+        Follows the liquid the pipettes move, attach before anything that skips commands
+        """
+        if not self.simulating:
+            return
+        for pipette in pipettes:
+            for name in ["aspirate", "dispense", "blow_out", "air_gap"]:
+                self._followed(pipette, name)
+
+    def finish(self, protocol):
+        """
+        Loads every source with what the run needed and prints the loading sheet
+        """
+        if not self.simulating:
+            return
+        protocol.comment("\n---------------Loading Sheet----------------\n\n")
+        for well, liquid, _, lowest in sorted(
+            self.sources.values(), key=lambda s: (str(s[0].parent), s[0].well_name)
+        ):
+            if lowest >= 0:
+                continue  # not used in this run
+            volume = math.ceil(-lowest + self.dead_volumes.get(well.parent.load_name, 0))
+            well.load_liquid(liquid, volume)
+            protocol.comment(
+                "%s %s: %s %d uL" % (well.parent, well.well_name, liquid.name, volume)
+            )
+
+
+# copy of TipPlanner in bradford_final.py, edit it there and run shared_check.py -w
+class TipPlanner:
+    """
+    Transfer-cost model that picks the pipette and tip size for each group of transfers and lays
+    out the tip racks for the run. A group is one step of the protocol, given as the volumes it
+    dispenses. Every way of doing a group (1 or 8 channel pipette, 200 or 1000 µL tips) is costed
+    as the predicted seconds of its aspirations, dispenses and tip changes plus what the tips it
+    uses are worth in seconds. Dispenses below the volume a tip is accurate for are costed as a
+    penalty, so the smallest tip is used for them when no tip is accurate
+    Slots: deck slots for the tip racks in use, each holds one tip size
+    Staging_slots: slots for the racks that replace the empty ones
+    Max_swaps: most rack swaps the run can do, None when the staging racks are refilled
+    """
+
+    tip_racks = {
+        200: "opentrons_flex_96_filtertiprack_200uL",
+        1000: "opentrons_flex_96_filtertiprack_1000uL",
+    }
+    max_volume = {200: 195, 1000: 995}  # µL per aspiration, 5 µL is kept for the blow out
+    min_volume = {200: 5, 1000: 50}  # µL, smallest dispense the tip is accurate for
+    tip_value = {200: 4.0, 1000: 6.0}  # s of run time one tip is worth
+    inaccurate_time = 60.0  # s, penalty for each dispense below the tip's min_volume
+    aspirate_time = 2.5  # s, moving to the source and aspirating
+    dispense_time = 2.0  # s, moving to the well and dispensing
+    tip_time = 9.0  # s, picking up and dropping a tip
+    rack_time = 50.0  # s, the gripper swapping an empty rack for a staging rack
+
+    def __init__(self, slots, staging_slots=(), sizes=(200, 1000), max_swaps=None):
+        self.slots = list(slots)
+        self.staging_slots = list(staging_slots)
+        self.sizes = list(sizes)
+        self.max_swaps = max_swaps
+        self.groups = []
+        self.choices = {}  # group name: chosen way of doing it, see cost
+        self.layout = {}  # slot: tip size
+        self.staging = {}  # staging slot: tip size
+
+    def add(
+        self,
+        name,
+        volumes,
+        channels=(1,),
+        multi_dispense=False,
+        extra=0,
+        tips=1,
+        aspirations_per_tip=None,
+        dispenses_per_source=None,
+    ):
+        """
+        Adds a group of transfers to the plan
+        Volumes: µL of each dispense in order. For the 8 channel they are per well, 8 wells in a row are one dispense
+        Channels: pipettes the protocol can do the group with, 1 and/or 8
+        Multi_dispense: True when one aspiration fills as many dispenses as fit in the tip
+        Extra: µL aspirated on top of every aspiration
+        Tips: tips picked up for the group, 0 when it keeps the tip of the group before
+        Aspirations_per_tip: the tip is changed after this many aspirations instead
+        Dispenses_per_source: the dispenses come in runs of this many from one source, an aspiration never spans two
+        """
+        self.groups.append(
+            {
+                "name": name,
+                "volumes": list(volumes),
+                "channels": list(channels),
+                "multi_dispense": multi_dispense,
+                "extra": extra,
+                "tips": tips,
+                "aspirations_per_tip": aspirations_per_tip,
+                "dispenses_per_source": dispenses_per_source,
+            }
+        )
+
+    def cost(self, group, channels, size):
+        """
+        Get's the predicted cost of a group done with one pipette and tip size
+        Return: {channels, size, max_volume, aspirations, tips, seconds, cost}
+        """
+        volumes = group["volumes"]
+        if channels == 8:
+            volumes = [max(volumes[i : i + 8]) for i in range(0, len(volumes), 8)]
+        inaccurate = sum(1 for volume in volumes if 0 < volume < self.min_volume[size])
+        max_volume = self.max_volume[size]
+        run = group["dispenses_per_source"] or len(volumes)
+        aspirations = 0
+        in_tip = None
+        for i, volume in enumerate(volumes):
+            if (
+                group["multi_dispense"]
+                and i % run != 0
+                and in_tip + volume + group["extra"] <= max_volume
+            ):
+                in_tip += volume
+                continue
+            aspirations += math.ceil((volume + group["extra"]) / max_volume)
+            in_tip = volume
+        dispenses = max(len(volumes), aspirations)
+        if group["aspirations_per_tip"] is None:
+            pick_ups = group["tips"]
+        else:
+            pick_ups = math.ceil(aspirations / group["aspirations_per_tip"])
+        seconds = (
+            aspirations * self.aspirate_time
+            + dispenses * self.dispense_time
+            + pick_ups * self.tip_time
+        )
+        return {
+            "channels": channels,
+            "size": size,
+            "max_volume": max_volume,
+            "aspirations": aspirations,
+            "tips": pick_ups * channels,
+            "seconds": seconds,
+            "cost": (
+                seconds
+                + pick_ups * channels * self.tip_value[size]
+                + inaccurate * self.inaccurate_time
+            ),
+        }
+
+    def rack_layout(self, tips):
+        """
+        Get's the slots for each tip size, the size using the most tips gets the spare slots
+        Tips: {tip size: tips used}
+        Return: {slot: tip size}, {staging slot: tip size}, number of rack swaps
+        """
+        sizes = sorted(tips, key=lambda size: -tips[size])
+        layout = {}
+        for i, slot in enumerate(self.slots):
+            layout[slot] = sizes[i] if i < len(sizes) else sizes[0]
+        needed = {
+            size: max(math.ceil(tips[size] / 96) - list(layout.values()).count(size), 0)
+            for size in sizes
+        }
+        staging = {}
+        for slot in self.staging_slots:
+            size = max(sizes, key=lambda size: needed[size])
+            if needed[size] == 0:
+                size = sizes[0]
+            staging[slot] = size
+            needed[size] = max(needed[size] - 1, 0)
+        swaps = sum(
+            max(math.ceil(tips[size] / 96) - list(layout.values()).count(size), 0)
+            for size in sizes
+        )
+        return layout, staging, swaps
+
+    def plan(self):
+        """
+        Picks the pipette and tip size of every group. Every set of tip sizes that fits in the
+        slots is tried, the cheapest one that needs no more rack swaps than the run can do is kept
+        """
+        best = None
+        for n in range(1, len(self.slots) + 1):
+            for sizes in itertools.combinations(self.sizes, n):
+                choices = {}
+                for group in self.groups:
+                    options = [
+                        self.cost(group, channels, size)
+                        for channels in group["channels"]
+                        for size in sizes
+                    ]
+                    choices[group["name"]] = min(options, key=lambda option: option["cost"])
+                tips = {size: 0 for size in sizes}
+                for choice in choices.values():
+                    tips[choice["size"]] += choice["tips"]
+                if 0 in tips.values() and len(sizes) > 1:
+                    continue  # the same as a smaller set of sizes
+                layout, staging, swaps = self.rack_layout(tips)
+                total = sum(choice["cost"] for choice in choices.values())
+                total += swaps * self.rack_time
+                over = self.max_swaps is not None and swaps > self.max_swaps
+                if best is None or (over, total) < best[0]:
+                    best = ((over, total), choices, layout, staging)
+        _, self.choices, self.layout, self.staging = best
+
+    def choice(self, name):
+        return self.choices[name]
+
+    def slots_for(self, size):
+        return [slot for slot, slot_size in self.layout.items() if slot_size == size]
+
+    def report(self, protocol):
+        """
+        Prints the chosen pipettes and the tip rack layout for the operator
+        """
+        protocol.comment("\n---------------Tip Plan----------------\n\n")
+        tips = {}
+        for name, choice in self.choices.items():
+            tips[choice["size"]] = tips.get(choice["size"], 0) + choice["tips"]
+            protocol.comment(
+                "%s: %d-channel, %d uL tips, %d aspirations, %d tips, about %d s"
+                % (
+                    name,
+                    choice["channels"],
+                    choice["size"],
+                    choice["aspirations"],
+                    choice["tips"],
+                    choice["seconds"],
+                )
+            )
+        for slot, size in list(self.layout.items()) + list(self.staging.items()):
+            protocol.comment(
+                "Tip rack %s: %d uL%s" % (slot, size, " (staging)" if slot in self.staging else "")
+            )
+        for size, n in sorted(tips.items()):
+            protocol.comment("Planned steps use %d tips of %d uL" % (n, size))
+
+
+# copy of AssayCompiler in bradford_final.py, edit it there and run shared_check.py -w
+class AssayCompiler:
+    """
+    Turns a declarative assay description into the standard tubes, the assay plate layout and the
+    pipetting steps that fill them. The BCA and Bradford protocols share this class, so a change to
+    how a step is planned or run lands in every assay. The steps pick up and drop their tips with
+    load_tips, the protocol's run() only says which labware and volumes they work on
+    Assay: {
+        name: shown in the run comments
+        standards: concentrations of the standard tubes, highest first
+        stock: concentration of the stock the standards are made from
+        dilution: "direct" when every tube is made from the stock, "serial" when each is made from the tube before
+        serial_from: tube that is diluted further when a direct volume is too small to pipette, None to not
+        blank: True to add a blank row after the standards
+        replicates: columns each standard and sample is put in
+        sample_volume: µL of standard, blank or sample per well
+        standard_extra: µL made of each standard on top of what the plates take
+        standard_min: smallest µL made of each standard
+        samples_per_plate: most samples on one plate, None to fill the plate
+        share_standards: True to put the standards on the first plate only when that takes fewer plates
+        max_plates: most assay plates the deck takes
+        reagent_volume: µL of working reagent per well
+        reagent_rate: aspirate rate of the working reagent
+        temperature: heater shaker °C, None for room temperature
+        shake_speed: rpm the reagent is mixed at
+        shake_minutes: minutes the reagent is mixed for
+        incubation_minutes: minutes the plate incubates after mixing
+        wavelength: nm the plate is read at
+        units: units of the standard concentrations
+        curve_degree: degree of the polynomial fitted to the standards, 1 for a straight line
+    }
+    """
+
+    rows = ["A", "B", "C", "D", "E", "F", "G", "H"]
+    min_volume = 5  # µL, smallest volume the protocols pipette
+    reagent_well_volume = 10500  # µL of working reagent used from each reservoir well
+    reagent_extra = 1000  # µL of working reagent loaded on top of what the plates take
+
+    stock_plate_samples = 48  # samples on a stock plate that are diluted, their dilutions take the other half
+
+    def __init__(self, assay, number_samples):
+        self.assay = dict(assay)
+        self.number_samples = number_samples
+        self.protocol = None
+        self.planner = None
+        self.dry_run = False
+        self.tips = []  # racks in use, the first is swapped for a staging rack when it runs out
+        self.staging_racks = []
+        self.chute = None
+        self.falcon_volumes = {}  # (id(labware), well name): µL left in a falcon
+        self.compile()
+
+    def compile(self):
+        """
+        Works out the plate layout, the standard tube volumes and the working reagent from the description
+        """
+        assay = self.assay
+        replicates = assay["replicates"]
+        standard_rows = len(assay["standards"]) + (1 if assay["blank"] else 0)
+        if standard_rows > len(self.rows):
+            raise ValueError("%s has more standards than rows on a plate" % assay["name"])
+
+        # LAYOUT
+        # the standards take the first replicates columns of a plate, the samples the rest. Either
+        # every plate has its own standards, or the first plate's are shared and the plates after it
+        # are all samples, which is only done when it takes fewer plates
+        self.sample_columns_per_plate = (12 - replicates) // replicates  # on a plate with standards
+        full_plate_columns = 12 // replicates  # on a plate without
+        if assay["samples_per_plate"] is not None:
+            self.sample_columns_per_plate = min(
+                self.sample_columns_per_plate, assay["samples_per_plate"] // 8
+            )
+            full_plate_columns = min(full_plate_columns, assay["samples_per_plate"] // 8)
+        self.num_sample_columns = math.ceil(self.number_samples / 8)
+        repeated_plates = max(math.ceil(self.num_sample_columns / self.sample_columns_per_plate), 1)
+        shared_plates = 1 + math.ceil(
+            max(self.num_sample_columns - self.sample_columns_per_plate, 0) / full_plate_columns
+        )
+        self.shared_standards = assay["share_standards"] and shared_plates < repeated_plates
+        self.plate_sample_columns = []  # sample columns (0 based) that go onto each plate
+        column = 0
+        while column < self.num_sample_columns or not self.plate_sample_columns:
+            size = self.sample_columns_per_plate
+            if self.shared_standards and self.plate_sample_columns:
+                size = full_plate_columns
+            self.plate_sample_columns.append(
+                list(range(column, min(column + size, self.num_sample_columns)))
+            )
+            column += size
+        self.num_plates = len(self.plate_sample_columns)
+        if self.num_plates > assay["max_plates"]:
+            raise ValueError(
+                "%d samples in %d replicates need %d %s plates, the deck takes %d"
+                % (self.number_samples, replicates, self.num_plates, assay["name"], assay["max_plates"])
+            )
+        self.standard_plates = [0] if self.shared_standards else list(range(0, self.num_plates))
+        self.plate_columns = [
+            (replicates if plate in self.standard_plates else 0) + len(columns) * replicates
+            for plate, columns in enumerate(self.plate_sample_columns)
+        ]
+        self.num_columns = sum(self.plate_columns)
+
+        # STANDARDS
+        # the standards are made once and loaded onto every plate that has them
+        concentrations = assay["standards"]
+        volume = assay["sample_volume"] * replicates * len(self.standard_plates) + assay["standard_extra"]
+        if assay["dilution"] == "serial":
+            # each tube only keeps what the next dilution leaves in it
+            volume = volume / min(
+                1 - concentrations[i + 1] / concentrations[i] for i in range(0, len(concentrations) - 1)
+            )
+        self.standard_volume = max(math.ceil(volume), assay["standard_min"])
+        self.tubes = []  # {source: None for the stock or the tube it's made from, stock: µL from the source, buffer: µL}
+        for i, concentration in enumerate(concentrations):
+            if assay["dilution"] == "serial" and i > 0:
+                stock = concentration * self.standard_volume / concentrations[i - 1]
+                self.tubes.append({"source": i - 1, "stock": stock, "buffer": self.standard_volume - stock})
+                continue
+            stock = self.standard_volume * concentration / assay["stock"]
+            if concentration == assay["stock"]:
+                if assay["dilution"] == "serial":
+                    stock = 0  # the stock tube is the first standard
+                self.tubes.append({"source": None, "stock": stock, "buffer": 0})
+            elif stock < self.min_volume and assay["serial_from"] is not None:
+                # made from the serial_from tube, which is made bigger to cover it
+                source = assay["serial_from"]
+                stock = stock * assay["stock"] / concentrations[source]
+                self.tubes.append({"source": source, "stock": stock, "buffer": self.standard_volume - stock})
+                self.tubes[source]["extra"] = self.tubes[source].get("extra", 0) + stock
+            else:
+                self.tubes.append({"source": None, "stock": stock, "buffer": self.standard_volume - stock})
+        for i, tube in enumerate(self.tubes):
+            if "extra" in tube:
+                total = self.standard_volume + tube.pop("extra")
+                tube["stock"] = total * concentrations[i] / assay["stock"]
+                tube["buffer"] = total - tube["stock"]
+
+        # WORKING REAGENT
+        self.reagent_left = self.num_columns * assay["reagent_volume"] * 8 + self.reagent_extra
+
+    def standard_wells(self, plate, tube):
+        """
+        Get's the wells a standard goes in
+        Tube: index of the standard, len(standards) for the blank
+        Return: well names, none on a plate that shares the first plate's standards
+        """
+        if plate not in self.standard_plates:
+            return []
+        return [self.rows[tube] + str(x) for x in range(1, self.assay["replicates"] + 1)]
+
+    def sample_wells(self, column):
+        """
+        Get's where a column of samples goes
+        Column: sample column (0 based)
+        Return: plate index, top well names of the plate columns it goes in
+        """
+        plate = [column in columns for columns in self.plate_sample_columns].index(True)
+        first = self.assay["replicates"] * self.plate_sample_columns[plate].index(column) + 1
+        if plate in self.standard_plates:
+            first += self.assay["replicates"]
+        return plate, ["A" + str(first + x) for x in range(0, self.assay["replicates"])]
+
+    def occupied_wells(self):
+        """
+        Get's every well that gets a standard, blank or sample
+        Return: [(plate index, well name)] in plate order, then row by row
+        """
+        wells = []
+        rows = len(self.assay["standards"]) + (1 if self.assay["blank"] else 0)
+        for plate in range(0, self.num_plates):
+            for tube in range(0, rows):
+                wells += [(plate, well) for well in self.standard_wells(plate, tube)]
+            for column in self.plate_sample_columns[plate]:
+                samples = min(self.number_samples - column * 8, 8)
+                for well in self.sample_wells(column)[1]:
+                    wells += [(plate, row + well[1:]) for row in self.rows[0:samples]]
+        return sorted(wells, key=lambda x: (x[0], x[1][0], int(x[1][1:])))
+
+    def stock_well(self, stocks, sample, diluted=False):
+        """
+        Get's the well of a sample that is diluted in the sample stock plates. A stock plate takes
+        6 columns of samples and their dilutions in the 6 after
+        Diluted: True for the well the sample is diluted into
+        """
+        well = sample % self.stock_plate_samples + (self.stock_plate_samples if diluted else 0)
+        return stocks[sample // self.stock_plate_samples].wells()[well]
+
+    # STEPS
+
+    def load_tips(self, protocol, planner, dry_run):
+        """
+        Loads the tip racks the plan lays out and the waste chute for the steps below
+        Dry_run: True to put the tips back in their racks instead of dropping them
+        Return: the tip racks
+        """
+        self.protocol = protocol
+        self.planner = planner
+        self.dry_run = dry_run
+        self.tips = [
+            protocol.load_labware(planner.tip_racks[size], slot)
+            for slot, size in planner.layout.items()
+        ]
+        self.chute = protocol.load_waste_chute()
+        return self.tips
+
+    def load_staging(self):
+        """
+        Loads the racks of the plan's staging slots, the first tip rack is swapped for one when it runs out
+        """
+        self.staging_racks = [
+            self.protocol.load_labware(self.planner.tip_racks[self.planner.staging[slot]], slot)
+            for slot in self.planner.staging_slots
+        ]
+
+    def remove_tip(self, pipette):
+        if self.dry_run:
+            pipette.return_tip()
+        else:
+            pipette.drop_tip(self.chute)
+
+    def pick_up(self, pipette, group):
+        """
+        Picks up a tip of the size planned for a group of transfers
+        """
+        size = self.planner.choice(group)["size"]
+        pipette.tip_racks = [rack for rack in self.tips if rack.load_name == self.planner.tip_racks[size].lower()]
+        try:
+            pipette.pick_up_tip()
+        except protocol_api.labware.OutOfTipsError:
+            if not self.staging_racks:
+                raise
+            self.check_tips()
+            self.pick_up(pipette, group)
+
+    def check_tips(self):
+        """
+        Swaps the empty first tip rack for the next staging rack with the gripper. The rack is swapped
+        once the pipette can't pick up from it, the 8 channel needs a full column. When every staging
+        slot is empty the staging racks are loaded again
+        """
+        protocol = self.protocol
+        staging_slots = self.planner.staging_slots
+        if protocol.deck[staging_slots[-1]] is None:
+            protocol.comment("No tip box detected in slot " + staging_slots[-1] + ", all staging slots are empty")
+            self.load_staging()
+            return
+        tip_slot = list(self.planner.layout)[0]
+        protocol.move_labware(labware=self.tips[0], new_location=self.chute, use_gripper=True)
+        for rack_num, slot in enumerate(staging_slots):
+            labware = protocol.deck[slot]
+            if labware and labware.is_tiprack:
+                self.tips[0] = self.staging_racks[rack_num]
+                protocol.move_labware(labware=self.staging_racks[rack_num], new_location=tip_slot, use_gripper=True)
+                break
+            protocol.comment("No tip box detected in slot " + slot + ".")
+
+    def falcon_height(self, pipette, falcon, volume):
+        """
+        Get's the aspirate height in a 15 mL falcon once a volume is taken out of it. The falcon is
+        measured with the tip on the first time, after that what the steps take out of it is counted
+        """
+        key = (id(falcon.parent), falcon.well_name)
+        if key not in self.falcon_volumes:
+            self.falcon_volumes[key] = get_vol_15ml_falcon(find_aspirate_height(pipette, falcon))
+        self.falcon_volumes[key] -= volume
+        return get_height_15ml_falcon(self.falcon_volumes[key])
+
+    def distribute(self, pipette, group, source, volumes, rate, dispense_rate, height=None, new_tips=False):
+        """
+        Fills wells from a 15 mL falcon with the 1 channel. Each aspiration takes as many wells as fit
+        in the tip with 5 µL extra and dispenses them in the order with the least travel
+        Volumes: {well: µL}
+        Height: mm above the bottom of the wells to dispense at, the pipette's default if None
+        New_tips: True for a new tip every aspiration, one tip for all of them otherwise
+        """
+        wells = list(volumes)
+        max_volume = self.planner.choice(group)["max_volume"]
+        travel_mm = [0, 0]  # before, after ordering the dispenses
+        for chunk in dispense_chunks([volumes[well] for well in wells], max_volume, 5):
+            if not pipette.has_tip:
+                self.pick_up(pipette, group)
+            aspirate_vol = sum(volumes[wells[x]] for x in chunk) + 5
+            source_height = self.falcon_height(pipette, source, aspirate_vol)
+            pipette.blow_out(source.top())
+            pipette.aspirate(aspirate_vol, source.bottom(source_height), rate)
+            targets, before, after = plan_dispense_order(source, [wells[x] for x in chunk])
+            travel_mm[0] += before
+            travel_mm[1] += after
+            for well in targets:
+                pipette.dispense(volumes[well], well if height is None else well.bottom(height), dispense_rate)
+            if new_tips:
+                self.remove_tip(pipette)
+        if pipette.has_tip:
+            self.remove_tip(pipette)
+        self.protocol.comment(travel_report(travel_mm[0], travel_mm[1]))
+
+    def add_from_above(self, pipette, group, source, volumes, rate, held=None, multi_dispense=True, extra=5, clearance=2):
+        """
+        Adds a reagent from a 15 mL falcon to wells with one tip. Every dispense is made from above the
+        liquid, so the tip never touches what is in the wells and goes back into the source clean. A
+        volume bigger than the tip is dispensed in tipfuls and what is left
+        Volumes: {well: µL}
+        Held: {well: µL} already in the wells, empty wells can be left out
+        """
+        held = held or {}
+        max_volume = self.planner.choice(group)["max_volume"]
+        if not multi_dispense:
+            extra = 0
+        dispenses = []  # (µL, location)
+        for well, volume in volumes.items():
+            if volume <= 0:
+                continue
+            pieces = [max_volume - extra] * (math.ceil(volume / (max_volume - extra)) - 1)
+            pieces.append(volume - sum(pieces))
+            for x, piece in enumerate(pieces):
+                dispenses.append((piece, above_liquid(well, piece, held.get(well, 0) + sum(pieces[:x]), clearance)))
+        if multi_dispense:
+            chunks = dispense_chunks([volume for volume, _ in dispenses], max_volume, extra)
+        else:
+            chunks = [[i] for i in range(0, len(dispenses))]
+        self.pick_up(pipette, group)
+        for chunk in chunks:
+            aspirate_vol = sum(dispenses[i][0] for i in chunk) + extra
+            pipette.aspirate(aspirate_vol, source.bottom(self.falcon_height(pipette, source, aspirate_vol)), rate)
+            for i in chunk:
+                pipette.dispense(dispenses[i][0], dispenses[i][1], rate)
+            # the extra goes back to the source, a single dispense is blown out where it was made
+            pipette.blow_out(source.top() if multi_dispense else dispenses[chunk[0]][1])
+        self.remove_tip(pipette)
+
+    def stamp_diluent(self, pipette, reservoir, columns, stocks):
+        """
+        Stamps the diluent of the full columns from the reservoir with the 8 channel, with one tip
+        Columns: [(sample column, µL per well)] from diluent_columns
+        Stocks: sample stock plates
+        """
+        max_volume = self.planner.choice("diluent stamping")["max_volume"]
+        self.pick_up(pipette, "diluent stamping")
+        for chunk in dispense_chunks([volume for _, volume in columns], max_volume, 5):
+            pipette.aspirate(sum(columns[x][1] for x in chunk) + 5, reservoir, 1)
+            for x in chunk:
+                column, volume = columns[x]
+                pipette.dispense(volume, self.stock_well(stocks, column * 8, diluted=True), 0.75)
+            pipette.blow_out(reservoir.top())
+        self.remove_tip(pipette)
+
+    def top_up_samples(self, pipette, group, stocks, top_ups):
+        """
+        Adds the sample the 8 channel doesn't move to the wells that are diluted from more, a tip per well
+        Top_ups: µL of each sample
+        """
+        for i, top_up in enumerate(top_ups):
+            if top_up > 0:
+                self.pick_up(pipette, group)
+                pipette.aspirate(top_up, self.stock_well(stocks, i).bottom(0.1), 0.5)
+                pipette.dispense(top_up, self.stock_well(stocks, i, diluted=True), 0.5)
+                self.remove_tip(pipette)
+
+    def load_column(self, pipette, group, source, targets, rate, dispense=None, new_tips=False, aspirate_rate=None, extra=5):
+        """
+        Loads a column onto its replicate columns with the 8 channel, with the tip on the pipette if it
+        has one. The tip is dropped at the end
+        Source: top well of the column
+        Targets: dispense locations in the top wells of the replicate columns
+        Dispense: MultiDispense made to deliver like a transfer per column, None for a plain multi dispense
+        New_tips: True for a transfer with a new tip per replicate column instead
+        Aspirate_rate: flow rate in the source, rate if None
+        Extra: µL aspirated on top of a plain multi dispense
+        """
+        volume = self.assay["sample_volume"]
+        aspirate_rate = aspirate_rate or rate
+        if new_tips:
+            for target in targets:
+                if not pipette.has_tip:
+                    self.pick_up(pipette, group)
+                pipette.aspirate(volume, source, aspirate_rate)
+                pipette.dispense(volume, target, rate)
+                pipette.blow_out(target.labware.as_well().top())
+                self.remove_tip(pipette)
+            return
+        if not pipette.has_tip:
+            self.pick_up(pipette, group)
+        if dispense is not None:
+            dispense.dispense(
+                pipette, source, targets, volume, rate, self.planner.choice(group)["max_volume"], aspirate_rate=aspirate_rate
+            )
+        else:
+            pipette.aspirate(volume * len(targets) + extra, source, aspirate_rate)
+            for target in targets:
+                pipette.dispense(volume, target, rate)
+        self.remove_tip(pipette)
+
+    def load_samples(self, pipette, group, plates, stocks, rate, height, sample_volumes=None, dilutions=None, dilution_rate=0.5, **load):
+        """
+        Loads every column of samples onto its replicate columns with the 8 channel, a tip per column
+        Plates: assay plates
+        Stocks: sample stock plates, the samples fill them unless they are diluted (stock_well)
+        Height: mm above the bottom of the assay wells to dispense at
+        Sample_volumes: µL of sample each well is diluted from, None to load the samples as they are.
+            A column is diluted with the smallest volume of its wells, the rest is added by top_up_samples
+        Dilutions: dilution of each sample
+        Load: keyword arguments for load_column
+        """
+        for column in range(0, self.num_sample_columns):
+            plate, wells = self.sample_wells(column)
+            targets = [plates[plate][well].bottom(height) for well in wells]
+            if sample_volumes is None:
+                source = stocks[column // 12].columns()[column % 12][0]
+                self.load_column(pipette, group, source, targets, rate, **load)
+                continue
+            first = column * 8
+            source = self.stock_well(stocks, first)
+            diluted = self.stock_well(stocks, first, diluted=True)
+            # the smallest well of the column sets the mix volume, a column with bigger wells gets more mixes
+            well_vols = [
+                volume * dilution
+                for volume, dilution in zip(sample_volumes[first:first + 8], dilutions[first:first + 8])
+            ]
+            mix_vol = max(min(well_vols) - 10, min(well_vols) / 2)
+            mixes = min(3 * math.ceil(max(well_vols) / min(well_vols)), 10)
+            column_vol = min(sample_volumes[first:first + 8])
+            self.pick_up(pipette, group)
+            pipette.aspirate(column_vol, source.bottom(0.1), dilution_rate)
+            pipette.dispense(column_vol, diluted, dilution_rate)
+            pipette.mix(mixes, mix_vol, diluted, dilution_rate)
+            pipette.blow_out(diluted.top())
+            pipette.touch_tip(diluted)
+            self.load_column(pipette, group, diluted, targets, rate, **load)
+
+    def make_standards(self, pipette, group, stock, tubes, rate, load, mixes=3, mix_rate=1.0, new_tip=True):
+        """
+        Makes the standard tubes with the 1 channel. Each is made from the stock or the tube it is
+        diluted from in tipfuls, mixed and loaded with the same tip
+        Stock: well of the stock, the first standard of a serial dilution
+        Tubes: well of each standard
+        Load: function(standard index) loading the mixed standard with the tip on the pipette
+        New_tip: False to carry the tip that loaded a standard on to making the next one, for a serial dilution
+        """
+        max_volume = self.planner.choice(group)["max_volume"]
+        for i, tube in enumerate(self.tubes):
+            if new_tip or not pipette.has_tip:
+                self.pick_up(pipette, group)
+            if tube["stock"] > 0:
+                source = stock if tube["source"] is None else tubes[tube["source"]]
+                for x in range(0, math.ceil(tube["stock"] / max_volume)):  # multi-plate standards can be more than one tip
+                    volume = min(max_volume, tube["stock"] - max_volume * x)
+                    pipette.aspirate(volume, source, rate)
+                    pipette.dispense(volume, tubes[i], rate)
+                pipette.mix(mixes, min(self.standard_volume - 10, max_volume), tubes[i], mix_rate)
+            load(i)
+            if new_tip:
+                self.remove_tip(pipette)
+        if pipette.has_tip:
+            self.remove_tip(pipette)
+
+    def load_standard(self, pipette, group, tube, source, plates, rate, height, dispense=None, new_tip=False):
+        """
+        Loads a standard from its tube onto its wells of the plates with standards, with the tip on the pipette
+        Tube: index of the standard, len(standards) for the blank
+        Height: mm above the bottom of the wells to dispense at
+        Dispense: MultiDispense to fill the wells from as few aspirations as fit in the tip, None for an aspiration per well
+        New_tip: True to blow the tip that made the standard out into its tube and load with a new one
+        """
+        volume = self.assay["sample_volume"]
+        if new_tip:
+            pipette.blow_out(source.top())
+            self.remove_tip(pipette)
+            self.pick_up(pipette, group)
+        targets = [plates[x][well] for x in self.standard_plates for well in self.standard_wells(x, tube)]
+        if dispense is None:
+            for well in targets:
+                pipette.aspirate(volume, source.bottom(1.5), rate)
+                pipette.dispense(volume, well.bottom(height), rate)
+                pipette.blow_out(well.top(-5))
+                pipette.touch_tip(well)
+            return
+        max_volume = self.planner.choice(group)["max_volume"]
+        travel_mm = [0, 0]  # before, after ordering the dispenses
+        for x, chunk in enumerate(dispense.chunks(targets, volume, max_volume)):
+            chunk, before, after = plan_dispense_order(source, chunk)
+            travel_mm[0] += before
+            travel_mm[1] += after
+            dispense.fill(
+                pipette, source, [well.bottom(height) for well in chunk], volume, rate, height=1.5, first=x == 0
+            )
+        self.protocol.comment(travel_report(travel_mm[0], travel_mm[1]))
+
+    def fill_standard_column(self, pipette, source, well, volume, height=1.5):
+        """
+        Fills a well of the standard column, the column of a sample plate that stamp_standards stamps
+        onto the plates with standards, with the tip on the pipette
+        Height: mm above the bottom of the source to aspirate at
+        """
+        pipette.aspirate(volume, source.bottom(height), 0.25)
+        pipette.dispense(volume, well, 0.25)
+        pipette.blow_out(well.top())
+
+    def stamp_standards(self, pipette, group, column, plates, dispense=None):
+        """
+        Stamps the standard column onto the replicate columns of every plate with standards with the 8 channel
+        Column: wells of the standard column
+        Dispense: MultiDispense for one tip, None for a new tip per replicate column
+        """
+        targets = [
+            plates[x][well].bottom(0.1) for x in self.standard_plates for well in self.standard_wells(x, 0)
+        ]
+        self.load_column(pipette, group, column[0], targets, 0.25, dispense=dispense, new_tips=dispense is None)
+
+    def add_reagent(self, pipette, reservoir, plate, columns, aspirations):
+        """
+        Adds the working reagent to the first columns of a plate with the 8 channel, the tip is kept
+        Aspirations: aspirations per column, more than one when the tip holds less than a well
+        """
+        volume = self.assay["reagent_volume"] / aspirations
+        for i in range(0, columns):
+            self.reagent_left -= self.assay["reagent_volume"] * 8
+            source = reservoir["A" + str(math.ceil(self.reagent_left / self.reagent_well_volume))]
+            for _ in range(0, aspirations):
+                pipette.aspirate(volume, source, self.assay["reagent_rate"])
+                pipette.dispense(volume, plate["A" + str(i + 1)].top(-1), rate=0.3)
+            pipette.blow_out(plate["A" + str(i + 1)].top(-1))
+            pipette.blow_out(plate["A" + str(i + 1)].top(-1))
+
+    def shake(self, protocol, heatshaker, dry_run):
+        """
+        Mixes the reagent into the plate on the heater shaker, heating it first when the assay incubates warm
+        """
+        if self.assay["temperature"] is not None:
+            heatshaker.set_and_wait_for_temperature(self.assay["temperature"])
+        heatshaker.set_and_wait_for_shake_speed(self.assay["shake_speed"])
+        if dry_run:
+            protocol.delay(seconds=10)
+        else:
+            protocol.delay(minutes=self.assay["shake_minutes"])
+        heatshaker.deactivate_shaker()
+
+    def incubation_seconds(self, dry_run):
+        return 10 if dry_run else self.assay["incubation_minutes"] * 60
+
+    def report(self, protocol):
+        """
+        Prints the compiled layout and standards for the operator
+        """
+        protocol.comment("\n---------------%s Plan----------------\n\n" % self.assay["name"])
+        for plate in range(0, self.num_plates):
+            protocol.comment(
+                "Plate %d: %d columns, sample columns %s"
+                % (
+                    plate + 1,
+                    self.plate_columns[plate],
+                    ", ".join(str(column + 1) for column in self.plate_sample_columns[plate]),
+                )
+            )
+        if self.shared_standards:
+            protocol.comment("The standards on plate 1 are shared by every plate")
+        for i, tube in enumerate(self.tubes):
+            source = "stock" if tube["source"] is None else "standard %d" % (tube["source"] + 1)
+            protocol.comment(
+                "Standard %d (%s): %.1f uL of %s + %.1f uL diluent"
+                % (i + 1, self.rows[i], tube["stock"], source, tube["buffer"])
+            )
+
+
+# copy of PlateQuantifier in bradford_final.py, edit it there and run shared_check.py -w
+class PlateQuantifier:
+    """
+    Reads the assay plates on the absorbance reader and works out the sample concentrations from a
+    standard curve fitted to the standards and blank of each plate. The simulator's reader reads 0
+    in every well, so a synthetic plate made from a model response stands in for it when simulating
+    with nothing read
+    Compiler: AssayCompiler of the run, gives where each standard and sample is
+    Dilution: times the samples were diluted before they went on the plate, one for every sample or a
+    list with the dilution of each sample
+    Names: (name, stock well) of each sample, by default its number and its well on the stock plate
+    """
+
+    synthetic_blank = 0.1  # absorbance of a synthetic blank well
+    synthetic_response = [-0.4, 1.4, 0.0]  # absorbance over the blank, polynomial of the fraction of the top standard
+    synthetic_noise = 0.01  # relative sd of a synthetic well
+
+    def __init__(self, compiler, dilution=1, names=None):
+        self.compiler = compiler
+        self.assay = compiler.assay
+        if not isinstance(dilution, list):
+            dilution = [dilution] * compiler.number_samples
+        self.dilutions = dilution
+        if names is None:
+            names = [
+                (str(i + 1), compiler.rows[i % 8] + str(i // 8 + 1))
+                for i in range(0, compiler.number_samples)
+            ]
+        self.names = names
+        self.absorbances = {}  # plate index: {well name: absorbance}
+        self.curves = {}  # plate index: (polynomial coefficients highest power first, r squared)
+        self.standards = []  # {plate, concentration, wells, absorbances}
+        self.samples = []  # {sample, name, stock_well, dilution, plate, wells, absorbances, concentrations, concentration}
+
+    def initialize(self, reader):
+        """
+        Sets the reader to the assay wavelength, it has to be closed and empty
+        """
+        reader.close_lid()
+        reader.initialize("single", [self.assay["wavelength"]])
+
+    def read(self, protocol, reader, plate, plate_index, slot):
+        """
+        Reads a plate on the reader and puts it back in slot. The reads are saved with the run
+        """
+        reader.open_lid()
+        protocol.move_labware(plate, reader, use_gripper=True)
+        reader.close_lid()
+        result = reader.read(export_filename="%s_plate_%d" % (self.assay["name"], plate_index + 1))
+        reader.open_lid()
+        protocol.move_labware(plate, slot, use_gripper=True)
+        reader.close_lid()
+        self.absorbances[plate_index] = result[self.assay["wavelength"]]
+        if protocol.is_simulating() and not any(self.absorbances[plate_index].values()):
+            self.absorbances[plate_index] = self.synthetic(plate_index)
+        self.quantify(plate_index)
+
+    def layout(self, plate_index):
+        """
+        Get's what is in the wells of a plate
+        Return: [(concentration, wells)] of the standards and blank, [(sample index, wells)] of the samples
+        """
+        compiler = self.compiler
+        standards = []
+        concentrations = list(self.assay["standards"]) + ([0] if self.assay["blank"] else [])
+        for tube, concentration in enumerate(concentrations):
+            standards.append((concentration, compiler.standard_wells(plate_index, tube)))
+        samples = []
+        for column in compiler.plate_sample_columns[plate_index]:
+            columns = compiler.sample_wells(column)[1]
+            for row in range(0, min(compiler.number_samples - column * 8, 8)):
+                samples.append(
+                    (column * 8 + row, [compiler.rows[row] + well[1:] for well in columns])
+                )
+        return standards, samples
+
+    def synthetic(self, plate_index):
+        """
+        Get's a made up read of a plate, the samples are spread over the range of the standards
+        Return: {well name: absorbance}
+        """
+        randomiser = random.Random(plate_index)
+        top = self.assay["standards"][0]
+        standards, samples = self.layout(plate_index)
+        fractions = [(concentration / top, wells) for concentration, wells in standards]
+        fractions += [(0.1 + 0.8 * ((sample * 0.618) % 1), wells) for sample, wells in samples]
+        absorbances = {}
+        for fraction, wells in fractions:
+            absorbance = self.synthetic_blank + numpy.polyval(self.synthetic_response, fraction)
+            for well in wells:
+                absorbances[well] = absorbance * randomiser.gauss(1, self.synthetic_noise)
+        return absorbances
+
+    def concentration(self, plate_index, absorbance):
+        """
+        Get's the concentration the curve of a plate gives an absorbance
+        Return: the smallest concentration that isn't negative, None when the curve never reaches it
+        """
+        coefficients = numpy.array(self.curves[plate_index][0], dtype=float)
+        coefficients[-1] -= absorbance
+        roots = numpy.roots(coefficients)
+        roots = [root.real for root in roots if abs(root.imag) < 1e-9 and root.real >= -1e-9]
+        if not roots:
+            return None
+        return max(min(roots), 0)
+
+    def quantify(self, plate_index):
+        """
+        Fits the standard curve of a plate and works out its samples
+        """
+        absorbances = self.absorbances[plate_index]
+        standards, samples = self.layout(plate_index)
+        x = [concentration for concentration, wells in standards for _ in wells]
+        y = [absorbances[well] for _, wells in standards for well in wells]
+        coefficients = numpy.polyfit(x, y, self.assay["curve_degree"])
+        residual = numpy.sum((numpy.polyval(coefficients, x) - y) ** 2)
+        total = numpy.sum((numpy.array(y) - numpy.mean(y)) ** 2)
+        self.curves[plate_index] = (list(coefficients), 1 - residual / total if total > 0 else 1)
+        for concentration, wells in standards:
+            self.standards.append(
+                {
+                    "plate": plate_index,
+                    "concentration": concentration,
+                    "wells": wells,
+                    "absorbances": [absorbances[well] for well in wells],
+                }
+            )
+        for sample, wells in samples:
+            concentrations = [self.concentration(plate_index, absorbances[well]) for well in wells]
+            dilution = self.dilutions[sample]
+            found = [c * dilution for c in concentrations if c is not None]
+            self.samples.append(
+                {
+                    "sample": sample,
+                    "name": self.names[sample][0],
+                    "stock_well": self.names[sample][1],
+                    "dilution": dilution,
+                    "plate": plate_index,
+                    "wells": wells,
+                    "absorbances": [absorbances[well] for well in wells],
+                    "concentrations": [None if c is None else c * dilution for c in concentrations],
+                    "concentration": sum(found) / len(found) if found else None,
+                }
+            )
+
+    def report(self, protocol):
+        """
+        Prints the standard curves and the concentration of every sample read so far
+        """
+        units = self.assay["units"]
+        protocol.comment("\n---------------%s Results----------------\n\n" % self.assay["name"])
+        for plate_index, (coefficients, r_squared) in sorted(self.curves.items()):
+            terms = " + ".join(
+                "%.4g c^%d" % (coefficient, len(coefficients) - 1 - i)
+                for i, coefficient in enumerate(coefficients)
+            )
+            protocol.comment(
+                "Plate %d curve: A%d = %s, R^2 %.4f"
+                % (plate_index + 1, self.assay["wavelength"], terms, r_squared)
+            )
+        mixed = len(set(self.dilutions)) > 1
+        if mixed:
+            protocol.comment("Sample concentrations are corrected for the dilution of each sample")
+        elif self.dilutions and self.dilutions[0] != 1:
+            protocol.comment("Sample concentrations are corrected for the %g times dilution" % self.dilutions[0])
+        for sample in self.samples:
+            if sample["concentration"] is None:
+                result = "outside the standard curve"
+            else:
+                result = "%.2f %s" % (sample["concentration"], units)
+            if mixed:
+                result += ", diluted %g times" % sample["dilution"]
+            protocol.comment(
+                "Sample %s (%s, plate %d %s): %s"
+                % (
+                    sample["name"],
+                    sample["stock_well"],
+                    sample["plate"] + 1,
+                    " ".join(sample["wells"]),
+                    result,
+                )
+            )
+
+
+# copy of ReplicateQC in bradford_final.py, edit it there and run shared_check.py -w
+class ReplicateQC:
+    """
+    Replicate QC of the quantified plates. The replicates of every sample and standard are checked
+    together as arrays: the CV of each, replicates far from the median of their sample and samples
+    outside the standard curve. Failing samples are listed as a re-run CSV, one per dilution they
+    are re-run at, that the protocol takes back in rerun_csv
+    Quantifier: PlateQuantifier with its plates read
+    Rerun_well: function giving the stock well of the ith sample of a re-run at a dilution
+    Split_dilutions: False when the protocol dilutes each sample on its own, the re-runs are one CSV
+    """
+
+    max_cv = 0.15  # sd / mean of the replicates
+    max_deviation = 0.25  # fraction of the median a replicate can be off by, checked with 3 or more replicates
+    rerun_fraction = 0.5  # samples above the curve are re-run diluted to about this fraction of the top standard
+    max_dilution = 20
+    header = ["sample", "stock_well", "rerun_well", "dilution", "reason"]
+
+    def __init__(self, quantifier, rerun_well, split_dilutions=True):
+        self.quantifier = quantifier
+        self.rerun_well = rerun_well
+        self.split_dilutions = split_dilutions
+        self.standards = []  # {plate, concentration, cv}
+        self.samples = []  # {name, stock_well, cv, reasons, dilution, rerun}
+        self.reruns = {}  # dilution: re-run CSV rows, None: every row when the dilutions aren't split
+
+    @staticmethod
+    def spread(values):
+        """
+        Get's the mean, CV and median of every row of replicates, missing replicates are left out
+        Values: array of rows x replicates, nan where a replicate is missing
+        Return: arrays of means, CVs (nan with less than 2 replicates) and medians
+        """
+        present = ~numpy.isnan(values)
+        counts = present.sum(axis=1)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            means = numpy.where(present, values, 0).sum(axis=1) / counts
+            squares = numpy.where(present, (values - means[:, None]) ** 2, 0).sum(axis=1)
+            cvs = numpy.sqrt(squares / (counts - 1)) / means
+        ordered = numpy.sort(values, axis=1)  # missing replicates sort last
+        lower = numpy.take_along_axis(ordered, numpy.maximum((counts - 1) // 2, 0)[:, None], axis=1)[:, 0]
+        upper = numpy.take_along_axis(ordered, numpy.minimum(counts // 2, values.shape[1] - 1)[:, None], axis=1)[:, 0]
+        return means, cvs, (lower + upper) / 2
+
+    def check(self):
+        """
+        Checks every standard and sample and works out the re-runs
+        """
+        quantifier = self.quantifier
+        standards = quantifier.standards
+        _, cvs, _ = self.spread(numpy.array([s["absorbances"] for s in standards], dtype=float))
+        self.standards = [
+            {"plate": s["plate"], "concentration": s["concentration"], "cv": cv}
+            for s, cv in zip(standards, cvs)
+        ]
+        samples = quantifier.samples
+        if not samples:
+            return
+        concentrations = numpy.array(
+            [[numpy.nan if c is None else c for c in s["concentrations"]] for s in samples], dtype=float
+        )
+        absorbances = numpy.array([s["absorbances"] for s in samples], dtype=float)
+        means, cvs, medians = self.spread(concentrations)
+
+        # replicates off from the rest of their sample, a duplicate pair only shows in the CV
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            outliers = numpy.abs(concentrations - medians[:, None]) > self.max_deviation * medians[:, None]
+        if concentrations.shape[1] < 3:
+            outliers[:] = False
+
+        # samples outside the standards, a replicate off the curve counts by its absorbance
+        top = max(quantifier.assay["standards"])
+        low = min(c for c in quantifier.assay["standards"] if c > 0)
+        top_absorbance = {
+            s["plate"]: numpy.mean(s["absorbances"]) for s in standards if s["concentration"] == top
+        }
+        plates = [s["plate"] for s in samples]
+        current = numpy.array([s["dilution"] for s in samples], dtype=float)
+        on_plate = means / current
+        missing = numpy.isnan(concentrations).any(axis=1)
+        over = absorbances.max(axis=1) > numpy.array([top_absorbance[plate] for plate in plates])
+        above = (on_plate > top) | (missing & over)
+        below = (on_plate < low) | (missing & ~over)
+
+        # re-run dilutions that bring the samples back into the curve
+        estimate = numpy.where(numpy.isnan(on_plate), 2 * top, on_plate)
+        dilutions = current
+        dilutions = numpy.where(
+            above, current * numpy.ceil(numpy.maximum(estimate, top) / (self.rerun_fraction * top)), dilutions
+        )
+        dilutions = numpy.where(
+            below,
+            numpy.maximum(numpy.floor(current * numpy.nan_to_num(on_plate) / (self.rerun_fraction * top)), 1),
+            dilutions,
+        )
+        dilutions = numpy.minimum(numpy.round(dilutions), self.max_dilution).astype(int)
+
+        # out of range samples are only re-run when the dilution can change
+        failed = (cvs > self.max_cv) | outliers.any(axis=1) | ((above | below) & (dilutions != current))
+        self.samples = []
+        self.reruns = {}
+        for i, sample in enumerate(samples):
+            reasons = []
+            if cvs[i] > self.max_cv:
+                reasons.append("cv %d%%" % round(cvs[i] * 100))
+            for x in numpy.flatnonzero(outliers[i]):
+                reasons.append("outlier " + sample["wells"][x])
+            if above[i]:
+                reasons.append("above the curve")
+            if below[i]:
+                reasons.append("below the curve")
+            self.samples.append(
+                {
+                    "name": sample["name"],
+                    "stock_well": sample["stock_well"],
+                    "cv": cvs[i],
+                    "reasons": reasons,
+                    "dilution": int(dilutions[i]),
+                    "rerun": bool(failed[i]),
+                }
+            )
+
+        # a re-run at mixed dilutions is ordered by dilution, so the columns it is diluted in are alike
+        order = numpy.flatnonzero(failed)
+        if not self.split_dilutions:
+            order = order[numpy.argsort(dilutions[order], kind="stable")]
+        for i in order:
+            rows = self.reruns.setdefault(int(dilutions[i]) if self.split_dilutions else None, [])
+            rows.append(
+                [
+                    samples[i]["name"],
+                    samples[i]["stock_well"],
+                    self.rerun_well(len(rows), int(dilutions[i])),
+                    str(dilutions[i]),
+                    "; ".join(self.samples[i]["reasons"]),
+                ]
+            )
+
+    def report(self, protocol):
+        """
+        Prints the failing standards and samples and the re-run CSVs
+        """
+        protocol.comment("\n---------------Replicate QC----------------\n\n")
+        for standard in self.standards:
+            if standard["cv"] > self.max_cv:
+                protocol.comment(
+                    "Standard %g on plate %d: cv %d%%, check the curve of the plate"
+                    % (standard["concentration"], standard["plate"] + 1, round(standard["cv"] * 100))
+                )
+        for sample in self.samples:
+            if sample["reasons"] and not sample["rerun"]:
+                protocol.comment(
+                    "Sample %s (%s): %s, no dilution brings it into the curve"
+                    % (sample["name"], sample["stock_well"], "; ".join(sample["reasons"]))
+                )
+        passed = len([sample for sample in self.samples if not sample["reasons"]])
+        failed = sum(len(rows) for rows in self.reruns.values())
+        protocol.comment("%d of %d samples pass, %d to re-run" % (passed, len(self.samples), failed))
+        for dilution, rows in sorted(self.reruns.items(), key=lambda item: item[0] or 0):
+            label = "Re-run" if dilution is None else "Re-run x%d" % dilution
+            for row in [self.header] + rows:
+                protocol.comment("%s: %s" % (label, ",".join(row)))
+
+
+# ASSAY DESCRIPTION
+# replicates, sample_volume and incubation_minutes come from the runtime parameters
+assay = {
+    "name": "BCA",
+    "standards": [1500, 1000, 750, 500, 250, 125, 25],  # µg/mL
+    "stock": 1500,
+    "dilution": "direct",
+    "serial_from": 3,  # the 25 µg/mL tube is made from the 500 µg/mL one
+    "blank": True,
+    "standard_extra": 60,
+    "standard_min": 0,
+    "samples_per_plate": None,
+    "share_standards": False,
+    "max_plates": 1,
+    "reagent_volume": 200,
+    "reagent_rate": 0.5,
+    "temperature": 37,
+    "shake_speed": 400,
+    "shake_minutes": 0.5,
+    "wavelength": 562,
+    "units": "ug/mL",
+    "curve_degree": 2,
+}
+
+
+# RE-RUN SAMPLES
+# A re-run CSV from the replicate QC, replicate_qc.py writes a copy of the protocol with it filled in.
+# Only its samples are run, re-arrayed into the sample plate as in rerun_well. Empty for a normal run
+rerun_csv = """
+"""
+
+
+# copy of read_rerun_csv in bradford_final.py, edit it there and run shared_check.py -w
+def read_rerun_csv(text, mixed_dilutions=False):
+    """
+    Get's the samples of a re-run CSV
+    Text: CSV from the replicate QC with a header row
+    Mixed_dilutions: True when the protocol dilutes each sample on its own
+    Return: [{sample, stock_well, rerun_well, dilution, reason}] in re-run order, the dilution they are
+    re-run at (None with mixed_dilutions)
+    """
+    rows = [row for row in csv.reader(io.StringIO(text.strip())) if row]
+    if not rows:
+        return [], None
+    if rows[0] != ReplicateQC.header:
+        raise ValueError("The re-run CSV needs the columns " + ",".join(ReplicateQC.header))
+    samples = [dict(zip(rows[0], row)) for row in rows[1:]]
+    dilutions = sorted(set(int(sample["dilution"]) for sample in samples))
+    if mixed_dilutions:
+        return samples, None
+    if len(dilutions) > 1:
+        raise ValueError(
+            "The re-run samples are at dilutions %s, re-run each dilution on its own"
+            % ", ".join(str(dilution) for dilution in dilutions)
+        )
+    return samples, dilutions[0] if dilutions else None
+
+
+# SAMPLE DILUTIONS
+# Times each sample is diluted before it is loaded, for samples that need another dilution than
+# sample_vol + buffer_vol, e.g. from an earlier quantification. Columns sample,dilution with the
+# samples numbered from 1, at most 40x. Empty to dilute every sample the same
+dilution_csv = """
+"""
+
+
+def read_dilution_csv(text, number_samples, dilution, max_dilution=40):
+    """
+    Get's the dilution of every sample
+    Text: CSV with the columns sample,dilution, samples not in it get the default dilution
+    Dilution: default dilution, 1 when the samples aren't diluted
+    Max_dilution: most a sample can be diluted, the 200 uL dilution well then holds 5 uL of it
+    Return: dilution of each sample in order
+    """
+    if dilution > max_dilution:
+        raise ValueError(
+            "sample_vol and buffer_vol dilute the samples %gx, the most a 200 uL dilution well takes is %dx"
+            % (dilution, max_dilution)
+        )
+    dilutions = [dilution] * number_samples
+    rows = [row for row in csv.reader(io.StringIO(text.strip())) if row]
+    if not rows:
+        return dilutions
+    if rows[0] != ["sample", "dilution"]:
+        raise ValueError("The dilution CSV needs the columns sample,dilution")
+    for sample, value in rows[1:]:
+        if not 1 <= int(sample) <= number_samples:
+            raise ValueError("Sample %s of the dilution CSV isn't one of the %d samples" % (sample, number_samples))
+        if float(value) < 1:
+            raise ValueError("Sample %s can't be diluted %s times" % (sample, value))
+        if float(value) > max_dilution:
+            raise ValueError(
+                "Sample %s of the dilution CSV is diluted %sx, the most a 200 uL dilution well takes is %dx"
+                % (sample, value, max_dilution)
+            )
+        dilutions[int(sample) - 1] = float(value)
+    return dilutions
+
+
 def add_parameters(parameters):
     parameters.add_int(
         variable_name="number_samples",
@@ -104,6 +1853,24 @@ def add_parameters(parameters):
         ],
         default=3,
     )
+    parameters.add_bool(
+        variable_name="multi_dispense_samples",
+        display_name="Multi Dispense Samples",
+        description="Fill the replicates of a sample column from one aspiration, False: a tip per replicate",
+        default=False,
+    )
+    parameters.add_bool(
+        variable_name="multi_dispense_standards",
+        display_name="Multi Dispense Standards",
+        description="Fill the standard tubes, standard replicates and blank from one aspiration each",
+        default=False,
+    )
+    parameters.add_bool(
+        variable_name="stamp_diluent",
+        display_name="Stamp Sample Diluent",
+        description="The 8 channel adds the sample diluent from reservoir A12, False: the 1 channel well by well",
+        default=True,
+    )
     parameters.add_int(
         variable_name="incubation_time",
         display_name="Incubation Time",
@@ -128,35 +1895,172 @@ def add_parameters(parameters):
         description="Return tips and skip incubation (ignore this unless you are testing)",
         default=False,
     )
+    parameters.add_bool(
+        variable_name="read_absorbance",
+        display_name="Read Absorbance",
+        description="Read the plate on the absorbance reader in C3 and work out the sample concentrations",
+        default=False,
+    )
+    parameters.add_bool(
+        variable_name="optimise_commands",
+        display_name="Optimise Commands",
+        description="Skip repeated blow outs, touch tips, latch changes and deactivations. Check with command_check.py",
+        default=False,
+    )
 
 
 def run(protocol: protocol_api.ProtocolContext):
     replication_mode= protocol.params.replication_mode
     number_samples = protocol.params.number_samples
-    is_dry_run = protocol.params.dry_run
-    add_lid = True  # protocol.params.add_lid
+    dilute_with_walt = protocol.params.dulute_with_walt
+    sample_vol = protocol.params.sample_vol
+    buffer_vol = protocol.params.buffer_vol
     working_sample_vol = protocol.params.working_sample_vol
-    pipette_max = 200-5
+    rerun = read_rerun_csv(rerun_csv, mixed_dilutions=True)[0]
+    if rerun:
+        # only the samples of the re-run, each at the dilution it is re-run at
+        number_samples = len(rerun)
+        dilutions = [float(sample["dilution"]) for sample in rerun]
+    else:
+        dilutions = read_dilution_csv(
+            dilution_csv, number_samples, (sample_vol + buffer_vol) / sample_vol if dilute_with_walt else 1
+        )
+    dilute_with_walt = max(dilutions) > 1
 
-    # LOADING TIPS
-    tips = [
-        protocol.load_labware("opentrons_flex_96_filtertiprack_200uL", slot)
-        for slot in ["A3", "B3"]
+    # SAMPLE VOLUMES
+    # each sample is diluted from sample_vol when the dilution loads every replicate and fits in the
+    # 200 ul well, otherwise the closest volume that does. The 8 channel moves the smallest volume of
+    # a column and the 1 channel tops up the wells that take more, the buffer makes up the dilution
+    loaded_vol = working_sample_vol * replication_mode + 5
+    well_sample_vols = [
+        min(max(sample_vol, math.ceil(loaded_vol / dilution)), math.floor(200 / dilution)) for dilution in dilutions
     ]
-    chute = protocol.load_waste_chute()
+    column_sample_vols = [min(well_sample_vols[i:i + 8]) for i in range(0, number_samples, 8)]
+    sample_top_ups = []
+    for i, dilution in enumerate(dilutions):
+        top_up = well_sample_vols[i] - column_sample_vols[i // 8]
+        if 0 < top_up < TipPlanner.min_volume[200]:
+            # too little to pipette, the well takes the column's volume when that's enough or 5 ul more
+            top_up = 0 if column_sample_vols[i // 8] * dilution >= loaded_vol else TipPlanner.min_volume[200]
+        sample_top_ups.append(top_up)
+        well_sample_vols[i] = column_sample_vols[i // 8] + top_up
+    sample_buffer_vols = [round(volume * (dilution - 1), 2) for volume, dilution in zip(well_sample_vols, dilutions)]
+    is_dry_run = protocol.params.dry_run
+    add_lid = True  # protocol.params.add_lid
+    read_absorbance = protocol.params.read_absorbance
+    samples_multi_dispense = protocol.params.multi_dispense_samples
+    standards_multi_dispense = protocol.params.multi_dispense_standards
+    # a tip that was just mixed in its source is wet already
+    sample_dispense = MultiDispense(pre_wet=0 if dilute_with_walt else 2)
+    standard_dispense = MultiDispense(pre_wet=0)
+    # the standards and blank are put in column 12 of the sample plate, A-H, where no sample goes,
+    # and the 8 channel stamps the column onto each replicate column. 10 µL is left in each well
+    standard_column_volume = working_sample_vol * replication_mode + 10
+    if standards_multi_dispense:
+        standard_column_volume += standard_dispense.extra
+    compiler = AssayCompiler(
+        dict(
+            assay,
+            replicates=replication_mode,
+            sample_volume=working_sample_vol,
+            incubation_minutes=protocol.params.incubation_time,
+        ),
+        number_samples,
+    )
+    num_sample_columns = compiler.num_sample_columns
+    standard_tubes = compiler.tubes
+    buffer_vols = [tube["buffer"] for tube in standard_tubes]
+    num_columns = compiler.num_columns
+    working_reagent_volume = assay["reagent_volume"]
 
-    def remove_tip(pipette):
-        if is_dry_run:
-            pipette.return_tip()
-        else:
-            pipette.drop_tip(chute)
+    # SAMPLE DILUENT
+    # the diluent is loaded into reservoir A12 when the working reagent leaves it free, and the 8
+    # channel stamps it onto the full diluted columns. A column with less than 8 samples is left to the
+    # 1 channel, a partial column of nozzles starts at the front nozzle and the unused ones behind it
+    # would hang over the A3 tip rack and the A2 tube rack
+    stamped_columns, diluent_left = [], sample_buffer_vols
+    if (
+        dilute_with_walt
+        and protocol.params.stamp_diluent
+        and math.ceil(compiler.reagent_left / compiler.reagent_well_volume) < 12
+    ):
+        stamped_columns, diluent_left = diluent_columns(sample_buffer_vols, TipPlanner.min_volume[200])
 
-    def find_aspirate_height(pip, source_well):
-        lld_height = (
-            pip.measure_liquid_height(source_well) - source_well.bottom().point.z
+    # TIP PLAN
+    # the run has no staging racks to swap in, so the plan has to fit in the A3 and B3 racks
+    planner = TipPlanner(["A3", "B3"], max_swaps=0)
+    if stamped_columns:
+        planner.add(
+            "diluent stamping",
+            [volume for _, volume in stamped_columns for _ in range(0, 8)],
+            channels=(8,),
+            multi_dispense=True,
+            extra=5,
+        )
+    if any(volume > 0 for volume in diluent_left):
+        planner.add(
+            "sample diluent",
+            [volume for volume in diluent_left if volume > 0],
+            multi_dispense=True,
+            extra=5,
+        )
+    if dilute_with_walt:
+        if any(sample_top_ups):
+            planner.add(
+                "sample top up",
+                [volume for volume in sample_top_ups if volume > 0],
+                tips=len([volume for volume in sample_top_ups if volume > 0]),
+            )
+        sample_volumes = [volume for volume in column_sample_vols for _ in range(0, 8)]
+    else:
+        sample_volumes = []
+    if samples_multi_dispense:
+        planner.add(
+            "sample transfer",
+            sample_volumes + [working_sample_vol] * (num_sample_columns * 8 * replication_mode),
+            channels=(8,),
+            multi_dispense=True,
+            extra=sample_dispense.extra,
+            tips=num_sample_columns,
+            dispenses_per_source=replication_mode,
+        )
+    else:
+        planner.add(
+            "sample transfer",
+            sample_volumes + [working_sample_vol] * (num_sample_columns * 8 * replication_mode),
+            channels=(8,),
+            tips=num_sample_columns * replication_mode,
         )
-        aspirate_height = max(lld_height - 5, 1)
-        return aspirate_height
+    planner.add(
+        "standard diluent",
+        buffer_vols,
+        multi_dispense=standards_multi_dispense,
+        extra=10 if standards_multi_dispense else 0,
+        tips=1,
+    )
+    planner.add(
+        "standards",
+        [standard_column_volume] * len(standard_tubes) + [tube["stock"] for tube in standard_tubes],
+        tips=len(standard_tubes),
+    )
+    planner.add("blank", [standard_column_volume], tips=1)
+    planner.add(
+        "standard stamping",
+        [working_sample_vol] * (8 * replication_mode),
+        channels=(8,),
+        multi_dispense=standards_multi_dispense,
+        extra=standard_dispense.extra if standards_multi_dispense else 0,
+        tips=1 if standards_multi_dispense else replication_mode,
+    )
+    planner.add(
+        "working reagent",
+        [working_reagent_volume] * (num_columns * 8),
+        channels=(8,),
+    )
+    planner.plan()
+
+    # LOADING TIPS
+    tips = compiler.load_tips(protocol, planner, is_dry_run)
 
     # LOADING PIPETTES
     left_pipette = protocol.load_instrument(
@@ -169,6 +2073,10 @@ def run(protocol: protocol_api.ProtocolContext):
     # LOADING LABWARE
     working_reagent_reservoir = protocol.load_labware("nest_12_reservoir_15ml", "D2")
     heatshaker = protocol.load_module("heaterShakerModuleV1", "D1")
+    sheet = LoadingSheet(simulating=protocol.is_simulating())
+    sheet.attach([left_pipette, right_pipette])
+    optimiser = CommandOptimiser(enabled=protocol.params.optimise_commands)
+    optimiser.attach(protocol, [left_pipette, right_pipette], [heatshaker])
     working_plate = protocol.load_labware("corning_96_wellplate_360ul_flat", "C2")
     reagent_stock = protocol.load_labware(
         "opentrons_10_tuberack_falcon_4x50ml_6x15ml_conical", "A1"
@@ -180,14 +2088,38 @@ def run(protocol: protocol_api.ProtocolContext):
     sample_stock = protocol.load_labware(
         "opentrons_96_wellplate_200ul_pcr_full_skirt", "B2"
     )
-    staging_slots = ["A4", "B4", "C4"]
+
+    def stock_well(i):
+        """
+        Get's where the ith sample goes in the sample plate
+        """
+        return "B2 " + sample_stock.wells()[i].well_name
+
+    if read_absorbance:
+        # the reader's lid is kept in C4
+        reader = protocol.load_module("absorbanceReaderV1", "C3")
+        staging_slots = ["A4", "B4", "D4"]
+        if rerun:
+            names = [(sample["sample"], stock_well(i)) for i, sample in enumerate(rerun)]
+        else:
+            names = [(str(i + 1), stock_well(i)) for i in range(0, number_samples)]
+        quantifier = PlateQuantifier(compiler, dilutions, names)
+        quantifier.initialize(reader)
+    else:
+        staging_slots = ["A4", "B4", "C4"]
     staging_racks = [
         protocol.load_labware("opentrons_flex_96_filtertiprack_1000uL", slot)
         for slot in staging_slots
     ]
+    planner.report(protocol)
+    compiler.report(protocol)
+    for i, sample in enumerate(rerun):
+        protocol.comment(
+            "Re-run sample %s (was %s, %s): load into %s"
+            % (sample["sample"], sample["stock_well"], sample["reason"], stock_well(i))
+        )
 
     # REPLENISHING TIPS
-    protein_addition_quick_transfer = False
 
     count = 0
     # DEFINING LIQUIDS
@@ -215,8 +2147,8 @@ def run(protocol: protocol_api.ProtocolContext):
     empty_tube = protocol.define_liquid("empty", "Empty Tubes for Standards", "#D3D3D3")
 
     # LOADING LIQUIDS
-    reagent_stock["A1"].load_liquid(water, 9000)
-    bsa_rack["A1"].load_liquid(bsa_stock, 550)
+    sheet.source(reagent_stock["A1"], water)
+    sheet.source(bsa_rack["A1"], bsa_stock)
     # reagent_stock["A3"].load_liquid(Reagent_A, 22000)
     # bsa_rack["D1"].load_liquid(Reagent_B, 1000)
     bsa_rack["B1"].load_liquid(empty_tube, 1)  # 1500 µg/mL
@@ -235,252 +2167,103 @@ def run(protocol: protocol_api.ProtocolContext):
     
     heatshaker.open_labware_latch()
     #Diluting Sample
-    diluted_sample_offset = 6
-    
-
-    if protocol.params.dulute_with_walt:
-        left_pipette.pick_up_tip()
-        vol_in_15_facon = get_vol_15ml_falcon(find_aspirate_height(left_pipette, dilutent_location))
-        # num_transfers = math.ceil((number_samples*protocol.params.buffer_vol)/pipette_max)
-        num_transfers = math.ceil((number_samples*protocol.params.buffer_vol)/(protocol.params.buffer_vol*math.floor(pipette_max/protocol.params.buffer_vol)))
-        well_counter = 0
-        col_num = replication_mode+1     # col num for the working_plate
-        # print(num_transfers)
-        for i in range (0, num_transfers):
-            if i != num_transfers-1:    # not on last iteration
-                aspirate_vol = pipette_max - pipette_max%protocol.params.buffer_vol
-            else:
-                aspirate_vol = (number_samples*protocol.params.buffer_vol)-(pipette_max - pipette_max%protocol.params.buffer_vol)*(num_transfers-1)
-            if left_pipette.has_tip == False:
-                left_pipette.pick_up_tip()
-            left_pipette.blow_out(dilutent_location.top())
-            left_pipette.aspirate(aspirate_vol+5, dilutent_location.bottom(get_height_15ml_falcon(vol_in_15_facon)), 1)
-            for x in range (0, math.floor(aspirate_vol/protocol.params.buffer_vol)):
-                left_pipette.dispense(protocol.params.buffer_vol, sample_stock.wells()[well_counter + 48], 0.75)
-                well_counter += 1
-            # remove_tip(left_pipette)
-            vol_in_15_facon-=aspirate_vol+5
-        remove_tip(left_pipette)
-        for i in range (0, math.ceil(number_samples/8)):
-            right_pipette.pick_up_tip()
-            right_pipette.aspirate(protocol.params.sample_vol, sample_stock['A' + str(i+1)].bottom(0.1), 0.5)
-            right_pipette.dispense(protocol.params.sample_vol, sample_stock['A' + str(i+1+diluted_sample_offset)], 0.5)
-            right_pipette.mix(3, protocol.params.sample_vol + protocol.params.buffer_vol-10, sample_stock['A' + str(i+1+diluted_sample_offset)], 0.5)
-            # right_pipette.blow_out(sample_stock['A' + str(i+1+diluted_sample_offset)].top())
-            right_pipette.touch_tip(sample_stock['A' + str(i+1+diluted_sample_offset)])
-            if protein_addition_quick_transfer:
-                right_pipette.aspirate(working_sample_vol*replication_mode+10, sample_stock['A' + str(i+1+diluted_sample_offset)],0.3)
-                for x in range (0,replication_mode):
-                    right_pipette.dispense(working_sample_vol, working_plate['A' + str(col_num)].bottom(0.5), 0.5)
-                    # right_pipette.blow_out(working_plate['A' + str(col_num)].top())
-                    col_num+=1
-                remove_tip(right_pipette)
-            else:
-                for x in range (0,replication_mode):
-                    if right_pipette.has_tip == False:
-                        right_pipette.pick_up_tip()
-                    right_pipette.aspirate(working_sample_vol, sample_stock['A' + str(i+1+diluted_sample_offset)],0.3)
-                    right_pipette.dispense(working_sample_vol, working_plate['A' + str(col_num)].bottom(0.5), 0.5)
-                    right_pipette.blow_out(working_plate['A' + str(col_num)].top())
-                    col_num+=1
-                    remove_tip(right_pipette)
-            
-            
-    else:
-        col_num = replication_mode+1
-        if protein_addition_quick_transfer:
-            for i in range (0, math.ceil(number_samples/8)):
-                right_pipette.pick_up_tip()
-                right_pipette.aspirate(working_sample_vol*replication_mode+10, sample_stock['A' + str(i+1)],0.5)
-                for x in range (0,replication_mode):
-                    right_pipette.dispense(working_sample_vol, working_plate['A' + str(col_num)].bottom(0.5), 0.5)
-                    # right_pipette.blow_out(working_plate['A' + str(col_num)].top())
-                    col_num+=1
-                remove_tip(right_pipette)
-        else:
-            for i in range (0, math.ceil(number_samples/8)):
-                # right_pipette.pick_up_tip()
-                for x in range (0,replication_mode):
-                    if right_pipette.has_tip == False:
-                        right_pipette.pick_up_tip()
-                    right_pipette.aspirate(working_sample_vol, sample_stock['A' + str(i+1)],0.5)
-                    # right_pipette.aspirate(working_sample_vol, sample_stock['A' + str(i+1+diluted_sample_offset)],0.3)
-                    right_pipette.dispense(working_sample_vol, working_plate['A' + str(col_num)].bottom(0.5), 0.5)
-                    right_pipette.blow_out(working_plate['A' + str(col_num)].top())
-                    col_num+=1
-                    remove_tip(right_pipette)
-                # remove_tip(right_pipette)
-
-            
-    def standard_loading(old, new):
-        """
-        old: well from sample stock
-        new: row letter from sample plate
-        """
-        # left_pipette.pick_up_tip()
-        if protein_addition_quick_transfer:
-            left_pipette.aspirate(working_sample_vol*replication_mode+5, bsa_rack[old].bottom(1.5), 0.25)
-
-            for i in range(1, replication_mode+1):  # A1,A2,A3
-                left_pipette.dispense(working_sample_vol, working_plate[new + str(i)].bottom(0.1), 0.25)
-        else:
-
-            for i in range(1, replication_mode+1):  # A1,A2,A3
-                if left_pipette.has_tip == False:
-                    left_pipette.pick_up_tip()
-                left_pipette.aspirate(working_sample_vol, bsa_rack[old].bottom(1.5), 0.25)
-                left_pipette.dispense(working_sample_vol, working_plate[new + str(i)].bottom(0.1), 0.25)
-                remove_tip(left_pipette)
-
-    # Standard Preparation  FINISH LATER
-    # standard_vol_per_tube = 500#working_sample_vol*replication_mode+50
-    standard_vol_per_tube = working_sample_vol*replication_mode+60
-    # dilutent_percentages = [0.25, 0.5, 0.625, 0.75, 0.875, 0.9375, 0.9875]
-    dilutent_percentages = [1, 2/3, 1/2, 1/3, 1/6, 1/12, 1/60]
-    buffer_vols =[]
-    bsa_vols = []
-    dilutent_pipette_vols = []
-    serial_dilution_stock_tube = 3      # tubes 0 to 7
-    amt_extra_in_1_over_12_tube=0
-    for i in range(0, len(dilutent_percentages)):
-        if standard_vol_per_tube*dilutent_percentages[i] < 5:
-            #add extra to the serial_dilution_stock_tube duluted tube to make up for the 5ul minimum
-            amt_extra_in_1_over_12_tube = (1/dilutent_percentages[serial_dilution_stock_tube])*standard_vol_per_tube*dilutent_percentages[i]
-            amt_in_1_over_12_tube = standard_vol_per_tube + amt_extra_in_1_over_12_tube
-            bsa_vols[serial_dilution_stock_tube] = amt_in_1_over_12_tube*dilutent_percentages[serial_dilution_stock_tube]
-            buffer_vols[serial_dilution_stock_tube] = amt_in_1_over_12_tube*(1-dilutent_percentages[serial_dilution_stock_tube])
-            bsa_vols.append(0)
-            buffer_vols.append(standard_vol_per_tube-amt_extra_in_1_over_12_tube)
-            # buffer_vols.append(standard_vol_per_tube*(1-dilutent_percentages[i]) - amt_extra_in_1_over_12_tube*(1-dilutent_percentages[i]))
-            # print(standard_vol_per_tube*(1-dilutent_percentages[i]) - amt_extra_in_1_over_12_tube*(1-dilutent_percentages[i]))
-
-        else:
-            bsa_vols.append(standard_vol_per_tube*dilutent_percentages[i])
-            buffer_vols.append(standard_vol_per_tube*(1-dilutent_percentages[i]))
-    
-    
-    print(buffer_vols)
-    print(bsa_vols)
-    total_dilutent = 0
-    for i in range(0, len(buffer_vols)):
-        if total_dilutent + buffer_vols[i] < (pipette_max - 10):
-            total_dilutent += buffer_vols[i]
-            # print(total_dilutent)
-            if i == len(buffer_vols) - 1:
-                dilutent_pipette_vols.append(total_dilutent)
-        else:
-            dilutent_pipette_vols.append(total_dilutent)
-            total_dilutent = buffer_vols[i]
-            if i == len(buffer_vols) - 1:
-                dilutent_pipette_vols.append(total_dilutent)
-    # dilutent_pipette_vols.append(total_dilutent)
-    
-    # left_pipette.pick_up_tip()
-    tube_spots = ["B1", "B2", "B3", "B4", "B5", "B6", "C1"]
-    well_num = 0
-    left_pipette.pick_up_tip()
-    try:
-        vol_in_15_facon
-    except NameError:
-        vol_in_15_facon = get_vol_15ml_falcon(find_aspirate_height(left_pipette, dilutent_location))
-    if protein_addition_quick_transfer:
-        for i in range(0, len(dilutent_pipette_vols)):
-            vol_in_15_facon -= dilutent_pipette_vols[i]+10
-            left_pipette.aspirate(
-                dilutent_pipette_vols[i] + 10, dilutent_location.bottom(get_height_15ml_falcon(vol_in_15_facon)), 0.5
-            )
-            amt_in_tip = dilutent_pipette_vols[i] + 10
-            while amt_in_tip > 10:
-                try:        # someties amt_in_tip is 10.0000000001
-                    left_pipette.dispense(
-                        buffer_vols[well_num],
-                        bsa_rack[tube_spots[well_num]],
-                        0.5,
-                    )
-                    amt_in_tip -= buffer_vols[well_num]
-                except:
-                    # print(amt_in_tip)
-                    break
-
-                well_num += 1
-        remove_tip(left_pipette)
+    diluent_reservoir = working_reagent_reservoir["A12"]
+    if samples_multi_dispense:
+        sample_load = dict(dispense=sample_dispense)
     else:
-        rack_order = ["B1", "B2", "B3", "B4", "B5", "B6", "C1"]
-        well_order = ["A", "B", "C", "D", "E", "F", "G"]
-        for i in range (0, len(buffer_vols)):
-            if left_pipette.has_tip == False:
-                left_pipette.pick_up_tip()
-            vol_in_15_facon -= buffer_vols[i]
-            left_pipette.aspirate(
-                buffer_vols[i], dilutent_location.bottom(get_height_15ml_falcon(vol_in_15_facon)), 0.5
+        sample_load = dict(new_tips=True)
+    if dilute_with_walt:
+        if stamped_columns:
+            sheet.source(diluent_reservoir, water)
+            compiler.stamp_diluent(right_pipette, diluent_reservoir, stamped_columns, [sample_stock])
+        if any(volume > 0 for volume in diluent_left):
+            # each aspiration fills as many of the sample buffers as fit in the tip, whatever their volumes
+            compiler.distribute(
+                left_pipette,
+                "sample diluent",
+                dilutent_location,
+                {
+                    compiler.stock_well([sample_stock], i, diluted=True): volume
+                    for i, volume in enumerate(diluent_left)
+                    if volume > 0
+                },
+                1,
+                0.75,
             )
-            left_pipette.dispense(buffer_vols[i],bsa_rack[tube_spots[i]])
-            left_pipette.blow_out(bsa_rack[rack_order[i]].top())
-            remove_tip(left_pipette)
-
-    rack_order = ["B1", "B2", "B3", "B4", "B5", "B6", "C1"]
-    well_order = ["A", "B", "C", "D", "E", "F", "G"]
-    
-    for i in range(0, len(bsa_vols)):
-        left_pipette.pick_up_tip()
-        if bsa_vols[i] == 0:
-            left_pipette.aspirate(amt_extra_in_1_over_12_tube, bsa_rack[tube_spots[serial_dilution_stock_tube]], 0.5)
-            print(amt_extra_in_1_over_12_tube)
-        else:
-            left_pipette.aspirate(
-                bsa_vols[i],
-                bsa_stock_location,
-                0.5,
-            )
-        left_pipette.dispense(
-            bsa_vols[i],
-            bsa_rack[tube_spots[i]],
+        compiler.top_up_samples(left_pipette, "sample top up", [sample_stock], sample_top_ups)
+        compiler.load_samples(
+            right_pipette,
+            "sample transfer",
+            [working_plate],
+            [sample_stock],
+            0.5,
             0.5,
+            sample_volumes=well_sample_vols,
+            dilutions=dilutions,
+            aspirate_rate=0.3,
+            **sample_load,
         )
-        left_pipette.mix(4, standard_vol_per_tube - 10, bsa_rack[tube_spots[i]], 0.5)
-        
-        standard_loading(rack_order[i], well_order[i])
-        # left_pipette.blow_out(bsa_rack[tube_spots[i]])
-        if left_pipette.has_tip:
-            remove_tip(left_pipette)
+    else:
+        compiler.load_samples(right_pipette, "sample transfer", [working_plate], [sample_stock], 0.5, 0.5, **sample_load)
+
+    # the standards and the blank fill column 12 of the sample plate, which is stamped onto the assay plate
+    standard_column = sample_stock.columns()[11]
+    tube_spots = ["B1", "B2", "B3", "B4", "B5", "B6", "C1"]
+    standard_locations = [bsa_rack[spot] for spot in tube_spots]
+    # conical tubes fill higher at the bottom than their depth fraction says, so the tip stays well above
+    compiler.add_from_above(
+        left_pipette,
+        "standard diluent",
+        dilutent_location,
+        {standard_locations[i]: buffer_vols[i] for i in range(0, len(buffer_vols))},
+        0.5,
+        multi_dispense=standards_multi_dispense,
+        extra=10,
+        clearance=10,
+    )
+    # the tip that mixed the standard fills its well of the standard column
+    compiler.make_standards(
+        left_pipette,
+        "standards",
+        bsa_stock_location,
+        standard_locations,
+        0.5,
+        lambda i: compiler.fill_standard_column(
+            left_pipette, standard_locations[i], standard_column[i], standard_column_volume
+        ),
+        mixes=4,
+        mix_rate=0.5,
+    )
 
     # Vial H: Blank
-    if protein_addition_quick_transfer:
-        left_pipette.pick_up_tip()
-        vol_in_15_facon-=working_sample_vol*replication_mode+5
-        left_pipette.aspirate(working_sample_vol*replication_mode+5, dilutent_location.bottom(get_height_15ml_falcon(vol_in_15_facon)), 0.25)
-        for i in range(1, replication_mode+1):  # A1,A2,A3
-            left_pipette.dispense(working_sample_vol, working_plate["H" + str(i)].bottom(0.1), 0.25)
-        remove_tip(left_pipette)
-    else:
-        for i in range(1, replication_mode+1):  # A1,A2,A3
-            left_pipette.pick_up_tip()
-            vol_in_15_facon-=working_sample_vol
-            left_pipette.aspirate(working_sample_vol, dilutent_location.bottom(get_height_15ml_falcon(vol_in_15_facon)), 0.25)
-            left_pipette.dispense(working_sample_vol, working_plate["H" + str(i)].bottom(0.1), 0.25)
-            remove_tip(left_pipette)
-        
+    compiler.pick_up(left_pipette, "blank")
+    compiler.fill_standard_column(
+        left_pipette,
+        dilutent_location,
+        standard_column[len(standard_tubes)],
+        standard_column_volume,
+        compiler.falcon_height(left_pipette, dilutent_location, standard_column_volume),
+    )
+    compiler.remove_tip(left_pipette)
+
+    compiler.stamp_standards(
+        right_pipette,
+        "standard stamping",
+        standard_column,
+        [working_plate],
+        standard_dispense if standards_multi_dispense else None,
+    )
+
     # Adding Working Reagent to Plate
-    num_columns = math.ceil(((math.ceil(number_samples / 8) * 8) * replication_mode) / 8) + replication_mode
-    working_reagent_volume = 200
-    right_pipette.pick_up_tip()
-    working_reagent_volume_amt = num_columns*200*8 +1000#(working_reagent_volume*8*(math.ceil(number_samples/8)) + 1000)/8
+    working_reagent_aspirations = planner.choice("working reagent")["aspirations"] // num_columns
+    compiler.pick_up(right_pipette, "working reagent")
     # Loading liquid for protocol setup
-    for i in range (0, math.ceil(working_reagent_volume_amt/(10.5*1000))):
-        if i ==math.ceil(working_reagent_volume_amt/(10.5*1000))-1:
-            working_reagent_reservoir.wells()[i].load_liquid(dye, working_reagent_volume_amt-10500*i + 1500)
-        else:
-            working_reagent_reservoir.wells()[i].load_liquid(dye, 12000)
-
-    for i in range (0, num_columns):
-        working_reagent_volume_amt = working_reagent_volume_amt-(working_reagent_volume*8)
-        # protocol.comment(str(working_reagent_volume_amt))
-        # protocol.comment(str(math.ceil(working_reagent_volume_amt/(10.5*1000))))
-        right_pipette.aspirate(working_reagent_volume, working_reagent_reservoir['A'+str(math.ceil(working_reagent_volume_amt/(10.5*1000)))],0.5)
-        right_pipette.dispense(working_reagent_volume, working_plate["A"+str(i+1)].top(-1), rate=0.3)
-        right_pipette.blow_out(working_plate["A"+str(i+1)].top(-1))
-        right_pipette.blow_out(working_plate["A"+str(i+1)].top(-1))
-    remove_tip(right_pipette)
+    for well in working_reagent_reservoir.wells():
+        if well.well_name != diluent_reservoir.well_name or not stamped_columns:
+            sheet.source(well, dye)
+
+    compiler.add_reagent(right_pipette, working_reagent_reservoir, working_plate, num_columns, working_reagent_aspirations)
+    compiler.remove_tip(right_pipette)
 
     # Prep HeaterShaker
     heatshaker.open_labware_latch()
@@ -505,21 +2288,12 @@ def run(protocol: protocol_api.ProtocolContext):
         )
     # protocol.pause("Place lid on well plate")
     heatshaker.close_labware_latch()
-    heatshaker.set_and_wait_for_temperature(37)
-    heatshaker.set_and_wait_for_shake_speed(400)
 
     # Shake For 30 Seconds
-    if is_dry_run:
-        protocol.delay(seconds=10)
-    else:
-        protocol.delay(minutes=0.5)
-    heatshaker.deactivate_shaker()
+    compiler.shake(protocol, heatshaker, is_dry_run)
 
-    protocol.comment("\n---------------25 Minute Incubation----------------\n\n")
-    if is_dry_run:
-        protocol.delay(seconds=10)
-    else:
-        protocol.delay(minutes=protocol.params.incubation_time)  # SEND EMAIL AT 10 MINUTES
+    protocol.comment("\n---------------%d Minute Incubation----------------\n\n" % protocol.params.incubation_time)
+    protocol.delay(seconds=compiler.incubation_seconds(is_dry_run))  # SEND EMAIL AT 10 MINUTES
 
     # Deactivating Heatshaker
     heatshaker.deactivate_heater()
@@ -528,6 +2302,9 @@ def run(protocol: protocol_api.ProtocolContext):
         protocol.move_labware(lid, "C1", use_gripper=True)
         protocol.move_labware(new_working_plate, "C2", use_gripper=True)
         heatshaker.close_labware_latch()
+        # the stand-in with the lid offset is back in C2, the reader needs the flat plate it really is
+        protocol.deck.__delitem__("C2")
+        working_plate = protocol.load_labware("corning_96_wellplate_360ul_flat", "C2")
         # left_pipette.pick_up_tip()
         # left_pipette.pick_up_tip()
     else:
@@ -535,3 +2312,13 @@ def run(protocol: protocol_api.ProtocolContext):
         heatshaker.close_labware_latch()
         
         # heatshaker.close_labware_latch()
+
+    if read_absorbance:
+        protocol.comment("\n---------------Reading Absorbance----------------\n\n")
+        quantifier.read(protocol, reader, working_plate, 0, "C2")
+        quantifier.report(protocol)
+        qc = ReplicateQC(quantifier, lambda i, dilution: stock_well(i), split_dilutions=False)
+        qc.check()
+        qc.report(protocol)
+    sheet.finish(protocol)
+    optimiser.finish(protocol)